@@ -1,3 +1,5 @@
 from .nested import *  # noqa: F403
+from .crossmatch import *  # noqa: F403
 from .utils import *  # noqa: F403
+from .thread_pool import *  # noqa: F403
 from .version import __version__  # noqa: F401
@@ -0,0 +1,104 @@
+"""Positional cross-match of two catalogs."""
+import astropy.units as u
+from astropy.coordinates import Angle
+
+import numpy as np
+
+from . import cdshealpix
+from .utils import _flat_radians
+
+__all__ = ["crossmatch"]
+
+# Larger radii are better served by cone searches
+_MAX_RADIUS = 30 * u.deg
+
+
+def crossmatch(lon1, lat1, lon2, lat2, radius, *, chunk_size=1 << 20, num_threads=0):
+    """Cross-match two catalogs within a radius.
+
+    The second catalog is sorted by HEALPix cell, at a depth chosen from ``radius``
+    so that a cell and its 8 neighbours contain all the points within ``radius`` of
+    the points of the cell. The points of the first catalog are then matched
+    ``chunk_size`` at a time, probing the cell of each point and its neighbours, so
+    that only the matches of a chunk are in memory at once.
+
+    Parameters
+    ----------
+    lon1 : `astropy.coordinates.Longitude`
+        The longitudes of the first catalog.
+    lat1 : `astropy.coordinates.Latitude`
+        The latitudes of the first catalog.
+    lon2 : `astropy.coordinates.Longitude`
+        The longitudes of the second catalog.
+    lat2 : `astropy.coordinates.Latitude`
+        The latitudes of the second catalog.
+    radius : `astropy.units.Quantity`
+        The cross-match radius, lower than 30 degrees.
+    chunk_size : int, optional
+        The number of points of the first catalog matched at each step.
+        Default to ``1 << 20``.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    matches : generator
+        A generator of ``(idx1, idx2, distance)`` tuples, one per chunk of the first
+        catalog. ``idx1`` and ``idx2`` are the `np.uint64` indices of the matched
+        points in the flattened catalogs, ``distance`` the
+        `~astropy.coordinates.Angle` between them. The pairs are sorted by ``idx1``
+        then by distance.
+
+    Raises
+    ------
+    ValueError
+        When ``radius`` is not in :math:`]0, 30]` degrees.
+        When the longitudes and latitudes of a catalog do not have the same shape.
+
+    Examples
+    --------
+    >>> from cdshealpix import crossmatch
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> lon1, lat1 = Longitude([0, 10], u.deg), Latitude([0, 10], u.deg)
+    >>> lon2, lat2 = Longitude([10, 0.001, 50], u.deg), Latitude([10, 0, 0], u.deg)
+    >>> for idx1, idx2, distance in crossmatch(lon1, lat1, lon2, lat2, 5 * u.arcsec):
+    ...     print(idx1, idx2)
+    [0 1] [1 0]
+    """
+    if not (isinstance(radius, u.Quantity)):
+        raise ValueError("`radius` must be of type `astropy.units.Quantity`")
+
+    if not 0 < radius <= _MAX_RADIUS:
+        raise ValueError("`radius` must be in ]0, 30] degrees")
+
+    if chunk_size < 1:
+        raise ValueError("`chunk_size` must be >= 1")
+
+    radius = radius.to_value(u.rad)
+    lon1, lat1 = _flat_radians(lon1, lat1)
+    lon2, lat2 = _flat_radians(lon2, lat2)
+    hashes, order = cdshealpix.crossmatch_index(
+        radius, lon2, lat2, np.uint16(num_threads)
+    )
+    return _chunks(
+        lon1, lat1, lon2, lat2, hashes, order, radius, chunk_size, num_threads
+    )
+
+
+def _chunks(lon1, lat1, lon2, lat2, hashes, order, radius, chunk_size, num_threads):
+    """Match the first catalog against the indexed second one, chunk by chunk."""
+    for start in range(0, lon1.size, chunk_size):
+        idx1, idx2, distance = cdshealpix.crossmatch_chunk(
+            radius,
+            lon1[start : start + chunk_size],
+            lat1[start : start + chunk_size],
+            start,
+            lon2,
+            lat2,
+            hashes,
+            order,
+            np.uint16(num_threads),
+        )
+        yield idx1, idx2, Angle(distance, u.rad, copy=False)
@@ -0,0 +1 @@
+from .index import HealpixIndex  # noqa: F401
@@ -0,0 +1,470 @@
+"""Spatial index of a catalog, answering region queries with rows.
+
+The rows of the catalog are sorted once by nested HEALPix cell at depth 29. A query
+covers its region with HEALPix cells (as `cdshealpix.nested.cone_search` does), turns
+these cells into ranges of depth 29 cells which are binary searched in the sorted
+catalog, and only tests exactly the rows of the cells partially covered by the region.
+
+An index can be saved in a binary file, then memory-mapped by the processes querying
+it: they start without reading the file, and share the pages cached by the system.
+"""
+from math import pi
+
+import astropy.units as u
+from astropy.coordinates import Angle, Latitude, Longitude
+
+import numpy as np
+
+from .. import cdshealpix
+from ..nested.healpix import _polygon_vertices
+from ..utils import _check_depth, _flat_radians
+
+
+_MAGIC = b"HPXINDEX"
+_VERSION = 1
+# The header of the files, followed by the hashes, the rows, the longitudes and the
+# latitudes of the index
+_HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u8"),
+        ("size", "<u8"),
+        ("coords_itemsize", "<u8"),
+        ("base_offsets", "<u8", (13,)),
+    ]
+)
+
+
+def _base_offsets(hashes):
+    """Get the offsets of the 12 base cells in the sorted depth 29 ``hashes``."""
+    starts = np.arange(13, dtype=np.uint64) << np.uint64(58)
+    return np.searchsorted(hashes, starts).astype(np.uint64)
+
+
+def _read_array(path, dtype, offset, size, mmap):
+    if size == 0:
+        return np.empty(0, dtype=dtype)
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(size,))
+    array = np.fromfile(path, dtype=dtype, count=size, offset=offset)
+    if array.size != size:
+        raise ValueError(f"'{path}' is truncated")
+    return array
+
+
+def _query_depth(size):
+    """Get the depth of the coverage of a query region of the given size in radians.
+
+    The cells are about 8 times smaller than the region, so that the rows are mostly
+    in fully covered cells while the coverage stays small.
+    """
+    if size <= 0:
+        return 29
+    # the mean size of the cells at depth 0 is sqrt(4 * pi / 12) radians
+    depth = np.floor(np.log2(8 * np.sqrt(pi / 3) / size))
+    return int(np.clip(depth, 0, 29))
+
+
+class HealpixIndex:
+    """An index of a catalog by HEALPix cell, for repeated region queries.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the rows of the catalog.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the rows of the catalog.
+    num_threads : int, optional
+        Specifies the number of threads to use to sort the catalog. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Examples
+    --------
+    >>> from cdshealpix.index import HealpixIndex
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> index = HealpixIndex(Longitude([0, 1, 50], u.deg), Latitude([0, 1, 0], u.deg))
+    >>> index.cone_search(Longitude(0, u.deg), Latitude(0, u.deg), 2 * u.deg)
+    array([0, 1], dtype=uint64)
+    """
+
+    def __init__(self, lon, lat, *, num_threads=0):
+        lon, lat = _flat_radians(lon, lat)
+        self._hashes, self._rows = cdshealpix.index_catalog(
+            lon, lat, np.uint16(num_threads)
+        )
+        self._base_offsets = _base_offsets(self._hashes)
+        # the coordinates are sorted as the hashes, to be read cell by cell
+        self._lon, self._lat = lon[self._rows], lat[self._rows]
+
+    @classmethod
+    def _from_arrays(cls, hashes, rows, base_offsets, lon, lat):
+        index = cls.__new__(cls)
+        index._hashes, index._rows, index._base_offsets = hashes, rows, base_offsets
+        index._lon, index._lat = lon, lat
+        return index
+
+    def __len__(self):
+        """Get the number of rows of the catalog."""
+        return self._rows.size
+
+    @property
+    def hashes(self):
+        """The depth 29 nested HEALPix indices of the rows, sorted.
+
+        Returns
+        -------
+        `numpy.ndarray`
+            A `np.uint64` array.
+        """
+        return self._hashes
+
+    @property
+    def rows(self):
+        """The rows of the catalog, in the order of `hashes`.
+
+        Returns
+        -------
+        `numpy.ndarray`
+            A `np.uint64` array.
+        """
+        return self._rows
+
+    def save(self, path):
+        """Save the index in a binary file.
+
+        The file is made of a header followed by the arrays of the index, all
+        little-endian:
+
+        * the magic string ``HPXINDEX``, then the format version, the number of rows
+          N and the size in bytes of the coordinates (4 or 8), as `np.uint64`.
+        * the offsets of the 12 base cells in the sorted hashes, and N, as 13
+          `np.uint64`.
+        * the N sorted `hashes` and the N `rows`, as `np.uint64`.
+        * the N longitudes then the N latitudes of the rows, in the order of
+          `hashes`, in radians.
+
+        Parameters
+        ----------
+        path : str, `pathlib.Path`
+            The file's path.
+        """
+        header = np.zeros(1, dtype=_HEADER)
+        header["magic"] = _MAGIC
+        header["version"] = _VERSION
+        header["size"] = len(self)
+        header["coords_itemsize"] = self._lon.dtype.itemsize
+        header["base_offsets"] = self._base_offsets
+        coords_dtype = f"<f{self._lon.dtype.itemsize}"
+        with open(path, "wb") as f:
+            header.tofile(f)
+            for array, dtype in (
+                (self._hashes, "<u8"),
+                (self._rows, "<u8"),
+                (self._lon, coords_dtype),
+                (self._lat, coords_dtype),
+            ):
+                np.ascontiguousarray(array, dtype=dtype).tofile(f)
+
+    @classmethod
+    def load(cls, path, *, mmap=True):
+        """Load an index saved with `save`.
+
+        Parameters
+        ----------
+        path : str, `pathlib.Path`
+            The file's path.
+        mmap : bool, optional
+            By default, the arrays of the index are memory-mapped (see `numpy.memmap`)
+            instead of being read: the loading is immediate and the pages of the file
+            are read by the queries, and shared by all the processes mapping it.
+            Set to `False` to read the whole file in memory.
+
+        Returns
+        -------
+        `HealpixIndex`
+            The index.
+
+        Raises
+        ------
+        ValueError
+            When the file is not a HEALPix index file of a supported version.
+
+        Examples
+        --------
+        >>> from cdshealpix.index import HealpixIndex
+        >>> from astropy.coordinates import Longitude, Latitude
+        >>> import astropy.units as u
+        >>> from tempfile import NamedTemporaryFile
+        >>> lon, lat = Longitude([0, 1, 50], u.deg), Latitude([0, 1, 0], u.deg)
+        >>> index = HealpixIndex(lon, lat)
+        >>> with NamedTemporaryFile() as f:
+        ...     index.save(f.name)
+        ...     index = HealpixIndex.load(f.name, mmap=False)
+        >>> len(index)
+        3
+        """
+        header = np.fromfile(path, dtype=_HEADER, count=1)
+        if header.size != 1 or header["magic"][0] != _MAGIC:
+            raise ValueError(f"'{path}' is not a HEALPix index file")
+        if header["version"][0] != _VERSION:
+            raise ValueError(
+                f"Unsupported HEALPix index file version: {header['version'][0]}"
+            )
+        size = int(header["size"][0])
+        coords_itemsize = int(header["coords_itemsize"][0])
+        if coords_itemsize not in (4, 8):
+            raise ValueError(f"'{path}' is not a HEALPix index file")
+
+        arrays = []
+        offset = _HEADER.itemsize
+        for dtype in ("<u8", "<u8", f"<f{coords_itemsize}", f"<f{coords_itemsize}"):
+            arrays.append(_read_array(path, dtype, offset, size, mmap))
+            offset += size * np.dtype(dtype).itemsize
+        hashes, rows, lon, lat = arrays
+        base_offsets = header["base_offsets"][0].astype(np.uint64)
+        return cls._from_arrays(hashes, rows, base_offsets, lon, lat)
+
+    def cone_search(self, lon, lat, radius, depth=None, delta_depth=2):
+        """Get the rows of the catalog in a cone.
+
+        Parameters
+        ----------
+        lon : `astropy.coordinates.Longitude`
+            Longitude of the center of the cone.
+        lat : `astropy.coordinates.Latitude`
+            Latitude of the center of the cone.
+        radius : `astropy.units.Quantity`
+            Radius of the cone.
+        depth : int, optional
+            Depth of the coverage of the cone, see `cdshealpix.nested.cone_search`.
+            By default, chosen from ``radius``.
+        delta_depth : int, optional
+            To control the approximation of the coverage, see
+            `cdshealpix.nested.cone_search`.
+
+        Returns
+        -------
+        rows : `numpy.ndarray`
+            The rows in the cone, sorted, as a `np.uint64` array.
+        """
+        if not (isinstance(radius, u.Quantity)):
+            raise ValueError("`radius` must be of type `astropy.units.Quantity`")
+
+        radius = radius.to_value(u.rad)
+        if depth is None:
+            depth = _query_depth(2 * radius)
+        _check_depth(depth)
+
+        return cdshealpix.index_cone_search(
+            self._hashes,
+            self._rows,
+            self._base_offsets,
+            self._lon,
+            self._lat,
+            np.uint8(depth),
+            np.uint8(delta_depth),
+            float(Longitude(lon).rad),
+            float(Latitude(lat).rad),
+            radius,
+        )
+
+    def polygon_search(self, lon, lat, depth=None):
+        """Get the rows of the catalog in a polygon.
+
+        Parameters
+        ----------
+        lon : `astropy.coordinates.Longitude`
+            The longitudes of the vertices of the polygon.
+        lat : `astropy.coordinates.Latitude`
+            The latitudes of the vertices of the polygon.
+        depth : int, optional
+            Depth of the coverage of the polygon, see
+            `cdshealpix.nested.polygon_search`. By default, chosen from the distances
+            between the vertices.
+
+        Returns
+        -------
+        rows : `numpy.ndarray`
+            The rows in the polygon, sorted, as a `np.uint64` array.
+
+        Raises
+        ------
+        ValueError
+            When the polygon has less than 3 distinct vertices.
+        """
+        lon, lat = _polygon_vertices(Longitude(lon), Latitude(lat))
+
+        if depth is None:
+            # the largest distance from the first vertex, with the haversine formula
+            s_lat, s_lon = np.sin(0.5 * (lat - lat[0])), np.sin(0.5 * (lon - lon[0]))
+            hav = s_lat**2 + np.cos(lat) * np.cos(lat[0]) * s_lon**2
+            depth = _query_depth(2 * np.arcsin(np.sqrt(min(hav.max(), 1))))
+        _check_depth(depth)
+
+        return cdshealpix.index_polygon_search(
+            self._hashes,
+            self._rows,
+            self._base_offsets,
+            self._lon,
+            self._lat,
+            np.uint8(depth),
+            lon,
+            lat,
+        )
+
+    def box_search(self, lon, lat, a, b, angle=0 * u.deg, depth=None):
+        """Get the rows of the catalog in a box.
+
+        The box's sides follow great circles, as in `cdshealpix.nested.box_search`.
+
+        Parameters
+        ----------
+        lon : `astropy.coordinates.Longitude`
+            Longitude of the center of the box.
+        lat : `astropy.coordinates.Latitude`
+            Latitude of the center of the box.
+        a : `astropy.coordinates.Angle`
+            Extension along the semi-major axis.
+        b : `astropy.coordinates.Angle`
+            Extension along the semi-minor axis.
+        angle : `astropy.coordinates.Angle`, optional
+            Rotation angle between the north and the semi-major axis, east of north.
+        depth : int, optional
+            Depth of the coverage of the box, see `cdshealpix.nested.box_search`. By
+            default, chosen from the size of the box.
+
+        Returns
+        -------
+        rows : `numpy.ndarray`
+            The rows in the box, sorted, as a `np.uint64` array.
+        """
+        a, b = a.to_value(u.rad), b.to_value(u.rad)
+        if depth is None:
+            depth = _query_depth(2 * min(a, b))
+        _check_depth(depth)
+
+        return cdshealpix.index_box_search(
+            self._hashes,
+            self._rows,
+            self._base_offsets,
+            self._lon,
+            self._lat,
+            np.uint8(depth),
+            float(Longitude(lon).rad),
+            float(Latitude(lat).rad),
+            a,
+            b,
+            angle.to_value(u.rad),
+        )
+
+    def zone_search(self, lon_min, lat_min, lon_max, lat_max, depth=None):
+        """Get the rows of the catalog in a zone.
+
+        All the rows inside have lon_min =< lon < lon_max and lat_min =< lat < lat_max,
+        as in `cdshealpix.nested.zone_search`.
+
+        Parameters
+        ----------
+        lon_min : `astropy.coordinates.Longitude`
+            Longitude of the bottom left corner of the zone.
+        lat_min : `astropy.coordinates.Latitude`
+            Latitude of the bottom left corner of the zone.
+        lon_max : `astropy.coordinates.Longitude`
+            Longitude of the upper right corner of the zone.
+        lat_max : `astropy.coordinates.Latitude`
+            Latitude of the upper right corner of the zone.
+        depth : int, optional
+            Depth of the coverage of the zone. By default, chosen from the size of the
+            zone.
+
+        Returns
+        -------
+        rows : `numpy.ndarray`
+            The rows in the zone, sorted, as a `np.uint64` array.
+        """
+        lon_min, lon_max = float(Longitude(lon_min).rad), float(Longitude(lon_max).rad)
+        lat_min, lat_max = float(Latitude(lat_min).rad), float(Latitude(lat_max).rad)
+        # this is because astropy wraps the angle when we actually want 2 * Pi here
+        if lon_max == 0:
+            lon_max = 2 * pi
+
+        if depth is None:
+            lon_extent = (lon_max - lon_min) % (2 * pi) or 2 * pi
+            depth = _query_depth(min(lon_extent, lat_max - lat_min))
+        _check_depth(depth)
+
+        return cdshealpix.index_zone_search(
+            self._hashes,
+            self._rows,
+            self._base_offsets,
+            self._lon,
+            self._lat,
+            np.uint8(depth),
+            lon_min,
+            lat_min,
+            lon_max,
+            lat_max,
+        )
+
+    def knn_search(self, lon, lat, k, *, num_threads=0):
+        """Get the ``k`` nearest rows of the catalog to positions.
+
+        The rows near a position are searched in cones of growing radius, each
+        probing the HEALPix cell of the position and its neighbours at the depth of
+        its radius, until ``k`` rows are found within the radius.
+
+        Parameters
+        ----------
+        lon : `astropy.coordinates.Longitude`
+            The longitudes of the positions.
+        lat : `astropy.coordinates.Latitude`
+            The latitudes of the positions.
+        k : int
+            The number of neighbours of each position, in ``[1, len(index)]``.
+        num_threads : int, optional
+            Specifies the number of threads to use for the computation. Default to 0
+            means it will use the default thread pool, see
+            `~cdshealpix.set_num_threads`.
+
+        Returns
+        -------
+        rows, distance : (`numpy.ndarray`, `astropy.coordinates.Angle`)
+            The `np.uint64` rows of the nearest neighbours of the flattened positions
+            and their distances, both of shape ``(lon.size, k)`` and ordered by
+            distance.
+
+        Raises
+        ------
+        ValueError
+            When ``k`` is not in ``[1, len(index)]``.
+            When ``lon`` and ``lat`` do not have the same shape.
+
+        Examples
+        --------
+        >>> from cdshealpix.index import HealpixIndex
+        >>> from astropy.coordinates import Longitude, Latitude
+        >>> import astropy.units as u
+        >>> lon, lat = Longitude([0, 1, 50], u.deg), Latitude([0, 1, 0], u.deg)
+        >>> index = HealpixIndex(lon, lat)
+        >>> rows, distance = index.knn_search(lon[:1], lat[:1], 2)
+        >>> rows
+        array([[0, 1]], dtype=uint64)
+        """
+        if not 1 <= k <= len(self):
+            raise ValueError("`k` must be in [1, len(index)]")
+
+        lon, lat = _flat_radians(lon, lat)
+        rows, distance = cdshealpix.index_knn_search(
+            self._hashes,
+            self._rows,
+            self._base_offsets,
+            self._lon,
+            self._lat,
+            lon.astype(np.float64, copy=False),
+            lat.astype(np.float64, copy=False),
+            k,
+            np.uint16(num_threads),
+        )
+        shape = (lon.size, k)
+        return rows.reshape(shape), Angle(distance.reshape(shape), u.rad, copy=False)
@@ -0,0 +1,283 @@
+"""Astropy-free conversions of HEALPix in the nested configuration.
+
+The functions of this module are the equivalent of the ones of `cdshealpix.nested`
+working on plain float64 `numpy.ndarray` objects, in radians or in degrees. They skip
+the construction of the astropy objects and the unit conversions, which cost more
+than the computation itself for small and medium sized arrays.
+"""
+import numpy as np
+
+from .. import cdshealpix
+from ..utils import (
+    _as_hashes,
+    _check_compact_depth,
+    _check_depth,
+    _check_out,
+    _check_outs,
+    _out_dtypes,
+    _raw_lonlat,
+)
+
+__all__ = [
+    "lonlat_to_healpix",
+    "healpix_to_lonlat",
+    "vertices",
+]
+
+
+def lonlat_to_healpix(
+    lon,
+    lat,
+    depth,
+    return_offsets=False,
+    *,
+    degrees=False,
+    num_threads=0,
+    out=None,
+    compact=False,
+):
+    r"""Get the HEALPix indexes that contains specific sky coordinates.
+
+    This is the equivalent of `cdshealpix.nested.lonlat_to_healpix` without astropy.
+
+    Parameters
+    ----------
+    lon : `numpy.ndarray`
+        The longitudes of the sky coordinates, in radians (or degrees if
+        ``degrees`` is set).
+    lat : `numpy.ndarray`
+        The latitudes of the sky coordinates, in radians (or degrees if
+        ``degrees`` is set).
+    depth : `numpy.ndarray`
+        The depth of the returned HEALPix cell indexes.
+    return_offsets : bool, optional
+        If set to `True`, returns a tuple made of 3 elements, the HEALPix cell
+        indexes and the dx, dy arrays telling where the (``lon``, ``lat``) coordinates
+        passed are located on the cells. ``dx`` and ``dy`` are :math:`\in [0, 1]`
+    degrees : bool, optional
+        Set to `True` if ``lon`` and ``lat`` are given in degrees. Default to `False`.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` array of the shape of the result in which the
+        HEALPix cell indexes are written instead of allocating a new array. When
+        ``return_offsets`` is set, a tuple of 3 arrays (``ipix``, ``dx``, ``dy``), the
+        last two of dtype `np.float64`. With ``compact``, the dtypes are `np.uint32`
+        and `np.float32`.
+    compact : bool, optional
+        If set to `True`, the HEALPix cell indexes are returned as `np.uint32` and the
+        offsets as `np.float32`, halving the memory used by the result. Only available
+        for depths up to 13. Default to `False`.
+
+    Returns
+    -------
+    ipix : `numpy.ndarray`
+        A numpy array containing all the HEALPix cell indexes stored as `np.uint64`.
+
+    Raises
+    ------
+    ValueError
+        When the number of longitudes and latitudes given do not match.
+        When the latitudes are out of :math:`[-\pi/2, \pi/2]`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix.nested.fast import lonlat_to_healpix
+    >>> import numpy as np
+    >>> lon = np.array([0, 50, 25])
+    >>> lat = np.array([6, -12, 45])
+    >>> ipix = lonlat_to_healpix(lon, lat, 12, degrees=True)
+    """
+    lon, lat = _raw_lonlat(lon, lat, degrees)
+    depth = np.atleast_1d(depth)
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+
+    lon, lat, depth = np.broadcast_arrays(lon, lat, depth)
+
+    ipix_dtype, offsets_dtype = _out_dtypes(compact)
+    if return_offsets:
+        ipix, dx, dy = _check_outs(
+            out, lon.shape, (ipix_dtype, offsets_dtype, offsets_dtype)
+        )
+    else:
+        ipix = _check_out(out, lon.shape, ipix_dtype)
+        # the offsets are not computed
+        dx = dy = None
+
+    cdshealpix.lonlat_to_healpix(
+        depth.astype(np.uint8, copy=False),
+        lon,
+        lat,
+        ipix,
+        dx,
+        dy,
+        np.uint16(num_threads),
+    )
+
+    if return_offsets:
+        return ipix, dx, dy
+    return ipix
+
+
+def healpix_to_lonlat(
+    ipix,
+    depth,
+    dx=0.5,
+    dy=0.5,
+    *,
+    degrees=False,
+    num_threads=0,
+    out=None,
+    compact=False,
+):
+    r"""Get the longitudes and latitudes of the center of some HEALPix cells.
+
+    This is the equivalent of `cdshealpix.nested.healpix_to_lonlat` without astropy.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes given as a `np.uint64` numpy array.
+    depth : `numpy.ndarray`
+        The HEALPix cell depth given as a `np.uint8` numpy array.
+    dx : float, optional
+        The offset position :math:`\in [0, 1[` along the X axis. By default, `dx=0.5`
+    dy : float, optional
+        The offset position :math:`\in [0, 1[` along the Y axis. By default, `dy=0.5`
+    degrees : bool, optional
+        Set to `True` to get the coordinates in degrees. Default to `False` (radians).
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
+
+    Returns
+    -------
+    lon, lat : (`numpy.ndarray`, `numpy.ndarray`)
+        The longitudes, in :math:`[0, 2\pi[`, and latitudes of the positions.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes given have values out of :math:`[0, 4^{29 - depth}[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+
+    Examples
+    --------
+    >>> from cdshealpix.nested.fast import healpix_to_lonlat
+    >>> import numpy as np
+    >>> ipix = np.array([42, 6, 10])
+    >>> lon, lat = healpix_to_lonlat(ipix, 12, degrees=True)
+    """
+    ipix = np.atleast_1d(ipix)
+    depth = np.atleast_1d(depth)
+    _check_depth(depth)
+
+    if dx < 0 or dx >= 1:
+        raise ValueError("dx must be between [0, 1[")
+
+    if dy < 0 or dy >= 1:
+        raise ValueError("dy must be between [0, 1[")
+
+    ipix, depth = np.broadcast_arrays(ipix, depth)
+
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, ipix.shape, (coords_dtype, coords_dtype))
+
+    cdshealpix.healpix_to_lonlat(
+        depth.astype(np.uint8, copy=False),
+        _as_hashes(ipix),
+        dx,
+        dy,
+        lon,
+        lat,
+        np.uint16(num_threads),
+    )
+
+    if degrees:
+        np.rad2deg(lon, out=lon)
+        np.rad2deg(lat, out=lat)
+    return lon, lat
+
+
+def vertices(
+    ipix, depth, step=1, *, degrees=False, num_threads=0, out=None, compact=False
+):
+    r"""Get the longitudes and latitudes of the vertices of some HEALPix cells.
+
+    This is the equivalent of `cdshealpix.nested.vertices` without astropy.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes given as a `np.uint64` numpy array.
+    depth : int, or `numpy.ndarray`
+        The depth of the HEALPix cells. If given as an array, should have the same shape than ipix
+    step : int, optional
+        The number of vertices returned per HEALPix side. By default it is set to 1 meaning that
+        it will only return the vertices of the cell. The number of vertices returned
+        is ``4 * step``.
+    degrees : bool, optional
+        Set to `True` to get the coordinates in degrees. Default to `False` (radians).
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
+
+    Returns
+    -------
+    lon, lat : (`numpy.ndarray`, `numpy.ndarray`)
+        Two :math:`N` x :math:`4 \times step` arrays where N is the number of HEALPix
+        cells given in `ipix`.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes given have values out of :math:`[0, 4^{29 - depth}[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+
+    Examples
+    --------
+    >>> from cdshealpix.nested.fast import vertices
+    >>> import numpy as np
+    >>> lon, lat = vertices(np.array([42, 6, 10]), 12)
+    """
+    ipix = np.atleast_1d(ipix)
+    _check_depth(depth)
+
+    if isinstance(depth, int) or np.isscalar(depth):
+        depth = np.full(len(ipix), depth)
+    if step < 1:
+        raise ValueError("The number of step must be >= 1")
+
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, (*ipix.shape, 4 * step), (coords_dtype, coords_dtype))
+
+    cdshealpix.vertices(
+        depth.astype(np.uint8, copy=False),
+        _as_hashes(ipix),
+        step,
+        lon,
+        lat,
+        np.uint16(num_threads),
+    )
+
+    if degrees:
+        np.rad2deg(lon, out=lon)
+        np.rad2deg(lat, out=lat)
+    return lon, lat
@@ -8,24 +8,62 @@ from astropy.coordinates import Angle, Latitude, Longitude, SkyCoord
 import numpy as np
 
 from .. import cdshealpix
-from ..utils import _validate_lonlat, _check_depth
+from ..utils import (
+    _as_hashes,
+    _check_compact_depth,
+    _check_budget,
+    _check_depth,
+    _check_format,
+    _check_out,
+    _check_outs,
+    _flat_radians,
+    _out_dtypes,
+    _validate_lonlat,
+)
 
 # Do not fill by hand :)
 # > egrep "^ *def" healpix.py | cut -c 5- | egrep -v '^_'| cut -d '(' -f 1 | sed -r "s/^(.*)$/ '\1'/" | tr '\n' ','
 __all__ = [
     "lonlat_to_healpix",
+    "lonlat_to_healpix_depths",
     "skycoord_to_healpix",
+    "sort_by_healpix",
+    "group_by_healpix",
     "healpix_to_lonlat",
     "healpix_to_skycoord",
     "vertices",
     "vertices_skycoord",
     "neighbours",
     "external_neighbours",
+    "to_parent",
+    "children_range",
+    "to_uniq",
+    "from_uniq",
+    "to_zuniq",
+    "from_zuniq",
     "cone_search",
+    "cone_search_batch",
     "box_search",
+    "box_search_batch",
     "zone_search",
+    "zone_search_batch",
     "polygon_search",
+    "polygon_search_batch",
     "elliptical_cone_search",
+    "elliptical_cone_search_batch",
+    "coverage_union",
+    "coverage_intersection",
+    "coverage_difference",
+    "coverage_complement",
+    "coverage_simplify",
+    "coverage_dilate",
+    "coverage_erode",
+    "coverage_border",
+    "coverage_contains",
+    "coverage_contains_ipix",
+    "points_in_cones",
+    "points_in_ellipses",
+    "points_in_polygons",
     "healpix_to_xy",
     "lonlat_to_xy",
     "xy_to_lonlat",
@@ -33,8 +71,27 @@ __all__ = [
 ]
 
 
+def _broadcast_cells(ipix, *depths):
+    """Broadcast HEALPix cell indexes and their depths, cast to uint8."""
+    ipix = _as_hashes(np.atleast_1d(ipix))
+    depths = [np.atleast_1d(depth) for depth in depths]
+    for depth in depths:
+        _check_depth(depth)
+    ipix, *depths = np.broadcast_arrays(ipix, *depths)
+    return (ipix, *(depth.astype(np.uint8, copy=False) for depth in depths))
+
+
+def _ravel_batch(*values):
+    """Broadcast the parameters of a batch of regions to 1-D float64 arrays."""
+    return (
+        x.astype(np.float64, copy=False).ravel() for x in np.broadcast_arrays(*values)
+    )
+
+
 @_validate_lonlat
-def lonlat_to_healpix(lon, lat, depth, return_offsets=False, num_threads=0):
+def lonlat_to_healpix(
+    lon, lat, depth, return_offsets=False, num_threads=0, *, out=None, compact=False
+):
     r"""Get the HEALPix indexes that contains specific sky coordinates.
 
     The depth of the returned HEALPix cell indexes must be specified. This
@@ -55,8 +112,17 @@ def lonlat_to_healpix(lon, lat, depth, return_offsets=False, num_threads=0):
         passed are located on the cells. ``dx`` and ``dy`` are :math:`\in [0, 1]`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` array of the shape of the result in which the
+        HEALPix cell indexes are written instead of allocating a new array. When
+        ``return_offsets`` is set, a tuple of 3 arrays (``ipix``, ``dx``, ``dy``), the
+        last two of dtype `np.float64`. With ``compact``, the dtypes are `np.uint32`
+        and `np.float32`.
+    compact : bool, optional
+        If set to `True`, the HEALPix cell indexes are returned as `np.uint32` and the
+        offsets as `np.float32`, halving the memory used by the result. Only available
+        for depths up to 13. Default to `False`.
 
     Returns
     -------
@@ -69,6 +135,8 @@ def lonlat_to_healpix(lon, lat, depth, return_offsets=False, num_threads=0):
         When the number of longitudes and latitudes given do not match.
         When `lon` is not of type `astropy.coordinates.Longitude`.
         When `lat` is not of type `astropy.coordinates.Latitude`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a depth greater than 13.
 
     Examples
     --------
@@ -85,18 +153,26 @@ def lonlat_to_healpix(lon, lat, depth, return_offsets=False, num_threads=0):
     lat = np.atleast_1d(lat.rad)
     depth = np.atleast_1d(depth)
     _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
 
     # Broadcasting arrays
     lon, lat, depth = np.broadcast_arrays(lon, lat, depth)
 
     # Allocation of the arrays storing the results
     num_ipix = lon.shape
-    ipix = np.empty(num_ipix, dtype=np.uint64)
-    dx = np.empty(num_ipix, dtype=np.float64)
-    dy = np.empty(num_ipix, dtype=np.float64)
+    ipix_dtype, offsets_dtype = _out_dtypes(compact)
+    if return_offsets:
+        ipix, dx, dy = _check_outs(
+            out, num_ipix, (ipix_dtype, offsets_dtype, offsets_dtype)
+        )
+    else:
+        ipix = _check_out(out, num_ipix, ipix_dtype)
+        # the offsets are not computed
+        dx = dy = None
 
     # Call the Rust extension
-    depth = depth.astype(np.uint8)
+    depth = depth.astype(np.uint8, copy=False)
     num_threads = np.uint16(num_threads)
     cdshealpix.lonlat_to_healpix(depth, lon, lat, ipix, dx, dy, num_threads)
 
@@ -105,6 +181,71 @@ def lonlat_to_healpix(lon, lat, depth, return_offsets=False, num_threads=0):
     return ipix
 
 
+@_validate_lonlat
+def lonlat_to_healpix_depths(lon, lat, depths, return_offsets=False, num_threads=0):
+    r"""Get the HEALPix indexes of sky coordinates at several depths at once.
+
+    The coordinates are projected once, at depth 29, and the indexes at the lower
+    depths are obtained by shifting the depth 29 index, which is much faster than
+    calling `lonlat_to_healpix` once per depth.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the sky coordinates.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the sky coordinates.
+    depths : `numpy.ndarray`
+        The depths of the returned HEALPix cell indexes.
+    return_offsets : bool, optional
+        If set to `True`, returns a tuple made of 3 elements, the HEALPix cell
+        indexes and the dx, dy arrays telling where the (``lon``, ``lat``) coordinates
+        passed are located in the cells at each depth. ``dx`` and ``dy`` are
+        :math:`\in [0, 1]`
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    ipix : `numpy.ndarray`
+        The `np.uint64` HEALPix cell indexes, of shape ``lon.shape + (len(depths),)``:
+        the last axis runs over ``depths``. ``dx`` and ``dy`` have the same shape and
+        are of dtype `np.float64`.
+
+    Raises
+    ------
+    ValueError
+        When the number of longitudes and latitudes given do not match.
+        When a depth is not in [0, 29].
+
+    Examples
+    --------
+    >>> from cdshealpix import lonlat_to_healpix_depths
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> lon = Longitude([0, 50, 25], u.deg)
+    >>> lat = Latitude([6, -12, 45], u.deg)
+    >>> ipix = lonlat_to_healpix_depths(lon, lat, [0, 5, 29])
+    >>> ipix[:, 0]
+    array([4, 8, 0], dtype=uint64)
+    """
+    depths = np.atleast_1d(depths).ravel()
+    _check_depth(depths)
+    shape = lon.shape + depths.shape
+
+    ipix, dx, dy = cdshealpix.lonlat_to_healpix_depths(
+        depths.astype(np.uint8),
+        np.ascontiguousarray(lon.rad).ravel(),
+        np.ascontiguousarray(lat.rad).ravel(),
+        return_offsets,
+        np.uint16(num_threads),
+    )
+    if return_offsets:
+        return ipix.reshape(shape), dx.reshape(shape), dy.reshape(shape)
+    return ipix.reshape(shape)
+
+
 def skycoord_to_healpix(skycoord, depth, return_offsets=False, num_threads=0):
     r"""Get the HEALPix indexes that contains specific sky coordinates.
 
@@ -125,8 +266,7 @@ def skycoord_to_healpix(skycoord, depth, return_offsets=False, num_threads=0):
         passed are located in the cells. ``dx`` and ``dy`` are :math:`\in [0, 1]`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -157,7 +297,136 @@ def skycoord_to_healpix(skycoord, depth, return_offsets=False, num_threads=0):
     )
 
 
-def healpix_to_lonlat(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
+def sort_by_healpix(lon, lat, depth, *, num_threads=0):
+    """Sort sky coordinates by HEALPix cell.
+
+    The coordinates are hashed at ``depth`` and sorted by cell index in parallel, with
+    a radix sort of the HEALPix cell indexes, which is faster than sorting the result
+    of `lonlat_to_healpix` with `numpy.argsort`. The sort is stable: the coordinates
+    of a cell keep their order.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the sky coordinates.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the sky coordinates.
+    depth : int
+        The depth of the HEALPix cells.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    order, ipix : (`numpy.ndarray`, `numpy.ndarray`)
+        The indices of the flattened coordinates sorted by HEALPix cell, and their
+        sorted HEALPix cell indexes, both as `np.uint64`.
+
+    Raises
+    ------
+    ValueError
+        When the number of longitudes and latitudes given do not match.
+
+    Examples
+    --------
+    >>> from cdshealpix import sort_by_healpix
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> lon = Longitude([0, 50, 25], u.deg)
+    >>> lat = Latitude([6, -12, 45], u.deg)
+    >>> order, ipix = sort_by_healpix(lon, lat, 0)
+    >>> order
+    array([2, 0, 1], dtype=uint64)
+    >>> ipix
+    array([0, 4, 8], dtype=uint64)
+    """
+    _check_depth(depth)
+    lon, lat = _flat_radians(lon, lat)
+    return cdshealpix.sort_by_healpix(np.uint8(depth), lon, lat, np.uint16(num_threads))
+
+
+def group_by_healpix(lon, lat, depth, values=None, *, reduce="count", num_threads=0):
+    """Count sky coordinates, or reduce values attached to them, by HEALPix cell.
+
+    Only the non-empty cells are returned, so that density maps can be made at any
+    depth without allocating the ``12 * 4**depth`` cells that `numpy.bincount` would
+    need. The coordinates are sorted by cell (see `sort_by_healpix`), then the cells
+    are reduced in parallel.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the sky coordinates.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the sky coordinates.
+    depth : int
+        The depth of the HEALPix cells.
+    values : `numpy.ndarray`, optional
+        The values attached to the coordinates, of the same size, reduced in each cell.
+        Required by all the reductions but ``"count"``.
+    reduce : {"count", "sum", "mean", "min", "max"}, optional
+        The reduction of each cell. Default to ``"count"``, the number of coordinates
+        in the cell. ``"min"`` and ``"max"`` ignore the NaN values.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    ipix, aggregate : (`numpy.ndarray`, `numpy.ndarray`)
+        The sorted `np.uint64` HEALPix cell indexes of the non-empty cells, and their
+        aggregate: the `np.uint64` number of coordinates for ``"count"``, the
+        `np.float64` reduction of their values otherwise.
+
+    Raises
+    ------
+    ValueError
+        When the number of longitudes and latitudes given do not match.
+        When ``values`` are missing or do not match the coordinates.
+        When ``reduce`` is not one of the available reductions.
+
+    Examples
+    --------
+    >>> from cdshealpix import group_by_healpix
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> import numpy as np
+    >>> lon = Longitude([0, 50, 25, 1], u.deg)
+    >>> lat = Latitude([6, -12, 45, 5], u.deg)
+    >>> ipix, counts = group_by_healpix(lon, lat, 0)
+    >>> ipix
+    array([0, 4, 8], dtype=uint64)
+    >>> counts
+    array([1, 2, 1], dtype=uint64)
+    >>> values = np.array([1, 2, 3, 4])
+    >>> ipix, mean = group_by_healpix(lon, lat, 0, values, reduce="mean")
+    >>> mean
+    array([3. , 2.5, 2. ])
+    """
+    _check_depth(depth)
+    lon, lat = _flat_radians(lon, lat)
+    if reduce == "count":
+        values = None
+    elif values is None:
+        raise ValueError(f"`values` are required by the '{reduce}' reduction")
+    else:
+        values = np.ascontiguousarray(values, dtype=np.float64).ravel()
+
+    ipix, counts, aggregate = cdshealpix.group_by_healpix(
+        np.uint8(depth),
+        lon,
+        lat,
+        values,
+        reduce,
+        np.uint16(num_threads),
+    )
+    return ipix, counts if aggregate is None else aggregate
+
+
+def healpix_to_lonlat(
+    ipix, depth, dx=0.5, dy=0.5, num_threads=0, *, out=None, compact=False
+):
     r"""Get the longitudes and latitudes of the center of some HEALPix cells.
 
     Parameters
@@ -174,8 +443,13 @@ def healpix_to_lonlat(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
         Set to 0.5 to get the center.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes (in radians) are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
 
     Returns
     -------
@@ -186,6 +460,7 @@ def healpix_to_lonlat(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
     ------
     ValueError
         When the HEALPix cell indexes given have values out of :math:`[0, 4^{29 - depth}[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
 
     Examples
     --------
@@ -199,7 +474,6 @@ def healpix_to_lonlat(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
     ipix = np.atleast_1d(ipix)
     depth = np.atleast_1d(depth)
     _check_depth(depth)
-    _check_ipixels(data=ipix, depth=depth)
 
     if dx < 0 or dx >= 1:
         raise ValueError("dx must be between [0, 1[")
@@ -211,17 +485,17 @@ def healpix_to_lonlat(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
     ipix, depth = np.broadcast_arrays(ipix, depth)
 
     # Allocation of the array containing the resulting coordinates
-    lon = np.empty(ipix.shape)
-    lat = np.empty(ipix.shape)
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, ipix.shape, (coords_dtype, coords_dtype))
 
     # Call the Rust extension
-    ipix = ipix.astype(np.uint64)
-    depth = depth.astype(np.uint8)
+    ipix = _as_hashes(ipix)
+    depth = depth.astype(np.uint8, copy=False)
     num_threads = np.uint16(num_threads)
 
     cdshealpix.healpix_to_lonlat(depth, ipix, dx, dy, lon, lat, num_threads)
 
-    return Longitude(lon, u.rad), Latitude(lat, u.rad)
+    return Longitude(lon, u.rad, copy=False), Latitude(lat, u.rad, copy=False)
 
 
 def healpix_to_skycoord(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
@@ -246,8 +520,7 @@ def healpix_to_skycoord(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
         The offset position :math:`\in [0, 1[` along the Y axis. By default, `dy=0.5`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment
-        variable (if set), or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -276,7 +549,7 @@ def healpix_to_skycoord(ipix, depth, dx=0.5, dy=0.5, num_threads=0):
     return SkyCoord(ra=lon, dec=lat, frame="icrs", unit="rad")
 
 
-def vertices(ipix, depth, step=1, num_threads=0):
+def vertices(ipix, depth, step=1, num_threads=0, *, out=None, compact=False):
     """Get the longitudes and latitudes of the vertices of some HEALPix cells at a given depth.
 
     This method returns the 4 vertices of each cell in `ipix`.
@@ -296,8 +569,13 @@ def vertices(ipix, depth, step=1, num_threads=0):
         of vertices returned is ``4 * step``.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes (in radians) are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
 
     Returns
     -------
@@ -310,6 +588,7 @@ def vertices(ipix, depth, step=1, num_threads=0):
     ------
     ValueError
         When the HEALPix cell indexes given have values out of :math:`[0, 4^{29 - depth}[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
 
     Examples
     --------
@@ -321,24 +600,23 @@ def vertices(ipix, depth, step=1, num_threads=0):
     """
     ipix = np.atleast_1d(ipix)
     _check_depth(depth)
-    _check_ipixels(data=ipix, depth=depth)
 
     if isinstance(depth, int) or np.isscalar(depth):
         depth = np.full(len(ipix), depth)
     if step < 1:
         raise ValueError("The number of step must be >= 1")
 
-    ipix = ipix.astype(np.uint64)
-    depth = depth.astype(np.uint8)
+    ipix = _as_hashes(ipix)
+    depth = depth.astype(np.uint8, copy=False)
 
     # Allocation of the array containing the resulting coordinates
-    lon = np.zeros((*ipix.shape, 4 * step))
-    lat = np.zeros((*ipix.shape, 4 * step))
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, (*ipix.shape, 4 * step), (coords_dtype, coords_dtype))
     num_threads = np.uint16(num_threads)
 
     cdshealpix.vertices(depth, ipix, step, lon, lat, num_threads)
 
-    return Longitude(lon, u.rad), Latitude(lat, u.rad)
+    return Longitude(lon, u.rad, copy=False), Latitude(lat, u.rad, copy=False)
 
 
 def vertices_skycoord(ipix, depth, step=1, num_threads=0):
@@ -361,8 +639,7 @@ def vertices_skycoord(ipix, depth, step=1, num_threads=0):
         of vertices returned is ``4 * step``.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -387,7 +664,7 @@ def vertices_skycoord(ipix, depth, step=1, num_threads=0):
     return SkyCoord(ra=lon, dec=lat, frame="icrs", unit="rad")
 
 
-def neighbours(ipix, depth, num_threads=0):
+def neighbours(ipix, depth, num_threads=0, *, out=None, compact=False):
     """Get the neighbouring cells of some HEALPix cells at a given depth.
 
     This method returns a :math:`N` x :math:`9` `np.uint64` numpy array containing the neighbours of each cell of the :math:`N` sized `ipix` array.
@@ -402,8 +679,14 @@ def neighbours(ipix, depth, num_threads=0):
         The depth of the HEALPix cells.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.int64` (`np.int32` if ``compact`` is set) array of shape
+        ``(*ipix.shape, 9)`` in which the result is written instead of allocating a new
+        array.
+    compact : bool, optional
+        If set to `True`, the neighbours are returned as `np.int32` instead of
+        `np.int64`. Only available for depths up to 13. Default to `False`.
 
     Returns
     -------
@@ -416,6 +699,8 @@ def neighbours(ipix, depth, num_threads=0):
     ------
     ValueError
         When the HEALPix cell indexes given have values out of :math:`[0, 4^{29 - depth}[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a depth greater than 13.
 
     Examples
     --------
@@ -426,19 +711,20 @@ def neighbours(ipix, depth, num_threads=0):
     >>> neighbours = neighbours(ipix, depth)
     """
     _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
     ipix = np.atleast_1d(ipix)
-    _check_ipixels(data=ipix, depth=depth)
-    ipix = ipix.astype(np.uint64)
+    ipix = _as_hashes(ipix)
 
     # Allocation of the array containing the neighbours
-    neighbours = np.zeros((*ipix.shape, 9), dtype=np.int64)
+    neighbours = _check_out(out, (*ipix.shape, 9), np.int32 if compact else np.int64)
     num_threads = np.uint16(num_threads)
     cdshealpix.neighbours(depth, ipix, neighbours, num_threads)
 
     return neighbours
 
 
-def external_neighbours(ipix, depth, delta_depth, num_threads=0):
+def external_neighbours(ipix, depth, delta_depth, num_threads=0, *, compact=False):
     """Get the neighbours of specific healpix cells.
 
     This method returns two arrays. One containing the healpix cells
@@ -457,8 +743,11 @@ def external_neighbours(ipix, depth, delta_depth, num_threads=0):
         The depth of the returned external neighbours will be equal to: `depth` + `delta_depth`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    compact : bool, optional
+        If set to `True`, the border cells are returned as `np.uint32` and the corner
+        cells as `np.int32`. Only available if `depth` + `delta_depth` is at most 13.
+        Default to `False`.
 
     Returns
     -------
@@ -469,14 +758,17 @@ def external_neighbours(ipix, depth, delta_depth, num_threads=0):
         It will be of shape: (N, 4) for N input pixels. -1 values will be put in the array when the pixels have no corners for specific directions.
     """
     _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth + delta_depth)
     ipix = np.atleast_1d(ipix)
-    _check_ipixels(data=ipix, depth=depth)
-    ipix = ipix.astype(np.uint64)
+    ipix = _as_hashes(ipix)
 
     # Allocation of the array containing the neighbours
     num_external_cells_on_edges = 4 << delta_depth
-    edge_cells = np.zeros((*ipix.shape, num_external_cells_on_edges), dtype=np.uint64)
-    corner_cells = np.zeros((*ipix.shape, 4), dtype=np.int64)
+    edge_cells = np.empty(
+        (*ipix.shape, num_external_cells_on_edges), dtype=_out_dtypes(compact)[0]
+    )
+    corner_cells = np.empty((*ipix.shape, 4), dtype=np.int32 if compact else np.int64)
 
     num_threads = np.uint16(num_threads)
     cdshealpix.external_neighbours(
@@ -486,8 +778,321 @@ def external_neighbours(ipix, depth, delta_depth, num_threads=0):
     return edge_cells, corner_cells
 
 
+def to_parent(ipix, depth, parent_depth, num_threads=0, *, out=None, compact=False):
+    """Get the parents of HEALPix cells at a lower depth.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes.
+    depth : `numpy.ndarray`
+        The depths of the cells, broadcast with ``ipix``: the cells can be of mixed
+        depths.
+    parent_depth : `numpy.ndarray`
+        The depths of the parents, broadcast with ``ipix``, not greater than ``depth``.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` (`np.uint32` if ``compact`` is set) array of the
+        broadcast shape in which the result is written instead of allocating a new
+        array.
+    compact : bool, optional
+        If set to `True`, the parents are returned as `np.uint32` instead of
+        `np.uint64`. Only available for parent depths up to 13. Default to `False`.
+
+    Returns
+    -------
+    parent : `numpy.ndarray`
+        The HEALPix cell indexes of the parents.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+        When a parent depth is greater than the depth of its cell.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a parent depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import to_parent
+    >>> import numpy as np
+    >>> print(to_parent(np.array([42, 6, 10]), np.array([3, 2, 2]), 1))
+    [2 1 2]
+    """
+    ipix, depth, parent_depth = _broadcast_cells(ipix, depth, parent_depth)
+    if compact:
+        _check_compact_depth(parent_depth)
+
+    parent = _check_out(out, ipix.shape, _out_dtypes(compact)[0])
+    cdshealpix.to_parent(ipix, depth, parent_depth, parent, np.uint16(num_threads))
+    return parent
+
+
+def children_range(ipix, depth, child_depth, num_threads=0, *, out=None, compact=False):
+    """Get the ranges of the children of HEALPix cells at a greater depth.
+
+    The children at ``child_depth`` of a cell are the cells of indexes in
+    ``[start, end[``.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes.
+    depth : `numpy.ndarray`
+        The depths of the cells, broadcast with ``ipix``: the cells can be of mixed
+        depths.
+    child_depth : `numpy.ndarray`
+        The depths of the children, broadcast with ``ipix``, not lower than ``depth``.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        A tuple of 2 C-contiguous `np.uint64` (`np.uint32` if ``compact`` is set)
+        arrays of the broadcast shape in which ``start`` and ``end`` are written
+        instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the ranges are returned as `np.uint32` instead of
+        `np.uint64`. Only available for child depths up to 13. Default to `False`.
+
+    Returns
+    -------
+    start, end : (`numpy.ndarray`, `numpy.ndarray`)
+        The first HEALPix cell index of the children, and the one following the last
+        child.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+        When a child depth is lower than the depth of its cell.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a child depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import children_range
+    >>> import numpy as np
+    >>> start, end = children_range(np.array([2, 1]), np.array([1, 0]), 2)
+    >>> print(start, end)
+    [ 8 16] [12 32]
+    """
+    ipix, depth, child_depth = _broadcast_cells(ipix, depth, child_depth)
+    if compact:
+        _check_compact_depth(child_depth)
+
+    dtype = _out_dtypes(compact)[0]
+    start, end = _check_outs(out, ipix.shape, (dtype, dtype))
+    cdshealpix.children_range(
+        ipix, depth, child_depth, start, end, np.uint16(num_threads)
+    )
+    return start, end
+
+
+def to_uniq(ipix, depth, num_threads=0, *, out=None, compact=False):
+    """Get the UNIQ indexes of HEALPix cells.
+
+    The UNIQ index of the cell ``ipix`` at ``depth`` is ``4 * 4**depth + ipix``: it
+    identifies a cell whatever its depth.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes.
+    depth : `numpy.ndarray`
+        The depths of the cells, broadcast with ``ipix``: the cells can be of mixed
+        depths.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` (`np.uint32` if ``compact`` is set) array of the
+        broadcast shape in which the result is written instead of allocating a new
+        array.
+    compact : bool, optional
+        If set to `True`, the UNIQ indexes are returned as `np.uint32` instead of
+        `np.uint64`. Only available for depths up to 13. Default to `False`.
+
+    Returns
+    -------
+    uniq : `numpy.ndarray`
+        The UNIQ indexes of the cells.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import to_uniq
+    >>> import numpy as np
+    >>> print(to_uniq(np.array([0, 11, 5]), np.array([0, 0, 1])))
+    [ 4 15 21]
+    """
+    ipix, depth = _broadcast_cells(ipix, depth)
+    if compact:
+        _check_compact_depth(depth)
+
+    uniq = _check_out(out, ipix.shape, _out_dtypes(compact)[0])
+    cdshealpix.to_uniq(ipix, depth, uniq, np.uint16(num_threads))
+    return uniq
+
+
+def from_uniq(uniq, num_threads=0, *, out=None, compact=False):
+    """Get the HEALPix cells and their depths from UNIQ indexes.
+
+    Parameters
+    ----------
+    uniq : `numpy.ndarray`
+        The UNIQ indexes, see `to_uniq`.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        A tuple of a C-contiguous `np.uint64` (`np.uint32` if ``compact`` is set) and
+        of a C-contiguous `np.uint8` array of the shape of ``uniq`` in which the cells
+        and their depths are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the HEALPix cell indexes are returned as `np.uint32` instead
+        of `np.uint64`. Only available for depths up to 13. Default to `False`.
+
+    Returns
+    -------
+    ipix, depth : (`numpy.ndarray`, `numpy.ndarray`)
+        The HEALPix cell indexes and their `np.uint8` depths.
+
+    Raises
+    ------
+    ValueError
+        When a UNIQ index is not the index of a cell of depth in [0, 29].
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a cell of depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import from_uniq
+    >>> import numpy as np
+    >>> ipix, depth = from_uniq(np.array([4, 15, 21]))
+    >>> print(ipix, depth)
+    [ 0 11  5] [0 0 1]
+    """
+    uniq = _as_hashes(np.atleast_1d(uniq))
+    # the UNIQ indexes of the cells up to depth 13 are lower than 4**15
+    if compact and uniq.size and uniq.max() >= 1 << 30:
+        _check_compact_depth(29)
+
+    ipix, depth = _check_outs(out, uniq.shape, (_out_dtypes(compact)[0], np.uint8))
+    cdshealpix.from_uniq(uniq, ipix, depth, np.uint16(num_threads))
+    return ipix, depth
+
+
+def to_zuniq(ipix, depth, num_threads=0, *, out=None):
+    """Get the ZUNIQ indexes of HEALPix cells.
+
+    The ZUNIQ index of the cell ``ipix`` at ``depth`` is
+    ``(2 * ipix + 1) * 4**(29 - depth)``: the index at depth 29 of its first
+    descendant with a sentinel bit marking its depth. Sorted ZUNIQ indexes follow the
+    order of the cells on the sky, the index of a cell lying among those of its
+    descendants.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes.
+    depth : `numpy.ndarray`
+        The depths of the cells, broadcast with ``ipix``: the cells can be of mixed
+        depths.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` array of the broadcast shape in which the result is
+        written instead of allocating a new array.
+
+    Returns
+    -------
+    zuniq : `numpy.ndarray`
+        The `np.uint64` ZUNIQ indexes of the cells.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+
+    Examples
+    --------
+    >>> from cdshealpix import to_zuniq
+    >>> import numpy as np
+    >>> print(to_zuniq(np.array([0, 1]), np.array([29, 28])))
+    [ 1 12]
+    """
+    ipix, depth = _broadcast_cells(ipix, depth)
+
+    zuniq = _check_out(out, ipix.shape, np.uint64)
+    cdshealpix.to_zuniq(ipix, depth, zuniq, np.uint16(num_threads))
+    return zuniq
+
+
+def from_zuniq(zuniq, num_threads=0, *, out=None):
+    """Get the HEALPix cells and their depths from ZUNIQ indexes.
+
+    Parameters
+    ----------
+    zuniq : `numpy.ndarray`
+        The ZUNIQ indexes, see `to_zuniq`.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        A tuple of a C-contiguous `np.uint64` and of a C-contiguous `np.uint8` array
+        of the shape of ``zuniq`` in which the cells and their depths are written
+        instead of allocating new arrays.
+
+    Returns
+    -------
+    ipix, depth : (`numpy.ndarray`, `numpy.ndarray`)
+        The `np.uint64` HEALPix cell indexes and their `np.uint8` depths.
+
+    Raises
+    ------
+    ValueError
+        When a ZUNIQ index is not the index of a cell of depth in [0, 29].
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+
+    Examples
+    --------
+    >>> from cdshealpix import from_zuniq
+    >>> import numpy as np
+    >>> ipix, depth = from_zuniq(np.array([1, 12]))
+    >>> print(ipix, depth)
+    [0 1] [29 28]
+    """
+    zuniq = _as_hashes(np.atleast_1d(zuniq))
+
+    ipix, depth = _check_outs(out, zuniq.shape, (np.uint64, np.uint8))
+    cdshealpix.from_zuniq(zuniq, ipix, depth, np.uint16(num_threads))
+    return ipix, depth
+
+
 @_validate_lonlat
-def cone_search(lon, lat, radius, depth, depth_delta=2, flat=False):
+def cone_search(
+    lon,
+    lat,
+    radius,
+    depth,
+    depth_delta=2,
+    flat=False,
+    *,
+    compact=False,
+    output="cells",
+    max_cells=None,
+    max_ranges=None,
+):
     """Get the HEALPix cells contained in a cone at a given depth.
 
     This method is wrapped around the `cone <https://docs.rs/cdshealpix/0.1.5/cdshealpix/nested/struct.Layer.html#method.cone_coverage_approx_custom>`__
@@ -508,6 +1113,23 @@ def cone_search(lon, lat, radius, depth, depth_delta=2, flat=False):
         The depth at which the computations will be made will therefore be equal to `depth` + `depth_delta`.
     flat : boolean, optional
         False by default (i.e. returns a consistent MOC). If True, the HEALPix cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    output : {"cells", "uniq", "ranges"}, optional
+        "cells" by default. With "uniq", the cells are returned as a single array of
+        NUNIQ indices ``4 * 4**depth + ipix``. With "ranges", the coverage is returned
+        as a (N, 2) `np.uint64` array of the sorted ranges ``[start, end[`` of the
+        depth 29 cells it contains, adjacent ranges being merged. `compact` is not
+        available with "ranges".
+    max_cells : int, optional
+        If given, the deepest cells that are not fully covered are replaced by their
+        parents until the result has at most ``max_cells`` cells, see
+        `coverage_simplify`. Not available with ``flat``.
+    max_ranges : int, optional
+        Same as ``max_cells`` for the number of ranges of the ``output="ranges"``
+        result, e.g. to bound the number of ``BETWEEN`` clauses of a query on an
+        indexed HEALPix column.
 
     Returns
     -------
@@ -517,6 +1139,10 @@ def cone_search(lon, lat, radius, depth, depth_delta=2, flat=False):
         * `ipix` stores HEALPix cell indices.
         * `depth` stores HEALPix cell depths.
         * `fully_covered` stores flags on whether the HEALPix cells are fully covered by the cone.
+    uniq : `numpy.ndarray`
+        With ``output="uniq"``, the NUNIQ indices of the cells, in the order of `ipix`.
+    ranges : `numpy.ndarray`
+        With ``output="ranges"``, the (N, 2) merged ranges of depth 29 cells.
 
     Examples
     --------
@@ -526,6 +1152,10 @@ def cone_search(lon, lat, radius, depth, depth_delta=2, flat=False):
     >>> ipix, depth, fully_covered = cone_search(lon=Longitude(0 * u.deg), lat=Latitude(0 * u.deg), radius=10 * u.deg, depth=10)
     """
     _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+    _check_format(output, compact)
+    _check_budget(flat, max_cells, max_ranges)
 
     if not lon.isscalar or not lat.isscalar or not radius.isscalar:
         raise ValueError("The longitude, latitude and radius must be scalar objects")
@@ -540,317 +1170,1706 @@ def cone_search(lon, lat, radius, depth, depth_delta=2, flat=False):
     lat = lat.rad
     radius = radius.to_value(u.rad)
 
-    ipix, depth, full = cdshealpix.cone_search(
+    return cdshealpix.cone_search(
         np.uint8(depth),
         np.uint8(depth_delta),
         np.float64(lon),
         np.float64(lat),
         np.float64(radius),
         bool(flat),
+        bool(compact),
+        output,
+        max_cells,
+        max_ranges,
     )
-    return ipix, depth, full
 
 
 @_validate_lonlat
-def box_search(lon, lat, a, b, angle=0 * u.deg, depth=14, *, flat=False):
-    """Get the HEALPix cells contained in a box at a given depth.
+def cone_search_batch(
+    lon, lat, radius, depth, depth_delta=2, *, flat=False, compact=False, num_threads=0
+):
+    """Get the HEALPix cells contained in many cones at once.
 
-    The box's sides follow great circles.
+    The cones are covered in parallel, as with `cone_search` for each of them, and
+    their cells are concatenated. The cells of the :math:`i^{th}` cone are at
+    ``offsets[i]:offsets[i + 1]`` in the returned arrays.
 
     Parameters
     ----------
-    lon : `~astropy.coordinates.Longitude`
-        Longitude of the center of the cone.
-    lat : `~astropy.coordinates.Latitude`
-        Latitude of the center of the cone.
-    a : `~astropy.coordinates.Angle`
-        Extension along longitudinal axis
-    b : `~astropy.coordinates.Angle`
-        Extension along latitudinal axis
-    angle : `~astropy.coordinates.Angle`
-        Rotation angle between the north and the semi-major axis, east of north
-    depth : int
+    lon : `astropy.coordinates.Longitude`
+        Longitudes of the centers of the cones.
+    lat : `astropy.coordinates.Latitude`
+        Latitudes of the centers of the cones.
+    radius : `astropy.units.Quantity`
+        Radii of the cones, broadcast against ``lon`` and ``lat``.
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    depth_delta : int, optional
+        To control the approximation, you can choose to perform the computations at a deeper depth using the `depth_delta` parameter.
+        The depth at which the computations will be made will therefore be equal to `depth` + `depth_delta`.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC per cone). If True, the HEALPix
+        cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    ipix, depth, fully_covered, offsets : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The concatenation of the results of the cone searches:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by their cone.
+        * `offsets` is a `np.uint64` array of size N + 1 for N cones, the cells of
+          the :math:`i^{th}` cone being at ``offsets[i]:offsets[i + 1]``.
+
+    Raises
+    ------
+    ValueError
+        When ``lon``, ``lat`` and ``radius`` cannot be broadcast together.
+        When ``compact`` is set for a depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import cone_search_batch
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> ipix, depth, fully_covered, offsets = cone_search_batch(
+    ...     lon=Longitude([0, 10, 20], u.deg), lat=Latitude([0, 5, 10], u.deg),
+    ...     radius=[1, 2, 3] * u.deg, depth=10
+    ... )
+    >>> cells_of_second_cone = ipix[offsets[1]:offsets[2]]
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+
+    if not (isinstance(radius, u.Quantity)):
+        raise ValueError("`radius` must be of type `astropy.units.Quantity`")
+
+    lon, lat, radius = _ravel_batch(lon.rad, lat.rad, radius.to_value(u.rad))
+
+    return cdshealpix.cone_search_batch(
+        np.uint8(depth),
+        np.uint8(depth_delta),
+        lon,
+        lat,
+        radius,
+        bool(flat),
+        bool(compact),
+        np.uint16(num_threads),
+    )
+
+
+@_validate_lonlat
+def box_search(
+    lon,
+    lat,
+    a,
+    b,
+    angle=0 * u.deg,
+    depth=14,
+    *,
+    flat=False,
+    compact=False,
+    output="cells",
+    max_cells=None,
+    max_ranges=None,
+):
+    """Get the HEALPix cells contained in a box at a given depth.
+
+    The box's sides follow great circles.
+
+    Parameters
+    ----------
+    lon : `~astropy.coordinates.Longitude`
+        Longitude of the center of the cone.
+    lat : `~astropy.coordinates.Latitude`
+        Latitude of the center of the cone.
+    a : `~astropy.coordinates.Angle`
+        Extension along longitudinal axis
+    b : `~astropy.coordinates.Angle`
+        Extension along latitudinal axis
+    angle : `~astropy.coordinates.Angle`
+        Rotation angle between the north and the semi-major axis, east of north
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC). If True, the HEALPix cells
+        returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    output : {"cells", "uniq", "ranges"}, optional
+        "cells" by default. With "uniq", the cells are returned as a single array of
+        NUNIQ indices ``4 * 4**depth + ipix``. With "ranges", the coverage is returned
+        as a (N, 2) `np.uint64` array of the sorted ranges ``[start, end[`` of the
+        depth 29 cells it contains, adjacent ranges being merged. `compact` is not
+        available with "ranges".
+    max_cells : int, optional
+        If given, the deepest cells that are not fully covered are replaced by their
+        parents until the result has at most ``max_cells`` cells, see
+        `coverage_simplify`. Not available with ``flat``.
+    max_ranges : int, optional
+        Same as ``max_cells`` for the number of ranges of the ``output="ranges"``
+        result, e.g. to bound the number of ``BETWEEN`` clauses of a query on an
+        indexed HEALPix column.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        A tuple containing 3 numpy arrays of identical size:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by the cone.
+    uniq : `numpy.ndarray`
+        With ``output="uniq"``, the NUNIQ indices of the cells, in the order of `ipix`.
+    ranges : `numpy.ndarray`
+        With ``output="ranges"``, the (N, 2) merged ranges of depth 29 cells.
+
+    Examples
+    --------
+    >>> from cdshealpix import box_search
+    >>> from astropy.coordinates import Longitude, Latitude, Angle
+    >>> import astropy.units as u
+    >>> ipix, depth, fully_covered = box_search(
+    ...     lon=Longitude(0 * u.deg), lat=Latitude(0 * u.deg),
+    ...     a=10 * u.deg, b=5 * u.deg, angle=0*u.deg, depth=10
+    ... )
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+    _check_format(output, compact)
+    _check_budget(flat, max_cells, max_ranges)
+
+    if (
+        not lon.isscalar
+        or not lat.isscalar
+        or not a.isscalar
+        or not b.isscalar
+        or not angle.isscalar
+    ):
+        raise ValueError("The longitude, latitude, and Angles must be scalar objects")
+
+    return cdshealpix.box_search(
+        np.uint8(depth),
+        np.float64(lon.rad),
+        np.float64(lat.rad),
+        np.float64(a.to_value(u.rad)),
+        np.float64(b.to_value(u.rad)),
+        np.float64(angle.to_value(u.rad)),
+        bool(flat),
+        bool(compact),
+        output,
+        max_cells,
+        max_ranges,
+    )
+
+
+@_validate_lonlat
+def box_search_batch(
+    lon,
+    lat,
+    a,
+    b,
+    angle=0 * u.deg,
+    depth=14,
+    *,
+    flat=False,
+    compact=False,
+    num_threads=0,
+):
+    """Get the HEALPix cells contained in many boxes at once.
+
+    The boxes are covered in parallel, as with `box_search` for each of them, and
+    their cells are concatenated. The cells of the :math:`i^{th}` box are at
+    ``offsets[i]:offsets[i + 1]`` in the returned arrays.
+
+    Parameters
+    ----------
+    lon : `~astropy.coordinates.Longitude`
+        Longitudes of the centers of the boxes.
+    lat : `~astropy.coordinates.Latitude`
+        Latitudes of the centers of the boxes.
+    a : `~astropy.coordinates.Angle`
+        Extensions along the longitudinal axis.
+    b : `~astropy.coordinates.Angle`
+        Extensions along the latitudinal axis.
+    angle : `~astropy.coordinates.Angle`
+        Rotation angles between the north and the semi-major axis, east of north.
+        All the parameters are broadcast together.
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC per box). If True, the
+        HEALPix cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    ipix, depth, fully_covered, offsets : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The concatenation of the results of the box searches:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by their box.
+        * `offsets` is a `np.uint64` array of size N + 1 for N boxes, the cells of
+          the :math:`i^{th}` box being at ``offsets[i]:offsets[i + 1]``.
+
+    Raises
+    ------
+    ValueError
+        When the parameters cannot be broadcast together.
+        When ``compact`` is set for a depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import box_search_batch
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> ipix, depth, fully_covered, offsets = box_search_batch(
+    ...     lon=Longitude([0, 10], u.deg), lat=Latitude([0, 10], u.deg),
+    ...     a=[10, 5] * u.deg, b=5 * u.deg, depth=10
+    ... )
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+
+    lon, lat, a, b, angle = _ravel_batch(
+        lon.rad, lat.rad, a.to_value(u.rad), b.to_value(u.rad), angle.to_value(u.rad)
+    )
+
+    return cdshealpix.box_search_batch(
+        np.uint8(depth),
+        lon,
+        lat,
+        a,
+        b,
+        angle,
+        bool(flat),
+        bool(compact),
+        np.uint16(num_threads),
+    )
+
+
+def zone_search(
+    lon_min,
+    lat_min,
+    lon_max,
+    lat_max,
+    depth=14,
+    *,
+    flat=False,
+    compact=False,
+    output="cells",
+    max_cells=None,
+    max_ranges=None,
+):
+    """Get the HEALPix cells contained in a zone at a given depth.
+
+    A zone is defined by its corners. All points inside have lon_min =< lon < lon_max
+    and lat_min =< lat < lat_max.
+
+    Parameters
+    ----------
+    lon_min : `~astropy.coordinates.Longitude`
+        Longitude of bottom left corner.
+    lat_min : `~astropy.coordinates.Latitude`
+        Latitude of the bottom left corner
+    lon_max : `~astropy.coordinates.Longitude`
+        Longitude of the upper right corner.
+    lat_max : `~astropy.coordinates.Latitude`
+        Latitude of the upper right corner
+    depth : int
         Maximum depth of the HEALPix cells that will be returned.
     flat : boolean, optional
         False by default (i.e. returns a consistent MOC). If True, the HEALPix cells
         returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    output : {"cells", "uniq", "ranges"}, optional
+        "cells" by default. With "uniq", the cells are returned as a single array of
+        NUNIQ indices ``4 * 4**depth + ipix``. With "ranges", the coverage is returned
+        as a (N, 2) `np.uint64` array of the sorted ranges ``[start, end[`` of the
+        depth 29 cells it contains, adjacent ranges being merged. `compact` is not
+        available with "ranges".
+    max_cells : int, optional
+        If given, the deepest cells that are not fully covered are replaced by their
+        parents until the result has at most ``max_cells`` cells, see
+        `coverage_simplify`. Not available with ``flat``.
+    max_ranges : int, optional
+        Same as ``max_cells`` for the number of ranges of the ``output="ranges"``
+        result, e.g. to bound the number of ``BETWEEN`` clauses of a query on an
+        indexed HEALPix column.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        A tuple containing 3 numpy arrays of identical size:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully
+           covered by the cone.
+    uniq : `numpy.ndarray`
+        With ``output="uniq"``, the NUNIQ indices of the cells, in the order of `ipix`.
+    ranges : `numpy.ndarray`
+        With ``output="ranges"``, the (N, 2) merged ranges of depth 29 cells.
+
+    Examples
+    --------
+    >>> from cdshealpix import zone_search
+    >>> from astropy.coordinates import Longitude, Latitude, Angle
+    >>> import astropy.units as u
+    >>> ipix, depth, fully_covered = zone_search(
+    ...     lon_min=Longitude(0 * u.deg), lat_min=Latitude(0 * u.deg),
+    ...     lon_max=Longitude(10 * u.deg), lat_max=Latitude(10 * u.deg), depth=10
+    ... )
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+    _check_format(output, compact)
+    _check_budget(flat, max_cells, max_ranges)
+
+    if (
+        not lon_min.isscalar
+        or not lat_min.isscalar
+        or not lon_max.isscalar
+        or not lat_max.isscalar
+    ):
+        raise ValueError("The longitudes and latitudes must be scalar objects")
+
+    if not isinstance(lon_min, Longitude) or not isinstance(lon_max, Longitude):
+        raise ValueError("longitudes must be of type `astropy.coordinates.Longitude`")
+
+    if not isinstance(lat_min, Latitude) or not isinstance(lat_max, Latitude):
+        raise ValueError("latitudes must be of type `astropy.coordinates.Latitude`")
+
+    # this is because astropy wraps the angle when we actually want 2 * Pi here
+    if lon_max.rad == 0:
+        lon_max.rad = 2 * pi
+
+    return cdshealpix.zone_search(
+        np.uint8(depth),
+        np.float64(lon_min.rad),
+        np.float64(lat_min.rad),
+        np.float64(lon_max.rad),
+        np.float64(lat_max.rad),
+        bool(flat),
+        bool(compact),
+        output,
+        max_cells,
+        max_ranges,
+    )
+
+
+def zone_search_batch(
+    lon_min,
+    lat_min,
+    lon_max,
+    lat_max,
+    depth=14,
+    *,
+    flat=False,
+    compact=False,
+    num_threads=0,
+):
+    """Get the HEALPix cells contained in many zones at once.
+
+    The zones are covered in parallel, as with `zone_search` for each of them, and
+    their cells are concatenated. The cells of the :math:`i^{th}` zone are at
+    ``offsets[i]:offsets[i + 1]`` in the returned arrays.
+
+    Parameters
+    ----------
+    lon_min : `~astropy.coordinates.Longitude`
+        Longitudes of the bottom left corners.
+    lat_min : `~astropy.coordinates.Latitude`
+        Latitudes of the bottom left corners.
+    lon_max : `~astropy.coordinates.Longitude`
+        Longitudes of the upper right corners.
+    lat_max : `~astropy.coordinates.Latitude`
+        Latitudes of the upper right corners. All the corners are broadcast together.
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC per zone). If True, the
+        HEALPix cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    ipix, depth, fully_covered, offsets : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The concatenation of the results of the zone searches:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by their zone.
+        * `offsets` is a `np.uint64` array of size N + 1 for N zones, the cells of
+          the :math:`i^{th}` zone being at ``offsets[i]:offsets[i + 1]``.
+
+    Raises
+    ------
+    ValueError
+        When the corners cannot be broadcast together.
+        When ``compact`` is set for a depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import zone_search_batch
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> ipix, depth, fully_covered, offsets = zone_search_batch(
+    ...     lon_min=Longitude([0, 20], u.deg), lat_min=Latitude([0, -10], u.deg),
+    ...     lon_max=Longitude([10, 30], u.deg), lat_max=Latitude([10, 0], u.deg), depth=10
+    ... )
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+
+    if not isinstance(lon_min, Longitude) or not isinstance(lon_max, Longitude):
+        raise ValueError("longitudes must be of type `astropy.coordinates.Longitude`")
+
+    if not isinstance(lat_min, Latitude) or not isinstance(lat_max, Latitude):
+        raise ValueError("latitudes must be of type `astropy.coordinates.Latitude`")
+
+    # this is because astropy wraps the angle when we actually want 2 * Pi here
+    lon_max = np.where(lon_max.rad == 0, 2 * pi, lon_max.rad)
+    lon_min, lat_min, lon_max, lat_max = _ravel_batch(
+        lon_min.rad, lat_min.rad, lon_max, lat_max.rad
+    )
+
+    return cdshealpix.zone_search_batch(
+        np.uint8(depth),
+        lon_min,
+        lat_min,
+        lon_max,
+        lat_max,
+        bool(flat),
+        bool(compact),
+        np.uint16(num_threads),
+    )
+
+
+@_validate_lonlat
+def polygon_search(
+    lon,
+    lat,
+    depth,
+    flat=False,
+    *,
+    compact=False,
+    output="cells",
+    max_cells=None,
+    max_ranges=None,
+):
+    """Get the HEALPix cells contained in a polygon at a given depth.
+
+    This method is wrapped around the `polygon_coverage <https://docs.rs/cdshealpix/0.1.5/cdshealpix/nested/struct.Layer.html#method.polygon_coverage>`__
+    method from the `cdshealpix Rust crate <https://crates.io/crates/cdshealpix>`__.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the vertices defining the polygon.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the vertices defining the polygon.
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC). If True, the HEALPix cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    output : {"cells", "uniq", "ranges"}, optional
+        "cells" by default. With "uniq", the cells are returned as a single array of
+        NUNIQ indices ``4 * 4**depth + ipix``. With "ranges", the coverage is returned
+        as a (N, 2) `np.uint64` array of the sorted ranges ``[start, end[`` of the
+        depth 29 cells it contains, adjacent ranges being merged. `compact` is not
+        available with "ranges".
+    max_cells : int, optional
+        If given, the deepest cells that are not fully covered are replaced by their
+        parents until the result has at most ``max_cells`` cells, see
+        `coverage_simplify`. Not available with ``flat``.
+    max_ranges : int, optional
+        Same as ``max_cells`` for the number of ranges of the ``output="ranges"``
+        result, e.g. to bound the number of ``BETWEEN`` clauses of a query on an
+        indexed HEALPix column.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        A tuple containing 3 numpy arrays of identical size:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by the polygon.
+    uniq : `numpy.ndarray`
+        With ``output="uniq"``, the NUNIQ indices of the cells, in the order of `ipix`.
+    ranges : `numpy.ndarray`
+        With ``output="ranges"``, the (N, 2) merged ranges of depth 29 cells.
+
+    Raises
+    ------
+    ValueError
+        When `lon` and `lat` do not have the same dimensions.
+    IndexError
+        When the number of distinct vertices given is lesser than 3 (i.e. defining at least a triangle).
+
+    Examples
+    --------
+    >>> from cdshealpix import polygon_search
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> import numpy as np
+    >>> lon = Longitude(np.random.rand(3) * 360, u.deg)
+    >>> lat = Latitude((np.random.rand(3) * 180 - 90), u.deg)
+    >>> max_depth = 12
+    >>> ipix, depth, fully_covered = polygon_search(lon, lat, max_depth)
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+    _check_format(output, compact)
+    _check_budget(flat, max_cells, max_ranges)
+
+    lon, lat = _polygon_vertices(lon, lat)
+
+    return cdshealpix.polygon_search(
+        depth, lon, lat, flat, compact, output, max_cells, max_ranges
+    )
+
+
+def _polygon_vertices(lon, lat):
+    """Get the vertices of a polygon in radians.
+
+    Raises a `ValueError` when the polygon has less than 3 distinct vertices.
+    """
+    lon = np.atleast_1d(lon.rad).ravel().astype(np.float64, copy=False)
+    lat = np.atleast_1d(lat.rad).ravel().astype(np.float64, copy=False)
+
+    num_vertices = lon.shape[0]
+
+    if num_vertices < 3:
+        raise ValueError("There must be at least 3 vertices in order to form a polygon")
+
+    # Check that there is at least 3 distinct vertices.
+    vertices = np.vstack((lon, lat)).T
+    distinct_vertices = np.unique(vertices, axis=0)
+    if distinct_vertices.shape[0] < 3:
+        raise ValueError(
+            "There must be at least 3 distinct vertices in order to form a polygon"
+        )
+    return lon, lat
+
+
+@_validate_lonlat
+def polygon_search_batch(
+    lon, lat, offsets, depth, *, flat=False, compact=False, num_threads=0
+):
+    """Get the HEALPix cells contained in many polygons at once.
+
+    The polygons are covered in parallel, as with `polygon_search` for each of them,
+    and their cells are concatenated. The vertices of all the polygons are given in
+    a single pair of arrays, the vertices of the :math:`i^{th}` polygon being at
+    ``offsets[i]:offsets[i + 1]``. The cells returned are indexed the same way by
+    the returned offsets.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the vertices of all the polygons.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the vertices of all the polygons.
+    offsets : `numpy.ndarray`
+        An increasing array of size N + 1 for N polygons, starting with 0 and ending
+        with the number of vertices.
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC per polygon). If True, the
+        HEALPix cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    ipix, depth, fully_covered, offsets : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The concatenation of the results of the polygon searches:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by their polygon.
+        * `offsets` is a `np.uint64` array of size N + 1, the cells of the
+          :math:`i^{th}` polygon being at ``offsets[i]:offsets[i + 1]``.
+
+    Raises
+    ------
+    ValueError
+        When `lon` and `lat` do not have the same dimensions.
+        When ``offsets`` are not increasing from 0 to the number of vertices.
+        When a polygon has less than 3 distinct vertices.
+        When ``compact`` is set for a depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import polygon_search_batch
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> import numpy as np
+    >>> lon = Longitude([0, 10, 5, 20, 30, 30, 20], u.deg)
+    >>> lat = Latitude([0, 0, 10, 0, 0, 10, 10], u.deg)
+    >>> offsets = np.array([0, 3, 7])  # a triangle and a quadrilateral
+    >>> ipix, depth, fully_covered, cell_offsets = polygon_search_batch(lon, lat, offsets, 8)
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+
+    lon = np.atleast_1d(lon.rad).ravel().astype(np.float64, copy=False)
+    lat = np.atleast_1d(lat.rad).ravel().astype(np.float64, copy=False)
+    offsets = np.atleast_1d(offsets)
+    if offsets.size == 0 or offsets.min() < 0:
+        raise ValueError(
+            "The offsets must be increasing, from 0 to the number of vertices "
+            f"({lon.size})"
+        )
+
+    return cdshealpix.polygon_search_batch(
+        np.uint8(depth),
+        lon,
+        lat,
+        np.ascontiguousarray(offsets, dtype=np.uint64),
+        bool(flat),
+        bool(compact),
+        np.uint16(num_threads),
+    )
+
+
+@_validate_lonlat
+def elliptical_cone_search(
+    lon,
+    lat,
+    a,
+    b,
+    pa,
+    depth,
+    delta_depth=2,
+    flat=False,
+    *,
+    compact=False,
+    output="cells",
+    max_cells=None,
+    max_ranges=None,
+):
+    """Get the HEALPix cells contained in an elliptical cone at a given depth.
+
+    This method is wrapped around the `elliptical_cone_coverage_custom <https://docs.rs/cdshealpix/0.1.5/cdshealpix/nested/struct.Layer.html#method.elliptical_cone_coverage_custom>`__
+    method from the `cdshealpix Rust crate <https://crates.io/crates/cdshealpix>`__.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        Longitude of the center of the elliptical cone.
+    lat : `astropy.coordinates.Latitude`
+        Latitude of the center of the elliptical cone.
+    a : `astropy.coordinates.Angle`
+        Semi-major axe angle of the elliptical cone.
+    b : `astropy.coordinates.Angle`
+        Semi-minor axe angle of the elliptical cone.
+    pa : `astropy.coordinates.Angle`
+        The position angle (i.e. the angle between the north and the semi-major axis, east-of-north).
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    delta_depth : int, optional
+        To control the approximation, you can choose to perform the computations at a deeper depth using the `depth_delta` parameter.
+        The depth at which the computations will be made will therefore be equal to `depth` + `depth_delta`.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC). If True, the HEALPix cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    output : {"cells", "uniq", "ranges"}, optional
+        "cells" by default. With "uniq", the cells are returned as a single array of
+        NUNIQ indices ``4 * 4**depth + ipix``. With "ranges", the coverage is returned
+        as a (N, 2) `np.uint64` array of the sorted ranges ``[start, end[`` of the
+        depth 29 cells it contains, adjacent ranges being merged. `compact` is not
+        available with "ranges".
+    max_cells : int, optional
+        If given, the deepest cells that are not fully covered are replaced by their
+        parents until the result has at most ``max_cells`` cells, see
+        `coverage_simplify`. Not available with ``flat``.
+    max_ranges : int, optional
+        Same as ``max_cells`` for the number of ranges of the ``output="ranges"``
+        result, e.g. to bound the number of ``BETWEEN`` clauses of a query on an
+        indexed HEALPix column.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        A tuple containing 3 numpy arrays of identical size:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by the elliptical cone.
+    uniq : `numpy.ndarray`
+        With ``output="uniq"``, the NUNIQ indices of the cells, in the order of `ipix`.
+    ranges : `numpy.ndarray`
+        With ``output="ranges"``, the (N, 2) merged ranges of depth 29 cells.
+
+    Raises
+    ------
+    ValueError
+        If one of `lon`, `lat`, `major_axe`, `minor_axe` or `pa` contains more that one value.
+    ValueError
+        If the semi-major axis `a` exceeds 90deg (i.e. area of one hemisphere)
+    ValueError
+        If the semi-minor axis `b` is greater than the semi-major axis `a`
+
+    Examples
+    --------
+    >>> from cdshealpix import elliptical_cone_search
+    >>> from astropy.coordinates import Angle, SkyCoord, Longitude, Latitude
+    >>> import astropy.units as u
+    >>> import numpy as np
+    >>> lon = Longitude(0, u.deg)
+    >>> lat = Latitude(0, u.deg)
+    >>> a = Angle(50, unit="deg")
+    >>> b = Angle(10, unit="deg")
+    >>> pa = Angle(45, unit="deg")
+    >>> max_depth = 12
+    >>> ipix, depth, fully_covered = elliptical_cone_search(lon, lat, a, b, pa, max_depth)
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+    _check_format(output, compact)
+    _check_budget(flat, max_cells, max_ranges)
+
+    if (
+        not lon.isscalar
+        or not lat.isscalar
+        or not a.isscalar
+        or not b.isscalar
+        or not pa.isscalar
+    ):
+        raise ValueError(
+            "The longitude, latitude, semi-minor axis, semi-major axis and angle must be "
+            "scalar objects"
+        )
+
+    if a >= Angle(np.pi / 2.0, unit="rad"):
+        raise ValueError("The semi-major axis exceeds 90deg.")
+
+    if b > a:
+        raise ValueError("The semi-minor axis is greater than the semi-major axis.")
+
+    # We could have continued to use `.to_value(u.rad)` instead of `.rad`.
+    # Although `to_value` is more generical (method of Quantity),
+    # Longitude/Latitude ensure that the values the contain are in the correct ranges.
+    return cdshealpix.elliptical_cone_search(
+        depth=depth,
+        delta_depth=delta_depth,
+        lon=lon.rad,
+        lat=lat.rad,
+        a=a.to_value(u.rad),
+        b=b.to_value(u.rad),
+        pa=pa.to_value(u.rad),
+        flat=flat,
+        compact=compact,
+        output=output,
+        max_cells=max_cells,
+        max_ranges=max_ranges,
+    )
+
+
+@_validate_lonlat
+def elliptical_cone_search_batch(
+    lon,
+    lat,
+    a,
+    b,
+    pa,
+    depth,
+    delta_depth=2,
+    *,
+    flat=False,
+    compact=False,
+    num_threads=0,
+):
+    """Get the HEALPix cells contained in many elliptical cones at once.
+
+    The elliptical cones are covered in parallel, as with `elliptical_cone_search`
+    for each of them, and their cells are concatenated. The cells of the
+    :math:`i^{th}` elliptical cone are at ``offsets[i]:offsets[i + 1]`` in the
+    returned arrays.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        Longitudes of the centers of the elliptical cones.
+    lat : `astropy.coordinates.Latitude`
+        Latitudes of the centers of the elliptical cones.
+    a : `astropy.coordinates.Angle`
+        Semi-major axe angles of the elliptical cones.
+    b : `astropy.coordinates.Angle`
+        Semi-minor axe angles of the elliptical cones.
+    pa : `astropy.coordinates.Angle`
+        The position angles (i.e. the angle between the north and the semi-major axis,
+        east-of-north). All the parameters are broadcast together.
+    depth : int
+        Maximum depth of the HEALPix cells that will be returned.
+    delta_depth : int, optional
+        To control the approximation, you can choose to perform the computations at a deeper depth using the `depth_delta` parameter.
+        The depth at which the computations will be made will therefore be equal to `depth` + `depth_delta`.
+    flat : boolean, optional
+        False by default (i.e. returns a consistent MOC per elliptical cone). If True,
+        the HEALPix cells returned will all be at depth indicated by `depth`.
+    compact : boolean, optional
+        False by default. If True, the HEALPix cell indices are returned as `np.uint32`
+        instead of `np.uint64`. Only available for depths up to 13.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+
+    Returns
+    -------
+    ipix, depth, fully_covered, offsets : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The concatenation of the results of the elliptical cone searches:
+
+        * `ipix` stores HEALPix cell indices.
+        * `depth` stores HEALPix cell depths.
+        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by their elliptical cone.
+        * `offsets` is a `np.uint64` array of size N + 1 for N elliptical cones, the
+          cells of the :math:`i^{th}` elliptical cone being at
+          ``offsets[i]:offsets[i + 1]``.
+
+    Raises
+    ------
+    ValueError
+        When the parameters cannot be broadcast together.
+        If a semi-major axis exceeds 90deg (i.e. area of one hemisphere).
+        If a semi-minor axis is greater than its semi-major axis.
+        When ``compact`` is set for a depth greater than 13.
+
+    Examples
+    --------
+    >>> from cdshealpix import elliptical_cone_search_batch
+    >>> from astropy.coordinates import Angle, Longitude, Latitude
+    >>> import astropy.units as u
+    >>> ipix, depth, fully_covered, offsets = elliptical_cone_search_batch(
+    ...     Longitude([0, 10], u.deg), Latitude([0, 10], u.deg),
+    ...     a=Angle([5, 10], u.deg), b=Angle([1, 2], u.deg), pa=Angle(45, u.deg), depth=10
+    ... )
+    """
+    _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
+
+    lon, lat, a, b, pa = _ravel_batch(
+        lon.rad, lat.rad, a.to_value(u.rad), b.to_value(u.rad), pa.to_value(u.rad)
+    )
+
+    return cdshealpix.elliptical_cone_search_batch(
+        np.uint8(depth),
+        np.uint8(delta_depth),
+        lon,
+        lat,
+        a,
+        b,
+        pa,
+        bool(flat),
+        bool(compact),
+        np.uint16(num_threads),
+    )
+
+
+def _as_coverage(coverage):
+    """Broadcast the (ipix, depth, fully_covered) cells of a coverage."""
+    ipix, depth, fully_covered = coverage
+    ipix, depth = _broadcast_cells(ipix, depth)
+    fully_covered = np.broadcast_to(np.asarray(fully_covered, dtype=bool), ipix.shape)
+    return ipix, depth, fully_covered
+
+
+def _coverage_morphology(function, coverage, n_cells, depth, num_threads, fmt):
+    depth = 0 if depth is None else depth
+    _check_depth(depth)
+    _check_format(fmt, False)
+    if n_cells < 0:
+        raise ValueError("n_cells must be positive")
+    return function(
+        _as_coverage(coverage),
+        np.uint32(n_cells),
+        np.uint8(depth),
+        fmt,
+        np.uint16(num_threads),
+    )
+
+
+def _coverage_operation(operation, coverages, depth, fmt):
+    _check_depth(depth)
+    _check_format(fmt, False)
+    return cdshealpix.coverage_operation(
+        operation, [_as_coverage(c) for c in coverages], np.uint8(depth), fmt
+    )
+
+
+def coverage_union(*coverages, output="cells"):
+    """Get the union of coverages.
+
+    The coverages are given as the ``(ipix, depth, fully_covered)`` cells returned by
+    the searches (with ``output="cells"``), for example by `cone_search` or
+    `polygon_search`. Their cells must not overlap. The sorted cells of the coverages
+    are merged in linear time, the result staying in the multi-order form.
+
+    Parameters
+    ----------
+    *coverages : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverages.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the union, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+        When no coverage is given.
+
+    Examples
+    --------
+    >>> from cdshealpix import cone_search, coverage_union
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> first = cone_search(Longitude(0 * u.deg), Latitude(0 * u.deg), 5 * u.deg, 8)
+    >>> second = cone_search(Longitude(5 * u.deg), Latitude(0 * u.deg), 5 * u.deg, 8)
+    >>> ipix, depth, fully_covered = coverage_union(first, second)
+    """
+    return _coverage_operation("union", coverages, 0, output)
+
+
+def coverage_intersection(*coverages, output="cells"):
+    """Get the intersection of coverages.
+
+    See `coverage_union` for the coverages. A cell of the result is fully covered when
+    it is fully covered by all the coverages.
+
+    Parameters
+    ----------
+    *coverages : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverages.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the intersection, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+        When no coverage is given.
+
+    Examples
+    --------
+    >>> from cdshealpix import cone_search, coverage_intersection
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> first = cone_search(Longitude(0 * u.deg), Latitude(0 * u.deg), 5 * u.deg, 8)
+    >>> second = cone_search(Longitude(5 * u.deg), Latitude(0 * u.deg), 5 * u.deg, 8)
+    >>> ipix, depth, fully_covered = coverage_intersection(first, second)
+    """
+    return _coverage_operation("intersection", coverages, 0, output)
+
+
+def coverage_difference(coverage, *others, output="cells"):
+    """Get a coverage minus other coverages.
+
+    See `coverage_union` for the coverages. The result is conservative: the cells
+    partially covered by the other coverages are kept, not fully covered.
+
+    Parameters
+    ----------
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    *others : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverages to remove.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the difference, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+
+    Examples
+    --------
+    >>> from cdshealpix import cone_search, coverage_difference
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> footprint = cone_search(Longitude(0 * u.deg), Latitude(0 * u.deg), 9 * u.deg, 8)
+    >>> mask = cone_search(Longitude(2 * u.deg), Latitude(1 * u.deg), 1 * u.deg, 8)
+    >>> ipix, depth, fully_covered = coverage_difference(footprint, mask)
+    """
+    return _coverage_operation("difference", (coverage, *others), 0, output)
+
+
+def coverage_complement(coverage, depth=None, *, output="cells"):
+    """Get the complement of a coverage on the sphere.
+
+    See `coverage_union` for the coverage. The cells partially covered by the coverage
+    are part of its complement too, not fully covered.
+
+    Parameters
+    ----------
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    depth : int, optional
+        The maximum depth of the cells of the complement. Default to the maximum
+        depth of the cells of the coverage, it cannot be lower.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the complement, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+
+    Examples
+    --------
+    >>> from cdshealpix import cone_search, coverage_complement
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> cone = cone_search(Longitude(0 * u.deg), Latitude(0 * u.deg), 10 * u.deg, 8)
+    >>> ipix, depth, fully_covered = coverage_complement(cone)
+    """
+    return _coverage_operation(
+        "complement", (coverage,), 0 if depth is None else depth, output
+    )
+
+
+def coverage_simplify(coverage, *, max_cells=None, max_ranges=None, output="cells"):
+    """Simplify a coverage to a maximum number of cells or ranges.
+
+    The deepest cells of the coverage that are not fully covered are replaced by their
+    parents, which absorb the cells they contain, until the coverage has at most
+    ``max_cells`` cells and ``max_ranges`` ranges of depth 29 cells. When all the
+    remaining cells are fully covered, the deepest ones are coarsened. The result is a
+    superset of the coverage: the cells added to it are all in the cells of the result
+    that are not fully covered, whose area bounds the false positive area.
+
+    See `coverage_union` for the coverage. The coverage may not reach the budget when
+    its cells are all at depth 0.
+
+    Parameters
+    ----------
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    max_cells : int, optional
+        The maximum number of cells of the result.
+    max_ranges : int, optional
+        The maximum number of ranges of depth 29 cells of the result, adjacent ranges
+        being merged, see the ``output="ranges"`` of `cone_search`.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the simplified coverage, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+
+    Examples
+    --------
+    >>> from cdshealpix import polygon_search, coverage_simplify
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> polygon = polygon_search(
+    ...     Longitude([20, -10, 25], u.deg), Latitude([10, 20, 30], u.deg), 12
+    ... )
+    >>> ranges = coverage_simplify(polygon, max_ranges=20, output="ranges")
+    >>> len(ranges) <= 20
+    True
+    """
+    _check_format(output, False)
+    _check_budget(False, max_cells, max_ranges)
+    return cdshealpix.coverage_simplify(
+        _as_coverage(coverage), max_cells, max_ranges, output
+    )
+
+
+def coverage_dilate(coverage, n_cells=1, depth=None, *, num_threads=0, output="cells"):
+    """Dilate a coverage by a number of cells.
+
+    The cells at ``depth`` that are up to ``n_cells`` cells away from the coverage are
+    added to it, as fully covered cells. They are found ring by ring, in parallel, each
+    ring being made of the cells along the outside of the cells of the previous one
+    (see `external_neighbours`), and are deduplicated in Rust.
+
+    See `coverage_union` for the coverage.
+
+    Parameters
+    ----------
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    n_cells : int, optional
+        The number of cells by which the coverage is dilated. Default to 1.
+    depth : int, optional
+        The depth of the added cells. Default to the maximum depth of the cells of the
+        coverage, it cannot be lower.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the dilated coverage, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+
+    Examples
+    --------
+    >>> from cdshealpix import coverage_dilate
+    >>> ranges = coverage_dilate(([0], [1], [True]), 1, output="ranges")
+    >>> # the cell and its 8 neighbours at depth 1
+    >>> print((ranges[:, 1] - ranges[:, 0]).sum() // 4**28)
+    9
+    """
+    return _coverage_morphology(
+        cdshealpix.coverage_dilate, coverage, n_cells, depth, num_threads, output
+    )
+
+
+def coverage_erode(coverage, n_cells=1, depth=None, *, num_threads=0, output="cells"):
+    """Erode a coverage by a number of cells.
+
+    The cells at ``depth`` of the coverage that are up to ``n_cells`` cells away from
+    its outside are removed from it, see `coverage_dilate`.
+
+    Parameters
+    ----------
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    n_cells : int, optional
+        The number of cells by which the coverage is eroded. Default to 1.
+    depth : int, optional
+        The depth of the removed cells. Default to the maximum depth of the cells of
+        the coverage, it cannot be lower.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the eroded coverage, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+
+    Examples
+    --------
+    >>> from cdshealpix import coverage_erode
+    >>> ipix, depth, fully_covered = coverage_erode(([0], [0], [True]), 1, depth=2)
+    >>> len(ipix)
+    4
+    """
+    return _coverage_morphology(
+        cdshealpix.coverage_erode, coverage, n_cells, depth, num_threads, output
+    )
+
+
+def coverage_border(
+    coverage, depth=None, *, outer=False, num_threads=0, output="cells"
+):
+    """Get the cells along the border of a coverage.
+
+    The border is made of the cells at ``depth`` of the coverage that touch its
+    outside or, with ``outer``, of the cells out of the coverage that touch it, see
+    `coverage_dilate`.
+
+    Parameters
+    ----------
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    depth : int, optional
+        The depth of the cells of the border. Default to the maximum depth of the cells
+        of the coverage, it cannot be lower.
+    outer : bool, optional
+        If set to `True`, the border is made of the cells out of the coverage, as for
+        a halo. Default to `False`.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    output : {"cells", "uniq", "ranges"}, optional
+        The format of the result, see `cone_search`. "cells" by default.
+
+    Returns
+    -------
+    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+        The cells of the border, as returned by the searches.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+
+    Examples
+    --------
+    >>> from cdshealpix import coverage_border
+    >>> ipix, depth, fully_covered = coverage_border(([0], [0], [True]), depth=2)
+    >>> len(ipix)
+    12
+    """
+    _check_depth(0 if depth is None else depth)
+    _check_format(output, False)
+    return cdshealpix.coverage_border(
+        _as_coverage(coverage),
+        np.uint8(0 if depth is None else depth),
+        bool(outer),
+        output,
+        np.uint16(num_threads),
+    )
+
+
+@_validate_lonlat
+def coverage_contains(
+    lon, lat, coverage, num_threads=0, *, fully_covered=False, region=None
+):
+    """Test whether sky coordinates are in a coverage.
+
+    The coverage is given as the ``(ipix, depth, fully_covered)`` cells returned by the
+    searches, see `coverage_union`. Its cells are merged into sorted ranges of depth 29
+    cells, in which the depth 29 cells of the points are looked for by binary search,
+    in parallel.
+
+    The cells of the coverage that are not fully covered also contain points out of the
+    region it was computed from. The points in the fully covered cells are inside the
+    region, those in the other cells of the coverage must be tested exactly against
+    the region to be sure: given the ``region``, this is done during the search, for
+    these points only.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the points.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the points.
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    fully_covered : bool, optional
+        If set to `True`, only the points in the fully covered cells of the coverage
+        are in it. Default to `False`.
+    region : one of the `cdshealpix.regions`, optional
+        The region the coverage was computed from, e.g. a `cdshealpix.regions.Cone`.
+        The points in the cells of the coverage that are not fully covered are only in
+        it if they are in the region.
 
     Returns
     -------
-    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
-        A tuple containing 3 numpy arrays of identical size:
+    inside : `numpy.ndarray`
+        Boolean array of the shape of ``lon`` and ``lat``, whether the points are in
+        the coverage.
 
-        * `ipix` stores HEALPix cell indices.
-        * `depth` stores HEALPix cell depths.
-        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by the cone.
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``, or when
+        ``region`` is not one of the `cdshealpix.regions`.
 
     Examples
     --------
-    >>> from cdshealpix import box_search
-    >>> from astropy.coordinates import Longitude, Latitude, Angle
+    >>> from cdshealpix import cone_search, coverage_contains
+    >>> from astropy.coordinates import Longitude, Latitude
     >>> import astropy.units as u
-    >>> ipix, depth, fully_covered = box_search(
-    ...     lon=Longitude(0 * u.deg), lat=Latitude(0 * u.deg),
-    ...     a=10 * u.deg, b=5 * u.deg, angle=0*u.deg, depth=10
-    ... )
+    >>> cone = cone_search(Longitude(0 * u.deg), Latitude(0 * u.deg), 10 * u.deg, 8)
+    >>> coverage_contains(Longitude([1, 30], u.deg), Latitude([1, 1], u.deg), cone)
+    array([ True, False])
     """
-    _check_depth(depth)
+    if region is not None:
+        region = getattr(region, "_region", None)
+        if not isinstance(region, cdshealpix.Region):
+            raise ValueError("The region must be one of `cdshealpix.regions`")
+    shape = lon.shape
+    lon, lat = _flat_radians(lon, lat)
+    inside = cdshealpix.coverage_contains(
+        _as_coverage(coverage),
+        lon,
+        lat,
+        bool(fully_covered),
+        region,
+        np.uint16(num_threads),
+    )
+    return inside.reshape(shape)
 
-    if (
-        not lon.isscalar
-        or not lat.isscalar
-        or not a.isscalar
-        or not b.isscalar
-        or not angle.isscalar
-    ):
-        raise ValueError("The longitude, latitude, and Angles must be scalar objects")
 
-    return cdshealpix.box_search(
-        np.uint8(depth),
-        np.float64(lon.rad),
-        np.float64(lat.rad),
-        np.float64(a.to_value(u.rad)),
-        np.float64(b.to_value(u.rad)),
-        np.float64(angle.to_value(u.rad)),
-        bool(flat),
+def coverage_contains_ipix(
+    ipix, depth, coverage, num_threads=0, *, fully_covered=False
+):
+    """Test whether HEALPix cells are in a coverage.
+
+    See `coverage_contains` for the coverage. A cell is in the coverage when it is
+    entirely covered by its cells, that can be of any depth.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes.
+    depth : `numpy.ndarray`
+        The depths of the cells, broadcast with ``ipix``: the cells can be of mixed
+        depths.
+    coverage : tuple of `numpy.ndarray`
+        The ``(ipix, depth, fully_covered)`` cells of the coverage.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    fully_covered : bool, optional
+        If set to `True`, only the fully covered cells of the coverage are considered.
+        Default to `False`.
+
+    Returns
+    -------
+    inside : `numpy.ndarray`
+        Boolean array of the broadcast shape of ``ipix`` and ``depth``, whether the
+        cells are in the coverage.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes are out of ``[0, 12 * 4**depth[``.
+
+    Examples
+    --------
+    >>> from cdshealpix import cone_search, coverage_contains_ipix
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> cone = cone_search(Longitude(0 * u.deg), Latitude(0 * u.deg), 10 * u.deg, 8)
+    >>> coverage_contains_ipix([4, 1], [1, 0], cone)
+    array([False, False])
+    """
+    ipix, depth = _broadcast_cells(ipix, depth)
+    return cdshealpix.coverage_contains_ipix(
+        _as_coverage(coverage), ipix, depth, bool(fully_covered), np.uint16(num_threads)
     )
 
 
-def zone_search(lon_min, lat_min, lon_max, lat_max, depth=14, *, flat=False):
-    """Get the HEALPix cells contained in a zone at a given depth.
+@_validate_lonlat
+def points_in_cones(
+    lon, lat, cone_lon, cone_lat, radius, depth, depth_delta=2, *, num_threads=0
+):
+    """Get, for many points, the cones containing them.
 
-    A zone is defined by its corners. All points inside have lon_min =< lon < lon_max
-    and lat_min =< lat < lat_max.
+    The cones are covered at ``depth`` (as with `cone_search`) and their cells are
+    indexed. Each point is then hashed once and only tested exactly against the cones
+    partially covering its cell. Choose ``depth`` so that the cells are about the size
+    of the cones: deeper, the index gets bigger, shallower, more points are tested
+    exactly.
 
     Parameters
     ----------
-    lon_min : `~astropy.coordinates.Longitude`
-        Longitude of bottom left corner.
-    lat_min : `~astropy.coordinates.Latitude`
-        Latitude of the bottom left corner
-    lon_max : `~astropy.coordinates.Longitude`
-        Longitude of the upper right corner.
-    lat_max : `~astropy.coordinates.Latitude`
-        Latitude of the upper right corner
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the points.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the points.
+    cone_lon : `astropy.coordinates.Longitude`
+        Longitudes of the centers of the cones.
+    cone_lat : `astropy.coordinates.Latitude`
+        Latitudes of the centers of the cones.
+    radius : `astropy.units.Quantity`
+        Radii of the cones, broadcast against ``cone_lon`` and ``cone_lat``.
     depth : int
-        Maximum depth of the HEALPix cells that will be returned.
-    flat : boolean, optional
-        False by default (i.e. returns a consistent MOC). If True, the HEALPix cells
-        returned will all be at depth indicated by `depth`.
+        Depth of the coverages of the cones.
+    depth_delta : int, optional
+        To control the approximation of the coverages, see `cone_search`.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
-    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
-        A tuple containing 3 numpy arrays of identical size:
+    point, cone : (`numpy.ndarray`, `numpy.ndarray`)
+        One (point, cone) pair of `np.uint64` indices per point in a cone, sorted by
+        point then by cone. The points are indexed in the flattened ``lon`` and ``lat``.
 
-        * `ipix` stores HEALPix cell indices.
-        * `depth` stores HEALPix cell depths.
-        * `fully_covered` stores flags on whether the HEALPix cells are fully
-           covered by the cone.
+    Raises
+    ------
+    ValueError
+        When ``cone_lon``, ``cone_lat`` and ``radius`` cannot be broadcast together.
 
     Examples
     --------
-    >>> from cdshealpix import zone_search
-    >>> from astropy.coordinates import Longitude, Latitude, Angle
+    >>> from cdshealpix import points_in_cones
+    >>> from astropy.coordinates import Longitude, Latitude
     >>> import astropy.units as u
-    >>> ipix, depth, fully_covered = zone_search(
-    ...     lon_min=Longitude(0 * u.deg), lat_min=Latitude(0 * u.deg),
-    ...     lon_max=Longitude(10 * u.deg), lat_max=Latitude(10 * u.deg), depth=10
+    >>> point, cone = points_in_cones(
+    ...     Longitude([0, 10, 20], u.deg), Latitude([0, 0, 0], u.deg),
+    ...     Longitude([0, 10], u.deg), Latitude([0, 1], u.deg), [2, 3] * u.deg, depth=6
     ... )
+    >>> point
+    array([0, 1], dtype=uint64)
+    >>> cone
+    array([0, 1], dtype=uint64)
     """
     _check_depth(depth)
 
-    if (
-        not lon_min.isscalar
-        or not lat_min.isscalar
-        or not lon_max.isscalar
-        or not lat_max.isscalar
-    ):
-        raise ValueError("The longitudes and latitudes must be scalar objects")
-
-    if not isinstance(lon_min, Longitude) or not isinstance(lon_max, Longitude):
-        raise ValueError("longitudes must be of type `astropy.coordinates.Longitude`")
-
-    if not isinstance(lat_min, Latitude) or not isinstance(lat_max, Latitude):
-        raise ValueError("latitudes must be of type `astropy.coordinates.Latitude`")
+    if not (isinstance(radius, u.Quantity)):
+        raise ValueError("`radius` must be of type `astropy.units.Quantity`")
 
-    # this is because astropy wraps the angle when we actually want 2 * Pi here
-    if lon_max.rad == 0:
-        lon_max.rad = 2 * pi
+    cone_lon, cone_lat, radius = _ravel_batch(
+        Longitude(cone_lon).rad, Latitude(cone_lat).rad, radius.to_value(u.rad)
+    )
 
-    return cdshealpix.zone_search(
+    return cdshealpix.points_in_cones(
         np.uint8(depth),
-        np.float64(lon_min.rad),
-        np.float64(lat_min.rad),
-        np.float64(lon_max.rad),
-        np.float64(lat_max.rad),
-        bool(flat),
+        np.uint8(depth_delta),
+        np.ascontiguousarray(lon.rad).ravel(),
+        np.ascontiguousarray(lat.rad).ravel(),
+        cone_lon,
+        cone_lat,
+        radius,
+        np.uint16(num_threads),
     )
 
 
 @_validate_lonlat
-def polygon_search(lon, lat, depth, flat=False):
-    """Get the HEALPix cells contained in a polygon at a given depth.
-
-    This method is wrapped around the `polygon_coverage <https://docs.rs/cdshealpix/0.1.5/cdshealpix/nested/struct.Layer.html#method.polygon_coverage>`__
-    method from the `cdshealpix Rust crate <https://crates.io/crates/cdshealpix>`__.
+def points_in_ellipses(
+    lon,
+    lat,
+    ellipse_lon,
+    ellipse_lat,
+    a,
+    b,
+    pa,
+    depth,
+    delta_depth=2,
+    *,
+    num_threads=0,
+):
+    """Get, for many points, the elliptical cones containing them.
+
+    The elliptical cones are covered at ``depth`` (as with `elliptical_cone_search`)
+    and their cells are indexed. Each point is then hashed once and only tested
+    exactly against the elliptical cones partially covering its cell: a point is inside
+    when its orthographic projection on the plane tangent to the center is inside the
+    ellipse of semi-axes ``sin(a)`` and ``sin(b)``.
 
     Parameters
     ----------
     lon : `astropy.coordinates.Longitude`
-        The longitudes of the vertices defining the polygon.
+        The longitudes of the points.
     lat : `astropy.coordinates.Latitude`
-        The latitudes of the vertices defining the polygon.
+        The latitudes of the points.
+    ellipse_lon : `astropy.coordinates.Longitude`
+        Longitudes of the centers of the elliptical cones.
+    ellipse_lat : `astropy.coordinates.Latitude`
+        Latitudes of the centers of the elliptical cones.
+    a : `astropy.coordinates.Angle`
+        Semi-major axe angles of the elliptical cones.
+    b : `astropy.coordinates.Angle`
+        Semi-minor axe angles of the elliptical cones.
+    pa : `astropy.coordinates.Angle`
+        The position angles (i.e. the angle between the north and the semi-major axis,
+        east-of-north). The parameters of the elliptical cones are broadcast together.
     depth : int
-        Maximum depth of the HEALPix cells that will be returned.
-    flat : boolean, optional
-        False by default (i.e. returns a consistent MOC). If True, the HEALPix cells returned will all be at depth indicated by `depth`.
+        Depth of the coverages of the elliptical cones.
+    delta_depth : int, optional
+        To control the approximation of the coverages, see `elliptical_cone_search`.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
-    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
-        A tuple containing 3 numpy arrays of identical size:
-
-        * `ipix` stores HEALPix cell indices.
-        * `depth` stores HEALPix cell depths.
-        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by the polygon.
+    point, ellipse : (`numpy.ndarray`, `numpy.ndarray`)
+        One (point, ellipse) pair of `np.uint64` indices per point in an elliptical
+        cone, sorted by point then by elliptical cone. The points are indexed in the
+        flattened ``lon`` and ``lat``.
 
     Raises
     ------
     ValueError
-        When `lon` and `lat` do not have the same dimensions.
-    IndexError
-        When the number of distinct vertices given is lesser than 3 (i.e. defining at least a triangle).
+        When the parameters of the elliptical cones cannot be broadcast together.
+        If a semi-major axis exceeds 90deg (i.e. area of one hemisphere).
+        If a semi-minor axis is greater than its semi-major axis.
 
     Examples
     --------
-    >>> from cdshealpix import polygon_search
-    >>> from astropy.coordinates import Longitude, Latitude
+    >>> from cdshealpix import points_in_ellipses
+    >>> from astropy.coordinates import Angle, Longitude, Latitude
     >>> import astropy.units as u
-    >>> import numpy as np
-    >>> lon = Longitude(np.random.rand(3) * 360, u.deg)
-    >>> lat = Latitude((np.random.rand(3) * 180 - 90), u.deg)
-    >>> max_depth = 12
-    >>> ipix, depth, fully_covered = polygon_search(lon, lat, max_depth)
+    >>> point, ellipse = points_in_ellipses(
+    ...     Longitude([0, 4, 0], u.deg), Latitude([0, 0, 4], u.deg),
+    ...     Longitude([0], u.deg), Latitude([0], u.deg),
+    ...     a=Angle([5], u.deg), b=Angle([1], u.deg), pa=Angle(90, u.deg), depth=6
+    ... )
+    >>> point
+    array([0, 1], dtype=uint64)
+    >>> ellipse
+    array([0, 0], dtype=uint64)
     """
     _check_depth(depth)
 
-    lon = np.atleast_1d(lon.rad).ravel()
-    lat = np.atleast_1d(lat.rad).ravel()
-
-    num_vertices = lon.shape[0]
-
-    if num_vertices < 3:
-        raise ValueError("There must be at least 3 vertices in order to form a polygon")
-
-    # Check that there is at least 3 distinct vertices.
-    vertices = np.vstack((lon, lat)).T
-    distinct_vertices = np.unique(vertices, axis=0)
-    if distinct_vertices.shape[0] < 3:
-        raise ValueError(
-            "There must be at least 3 distinct vertices in order to form a polygon"
-        )
-
-    ipix, depth, full = cdshealpix.polygon_search(depth, lon, lat, flat)
+    ellipse_lon, ellipse_lat, a, b, pa = _ravel_batch(
+        Longitude(ellipse_lon).rad,
+        Latitude(ellipse_lat).rad,
+        a.to_value(u.rad),
+        b.to_value(u.rad),
+        pa.to_value(u.rad),
+    )
 
-    return ipix, depth, full
+    return cdshealpix.points_in_ellipses(
+        np.uint8(depth),
+        np.uint8(delta_depth),
+        np.ascontiguousarray(lon.rad).ravel(),
+        np.ascontiguousarray(lat.rad).ravel(),
+        ellipse_lon,
+        ellipse_lat,
+        a,
+        b,
+        pa,
+        np.uint16(num_threads),
+    )
 
 
 @_validate_lonlat
-def elliptical_cone_search(lon, lat, a, b, pa, depth, delta_depth=2, flat=False):
-    """Get the HEALPix cells contained in an elliptical cone at a given depth.
+def points_in_polygons(lon, lat, poly_lon, poly_lat, offsets, depth, *, num_threads=0):
+    """Get, for many points, the polygons containing them.
 
-    This method is wrapped around the `elliptical_cone_coverage_custom <https://docs.rs/cdshealpix/0.1.5/cdshealpix/nested/struct.Layer.html#method.elliptical_cone_coverage_custom>`__
-    method from the `cdshealpix Rust crate <https://crates.io/crates/cdshealpix>`__.
+    The polygons are covered at ``depth`` (as with `polygon_search`) and their cells
+    are indexed. Each point is then hashed once and only tested exactly against the
+    polygons partially covering its cell. The vertices of the polygons are given as
+    in `polygon_search_batch`.
 
     Parameters
     ----------
     lon : `astropy.coordinates.Longitude`
-        Longitude of the center of the elliptical cone.
+        The longitudes of the points.
     lat : `astropy.coordinates.Latitude`
-        Latitude of the center of the elliptical cone.
-    a : `astropy.coordinates.Angle`
-        Semi-major axe angle of the elliptical cone.
-    b : `astropy.coordinates.Angle`
-        Semi-minor axe angle of the elliptical cone.
-    pa : `astropy.coordinates.Angle`
-        The position angle (i.e. the angle between the north and the semi-major axis, east-of-north).
+        The latitudes of the points.
+    poly_lon : `astropy.coordinates.Longitude`
+        The longitudes of the vertices of all the polygons.
+    poly_lat : `astropy.coordinates.Latitude`
+        The latitudes of the vertices of all the polygons.
+    offsets : `numpy.ndarray`
+        An increasing array of size N + 1 for N polygons, starting with 0 and ending
+        with the number of vertices.
     depth : int
-        Maximum depth of the HEALPix cells that will be returned.
-    delta_depth : int, optional
-        To control the approximation, you can choose to perform the computations at a deeper depth using the `depth_delta` parameter.
-        The depth at which the computations will be made will therefore be equal to `depth` + `depth_delta`.
-    flat : boolean, optional
-        False by default (i.e. returns a consistent MOC). If True, the HEALPix cells returned will all be at depth indicated by `depth`.
+        Depth of the coverages of the polygons.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
-    ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
-        A tuple containing 3 numpy arrays of identical size:
-
-        * `ipix` stores HEALPix cell indices.
-        * `depth` stores HEALPix cell depths.
-        * `fully_covered` stores flags on whether the HEALPix cells are fully covered by the elliptical cone.
+    point, polygon : (`numpy.ndarray`, `numpy.ndarray`)
+        One (point, polygon) pair of `np.uint64` indices per point in a polygon, sorted
+        by point then by polygon. The points are indexed in the flattened ``lon`` and
+        ``lat``.
 
     Raises
     ------
     ValueError
-        If one of `lon`, `lat`, `major_axe`, `minor_axe` or `pa` contains more that one value.
-    ValueError
-        If the semi-major axis `a` exceeds 90deg (i.e. area of one hemisphere)
-    ValueError
-        If the semi-minor axis `b` is greater than the semi-major axis `a`
+        When ``poly_lon`` and ``poly_lat`` do not have the same dimensions.
+        When ``offsets`` are not increasing from 0 to the number of vertices.
+        When a polygon has less than 3 distinct vertices.
 
     Examples
     --------
-    >>> from cdshealpix import elliptical_cone_search
-    >>> from astropy.coordinates import Angle, SkyCoord, Longitude, Latitude
+    >>> from cdshealpix import points_in_polygons
+    >>> from astropy.coordinates import Longitude, Latitude
     >>> import astropy.units as u
     >>> import numpy as np
-    >>> lon = Longitude(0, u.deg)
-    >>> lat = Latitude(0, u.deg)
-    >>> a = Angle(50, unit="deg")
-    >>> b = Angle(10, unit="deg")
-    >>> pa = Angle(45, unit="deg")
-    >>> max_depth = 12
-    >>> ipix, depth, fully_covered = elliptical_cone_search(lon, lat, a, b, pa, max_depth)
+    >>> point, polygon = points_in_polygons(
+    ...     Longitude([5, 25, 50], u.deg), Latitude([3, 5, 5], u.deg),
+    ...     Longitude([0, 10, 5, 20, 30, 30, 20], u.deg),
+    ...     Latitude([0, 0, 10, 0, 0, 10, 10], u.deg),
+    ...     offsets=np.array([0, 3, 7]), depth=6,
+    ... )
+    >>> point
+    array([0, 1], dtype=uint64)
+    >>> polygon
+    array([0, 1], dtype=uint64)
     """
     _check_depth(depth)
 
-    if (
-        not lon.isscalar
-        or not lat.isscalar
-        or not a.isscalar
-        or not b.isscalar
-        or not pa.isscalar
-    ):
+    poly_lon = np.atleast_1d(Longitude(poly_lon).rad).ravel().astype(np.float64)
+    poly_lat = np.atleast_1d(Latitude(poly_lat).rad).ravel().astype(np.float64)
+    offsets = np.atleast_1d(offsets)
+    if offsets.size == 0 or offsets.min() < 0:
         raise ValueError(
-            "The longitude, latitude, semi-minor axis, semi-major axis and angle must be "
-            "scalar objects"
+            "The offsets must be increasing, from 0 to the number of vertices "
+            f"({poly_lon.size})"
         )
 
-    if a >= Angle(np.pi / 2.0, unit="rad"):
-        raise ValueError("The semi-major axis exceeds 90deg.")
-
-    if b > a:
-        raise ValueError("The semi-minor axis is greater than the semi-major axis.")
-
-    # We could have continued to use `.to_value(u.rad)` instead of `.rad`.
-    # Although `to_value` is more generical (method of Quantity),
-    # Longitude/Latitude ensure that the values the contain are in the correct ranges.
-    ipix, depth, full = cdshealpix.elliptical_cone_search(
-        depth=depth,
-        delta_depth=delta_depth,
-        lon=lon.rad,
-        lat=lat.rad,
-        a=a.to_value(u.rad),
-        b=b.to_value(u.rad),
-        pa=pa.to_value(u.rad),
-        flat=flat,
+    return cdshealpix.points_in_polygons(
+        np.uint8(depth),
+        np.ascontiguousarray(lon.rad).ravel(),
+        np.ascontiguousarray(lat.rad).ravel(),
+        poly_lon,
+        poly_lat,
+        np.ascontiguousarray(offsets, dtype=np.uint64),
+        np.uint16(num_threads),
     )
 
-    return ipix, depth, full
-
 
 def healpix_to_xy(ipix, depth, num_threads=0):
     r"""Project the center of a HEALPix cell to the xy-HEALPix plane.
@@ -863,8 +2882,7 @@ def healpix_to_xy(ipix, depth, num_threads=0):
         The depth of the HEALPix cells
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -886,18 +2904,17 @@ def healpix_to_xy(ipix, depth, num_threads=0):
     depth = np.atleast_1d(depth)
 
     _check_depth(depth)
-    _check_ipixels(ipix, depth)
 
     # Broadcasting
     ipix, depth = np.broadcast_arrays(ipix, depth)
 
     # Allocation of the array containing the resulting coordinates
-    x = np.zeros(ipix.shape, dtype=np.float64)
-    y = np.zeros(ipix.shape, dtype=np.float64)
+    x = np.empty(ipix.shape, dtype=np.float64)
+    y = np.empty(ipix.shape, dtype=np.float64)
 
     # Call the Rust extension
-    ipix = ipix.astype(np.uint64)
-    depth = depth.astype(np.uint8)
+    ipix = _as_hashes(ipix)
+    depth = depth.astype(np.uint8, copy=False)
     num_threads = np.uint16(num_threads)
 
     cdshealpix.healpix_to_xy(ipix, depth, x, y, num_threads)
@@ -917,8 +2934,7 @@ def lonlat_to_xy(lon, lat, num_threads=0):
         The latitudes of the sky coordinates.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -960,8 +2976,7 @@ def xy_to_lonlat(x, y, num_threads=0):
         Position on the Y axis of the HEALPix plane, :math:`y \in [-2, 2]`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -1001,7 +3016,7 @@ def xy_to_lonlat(x, y, num_threads=0):
 
 
 @_validate_lonlat
-def bilinear_interpolation(lon, lat, depth, num_threads=0):
+def bilinear_interpolation(lon, lat, depth, num_threads=0, *, out=None, compact=False):
     r"""Compute the HEALPix bilinear interpolation from sky coordinates.
 
     For each (``lon``, ``lat``) sky position given, this function
@@ -1029,8 +3044,15 @@ def bilinear_interpolation(lon, lat, depth, num_threads=0):
         The depth of the HEALPix cells
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` array and a C-contiguous `np.float64` array, both of
+        shape ``(*lon.shape, 4)``, in which the cells and the weights are written instead
+        of allocating new arrays. With ``compact``, the dtypes are `np.uint32` and
+        `np.float32`.
+    compact : bool, optional
+        If set to `True`, the cells are returned as `np.uint32` and the weights as
+        `np.float32`. Only available for depths up to 13. Default to `False`.
 
     Returns
     -------
@@ -1054,6 +3076,8 @@ def bilinear_interpolation(lon, lat, depth, num_threads=0):
     >>> ipix, weights = bilinear_interpolation(lon, lat, depth)
     """
     _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
 
     lon = np.atleast_1d(lon.rad)
     lat = np.atleast_1d(lat.rad)
@@ -1070,8 +3094,7 @@ def bilinear_interpolation(lon, lat, depth, num_threads=0):
 
     mask_invalid = np.repeat(mask_invalid[:, np.newaxis], 4, axis=mask_invalid.ndim)
 
-    ipix = np.empty(shape=(*num_coords, 4), dtype=np.uint64)
-    weights = np.empty(shape=(*num_coords, 4), dtype=np.float64)
+    ipix, weights = _check_outs(out, (*num_coords, 4), _out_dtypes(compact))
 
     num_threads = np.uint16(num_threads)
 
@@ -1082,20 +3105,3 @@ def bilinear_interpolation(lon, lat, depth, num_threads=0):
     weights_masked_array = np.ma.masked_array(weights, mask=mask_invalid)
 
     return ipix_masked_array, weights_masked_array
-
-
-# Raise a ValueError exception if the input
-# HEALPix cells array contains invalid values
-# data and depth must have the same shape
-def _check_ipixels(data, depth):
-    if isinstance(depth, int):
-        npix = 12 * 4 ** (depth)
-        valid_ipix = [0, npix]
-    else:
-        npix = np.array(12 * 4 ** depth.astype(np.uint64))
-        valid_ipix = np.stack((np.zeros(npix.shape), npix)).T
-
-    if (data >= npix).any() or (data < 0).any():
-        raise ValueError(
-            f"The input HEALPix array contains values out of {valid_ipix}."
-        )
@@ -0,0 +1 @@
+from .regions import *  # noqa: F403
@@ -0,0 +1,293 @@
+"""Regions whose coverages are computed once per depth.
+
+A region is checked and converted in radians when it is created, and keeps its
+geometry on the Rust side. Its coverages are memoized by ``(depth, delta_depth,
+flat)``: querying again a coverage, in any format, only converts its memoized cells.
+The memory used by the memoized coverages of a region is bounded by its
+``max_memory``, the least recently used coverages being dropped first.
+"""
+from math import pi
+
+import astropy.units as u
+from astropy.coordinates import Latitude, Longitude
+
+import numpy as np
+
+from .. import cdshealpix
+from ..nested.healpix import _polygon_vertices
+from ..utils import _check_budget, _check_compact_depth, _check_depth, _check_format
+
+__all__ = ["Cone", "Ellipse", "Polygon", "Box", "Zone"]
+
+# The default bound of the memory of the memoized coverages of a region, in bytes
+_MAX_MEMORY = 64 * 2**20
+
+
+def _scalar_angles(*angles):
+    """Get scalar `astropy.units.Quantity` angles in radians."""
+    if not all(isinstance(angle, u.Quantity) for angle in angles):
+        raise ValueError("The angles must be of type `astropy.units.Quantity`")
+    if not all(angle.isscalar for angle in angles):
+        raise ValueError("The longitudes, latitudes and angles must be scalar objects")
+    return [float(angle.to_value(u.rad)) for angle in angles]
+
+
+class _Region:
+    """Base class of the regions.
+
+    Parameters
+    ----------
+    region : `cdshealpix.cdshealpix.Region`
+        The geometry of the region and its memoized coverages.
+    """
+
+    # whether the coverages of the region are computed at a deeper depth
+    _uses_delta_depth = False
+
+    def __init__(self, region):
+        self._region = region
+
+    def search(
+        self,
+        depth,
+        delta_depth=2,
+        flat=False,
+        *,
+        compact=False,
+        output="cells",
+        max_cells=None,
+        max_ranges=None,
+    ):
+        """Get the HEALPix cells of the region at a given depth.
+
+        The result is that of the search of the region, e.g.
+        `cdshealpix.nested.cone_search` for a `Cone`, the coverage being only
+        computed by the first search at a given ``depth``, ``delta_depth`` and
+        ``flat``.
+
+        Parameters
+        ----------
+        depth : int
+            Maximum depth of the HEALPix cells that will be returned.
+        delta_depth : int, optional
+            Only used by `Cone` and `Ellipse`. To control the approximation, the
+            computations are made at the depth ``depth + delta_depth``.
+        flat : bool, optional
+            False by default (i.e. returns a consistent MOC). If True, the HEALPix
+            cells returned will all be at depth indicated by `depth`.
+        compact : bool, optional
+            False by default. If True, the HEALPix cell indices are returned as
+            `np.uint32` instead of `np.uint64`. Only available for depths up to 13.
+        output : {"cells", "uniq", "ranges"}, optional
+            "cells" by default, see `cdshealpix.nested.cone_search`.
+        max_cells, max_ranges : int, optional
+            To simplify the coverage, see `cdshealpix.nested.coverage_simplify`. Not
+            available with ``flat``.
+
+        Returns
+        -------
+        ipix, depth, fully_covered : (`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`)
+            The cells of the coverage, their depths and whether they are fully
+            covered by the region.
+        uniq : `numpy.ndarray`
+            With ``output="uniq"``, the NUNIQ indices of the cells.
+        ranges : `numpy.ndarray`
+            With ``output="ranges"``, the (N, 2) merged ranges of depth 29 cells.
+        """
+        if not self._uses_delta_depth:
+            delta_depth = 0
+        _check_depth(depth)
+        _check_depth(depth + delta_depth)
+        if compact:
+            _check_compact_depth(depth)
+        _check_format(output, compact)
+        _check_budget(flat, max_cells, max_ranges)
+        return self._region.coverage(
+            np.uint8(depth),
+            np.uint8(delta_depth),
+            bool(flat),
+            bool(compact),
+            output,
+            max_cells,
+            max_ranges,
+        )
+
+    def cache_info(self):
+        """Get the number of memoized coverages and the memory they use.
+
+        Returns
+        -------
+        n_coverages, memory : (int, int)
+            The number of memoized coverages and their memory, in bytes.
+        """
+        return self._region.cache_info()
+
+    def clear_cache(self):
+        """Drop the memoized coverages."""
+        self._region.clear_cache()
+
+
+class Cone(_Region):
+    """A cone, covered as by `cdshealpix.nested.cone_search`.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        Longitude of the center of the cone.
+    lat : `astropy.coordinates.Latitude`
+        Latitude of the center of the cone.
+    radius : `astropy.units.Quantity`
+        Radius of the cone.
+    max_memory : int, optional
+        The maximum memory of the memoized coverages, in bytes. 64 MiB by default.
+
+    Examples
+    --------
+    >>> from cdshealpix.regions import Cone
+    >>> from cdshealpix import cone_search
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> import numpy as np
+    >>> lon, lat = Longitude(10 * u.deg), Latitude(20 * u.deg)
+    >>> cone = Cone(lon, lat, 5 * u.deg)
+    >>> uniq = cone.search(10, output="uniq")
+    >>> ranges = cone.search(10, output="ranges")
+    >>> cone.cache_info()[0]
+    1
+    >>> np.array_equal(uniq, cone_search(lon, lat, 5 * u.deg, 10, output="uniq"))
+    True
+    """
+
+    _uses_delta_depth = True
+
+    def __init__(self, lon, lat, radius, *, max_memory=_MAX_MEMORY):
+        lon, lat, radius = _scalar_angles(Longitude(lon), Latitude(lat), radius)
+        super().__init__(cdshealpix.Region.cone(lon, lat, radius, max_memory))
+
+
+class Ellipse(_Region):
+    """An elliptical cone, covered as by `cdshealpix.nested.elliptical_cone_search`.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        Longitude of the center of the ellipse.
+    lat : `astropy.coordinates.Latitude`
+        Latitude of the center of the ellipse.
+    a : `astropy.coordinates.Angle`
+        Semi-major axis angle of the ellipse, smaller than 90deg.
+    b : `astropy.coordinates.Angle`
+        Semi-minor axis angle of the ellipse, at most ``a``.
+    pa : `astropy.coordinates.Angle`
+        Position angle (East of North) of the ellipse.
+    max_memory : int, optional
+        The maximum memory of the memoized coverages, in bytes. 64 MiB by default.
+
+    Raises
+    ------
+    ValueError
+        If the semi-major axis `a` exceeds 90deg or if the semi-minor axis `b` is
+        greater than `a`.
+    """
+
+    _uses_delta_depth = True
+
+    def __init__(self, lon, lat, a, b, pa, *, max_memory=_MAX_MEMORY):
+        lon, lat, a, b, pa = _scalar_angles(Longitude(lon), Latitude(lat), a, b, pa)
+        if a >= pi / 2:
+            raise ValueError("The semi-major axis exceeds 90deg.")
+        if b > a:
+            raise ValueError("The semi-minor axis is greater than the semi-major axis.")
+        super().__init__(
+            cdshealpix.Region.elliptical_cone(lon, lat, a, b, pa, max_memory)
+        )
+
+
+class Polygon(_Region):
+    """A polygon, covered as by `cdshealpix.nested.polygon_search`.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        The longitudes of the vertices of the polygon.
+    lat : `astropy.coordinates.Latitude`
+        The latitudes of the vertices of the polygon.
+    max_memory : int, optional
+        The maximum memory of the memoized coverages, in bytes. 64 MiB by default.
+
+    Raises
+    ------
+    ValueError
+        When the polygon has less than 3 distinct vertices.
+
+    Examples
+    --------
+    >>> from cdshealpix.regions import Polygon
+    >>> from astropy.coordinates import Longitude, Latitude
+    >>> import astropy.units as u
+    >>> polygon = Polygon(
+    ...     Longitude([0, 20, 20, 0], u.deg), Latitude([0, 0, 20, 20], u.deg)
+    ... )
+    >>> coverages = [polygon.search(depth) for depth in range(5, 10)]
+    >>> polygon.cache_info()[0]
+    5
+    """
+
+    def __init__(self, lon, lat, *, max_memory=_MAX_MEMORY):
+        lon, lat = _polygon_vertices(Longitude(lon), Latitude(lat))
+        super().__init__(cdshealpix.Region.polygon(lon, lat, max_memory))
+
+
+class Box(_Region):
+    """A box, covered as by `cdshealpix.nested.box_search`.
+
+    Parameters
+    ----------
+    lon : `astropy.coordinates.Longitude`
+        Longitude of the center of the box.
+    lat : `astropy.coordinates.Latitude`
+        Latitude of the center of the box.
+    a : `astropy.coordinates.Angle`
+        Extension along the longitudinal axis.
+    b : `astropy.coordinates.Angle`
+        Extension along the latitudinal axis.
+    angle : `astropy.coordinates.Angle`, optional
+        Rotation angle between the north and the semi-major axis, east of north.
+    max_memory : int, optional
+        The maximum memory of the memoized coverages, in bytes. 64 MiB by default.
+    """
+
+    def __init__(self, lon, lat, a, b, angle=0 * u.deg, *, max_memory=_MAX_MEMORY):
+        lon, lat, a, b, angle = _scalar_angles(
+            Longitude(lon), Latitude(lat), a, b, angle
+        )
+        super().__init__(cdshealpix.Region.box(lon, lat, a, b, angle, max_memory))
+
+
+class Zone(_Region):
+    """A zone, covered as by `cdshealpix.nested.zone_search`.
+
+    Parameters
+    ----------
+    lon_min : `astropy.coordinates.Longitude`
+        Longitude of the bottom left corner of the zone.
+    lat_min : `astropy.coordinates.Latitude`
+        Latitude of the bottom left corner of the zone.
+    lon_max : `astropy.coordinates.Longitude`
+        Longitude of the upper right corner of the zone.
+    lat_max : `astropy.coordinates.Latitude`
+        Latitude of the upper right corner of the zone.
+    max_memory : int, optional
+        The maximum memory of the memoized coverages, in bytes. 64 MiB by default.
+    """
+
+    def __init__(self, lon_min, lat_min, lon_max, lat_max, *, max_memory=_MAX_MEMORY):
+        lon_min, lat_min, lon_max, lat_max = _scalar_angles(
+            Longitude(lon_min), Latitude(lat_min), Longitude(lon_max), Latitude(lat_max)
+        )
+        # this is because astropy wraps the angle when we actually want 2 * Pi here
+        if lon_max == 0:
+            lon_max = 2 * pi
+        super().__init__(
+            cdshealpix.Region.zone(lon_min, lat_min, lon_max, lat_max, max_memory)
+        )
@@ -0,0 +1,275 @@
+"""Astropy-free conversions of HEALPix in the ring configuration.
+
+The functions of this module are the equivalent of the ones of `cdshealpix.ring`
+working on plain float64 `numpy.ndarray` objects, in radians or in degrees.
+"""
+import numpy as np
+
+from .. import cdshealpix
+from ..utils import _as_hashes, _check_out, _check_outs, _out_dtypes, _raw_lonlat
+from .healpix import _check_compact_nside, _check_nside
+
+__all__ = [
+    "lonlat_to_healpix",
+    "healpix_to_lonlat",
+    "vertices",
+]
+
+
+def lonlat_to_healpix(
+    lon,
+    lat,
+    nside,
+    return_offsets=False,
+    *,
+    degrees=False,
+    num_threads=0,
+    out=None,
+    compact=False,
+):
+    r"""Get the HEALPix indexes that contains specific sky coordinates.
+
+    This is the equivalent of `cdshealpix.ring.lonlat_to_healpix` without astropy.
+
+    Parameters
+    ----------
+    lon : `numpy.ndarray`
+        The longitudes of the sky coordinates, in radians (or degrees if
+        ``degrees`` is set).
+    lat : `numpy.ndarray`
+        The latitudes of the sky coordinates, in radians (or degrees if
+        ``degrees`` is set).
+    nside : `numpy.ndarray`
+        The nside of the returned HEALPix cell indexes.
+    return_offsets : bool, optional
+        If set to `True`, returns a tuple made of 3 elements, the HEALPix cell
+        indexes and the dx, dy arrays telling where the (``lon``, ``lat``) coordinates
+        passed are located on the cells. ``dx`` and ``dy`` are :math:`\in [0, 1]`
+    degrees : bool, optional
+        Set to `True` if ``lon`` and ``lat`` are given in degrees. Default to `False`.
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` array of the shape of the result in which the
+        HEALPix cell indexes are written instead of allocating a new array. When
+        ``return_offsets`` is set, a tuple of 3 arrays (``ipix``, ``dx``, ``dy``), the
+        last two of dtype `np.float64`. With ``compact``, the dtypes are `np.uint32`
+        and `np.float32`.
+    compact : bool, optional
+        If set to `True`, the HEALPix cell indexes are returned as `np.uint32` and the
+        offsets as `np.float32`, halving the memory used by the result. Only available
+        for nsides up to 8192. Default to `False`.
+
+    Returns
+    -------
+    ipix : `numpy.ndarray`
+        A numpy array containing all the HEALPix cell indexes stored as `np.uint64`.
+
+    Raises
+    ------
+    ValueError
+        When the number of longitudes and latitudes given do not match.
+        When the latitudes are out of :math:`[-\pi/2, \pi/2]`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for an nside greater than 8192.
+
+    Examples
+    --------
+    >>> from cdshealpix.ring.fast import lonlat_to_healpix
+    >>> import numpy as np
+    >>> lon = np.array([0, 50, 25])
+    >>> lat = np.array([6, -12, 45])
+    >>> ipix = lonlat_to_healpix(lon, lat, 1 << 12, degrees=True)
+    """
+    lon, lat = _raw_lonlat(lon, lat, degrees)
+    nside = np.atleast_1d(nside)
+
+    _check_nside(nside)
+    if compact:
+        _check_compact_nside(nside)
+
+    lon, lat, nside = np.broadcast_arrays(lon, lat, nside)
+
+    ipix_dtype, offsets_dtype = _out_dtypes(compact)
+    if return_offsets:
+        ipix, dx, dy = _check_outs(
+            out, lon.shape, (ipix_dtype, offsets_dtype, offsets_dtype)
+        )
+    else:
+        ipix = _check_out(out, lon.shape, ipix_dtype)
+        # the offsets are not computed
+        dx = dy = None
+
+    cdshealpix.lonlat_to_healpix_ring(
+        nside.astype(np.uint32, copy=False),
+        lon,
+        lat,
+        ipix,
+        dx,
+        dy,
+        np.uint16(num_threads),
+    )
+
+    if return_offsets:
+        return ipix, dx, dy
+    return ipix
+
+
+def healpix_to_lonlat(
+    ipix,
+    nside,
+    dx=0.5,
+    dy=0.5,
+    *,
+    degrees=False,
+    num_threads=0,
+    out=None,
+    compact=False,
+):
+    r"""Get the longitudes and latitudes of the center of some HEALPix cells.
+
+    This is the equivalent of `cdshealpix.ring.healpix_to_lonlat` without astropy.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes given as a `np.uint64` numpy array.
+    nside : `numpy.ndarray`
+        The nside of the HEALPix cells.
+    dx : float, optional
+        The offset position :math:`\in [0, 1[` along the X axis. By default, `dx=0.5`
+    dy : float, optional
+        The offset position :math:`\in [0, 1[` along the Y axis. By default, `dy=0.5`
+    degrees : bool, optional
+        Set to `True` to get the coordinates in degrees. Default to `False` (radians).
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
+
+    Returns
+    -------
+    lon, lat : (`numpy.ndarray`, `numpy.ndarray`)
+        The longitudes, in :math:`[0, 2\pi[`, and latitudes of the positions.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes given have values out of :math:`[0, 12` x :math:`N_{side} ^ 2[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+
+    Examples
+    --------
+    >>> from cdshealpix.ring.fast import healpix_to_lonlat
+    >>> import numpy as np
+    >>> ipix = np.array([42, 6, 10])
+    >>> lon, lat = healpix_to_lonlat(ipix, 1 << 12, degrees=True)
+    """
+    ipix = np.atleast_1d(ipix)
+    nside = np.atleast_1d(nside)
+    _check_nside(nside)
+
+    if dx < 0 or dx >= 1:
+        raise ValueError("dx must be between [0, 1[")
+
+    if dy < 0 or dy >= 1:
+        raise ValueError("dy must be between [0, 1[")
+
+    ipix, nside = np.broadcast_arrays(ipix, nside)
+
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, ipix.shape, (coords_dtype, coords_dtype))
+
+    cdshealpix.healpix_to_lonlat_ring(
+        nside.astype(np.uint32, copy=False),
+        _as_hashes(ipix),
+        dx,
+        dy,
+        lon,
+        lat,
+        np.uint16(num_threads),
+    )
+
+    if degrees:
+        np.rad2deg(lon, out=lon)
+        np.rad2deg(lat, out=lat)
+    return lon, lat
+
+
+def vertices(
+    ipix, nside, step=1, *, degrees=False, num_threads=0, out=None, compact=False
+):
+    r"""Get the longitudes and latitudes of the vertices of some HEALPix cells.
+
+    This is the equivalent of `cdshealpix.ring.vertices` without astropy.
+
+    Parameters
+    ----------
+    ipix : `numpy.ndarray`
+        The HEALPix cell indexes given as a `np.uint64` numpy array.
+    nside : int
+        The nside of the HEALPix cells.
+    step : int, optional
+        The number of vertices returned per HEALPix side. By default it is set to 1 meaning that
+        it will only return the vertices of the cell. The number of vertices returned
+        is ``4 * step``.
+    degrees : bool, optional
+        Set to `True` to get the coordinates in degrees. Default to `False` (radians).
+    num_threads : int, optional
+        Specifies the number of threads to use for the computation. Default to 0 means
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
+
+    Returns
+    -------
+    lon, lat : (`numpy.ndarray`, `numpy.ndarray`)
+        Two :math:`N` x :math:`4 \times step` arrays where N is the number of HEALPix
+        cells given in `ipix`.
+
+    Raises
+    ------
+    ValueError
+        When the HEALPix cell indexes given have values out of :math:`[0, 12` x :math:`N_{side} ^ 2[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+
+    Examples
+    --------
+    >>> from cdshealpix.ring.fast import vertices
+    >>> import numpy as np
+    >>> lon, lat = vertices(np.array([42, 6, 10]), 1 << 12)
+    """
+    if nside < 1 or nside > (1 << 29):
+        raise ValueError("nside must be in the [1, (1 << 29)[ closed range")
+
+    if step < 1:
+        raise ValueError("The number of step must be >= 1")
+
+    ipix = np.atleast_1d(ipix)
+
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, (*ipix.shape, 4 * step), (coords_dtype, coords_dtype))
+
+    cdshealpix.vertices_ring(
+        nside,
+        _as_hashes(ipix),
+        step,
+        lon,
+        lat,
+        np.uint16(num_threads),
+    )
+
+    if degrees:
+        np.rad2deg(lon, out=lon)
+        np.rad2deg(lat, out=lat)
+    return lon, lat
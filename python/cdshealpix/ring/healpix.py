@@ -7,7 +7,15 @@ from astropy.coordinates import Latitude, Longitude, SkyCoord
 import numpy as np
 
 from .. import cdshealpix
-from ..utils import _validate_lonlat
+from ..utils import (
+    _COMPACT_MAX_DEPTH,
+    _as_hashes,
+    _check_out,
+    _check_outs,
+    _first_invalid,
+    _out_dtypes,
+    _validate_lonlat,
+)
 
 # Do not fill by hand :)
 # > egrep "^ *def" healpix.py | cut -c 5- | egrep -v '^_'| cut -d '(' -f 1 | sed -r "s/^(.*)$/ '\1'/" | tr '\n' ','
@@ -22,19 +30,32 @@ __all__ = [
 ]
 
 
-# Raise a ValueError exception if the input
-# HEALPix cells array contains invalid values
-def _check_ipixels(data, nside):
-    npix = 12 * (nside**2)
-    if (data >= npix).any() or (data < 0).any():
-        valid_ipix = np.stack((np.zeros(npix.shape), npix)).T
+def _check_nside(nside):
+    # The Rust kernels check the uint32 nsides they are given, only the values
+    # that would wrap around once cast to uint32 have to be rejected here.
+    nside = np.asarray(nside)
+    if nside.dtype == np.uint32 or nside.size == 0:
+        return
+    if nside.min() < 1 or nside.max() > (1 << 29):
+        index, value = _first_invalid((nside < 1) | (nside > (1 << 29)), nside)
         raise ValueError(
-            f"The input HEALPix array contains values out of {valid_ipix}."
+            f"nside must be in the [1, (1 << 29)[ closed range: {value} at index "
+            f"{index}."
+        )
+
+
+def _check_compact_nside(nside):
+    if np.max(nside) > (1 << _COMPACT_MAX_DEPTH):
+        raise ValueError(
+            "compact outputs are only available for nsides up to "
+            f"{1 << _COMPACT_MAX_DEPTH}"
         )
 
 
 @_validate_lonlat
-def lonlat_to_healpix(lon, lat, nside, return_offsets=False, num_threads=0):
+def lonlat_to_healpix(
+    lon, lat, nside, return_offsets=False, num_threads=0, *, out=None, compact=False
+):
     r"""Get the HEALPix indexes that contains specific sky coordinates.
 
     The ``nside`` of the returned HEALPix cell indexes must be specified. This
@@ -55,8 +76,17 @@ def lonlat_to_healpix(lon, lat, nside, return_offsets=False, num_threads=0):
         passed are located on the cells. ``dx`` and ``dy`` are :math:`\in [0, 1]`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` array of the shape of the result in which the
+        HEALPix cell indexes are written instead of allocating a new array. When
+        ``return_offsets`` is set, a tuple of 3 arrays (``ipix``, ``dx``, ``dy``), the
+        last two of dtype `np.float64`. With ``compact``, the dtypes are `np.uint32`
+        and `np.float32`.
+    compact : bool, optional
+        If set to `True`, the HEALPix cell indexes are returned as `np.uint32` and the
+        offsets as `np.float32`, halving the memory used by the result. Only available
+        for nsides up to 8192. Default to `False`.
 
     Returns
     -------
@@ -67,6 +97,8 @@ def lonlat_to_healpix(lon, lat, nside, return_offsets=False, num_threads=0):
     ------
     ValueError
         When the number of longitudes and latitudes given do not match.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for an nside greater than 8192.
 
     Examples
     --------
@@ -89,20 +121,27 @@ def lonlat_to_healpix(lon, lat, nside, return_offsets=False, num_threads=0):
     lat = np.atleast_1d(lat.rad)
     nside = np.atleast_1d(nside)
 
-    if (nside < 1).any() or (nside > (1 << 29)).any():
-        raise ValueError("nside must be in the [1, (1 << 29)[ closed range")
+    _check_nside(nside)
+    if compact:
+        _check_compact_nside(nside)
 
     # Broadcasting
     lon, lat, nside = np.broadcast_arrays(lon, lat, nside)
 
     # Allocation of the array containing the resulting coordinates
     num_ipix = lon.shape
-    ipix = np.empty(num_ipix, dtype=np.uint64)
-    dx = np.empty(num_ipix, dtype=np.float64)
-    dy = np.empty(num_ipix, dtype=np.float64)
+    ipix_dtype, offsets_dtype = _out_dtypes(compact)
+    if return_offsets:
+        ipix, dx, dy = _check_outs(
+            out, num_ipix, (ipix_dtype, offsets_dtype, offsets_dtype)
+        )
+    else:
+        ipix = _check_out(out, num_ipix, ipix_dtype)
+        # the offsets are not computed
+        dx = dy = None
 
     # Call the Rust extension
-    nside = nside.astype(np.uint32)
+    nside = nside.astype(np.uint32, copy=False)
     num_threads = np.uint16(num_threads)
     cdshealpix.lonlat_to_healpix_ring(nside, lon, lat, ipix, dx, dy, num_threads)
 
@@ -131,8 +170,7 @@ def skycoord_to_healpix(skycoord, nside, return_offsets=False, num_threads=0):
         passed are located in the cells. ``dx`` and ``dy`` are :math:`\in [0, 1]`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -163,7 +201,9 @@ def skycoord_to_healpix(skycoord, nside, return_offsets=False, num_threads=0):
     )
 
 
-def healpix_to_lonlat(ipix, nside, dx=0.5, dy=0.5, num_threads=0):
+def healpix_to_lonlat(
+    ipix, nside, dx=0.5, dy=0.5, num_threads=0, *, out=None, compact=False
+):
     r"""Get the longitudes and latitudes of the center of some HEALPix cells at a given depth.
 
     This method does the opposite transformation of `lonlat_to_healpix`.
@@ -182,8 +222,13 @@ def healpix_to_lonlat(ipix, nside, dx=0.5, dy=0.5, num_threads=0):
         The offset position :math:`\in [0, 1[` along the Y axis. By default, `dy=0.5`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes (in radians) are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
 
     Returns
     -------
@@ -194,6 +239,7 @@ def healpix_to_lonlat(ipix, nside, dx=0.5, dy=0.5, num_threads=0):
     ------
     ValueError
         When the HEALPix cell indexes given have values out of :math:`[0, 12` x :math:`N_{side} ^ 2[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
 
     Examples
     --------
@@ -207,8 +253,7 @@ def healpix_to_lonlat(ipix, nside, dx=0.5, dy=0.5, num_threads=0):
     # Check arrays
     ipix = np.atleast_1d(ipix)
     nside = np.atleast_1d(nside)
-    if (nside < 1).any() or (nside > (1 << 29)).any():
-        raise ValueError("nside must be in the [1, (1 << 29)[ closed range")
+    _check_nside(nside)
 
     if dx < 0 or dx >= 1:
         raise ValueError("dx must be between [0, 1[")
@@ -216,23 +261,21 @@ def healpix_to_lonlat(ipix, nside, dx=0.5, dy=0.5, num_threads=0):
     if dy < 0 or dy >= 1:
         raise ValueError("dy must be between [0, 1[")
 
-    _check_ipixels(data=ipix, nside=nside)
-
     # Broadcasting
     ipix, nside = np.broadcast_arrays(ipix, nside)
 
     size_skycoords = ipix.shape
     # Allocation of the array containing the resulting coordinates
-    lon = np.zeros(size_skycoords)
-    lat = np.zeros(size_skycoords)
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, size_skycoords, (coords_dtype, coords_dtype))
 
     # Call the Rust extension
-    nside = nside.astype(np.uint32)
-    ipix = ipix.astype(np.uint64)
+    nside = nside.astype(np.uint32, copy=False)
+    ipix = _as_hashes(ipix)
     num_threads = np.uint16(num_threads)
 
     cdshealpix.healpix_to_lonlat_ring(nside, ipix, dx, dy, lon, lat, num_threads)
-    return Longitude(lon, u.rad), Latitude(lat, u.rad)
+    return Longitude(lon, u.rad, copy=False), Latitude(lat, u.rad, copy=False)
 
 
 def healpix_to_skycoord(ipix, nside, dx=0.5, dy=0.5, num_threads=0):
@@ -256,8 +299,7 @@ def healpix_to_skycoord(ipix, nside, dx=0.5, dy=0.5, num_threads=0):
         The offset position :math:`\in [0, 1[` along the Y axis. By default, `dy=0.5`
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -294,8 +336,7 @@ def healpix_to_xy(ipix, nside, num_threads=0):
         The nside of the HEALPix cells
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
 
     Returns
     -------
@@ -317,28 +358,25 @@ def healpix_to_xy(ipix, nside, num_threads=0):
     ipix = np.atleast_1d(ipix)
     nside = np.atleast_1d(nside)
 
-    if (nside < 1).any() or (nside > (1 << 29)).any():
-        raise ValueError("nside must be in the [1, (1 << 29)[ closed range")
-
-    _check_ipixels(data=ipix, nside=nside)
+    _check_nside(nside)
 
     # Broadcasting
     ipix, nside = np.broadcast_arrays(ipix, nside)
 
     # Allocation for the resulting arrays
-    x = np.zeros(ipix.shape, dtype=np.float64)
-    y = np.zeros(ipix.shape, dtype=np.float64)
+    x = np.empty(ipix.shape, dtype=np.float64)
+    y = np.empty(ipix.shape, dtype=np.float64)
 
     # Call the Rust extension
-    ipix = ipix.astype(np.uint64)
-    nside = nside.astype(np.uint32)
+    ipix = _as_hashes(ipix)
+    nside = nside.astype(np.uint32, copy=False)
     num_threads = np.uint16(num_threads)
     cdshealpix.healpix_to_xy_ring(nside, ipix, x, y, num_threads)
 
     return x, y
 
 
-def vertices(ipix, nside, step=1, num_threads=0):
+def vertices(ipix, nside, step=1, num_threads=0, *, out=None, compact=False):
     """Get the longitudes and latitudes of the vertices of some HEALPix cells at a given nside.
 
     This method returns the 4 vertices of each cell in `ipix`.
@@ -358,8 +396,13 @@ def vertices(ipix, nside, step=1, num_threads=0):
         of vertices returned is ``4 * step``.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : tuple of `numpy.ndarray`, optional
+        Two C-contiguous `np.float64` arrays of the shape of the result in which the
+        longitudes and latitudes (in radians) are written instead of allocating new arrays.
+    compact : bool, optional
+        If set to `True`, the coordinates are computed as `np.float32` instead of
+        `np.float64`, ``out`` must then be of dtype `np.float32`. Default to `False`.
 
     Returns
     -------
@@ -376,6 +419,7 @@ def vertices(ipix, nside, step=1, num_threads=0):
     ------
     ValueError
         When the HEALPix cell indexes given have values out of :math:`[0, 12` x :math:`N_{side} ^ 2[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
 
     Examples
     --------
@@ -392,16 +436,15 @@ def vertices(ipix, nside, step=1, num_threads=0):
         raise ValueError("The number of step must be >= 1")
 
     ipix = np.atleast_1d(ipix)
-    _check_ipixels(data=ipix, nside=nside)
-    ipix = ipix.astype(np.uint64)
+    ipix = _as_hashes(ipix)
 
     # Allocation of the array containing the resulting coordinates
-    lon = np.zeros((*ipix.shape, 4 * step))
-    lat = np.zeros((*ipix.shape, 4 * step))
+    coords_dtype = _out_dtypes(compact)[1]
+    lon, lat = _check_outs(out, (*ipix.shape, 4 * step), (coords_dtype, coords_dtype))
     num_threads = np.uint16(num_threads)
 
     cdshealpix.vertices_ring(nside, ipix, step, lon, lat, num_threads)
-    return Longitude(lon, u.rad), Latitude(lat, u.rad)
+    return Longitude(lon, u.rad, copy=False), Latitude(lat, u.rad, copy=False)
 
 
 def vertices_skycoord(ipix, nside, step=1):
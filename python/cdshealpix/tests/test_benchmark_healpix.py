@@ -6,11 +6,14 @@ from astropy.coordinates import Latitude, Longitude
 import numpy as np
 import pytest
 
+from ..nested import fast
+from ..ring import fast as ring_fast
 from ..nested.healpix import (
     cone_search,
     healpix_to_lonlat,
     healpix_to_skycoord,
     lonlat_to_healpix,
+    lonlat_to_healpix_depths,
     neighbours,
     vertices,
 )
@@ -49,6 +52,23 @@ def test_lonlat_to_healpix_broadcast_multithread(benchmark):
     )
 
 
+@pytest.mark.benchmark(group="lonlat_to_healpix_broadcast")
+def test_lonlat_to_healpix_depths(benchmark):
+    size = 10000
+    depths = np.random.randint(low=0, high=29, size=10)
+
+    lon = Longitude(np.random.rand(size) * 360, u.deg)
+    lat = Latitude(np.random.rand(size) * 180 - 90, u.deg)
+
+    benchmark(
+        lonlat_to_healpix_depths,
+        lon=lon,
+        lat=lat,
+        depths=depths,
+        num_threads=1,
+    )
+
+
 @pytest.mark.benchmark(group="lonlat_to_healpix_broadcast")
 def test_lonlat_to_healpix_astropy_broadcast(benchmark):
     depth = np.random.randint(low=0, high=29, size=10)
@@ -87,6 +107,26 @@ def test_lonlat_to_healpix_multithread(benchmark):
     benchmark(lonlat_to_healpix, lon=lon, lat=lat, depth=depth)
 
 
+@pytest.mark.benchmark(group="lonlat_to_healpix")
+def test_lonlat_to_healpix_fast(benchmark):
+    size = 10000
+    depth = 12
+    lon = np.random.rand(size) * 360
+    lat = np.random.rand(size) * 180 - 90
+
+    benchmark(fast.lonlat_to_healpix, lon=lon, lat=lat, depth=depth, degrees=True)
+
+
+@pytest.mark.benchmark(group="lonlat_to_healpix")
+def test_lonlat_to_healpix_ring_fast(benchmark):
+    size = 10000
+    nside = 1 << 12
+    lon = np.random.rand(size) * 360
+    lat = np.random.rand(size) * 180 - 90
+
+    benchmark(ring_fast.lonlat_to_healpix, lon=lon, lat=lat, nside=nside, degrees=True)
+
+
 @pytest.mark.benchmark(group="lonlat_to_healpix")
 def test_lonlat_to_healpix_astropy(benchmark):
     size = 10000
@@ -162,6 +202,24 @@ def test_healpix_to_lonlat_multithread(benchmark):
     benchmark(healpix_to_lonlat, ipix=ipixels, depth=depth)
 
 
+@pytest.mark.benchmark(group="healpix_to_lonlat")
+def test_healpix_to_lonlat_fast(benchmark):
+    size = 10000
+    depth = 12
+    ipixels = np.random.randint(12 * 4 ** (depth), size=size)
+
+    benchmark(fast.healpix_to_lonlat, ipix=ipixels, depth=depth, degrees=True)
+
+
+@pytest.mark.benchmark(group="healpix_to_lonlat")
+def test_healpix_to_lonlat_ring_fast(benchmark):
+    size = 10000
+    nside = 1 << 12
+    ipixels = np.random.randint(12 * nside**2, size=size)
+
+    benchmark(ring_fast.healpix_to_lonlat, ipix=ipixels, nside=nside, degrees=True)
+
+
 @pytest.mark.benchmark(group="healpix_to_lonlat")
 def test_healpix_to_lonlat_astropy(benchmark):
     size = 10000
@@ -199,6 +257,15 @@ def test_healpix_vertices_lonlat_multithread(benchmark):
     lon, lat = benchmark(vertices, ipix=ipixels, depth=depth)
 
 
+@pytest.mark.benchmark(group="vertices")
+def test_healpix_vertices_lonlat_fast(benchmark):
+    depth = 12
+    size = 100000
+    ipixels = np.random.randint(12 * 4 ** (depth), size=size)
+
+    lon, lat = benchmark(fast.vertices, ipix=ipixels, depth=depth)
+
+
 @pytest.mark.benchmark(group="vertices")
 def test_healpix_vertices_lonlat_astropy(benchmark):
     depth = 12
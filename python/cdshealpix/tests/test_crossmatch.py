@@ -0,0 +1,57 @@
+import astropy.units as u
+from astropy.coordinates import Latitude, Longitude, angular_separation
+
+import numpy as np
+import pytest
+
+from .. import crossmatch
+
+
+def _random_catalog(size):
+    lon = Longitude(np.random.rand(size) * 360, u.deg)
+    lat = Latitude(np.arcsin(np.random.rand(size) * 2 - 1), u.rad)
+    return lon, lat
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1 << 20])
+def test_crossmatch(chunk_size):
+    lon1, lat1 = _random_catalog(300)
+    lon2, lat2 = _random_catalog(3000)
+    radius = 3 * u.deg
+
+    chunks = list(crossmatch(lon1, lat1, lon2, lat2, radius, chunk_size=chunk_size))
+    assert len(chunks) == -(-300 // chunk_size)
+    idx1 = np.concatenate([c[0] for c in chunks])
+    idx2 = np.concatenate([c[1] for c in chunks])
+    distance = np.concatenate([c[2].rad for c in chunks])
+
+    separation = angular_separation(
+        lon1[:, np.newaxis], lat1[:, np.newaxis], lon2, lat2
+    )
+    expected1, expected2 = np.nonzero(separation <= radius)
+    order = np.lexsort((idx2, idx1))
+    np.testing.assert_array_equal(idx1[order], expected1)
+    np.testing.assert_array_equal(idx2[order], expected2)
+    np.testing.assert_allclose(
+        distance[order], separation[expected1, expected2].rad, atol=1e-12
+    )
+    # sorted by the first catalog, then by distance
+    assert (np.diff(idx1.astype(np.int64)) >= 0).all()
+
+
+def test_crossmatch_float32():
+    lon = Longitude(np.array([0, 10, 20], dtype=np.float32), u.deg)
+    lat = Latitude(np.array([0, 10, 20], dtype=np.float32), u.deg)
+    ((idx1, idx2, distance),) = crossmatch(lon, lat, lon, lat, 1 * u.arcsec)
+    np.testing.assert_array_equal(idx1, [0, 1, 2])
+    np.testing.assert_array_equal(idx2, [0, 1, 2])
+
+
+def test_crossmatch_exceptions():
+    lon, lat = _random_catalog(10)
+    with pytest.raises(ValueError, match="`radius` must be in"):
+        crossmatch(lon, lat, lon, lat, 40 * u.deg)
+    with pytest.raises(ValueError, match="`radius` must be of type"):
+        crossmatch(lon, lat, lon, lat, 1)
+    with pytest.raises(ValueError, match="should have the same shape"):
+        crossmatch(lon, lat, lon[:5], lat, 1 * u.deg)
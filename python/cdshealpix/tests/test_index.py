@@ -0,0 +1,151 @@
+import astropy.units as u
+from astropy.coordinates import Latitude, Longitude, angular_separation
+
+import numpy as np
+import pytest
+
+from ..index import HealpixIndex
+from ..nested import points_in_polygons
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    lon = Longitude(np.random.rand(20000) * 360, u.deg)
+    lat = Latitude(np.arcsin(np.random.rand(20000) * 2 - 1), u.rad)
+    return lon, lat, HealpixIndex(lon, lat)
+
+
+def test_healpix_index(catalog):
+    lon, lat, index = catalog
+    assert len(index) == 20000
+    assert (np.diff(index.hashes.astype(np.float64)) >= 0).all()
+    np.testing.assert_array_equal(np.sort(index.rows), np.arange(20000))
+
+
+@pytest.mark.parametrize("depth", [None, 4, 10])
+def test_cone_search(catalog, depth):
+    lon, lat, index = catalog
+    center_lon, center_lat = Longitude(30, u.deg), Latitude(40, u.deg)
+    rows = index.cone_search(center_lon, center_lat, 5 * u.deg, depth=depth)
+    separation = angular_separation(lon, lat, center_lon, center_lat)
+    np.testing.assert_array_equal(rows, np.nonzero(separation <= 5 * u.deg)[0])
+
+
+def test_polygon_search(catalog):
+    lon, lat, index = catalog
+    poly_lon = Longitude([0, 20, 20, 0], u.deg)
+    poly_lat = Latitude([0, 0, 20, 20], u.deg)
+    rows = index.polygon_search(poly_lon, poly_lat)
+    expected, _ = points_in_polygons(lon, lat, poly_lon, poly_lat, [0, 4], 6)
+    np.testing.assert_array_equal(rows, expected)
+
+    with pytest.raises(ValueError, match="3 distinct vertices"):
+        index.polygon_search(poly_lon[[0, 0, 1]], poly_lat[[0, 0, 1]])
+
+
+def _unit_vectors(lon, lat):
+    return np.stack(
+        (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1
+    )
+
+
+@pytest.mark.parametrize("depth", [None, 4, 10])
+def test_box_search(catalog, depth):
+    lon, lat, index = catalog
+    rows = index.box_search(
+        Longitude(30, u.deg),
+        Latitude(40, u.deg),
+        10 * u.deg,
+        5 * u.deg,
+        30 * u.deg,
+        depth=depth,
+    )
+
+    # the corners of the box, from the center and the directions of its axes
+    a, b, angle = np.radians([10, 5, 30])
+    center = _unit_vectors(np.radians(30), np.radians(40))
+    north = _unit_vectors(np.radians(30) + np.pi, np.radians(90 - 40))
+    east = np.cross(north, center)
+    major = np.cos(angle) * north + np.sin(angle) * east
+    minor = np.cross(major, center)
+    # the sides cross the major axis at `a` from the center and the minor one at `b`
+    t = np.arctan(np.cos(a) * np.tan(b))
+    corners = np.array(
+        [
+            np.cos(t) * (np.cos(a) * center + s * np.sin(a) * major)
+            + v * np.sin(t) * minor
+            for s, v in ((1, 1), (-1, 1), (-1, -1), (1, -1))
+        ]
+    )
+    # the points on the same side of the great circles of the sides as the center
+    normals = np.cross(corners, np.roll(corners, -1, axis=0))
+    sides = _unit_vectors(lon.rad, lat.rad) @ normals.T * (center @ normals.T)
+    np.testing.assert_array_equal(rows, np.nonzero((sides >= 0).all(axis=1))[0])
+
+
+@pytest.mark.parametrize(("lon_min", "lon_max"), [(10, 50), (350, 10), (300, 0)])
+def test_zone_search(catalog, lon_min, lon_max):
+    lon, lat, index = catalog
+    rows = index.zone_search(
+        Longitude(lon_min, u.deg),
+        Latitude(-20, u.deg),
+        Longitude(lon_max, u.deg),
+        Latitude(30, u.deg),
+    )
+    in_lon = (lon.deg >= lon_min) & (lon.deg < (lon_max or 360))
+    if lon_min > lon_max > 0:
+        in_lon = (lon.deg >= lon_min) | (lon.deg < lon_max)
+    in_lat = (lat.deg >= -20) & (lat.deg < 30)
+    np.testing.assert_array_equal(rows, np.nonzero(in_lon & in_lat)[0])
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load(catalog, tmp_path, mmap):
+    lon, lat, index = catalog
+    index.save(tmp_path / "index.bin")
+    loaded = HealpixIndex.load(tmp_path / "index.bin", mmap=mmap)
+    assert len(loaded) == 20000
+    np.testing.assert_array_equal(loaded.hashes, index.hashes)
+    np.testing.assert_array_equal(loaded.rows, index.rows)
+    np.testing.assert_array_equal(
+        loaded.cone_search(Longitude(30, u.deg), Latitude(40, u.deg), 5 * u.deg),
+        index.cone_search(Longitude(30, u.deg), Latitude(40, u.deg), 5 * u.deg),
+    )
+
+
+def test_save_load_empty(tmp_path):
+    index = HealpixIndex(Longitude([], u.deg), Latitude([], u.deg))
+    index.save(tmp_path / "index.bin")
+    loaded = HealpixIndex.load(tmp_path / "index.bin")
+    assert len(loaded) == 0
+    rows = loaded.cone_search(Longitude(30, u.deg), Latitude(40, u.deg), 5 * u.deg)
+    assert rows.size == 0
+
+
+def test_load_invalid(tmp_path):
+    (tmp_path / "index.bin").write_bytes(b"NOTINDEX" + bytes(128))
+    with pytest.raises(ValueError, match="not a HEALPix index file"):
+        HealpixIndex.load(tmp_path / "index.bin")
+
+
+@pytest.mark.parametrize("k", [1, 5, 100])
+def test_knn_search(catalog, k):
+    lon, lat, index = catalog
+    query_lon = Longitude(np.random.rand(50) * 360, u.deg)
+    query_lat = Latitude(np.arcsin(np.random.rand(50) * 2 - 1), u.rad)
+    rows, distance = index.knn_search(query_lon, query_lat, k)
+    assert rows.shape == distance.shape == (50, k)
+
+    separation = angular_separation(
+        lon.rad, lat.rad, query_lon.rad[:, None], query_lat.rad[:, None]
+    )
+    expected = np.sort(separation, axis=1)[:, :k]
+    np.testing.assert_allclose(distance.rad, expected, atol=1e-12)
+    np.testing.assert_allclose(
+        np.take_along_axis(separation, rows.astype(np.intp), axis=1),
+        distance.rad,
+        atol=1e-12,
+    )
+
+    with pytest.raises(ValueError, match="`k` must be in"):
+        index.knn_search(query_lon, query_lat, 20001)
@@ -1,34 +1,65 @@
 # Standard Library
 import pathlib
 import re
+import threading
+import time
 
 # Astropy tools
 # General Astronomy tools
 import astropy.units as u
-from astropy.coordinates import Angle, Latitude, Longitude, SkyCoord
+from astropy.coordinates import Angle, Latitude, Longitude, SkyCoord, angular_separation
 
 import numpy as np
 import pytest
 
 from .. import from_ring, to_ring
+from ..nested import fast
 from ..nested.healpix import (
     bilinear_interpolation,
+    children_range,
     cone_search,
+    cone_search_batch,
+    coverage_border,
+    coverage_complement,
+    coverage_contains,
+    coverage_contains_ipix,
+    coverage_difference,
+    coverage_dilate,
+    coverage_erode,
+    coverage_intersection,
+    coverage_simplify,
+    coverage_union,
     box_search,
+    box_search_batch,
     zone_search,
+    zone_search_batch,
     elliptical_cone_search,
+    elliptical_cone_search_batch,
     external_neighbours,
+    from_uniq,
+    from_zuniq,
     healpix_to_lonlat,
     healpix_to_skycoord,
     healpix_to_xy,
     lonlat_to_healpix,
+    lonlat_to_healpix_depths,
     lonlat_to_xy,
     neighbours,
+    points_in_cones,
+    points_in_ellipses,
+    points_in_polygons,
     polygon_search,
+    polygon_search_batch,
     skycoord_to_healpix,
+    to_parent,
+    to_uniq,
+    to_zuniq,
+    group_by_healpix,
+    sort_by_healpix,
     vertices,
     xy_to_lonlat,
 )
+from ..regions import Cone, Zone
 
 
 @pytest.mark.parametrize("size", [1, 10, 100])
@@ -52,6 +83,129 @@ def test_lonlat_to_healpix(size):
     assert ((dy >= 0) & (dy <= 1)).all()
 
 
+@pytest.mark.parametrize("depth", [0, 7, 29])
+def test_sort_by_healpix(depth):
+    lon = Longitude(np.random.rand(200000) * 360, u.deg)
+    lat = Latitude(np.arcsin(np.random.rand(200000) * 2 - 1), u.rad)
+    order, ipix = sort_by_healpix(lon, lat, depth)
+
+    expected = lonlat_to_healpix(lon, lat, depth)
+    np.testing.assert_array_equal(order, np.argsort(expected, kind="stable"))
+    np.testing.assert_array_equal(ipix, expected[order.astype(np.intp)])
+
+    order, ipix = sort_by_healpix(lon[:0], lat[:0], depth)
+    assert order.size == ipix.size == 0
+
+
+@pytest.mark.parametrize("depth", [3, 20])
+def test_group_by_healpix(depth):
+    lon = Longitude(np.random.rand(100000) * 360, u.deg)
+    lat = Latitude(np.arcsin(np.random.rand(100000) * 2 - 1), u.rad)
+    values = np.random.rand(100000)
+    expected_ipix, inverse, expected_counts = np.unique(
+        lonlat_to_healpix(lon, lat, depth), return_inverse=True, return_counts=True
+    )
+
+    ipix, counts = group_by_healpix(lon, lat, depth)
+    np.testing.assert_array_equal(ipix, expected_ipix)
+    np.testing.assert_array_equal(counts, expected_counts)
+
+    sums = np.bincount(inverse, weights=values)
+    _, aggregate = group_by_healpix(lon, lat, depth, values, reduce="sum")
+    np.testing.assert_allclose(aggregate, sums)
+    _, aggregate = group_by_healpix(lon, lat, depth, values, reduce="mean")
+    np.testing.assert_allclose(aggregate, sums / expected_counts)
+    _, aggregate = group_by_healpix(lon, lat, depth, values, reduce="max")
+    maxima = np.full(expected_ipix.size, -np.inf)
+    np.maximum.at(maxima, inverse, values)
+    np.testing.assert_array_equal(aggregate, maxima)
+
+    with pytest.raises(ValueError, match="are required"):
+        group_by_healpix(lon, lat, depth, reduce="min")
+    with pytest.raises(ValueError, match="Unknown reduction"):
+        group_by_healpix(lon, lat, depth, values, reduce="median")
+
+
+def test_lonlat_to_healpix_depths():
+    depths = np.array([0, 5, 8, 11, 14, 29])
+    lon = Longitude(np.random.rand(10000) * 360, u.deg).reshape(100, 100)
+    lat = Latitude(np.arcsin(np.random.rand(10000) * 2 - 1), u.rad).reshape(100, 100)
+    ipix, dx, dy = lonlat_to_healpix_depths(lon, lat, depths, return_offsets=True)
+    assert ipix.shape == dx.shape == dy.shape == (100, 100, 6)
+
+    for k, depth in enumerate(depths):
+        expected, expected_dx, expected_dy = lonlat_to_healpix(
+            lon, lat, depth, return_offsets=True
+        )
+        np.testing.assert_array_equal(ipix[..., k], expected)
+        np.testing.assert_allclose(dx[..., k], expected_dx, atol=1e-9)
+        np.testing.assert_allclose(dy[..., k], expected_dy, atol=1e-9)
+
+    np.testing.assert_array_equal(lonlat_to_healpix_depths(lon, lat, depths), ipix)
+    with pytest.raises(ValueError, match="Depth must be in"):
+        lonlat_to_healpix_depths(lon, lat, [5, 30])
+
+
+def _mixed_depth_cells(size=10000):
+    depth = np.random.randint(0, 30, size=size)
+    ipix = np.random.randint(0, 12 << (2 * depth)).astype(np.uint64)
+    return ipix, depth.astype(np.uint8)
+
+
+def test_to_parent_children_range():
+    ipix, depth = _mixed_depth_cells()
+    parent_depth = (depth * np.random.rand(depth.size)).astype(np.uint8)
+    parent = to_parent(ipix, depth, parent_depth)
+    shift = 2 * (depth - parent_depth).astype(np.uint64)
+    np.testing.assert_array_equal(parent, ipix >> shift)
+
+    start, end = children_range(parent, parent_depth, depth)
+    assert ((start <= ipix) & (ipix < end)).all()
+    np.testing.assert_array_equal(end - start, np.uint64(1) << shift)
+
+    ipix, depth = ipix[depth >= 3], depth[depth >= 3]
+    out = np.empty(ipix.shape, dtype=np.uint32)
+    assert to_parent(ipix, depth, 3, out=out, compact=True) is out
+    np.testing.assert_array_equal(out, to_parent(ipix, depth, 3))
+
+    with pytest.raises(ValueError, match="parent depth must not be greater"):
+        to_parent(np.array([1, 2]), 4, np.array([4, 5]))
+    with pytest.raises(ValueError, match="child depth must be in"):
+        children_range(np.array([1, 2]), 4, np.array([4, 3]))
+    with pytest.raises(ValueError, match="out of"):
+        to_parent(np.array([12 * 4**4]), 4, 2)
+
+
+def test_uniq_zuniq():
+    ipix, depth = _mixed_depth_cells()
+    uniq = to_uniq(ipix, depth)
+    np.testing.assert_array_equal(uniq, (np.uint64(4) << 2 * depth) + ipix)
+    decoded_ipix, decoded_depth = from_uniq(uniq)
+    np.testing.assert_array_equal(decoded_ipix, ipix)
+    np.testing.assert_array_equal(decoded_depth, depth)
+
+    zuniq = to_zuniq(ipix, depth)
+    decoded_ipix, decoded_depth = from_zuniq(zuniq)
+    np.testing.assert_array_equal(decoded_ipix, ipix)
+    np.testing.assert_array_equal(decoded_depth, depth)
+    # the index of a cell lies among those of its descendants
+    start, end = children_range(ipix, depth, 29)
+    assert (to_zuniq(start, 29) <= zuniq).all()
+    assert (zuniq <= to_zuniq(end - np.uint64(1), 29)).all()
+
+    ipix, depth = ipix[depth <= 13], depth[depth <= 13]
+    uniq = to_uniq(ipix, depth, compact=True)
+    assert uniq.dtype == np.uint32
+    np.testing.assert_array_equal(from_uniq(uniq, compact=True)[0], ipix)
+
+    with pytest.raises(ValueError, match="UNIQ array contains invalid values"):
+        from_uniq(np.array([4, 3]))
+    with pytest.raises(ValueError, match="ZUNIQ array contains invalid values"):
+        from_zuniq(np.array([1, 2]))
+    with pytest.raises(ValueError, match="compact outputs"):
+        from_uniq(np.array([4, 1 << 40]), compact=True)
+
+
 # regression test for issue #35
 def test_lonlat_to_healpix_float32():
     healpix = lonlat_to_healpix(
@@ -63,6 +217,121 @@ def test_lonlat_to_healpix_float32():
     assert healpix[0] == 76
 
 
+def test_float32_coordinates_are_read_in_place():
+    lon = (np.random.rand(1000) * 2 * np.pi).astype(np.float32)
+    lat = ((np.random.rand(1000) - 0.5) * np.pi).astype(np.float32)
+    expected = lonlat_to_healpix(
+        Longitude(lon.astype(np.float64), u.rad),
+        Latitude(lat.astype(np.float64), u.rad),
+        12,
+    )
+    np.testing.assert_array_equal(
+        lonlat_to_healpix(Longitude(lon, u.rad), Latitude(lat, u.rad), 12), expected
+    )
+    np.testing.assert_array_equal(fast.lonlat_to_healpix(lon, lat, 12), expected)
+
+
+@pytest.mark.parametrize("dtype", [np.int32, np.uint32, np.int64, np.uint64])
+def test_integer_hashes_are_read_in_place(dtype):
+    depth = 10
+    ipix = np.arange(0, 12 * 4**depth, 997)
+    lon, lat = fast.healpix_to_lonlat(ipix.astype(np.uint64), depth)
+    lon_dtype, lat_dtype = fast.healpix_to_lonlat(ipix.astype(dtype), depth)
+    np.testing.assert_array_equal(lon_dtype, lon)
+    np.testing.assert_array_equal(lat_dtype, lat)
+    np.testing.assert_array_equal(
+        neighbours(ipix.astype(dtype), depth), neighbours(ipix, depth)
+    )
+    if np.issubdtype(dtype, np.signedinteger):
+        with pytest.raises(ValueError, match=re.escape(": -5 at index [1].")):
+            to_ring(np.array([0, -5], dtype=dtype), depth)
+
+
+class _Counter(threading.Thread):
+    """A Python loop counting its iterations until it is stopped."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.count = 0
+        self.stopped = False
+
+    def run(self):
+        while not self.stopped:
+            self.count += 1
+
+
+def _random_lonlat(size):
+    lon = Longitude(np.random.rand(size) * 360, u.deg)
+    lat = Latitude(np.random.rand(size) * 180 - 90, u.deg)
+    return lon, lat
+
+
+def test_lonlat_to_healpix_releases_the_gil():
+    lon, lat = _random_lonlat(4_000_000)
+    small_lon, small_lat = _random_lonlat(100)
+    barrier = threading.Barrier(2)
+    interval, ends = [], []
+
+    def convert():
+        barrier.wait()
+        start = time.perf_counter()
+        lonlat_to_healpix(lon, lat, 29, num_threads=1)
+        interval.extend((start, time.perf_counter()))
+
+    def convert_small():
+        barrier.wait()
+        while not interval:
+            lonlat_to_healpix(small_lon, small_lat, 29)
+            ends.append(time.perf_counter())
+
+    # retried, as the measures depend on the load of the machine
+    for _ in range(3):
+        interval.clear()
+        ends.clear()
+        threads = [
+            threading.Thread(target=convert),
+            threading.Thread(target=convert_small),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        start, end = interval
+        ticks = [start] + [tick for tick in ends if start < tick < end] + [end]
+        # if the GIL was held by the Rust kernel, no small conversion would end
+        # while the large one is computed
+        if np.diff(ticks).max() < (end - start) / 2:
+            break
+    else:
+        pytest.fail("The conversions of two Python threads did not overlap")
+
+
+def test_lonlat_to_healpix_lets_python_threads_run():
+    lon, lat = _random_lonlat(4_000_000)
+    counter = _Counter()
+    counter.start()
+    try:
+        # retried, as the measures depend on the load of the machine
+        for _ in range(3):
+            # the speed of the loop while the main thread sleeps without the GIL
+            count, start = counter.count, time.perf_counter()
+            time.sleep(0.1)
+            speed = (counter.count - count) / (time.perf_counter() - start)
+
+            count, start = counter.count, time.perf_counter()
+            lonlat_to_healpix(lon, lat, 29, num_threads=1)
+            expected = speed * (time.perf_counter() - start)
+            # if the GIL was held by the Rust kernel, the loop would only run during
+            # the switch intervals of the Python code around the kernel
+            if counter.count - count > expected / 4:
+                break
+        else:
+            pytest.fail("A Python thread was blocked during the conversions")
+    finally:
+        counter.stopped = True
+        counter.join()
+
+
 @pytest.mark.parametrize("size", [1, 10, 100])
 def test_healpix_to_lonlat(size):
     depth = np.random.randint(30)
@@ -109,6 +378,14 @@ def test_invalid_depth_exception():
         neighbours(ipix, -2)
     with pytest.raises(ValueError, match=match):
         cone_search(Longitude(0, u.deg), Latitude(0, u.deg), 15 * u.deg, -2)
+    # the first invalid depth is reported, by the Rust kernels for uint8 depths
+    for dtype in (np.int64, np.uint8):
+        with pytest.raises(ValueError, match=re.escape(": 30 at index [1, 0].")):
+            lonlat_to_healpix(
+                Longitude([0, 1], u.deg)[:, np.newaxis],
+                Latitude([0, 1], u.deg)[:, np.newaxis],
+                np.array([[5, 6], [30, 31]], dtype=dtype),
+            )
 
 
 def test_lonlat_shape_exception():
@@ -139,12 +416,157 @@ def test_invalid_ipix_exception(depth):
         neighbours(invalid_ipix1, depth)
 
 
+def test_invalid_ipix_exception_reports_the_first_invalid_value():
+    depth = 1
+    ipix = np.array([[0, 3], [50, -20]])
+    with pytest.raises(ValueError, match=re.escape("[0, 48[: 50 at index [1, 0].")):
+        healpix_to_lonlat(ipix, depth)
+    with pytest.raises(ValueError, match=re.escape("[0, 48[: -20 at index [0].")):
+        to_ring(np.array([-20, 50]), depth)
+    with pytest.raises(ValueError, match=re.escape("[0, 12[: 12 at index [1, 1].")):
+        healpix_to_xy(np.array([[0, 11], [1, 12]]), np.array([1, 0]))
+
+
+def test_out_parameters(tmp_path):
+    ipix = np.arange(12)
+    lon_out, lat_out = np.empty(12), np.empty(12)
+    lon, lat = healpix_to_lonlat(ipix, 0, out=(lon_out, lat_out))
+    assert np.shares_memory(lon, lon_out) and np.shares_memory(lat, lat_out)
+    expected_lon, expected_lat = healpix_to_lonlat(ipix, 0)
+    np.testing.assert_array_equal(lon_out, expected_lon.rad)
+    np.testing.assert_array_equal(lat_out, expected_lat.rad)
+    # write in a slice of a bigger memory-mapped array
+    buffer = np.memmap(
+        tmp_path / "neighbours", dtype=np.int64, mode="w+", shape=(2, 12, 9)
+    )
+    neighbours(ipix, 0, out=buffer[1])
+    np.testing.assert_array_equal(buffer[1], neighbours(ipix, 0))
+    ipix_ring = np.empty(12, dtype=np.uint64)
+    to_ring(ipix, 0, out=ipix_ring)
+    np.testing.assert_array_equal(from_ring(ipix_ring, 0), ipix)
+    # the hashes are the same whether the offsets are computed or not
+    lon, lat = healpix_to_lonlat(ipix, 0)
+    ipix_out = np.empty(12, dtype=np.uint64)
+    lonlat_to_healpix(lon, lat, 3, out=ipix_out)
+    expected, _, _ = lonlat_to_healpix(lon, lat, 3, return_offsets=True)
+    np.testing.assert_array_equal(ipix_out, expected)
+
+
+def test_out_parameters_exceptions():
+    ipix = np.arange(12)
+    with pytest.raises(ValueError, match="out must be of dtype uint64"):
+        to_ring(ipix, 0, out=np.empty(12, dtype=np.int64))
+    with pytest.raises(ValueError, match=re.escape("out must be of shape (12, 9)")):
+        neighbours(ipix, 0, out=np.empty((12, 8), dtype=np.int64))
+    with pytest.raises(ValueError, match="out must be C-contiguous"):
+        to_ring(ipix, 0, out=np.empty(24, dtype=np.uint64)[::2])
+    with pytest.raises(ValueError, match="out must be a tuple of 2"):
+        vertices(ipix, 0, out=np.empty((12, 4)))
+
+
+def test_compact_outputs():
+    depth = 13
+    lon = Longitude(np.random.rand(1000) * 360, u.deg)
+    lat = Latitude(np.random.rand(1000) * 180 - 90, u.deg)
+    ipix, dx, dy = lonlat_to_healpix(lon, lat, depth, return_offsets=True)
+    ipix32, dx32, dy32 = lonlat_to_healpix(
+        lon, lat, depth, return_offsets=True, compact=True
+    )
+    assert (ipix32.dtype, dx32.dtype, dy32.dtype) == (np.uint32, np.float32, np.float32)
+    np.testing.assert_array_equal(ipix32, ipix)
+    np.testing.assert_array_equal(dx32, dx.astype(np.float32))
+
+    lon32, lat32 = healpix_to_lonlat(ipix, depth, compact=True)
+    assert lon32.dtype == lat32.dtype == np.float32
+    lon64, lat64 = healpix_to_lonlat(ipix, depth)
+    np.testing.assert_array_equal(lon32.rad, lon64.rad.astype(np.float32))
+
+    lon32, _ = vertices(ipix, depth, compact=True)
+    assert lon32.dtype == np.float32
+
+    n32 = neighbours(ipix, depth, compact=True)
+    assert n32.dtype == np.int32
+    np.testing.assert_array_equal(n32, neighbours(ipix, depth))
+
+    ipix_ring = to_ring(ipix, depth, compact=True)
+    assert ipix_ring.dtype == np.uint32
+    np.testing.assert_array_equal(ipix_ring, to_ring(ipix, depth))
+
+    edges, corners = external_neighbours(ipix, 11, 2, compact=True)
+    assert (edges.dtype, corners.dtype) == (np.uint32, np.int32)
+
+    cells, _, _ = cone_search(lon[0], lat[0], 1 * u.deg, depth, compact=True)
+    assert cells.dtype == np.uint32
+    np.testing.assert_array_equal(
+        cells, cone_search(lon[0], lat[0], 1 * u.deg, depth)[0]
+    )
+
+
+def test_compact_outputs_exceptions():
+    lon = Longitude([1], u.deg)
+    lat = Latitude([1], u.deg)
+    with pytest.raises(ValueError, match="only available for depths up to 13"):
+        lonlat_to_healpix(lon, lat, 14, compact=True)
+    with pytest.raises(ValueError, match="only available for depths up to 13"):
+        external_neighbours(np.array([0]), 12, 2, compact=True)
+    with pytest.raises(ValueError, match="only available for depths up to 13"):
+        cone_search(lon[0], lat[0], 1 * u.deg, 14, compact=True)
+    with pytest.raises(ValueError, match="out must be of dtype uint32"):
+        to_ring(np.array([0]), 5, out=np.empty(1, dtype=np.uint64), compact=True)
+
+
 def test_healpix_to_skycoord():
     ipix = np.array([0, 2, 4])
     skycoord = healpix_to_skycoord(ipix=ipix, depth=0)
     assert skycoord.icrs.ra.shape == skycoord.icrs.dec.shape
 
 
+@pytest.mark.parametrize("degrees", [False, True])
+def test_fast_lonlat_to_healpix_matches_astropy_path(degrees):
+    depth = np.random.randint(30)
+    lon = Longitude(np.random.rand(1000) * 360, u.deg)
+    lat = Latitude(np.random.rand(1000) * 180 - 90, u.deg)
+
+    expected = lonlat_to_healpix(lon, lat, depth, return_offsets=True)
+    if degrees:
+        result = fast.lonlat_to_healpix(
+            lon.deg, lat.deg, depth, return_offsets=True, degrees=True
+        )
+    else:
+        result = fast.lonlat_to_healpix(lon.rad, lat.rad, depth, return_offsets=True)
+    np.testing.assert_array_equal(result[0], expected[0])
+    np.testing.assert_allclose(result[1], expected[1])
+    np.testing.assert_allclose(result[2], expected[2])
+
+
+def test_fast_healpix_to_lonlat_matches_astropy_path():
+    depth = np.array([3, 12])
+    ipix = np.array([42, 6, 10])
+    lon, lat = healpix_to_lonlat(ipix[:, np.newaxis], depth[np.newaxis, :])
+    lon_fast, lat_fast = fast.healpix_to_lonlat(
+        ipix[:, np.newaxis], depth[np.newaxis, :], degrees=True
+    )
+    assert isinstance(lon_fast, np.ndarray) and not isinstance(lon_fast, u.Quantity)
+    np.testing.assert_allclose(lon_fast, lon.deg)
+    np.testing.assert_allclose(lat_fast, lat.deg)
+
+    lon, lat = vertices(ipix, 12, step=2)
+    lon_fast, lat_fast = fast.vertices(ipix, 12, step=2)
+    np.testing.assert_allclose(lon_fast, lon.rad)
+    np.testing.assert_allclose(lat_fast, lat.rad)
+
+
+def test_fast_exceptions():
+    with pytest.raises(ValueError, match="Latitudes must be in the"):
+        fast.lonlat_to_healpix([0.0], [91.0], 5, degrees=True)
+    with pytest.raises(ValueError, match="should have the same shape"):
+        fast.lonlat_to_healpix([0.0, 1.0], [0.0], 5)
+    with pytest.raises(ValueError, match="Depth must be in the"):
+        fast.lonlat_to_healpix([0.0], [0.0], 30)
+    with pytest.raises(ValueError, match="out of"):
+        fast.healpix_to_lonlat([12], 0)
+
+
 def test_vertices_lonlat():
     depth = 12
     size = 10000
@@ -189,6 +611,148 @@ def test_cone_search():
         )
 
 
+@pytest.mark.parametrize("flat", [False, True])
+def test_cone_search_batch(flat):
+    lon = Longitude(np.random.rand(20) * 360, u.deg)
+    lat = Latitude(np.random.rand(20) * 180 - 90, u.deg)
+    radius = np.random.rand(20) * 2 * u.deg
+    ipix, depth, full, offsets = cone_search_batch(lon, lat, radius, 10, flat=flat)
+    assert offsets.shape == (21,) and offsets[0] == 0 and offsets[-1] == ipix.size
+    for i in range(20):
+        expected = cone_search(lon[i], lat[i], radius[i], 10, flat=flat)
+        cone = slice(offsets[i], offsets[i + 1])
+        np.testing.assert_array_equal(ipix[cone], expected[0])
+        np.testing.assert_array_equal(depth[cone], expected[1])
+        np.testing.assert_array_equal(full[cone], expected[2])
+
+    # a single radius for all the cones
+    _, _, _, offsets_r = cone_search_batch(lon, lat, 1 * u.deg, 10)
+    assert offsets_r.shape == (21,)
+    with pytest.raises(ValueError, match="Depth must be in the"):
+        cone_search_batch(lon, lat, radius, 30)
+
+
+def _assert_batch_equal(batch, expected):
+    ipix, depth, full, offsets = batch
+    assert offsets.shape == (len(expected) + 1,)
+    assert offsets[0] == 0 and offsets[-1] == ipix.size
+    for i, cells in enumerate(expected):
+        region = slice(offsets[i], offsets[i + 1])
+        np.testing.assert_array_equal(ipix[region], cells[0])
+        np.testing.assert_array_equal(depth[region], cells[1])
+        np.testing.assert_array_equal(full[region], cells[2])
+
+
+@pytest.mark.parametrize("flat", [False, True])
+def test_box_search_batch(flat):
+    lon = Longitude(np.random.rand(10) * 360, u.deg)
+    lat = Latitude(np.random.rand(10) * 160 - 80, u.deg)
+    a = (np.random.rand(10) * 4 + 1) * u.deg
+    b = np.random.rand(10) * u.deg
+    angle = np.random.rand(10) * 180 * u.deg
+    expected = [
+        box_search(lon[i], lat[i], a[i], b[i], angle[i], 10, flat=flat)
+        for i in range(10)
+    ]
+    _assert_batch_equal(
+        box_search_batch(lon, lat, a, b, angle, 10, flat=flat), expected
+    )
+
+
+@pytest.mark.parametrize("flat", [False, True])
+def test_zone_search_batch(flat):
+    lon_min = Longitude([0, 10, 350], u.deg)
+    lat_min = Latitude([0, -20, 80], u.deg)
+    lon_max = Longitude([10, 20, 360], u.deg)
+    lat_max = Latitude([10, 0, 90], u.deg)
+    expected = [
+        zone_search(lon_min[i], lat_min[i], lon_max[i], lat_max[i], 8, flat=flat)
+        for i in range(3)
+    ]
+    _assert_batch_equal(
+        zone_search_batch(lon_min, lat_min, lon_max, lat_max, 8, flat=flat), expected
+    )
+
+
+@pytest.mark.parametrize("depth", [3, 8])
+def test_points_in_cones(depth):
+    lon = Longitude(np.random.rand(2000) * 360, u.deg)
+    lat = Latitude(np.arcsin(np.random.rand(2000) * 2 - 1), u.rad)
+    cone_lon = Longitude(np.random.rand(50) * 360, u.deg)
+    cone_lat = Latitude(np.random.rand(50) * 180 - 90, u.deg)
+    radius = np.random.rand(50) * 10 * u.deg
+    point, cone = points_in_cones(lon, lat, cone_lon, cone_lat, radius, depth)
+
+    separation = angular_separation(
+        lon[:, np.newaxis], lat[:, np.newaxis], cone_lon, cone_lat
+    )
+    expected_point, expected_cone = np.nonzero(separation <= radius)
+    np.testing.assert_array_equal(point, expected_point)
+    np.testing.assert_array_equal(cone, expected_cone)
+
+
+def _unit_vectors(lon, lat):
+    lon, lat = lon.rad, lat.rad
+    return np.stack(
+        (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1
+    )
+
+
+@pytest.mark.parametrize("depth", [3, 8])
+def test_points_in_ellipses(depth):
+    lon = Longitude(np.random.rand(2000) * 360, u.deg)
+    lat = Latitude(np.arcsin(np.random.rand(2000) * 2 - 1), u.rad)
+    ellipse_lon = Longitude(np.random.rand(50) * 360, u.deg)
+    ellipse_lat = Latitude(np.random.rand(50) * 180 - 90, u.deg)
+    a = Angle(np.random.rand(50) * 10 + 1, u.deg)
+    b = a * np.random.rand(50)
+    pa = Angle(np.random.rand(50) * 180, u.deg)
+    point, ellipse = points_in_ellipses(
+        lon, lat, ellipse_lon, ellipse_lat, a, b, pa, depth
+    )
+
+    # the orthographic projection of the points on the planes tangent to the centers
+    center = _unit_vectors(ellipse_lon, ellipse_lat)
+    # the unit vectors at 90deg north of the centers
+    north = _unit_vectors(ellipse_lon + 180 * u.deg, Latitude(90 * u.deg) - ellipse_lat)
+    east = np.cross(north, center)
+    major = np.cos(pa.rad)[:, np.newaxis] * north + np.sin(pa.rad)[:, np.newaxis] * east
+    minor = np.cross(major, center)
+    points = _unit_vectors(lon, lat)
+    x, u_, v = (points @ axis.T for axis in (center, major, minor))
+    inside = (x > 0) & ((u_ / np.sin(a.rad)) ** 2 + (v / np.sin(b.rad)) ** 2 <= 1)
+    expected_point, expected_ellipse = np.nonzero(inside)
+    np.testing.assert_array_equal(point, expected_point)
+    np.testing.assert_array_equal(ellipse, expected_ellipse)
+
+    with pytest.raises(ValueError, match="semi-minor axis .*: ellipse 0"):
+        points_in_ellipses(lon, lat, ellipse_lon, ellipse_lat, b, a, pa, depth)
+
+
+def test_points_in_polygons():
+    poly_lon = Longitude([0, 10, 5, 20, 30, 30, 20], u.deg)
+    poly_lat = Latitude([0, 0, 10, 0, 0, 10, 10], u.deg)
+    offsets = [0, 3, 7]
+    # the centers of the cells fully covered by the polygons, and points outside
+    cells = [polygon_search(poly_lon[0:3], poly_lat[0:3], 10, flat=True)]
+    cells.append(polygon_search(poly_lon[3:7], poly_lat[3:7], 10, flat=True))
+    inside = [ipix[fully_covered] for ipix, _, fully_covered in cells]
+    lon, lat = healpix_to_lonlat(np.concatenate(inside), 10)
+    lon = Longitude(np.concatenate([lon.deg, [50, 15, 25]]), u.deg)
+    lat = Latitude(np.concatenate([lat.deg, [5, 5, -5]]), u.deg)
+
+    point, polygon = points_in_polygons(lon, lat, poly_lon, poly_lat, offsets, 6)
+    np.testing.assert_array_equal(point, np.arange(lon.size - 3))
+    np.testing.assert_array_equal(
+        polygon, np.repeat([0, 1], [inside[0].size, inside[1].size])
+    )
+
+    with pytest.raises(ValueError, match="3 distinct vertices .*: polygon 0"):
+        points_in_polygons(
+            lon, lat, poly_lon[[0, 0, 1]], poly_lat[[0, 0, 1]], [0, 3], depth=6
+        )
+
+
 def test_box_search():
     lon = Longitude(0 * u.deg)
     lat = Latitude(0 * u.deg)
@@ -233,6 +797,33 @@ def test_polygon_search(size):
         assert ((ipix >= 0) & (ipix < npix)).all()
 
 
+def test_polygon_search_batch():
+    sizes = np.random.randint(3, 8, size=10)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    lon = Longitude(np.random.rand(offsets[-1]) * 30, u.deg)
+    lat = Latitude(np.random.rand(offsets[-1]) * 30, u.deg)
+    ipix, depth, full, cell_offsets = polygon_search_batch(lon, lat, offsets, 8)
+    assert cell_offsets.shape == (11,) and cell_offsets[-1] == ipix.size
+    for i in range(10):
+        polygon = slice(offsets[i], offsets[i + 1])
+        expected = polygon_search(lon[polygon], lat[polygon], 8)
+        cells = slice(cell_offsets[i], cell_offsets[i + 1])
+        np.testing.assert_array_equal(ipix[cells], expected[0])
+        np.testing.assert_array_equal(depth[cells], expected[1])
+        np.testing.assert_array_equal(full[cells], expected[2])
+
+
+def test_polygon_search_batch_exceptions():
+    lon = Longitude([0, 10, 10, 0, 10, 5], u.deg)
+    lat = Latitude([0, 0, 0, 0, 0, 10], u.deg)
+    with pytest.raises(ValueError, match="3 distinct vertices .*: polygon 0"):
+        polygon_search_batch(lon, lat, [0, 3, 6], 8)
+    with pytest.raises(ValueError, match="The offsets must be increasing"):
+        polygon_search_batch(lon, lat, [0, 3, 5], 8)
+    with pytest.raises(ValueError, match="The offsets must be increasing"):
+        polygon_search_batch(lon, lat, [0, 4, 3, 6], 8)
+
+
 # From https://github.com/cds-astro/cds-healpix-python/issues/10
 def test_polygon_search_issue10():
     coords = SkyCoord(
@@ -280,6 +871,27 @@ def test_polygon_search_big_polygon():
     assert (ipix == np.asarray([0, 3, 4, 5, 7, 8, 9, 10, 11])).all()
 
 
+@pytest.mark.parametrize("flat", [False, True])
+def test_elliptical_cone_search_batch(flat):
+    lon = Longitude(np.random.rand(10) * 360, u.deg)
+    lat = Latitude(np.random.rand(10) * 180 - 90, u.deg)
+    a = Angle(np.random.rand(10) * 4 + 1, u.deg)
+    b = a * np.random.rand(10)
+    pa = Angle(np.random.rand(10) * 180, u.deg)
+    expected = [
+        elliptical_cone_search(lon[i], lat[i], a[i], b[i], pa[i], 10, flat=flat)
+        for i in range(10)
+    ]
+    _assert_batch_equal(
+        elliptical_cone_search_batch(lon, lat, a, b, pa, 10, flat=flat), expected
+    )
+
+    with pytest.raises(ValueError, match="semi-minor axis .*: ellipse 1"):
+        elliptical_cone_search_batch(
+            lon[:2], lat[:2], Angle([2, 2], u.deg), Angle([1, 3], u.deg), pa[:2], 10
+        )
+
+
 def test_elliptical_cone_search():
     lon = Longitude(0, u.deg)
     lat = Latitude(0, u.deg)
@@ -295,6 +907,260 @@ def test_elliptical_cone_search():
     assert ((ipix >= 0) & (ipix < npix)).all()
 
 
+_SEARCHES = [
+    lambda **kw: cone_search(
+        Longitude(20, u.deg), Latitude(40, u.deg), 10 * u.deg, depth=8, **kw
+    ),
+    lambda **kw: box_search(
+        Longitude(20, u.deg), Latitude(40, u.deg), 10 * u.deg, 5 * u.deg, depth=8, **kw
+    ),
+    lambda **kw: zone_search(
+        Longitude(0, u.deg),
+        Latitude(0, u.deg),
+        Longitude(10, u.deg),
+        Latitude(10, u.deg),
+        depth=8,
+        **kw,
+    ),
+    lambda **kw: polygon_search(
+        Longitude([20, -10, 25], u.deg), Latitude([10, 20, 30], u.deg), 8, **kw
+    ),
+    lambda **kw: elliptical_cone_search(
+        Longitude(20, u.deg),
+        Latitude(40, u.deg),
+        Angle(10, u.deg),
+        Angle(5, u.deg),
+        Angle(30, u.deg),
+        8,
+        **kw,
+    ),
+]
+
+
+@pytest.mark.parametrize("search", _SEARCHES)
+@pytest.mark.parametrize("flat", [False, True])
+def test_search_formats(search, flat):
+    ipix, depth, _ = search(flat=flat)
+    np.testing.assert_array_equal(
+        search(flat=flat, output="uniq"), to_uniq(ipix, depth)
+    )
+    uniq = search(flat=flat, compact=True, output="uniq")
+    assert uniq.dtype == np.uint32
+    np.testing.assert_array_equal(uniq, to_uniq(ipix, depth))
+
+    ranges = search(flat=flat, output="ranges")
+    assert ranges.dtype == np.uint64
+    assert ranges.shape[1] == 2
+    # the ranges are sorted, disjoint, and not adjacent
+    assert (ranges[:, 0] < ranges[:, 1]).all()
+    assert (ranges[1:, 0] > ranges[:-1, 1]).all()
+    start, end = children_range(ipix, depth, 29)
+    covered = np.zeros(len(start), dtype=bool)
+    for range_start, range_end in ranges:
+        covered |= (range_start <= start) & (end <= range_end)
+    assert covered.all()
+    assert (ranges[:, 1] - ranges[:, 0]).sum() == (end - start).sum()
+
+    with pytest.raises(ValueError, match="Unknown output"):
+        search(output="moc")
+    with pytest.raises(ValueError, match="not available with the 'ranges' output"):
+        search(compact=True, output="ranges")
+
+
+def _flat_cells(coverage, depth):
+    """Get the cells at ``depth`` of a coverage, sorted."""
+    start, end = children_range(coverage[0], coverage[1], depth)
+    cells = [np.arange(a, b, dtype=np.uint64) for a, b in zip(start, end)]
+    return np.concatenate(cells)
+
+
+def test_coverage_operations():
+    depth = 8
+    first = cone_search(Longitude(0, u.deg), Latitude(0, u.deg), 5 * u.deg, depth)
+    second = polygon_search(
+        Longitude([3, 12, 8], u.deg), Latitude([-5, 0, 6], u.deg), depth
+    )
+    first_cells = _flat_cells(first, depth)
+    second_cells = _flat_cells(second, depth)
+
+    union = coverage_union(first, second)
+    np.testing.assert_array_equal(
+        _flat_cells(union, depth), np.union1d(first_cells, second_cells)
+    )
+    intersection = coverage_intersection(first, second)
+    np.testing.assert_array_equal(
+        _flat_cells(intersection, depth), np.intersect1d(first_cells, second_cells)
+    )
+    np.testing.assert_array_equal(
+        _flat_cells(coverage_intersection(union, first), depth), first_cells
+    )
+
+    # the cells partially covered by the second coverage are kept
+    difference = _flat_cells(coverage_difference(first, second), depth)
+    assert np.isin(np.setdiff1d(first_cells, second_cells), difference).all()
+    assert np.isin(difference, first_cells).all()
+    second_full = _flat_cells((second[0][second[2]], second[1][second[2]]), depth)
+    assert not np.isin(difference, second_full).any()
+
+    first_full = _flat_cells((first[0][first[2]], first[1][first[2]]), depth)
+    complement = _flat_cells(coverage_complement(first), depth)
+    np.testing.assert_array_equal(
+        np.union1d(complement, first_cells), np.arange(12 * 4**depth)
+    )
+    assert not np.isin(complement, first_full).any()
+
+    ranges = coverage_union(first, second, output="ranges")
+    start, end = children_range(union[0], union[1], 29)
+    assert (ranges[:, 1] - ranges[:, 0]).sum() == (end - start).sum()
+
+    with pytest.raises(ValueError, match="At least one coverage"):
+        coverage_union()
+    with pytest.raises(ValueError, match="values out of"):
+        coverage_union((np.array([12]), 0, True))
+
+
+def test_coverage_contains():
+    depth = 8
+    center_lon, center_lat = Longitude(30, u.deg), Latitude(20, u.deg)
+    cone = cone_search(center_lon, center_lat, 5 * u.deg, depth)
+    lon = Longitude(np.random.rand(10000) * 20 + 20, u.deg)
+    lat = Latitude(np.random.rand(10000) * 20 + 10, u.deg)
+
+    cells = lonlat_to_healpix(lon, lat, depth)
+    flat_cells = _flat_cells(cone, depth)
+    inside = coverage_contains(lon, lat, cone)
+    np.testing.assert_array_equal(inside, np.isin(cells, flat_cells))
+    full = _flat_cells((cone[0][cone[2]], cone[1][cone[2]]), depth)
+    surely_inside = coverage_contains(lon, lat, cone, fully_covered=True)
+    np.testing.assert_array_equal(surely_inside, np.isin(cells, full))
+    # the points in the fully covered cells are in the cone
+    separation = angular_separation(lon, lat, center_lon, center_lat)
+    assert (separation[surely_inside] <= 5 * u.deg).all()
+    assert (separation[~inside] > 5 * u.deg).all()
+    # given the region, the points in the other cells are tested exactly
+    region = Cone(center_lon, center_lat, 5 * u.deg)
+    exact = coverage_contains(lon, lat, cone, region=region)
+    np.testing.assert_array_equal(exact, separation <= 5 * u.deg)
+    np.testing.assert_array_equal(
+        coverage_contains(lon, lat, cone, fully_covered=True, region=region),
+        surely_inside,
+    )
+    zone = (
+        Longitude(25, u.deg),
+        Latitude(15, u.deg),
+        Longitude(35, u.deg),
+        Latitude(25, u.deg),
+    )
+    in_zone = coverage_contains(lon, lat, zone_search(*zone, depth), region=Zone(*zone))
+    np.testing.assert_array_equal(
+        in_zone, (lon >= zone[0]) & (lon < zone[2]) & (lat >= zone[1]) & (lat < zone[3])
+    )
+
+    shaped = coverage_contains(lon.reshape(100, 100), lat.reshape(100, 100), cone)
+    np.testing.assert_array_equal(shaped, inside.reshape(100, 100))
+
+    np.testing.assert_array_equal(
+        coverage_contains_ipix(cells, depth, cone), np.isin(cells, flat_cells)
+    )
+    # a cell is in the coverage only if all its children are
+    parents = np.unique(cells >> np.uint64(2))
+    children = parents[:, None] * np.uint64(4) + np.arange(4, dtype=np.uint64)
+    np.testing.assert_array_equal(
+        coverage_contains_ipix(parents, depth - 1, cone),
+        np.isin(children, flat_cells).all(axis=1),
+    )
+
+    with pytest.raises(ValueError, match="values out of"):
+        coverage_contains_ipix([12], 0, cone)
+    with pytest.raises(ValueError, match="one of `cdshealpix.regions`"):
+        coverage_contains(lon, lat, cone, region=cone)
+
+
+@pytest.mark.parametrize("max_cells,max_ranges", [(50, None), (None, 20), (30, 5)])
+def test_coverage_simplify(max_cells, max_ranges):
+    lon = Longitude([20, -10, 25, 15], u.deg)
+    lat = Latitude([10, 20, 30, 15], u.deg)
+    polygon = polygon_search(lon, lat, 12)
+    simplified = coverage_simplify(polygon, max_cells=max_cells, max_ranges=max_ranges)
+    ranges = coverage_simplify(
+        polygon, max_cells=max_cells, max_ranges=max_ranges, output="ranges"
+    )
+    if max_cells is not None:
+        assert len(simplified[0]) <= max_cells
+    if max_ranges is not None:
+        assert len(ranges) <= max_ranges
+    assert len(simplified[0]) < len(polygon[0])
+
+    # the simplified coverage contains the coverage, and its fully covered cells are
+    # fully covered by the polygon
+    assert coverage_contains_ipix(polygon[0], polygon[1], simplified).all()
+    full = simplified[2]
+    assert coverage_contains_ipix(
+        simplified[0][full], simplified[1][full], polygon, fully_covered=True
+    ).all()
+
+    for a, b in zip(
+        polygon_search(lon, lat, 12, max_cells=max_cells, max_ranges=max_ranges),
+        simplified,
+    ):
+        np.testing.assert_array_equal(a, b)
+
+    # the coverage is returned as is when it fits
+    for a, b in zip(coverage_simplify(polygon, max_cells=len(polygon[0])), polygon):
+        np.testing.assert_array_equal(a, b)
+
+    with pytest.raises(ValueError, match="not available for flat results"):
+        polygon_search(lon, lat, 12, flat=True, max_cells=10)
+
+
+def _dilated_cells(cells, depth):
+    """Get the sorted cells at ``depth`` and their neighbours."""
+    dilated = neighbours(cells, depth).ravel()
+    return np.unique(dilated[dilated >= 0]).astype(np.uint64)
+
+
+@pytest.mark.parametrize("n_cells", [1, 3])
+def test_coverage_morphology(n_cells):
+    depth = 7
+    lon = Longitude([20, -10, 25, 15], u.deg)
+    lat = Latitude([10, 20, 30, 15], u.deg)
+    polygon = polygon_search(lon, lat, depth)
+    cells = _flat_cells(polygon, depth)
+
+    dilated = cells
+    for _ in range(n_cells):
+        dilated = _dilated_cells(dilated, depth)
+    result = coverage_dilate(polygon, n_cells)
+    np.testing.assert_array_equal(_flat_cells(result, depth), dilated)
+    added = ~coverage_contains_ipix(result[0], result[1], polygon)
+    assert result[2][added].all()
+
+    outside = np.setdiff1d(np.arange(12 * 4**depth, dtype=np.uint64), cells)
+    near_outside = outside
+    for _ in range(n_cells):
+        near_outside = _dilated_cells(near_outside, depth)
+    np.testing.assert_array_equal(
+        _flat_cells(coverage_erode(polygon, n_cells), depth),
+        np.setdiff1d(cells, near_outside),
+    )
+
+    np.testing.assert_array_equal(
+        _flat_cells(coverage_border(polygon), depth),
+        np.intersect1d(cells, _dilated_cells(outside, depth)),
+    )
+    np.testing.assert_array_equal(
+        _flat_cells(coverage_border(polygon, outer=True), depth),
+        np.setdiff1d(_dilated_cells(cells, depth), cells),
+    )
+
+    # the cells are removed at the given depth
+    border = _flat_cells(coverage_border(polygon, depth + 1), depth + 1)
+    np.testing.assert_array_equal(
+        _flat_cells(coverage_erode(polygon, 1, depth + 1), depth + 1),
+        np.setdiff1d(_flat_cells(polygon, depth + 1), border),
+    )
+
+
 @pytest.mark.parametrize(
     "depth,ipix,expected_border_cells,expected_corner_cells",
     [
@@ -0,0 +1,108 @@
+import astropy.units as u
+from astropy.coordinates import Angle, Latitude, Longitude
+
+import numpy as np
+import pytest
+
+from ..nested import (
+    box_search,
+    cone_search,
+    elliptical_cone_search,
+    polygon_search,
+    zone_search,
+)
+from ..regions import Box, Cone, Ellipse, Polygon, Zone
+
+_LON, _LAT = Longitude(30, u.deg), Latitude(40, u.deg)
+_POLY_LON = Longitude([0, 20, 20, 0], u.deg)
+_POLY_LAT = Latitude([0, 0, 20, 20], u.deg)
+_A, _B, _PA = Angle(10, u.deg), Angle(5, u.deg), Angle(30, u.deg)
+_ZONE = (
+    Longitude(350, u.deg),
+    Latitude(-20, u.deg),
+    Longitude(10, u.deg),
+    Latitude(30, u.deg),
+)
+
+# (region, search of the same region taking the depth and the keyword arguments)
+_REGIONS = [
+    (
+        lambda: Cone(_LON, _LAT, 5 * u.deg),
+        lambda depth, **kw: cone_search(_LON, _LAT, 5 * u.deg, depth, **kw),
+    ),
+    (
+        lambda: Ellipse(_LON, _LAT, _A, _B, _PA),
+        lambda depth, **kw: elliptical_cone_search(
+            _LON, _LAT, _A, _B, _PA, depth, **kw
+        ),
+    ),
+    (
+        lambda: Polygon(_POLY_LON, _POLY_LAT),
+        lambda depth, **kw: polygon_search(_POLY_LON, _POLY_LAT, depth, **kw),
+    ),
+    (
+        lambda: Box(_LON, _LAT, _A, _B, _PA),
+        lambda depth, **kw: box_search(_LON, _LAT, _A, _B, _PA, depth, **kw),
+    ),
+    (
+        lambda: Zone(*_ZONE),
+        lambda depth, **kw: zone_search(*_ZONE, depth, **kw),
+    ),
+]
+
+
+@pytest.mark.parametrize(("region", "search"), _REGIONS)
+@pytest.mark.parametrize("output", ["cells", "uniq", "ranges"])
+def test_region_search(region, search, output):
+    region = region()
+    for _ in range(2):
+        for depth in (4, 9):
+            for flat in (False, True):
+                result = region.search(depth, flat=flat, output=output)
+                expected = search(depth, flat=flat, output=output)
+                for array, expected_array in zip(
+                    result if output == "cells" else [result],
+                    expected if output == "cells" else [expected],
+                ):
+                    np.testing.assert_array_equal(array, expected_array)
+    assert region.cache_info()[0] == 4
+
+    ipix, _, _ = region.search(9, compact=True)
+    assert ipix.dtype == np.uint32
+    simplified = region.search(9, max_cells=10)
+    np.testing.assert_array_equal(simplified[0], search(9, max_cells=10)[0])
+    assert region.cache_info()[0] == 4
+
+    region.clear_cache()
+    assert region.cache_info() == (0, 0)
+
+
+def test_region_cache_memory():
+    cone = Cone(_LON, _LAT, 5 * u.deg, max_memory=0)
+    cone.search(9)
+    assert cone.cache_info() == (0, 0)
+
+    cone = Cone(_LON, _LAT, 5 * u.deg)
+    cone.search(9)
+    _, memory = cone.cache_info()
+    assert memory > 0
+
+    # only the most recently used coverage fits
+    cone = Cone(_LON, _LAT, 5 * u.deg, max_memory=memory)
+    cone.search(9)
+    cone.search(9, delta_depth=1)
+    assert cone.cache_info()[0] == 1
+    cone.search(8)
+    assert cone.cache_info()[0] <= 2
+    assert cone.cache_info()[1] <= memory
+
+
+def test_region_errors():
+    with pytest.raises(ValueError, match="3 distinct vertices"):
+        Polygon(_POLY_LON[[0, 0, 1]], _POLY_LAT[[0, 0, 1]])
+    with pytest.raises(ValueError, match="semi-minor"):
+        Ellipse(_LON, _LAT, _B, _A, _PA)
+    with pytest.raises(ValueError, match="scalar"):
+        Cone(_POLY_LON, _POLY_LAT, 5 * u.deg)
+    with pytest.raises(ValueError, match="Unknown output"):
+        Cone(_LON, _LAT, 5 * u.deg).search(9, output="moc")
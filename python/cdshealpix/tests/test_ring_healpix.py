@@ -1,3 +1,5 @@
+import re
+
 # Astropy tools
 import astropy.units as u
 from astropy.coordinates import Latitude, Longitude, SkyCoord
@@ -5,6 +7,7 @@ from astropy.coordinates import Latitude, Longitude, SkyCoord
 import numpy as np
 import pytest
 
+from ..ring import fast
 from ..ring.healpix import (
     healpix_to_lonlat,
     healpix_to_xy,
@@ -137,3 +140,49 @@ def test_vertices_lonlat_step(step):
     lon, lat = vertices(ipix=ipixels, nside=nside, step=step)
     assert lon.shape == lat.shape
     assert lon.shape == (size, 4 * step)
+
+
+def test_fast_matches_astropy_path():
+    nside = 1 << 10
+    lon = Longitude(np.random.rand(1000) * 360, u.deg)
+    lat = Latitude(np.random.rand(1000) * 180 - 90, u.deg)
+
+    ipix = lonlat_to_healpix(lon, lat, nside)
+    ipix_fast = fast.lonlat_to_healpix(lon.deg, lat.deg, nside, degrees=True)
+    np.testing.assert_array_equal(ipix_fast, ipix)
+
+    lon, lat = healpix_to_lonlat(ipix, nside)
+    lon_fast, lat_fast = fast.healpix_to_lonlat(ipix, nside)
+    np.testing.assert_allclose(lon_fast, lon.rad)
+    np.testing.assert_allclose(lat_fast, lat.rad)
+
+    lon, lat = vertices(ipix, nside)
+    lon_fast, lat_fast = fast.vertices(ipix, nside, degrees=True)
+    np.testing.assert_allclose(lon_fast, lon.deg)
+    np.testing.assert_allclose(lat_fast, lat.deg)
+
+
+def test_compact_outputs():
+    nside = 1 << 13
+    lon = np.random.rand(1000) * 2 * np.pi
+    lat = (np.random.rand(1000) - 0.5) * np.pi
+    ipix = fast.lonlat_to_healpix(lon, lat, nside)
+    ipix32 = fast.lonlat_to_healpix(lon, lat, nside, compact=True)
+    assert ipix32.dtype == np.uint32
+    np.testing.assert_array_equal(ipix32, ipix)
+    lon32, lat32 = healpix_to_lonlat(ipix, nside, compact=True)
+    assert lon32.dtype == lat32.dtype == np.float32
+    with pytest.raises(ValueError, match="only available for nsides up to 8192"):
+        fast.lonlat_to_healpix(lon, lat, nside << 1, compact=True)
+
+
+def test_invalid_ipix_exception():
+    with pytest.raises(ValueError, match=r"\[0, 48\[: 48 at index \[1\]\."):
+        healpix_to_lonlat(np.array([0, 48]), 2)
+    with pytest.raises(ValueError, match="nside must be in the"):
+        healpix_to_lonlat(np.array([0, 1]), 0)
+    for dtype in (np.int64, np.uint32):
+        with pytest.raises(ValueError, match=re.escape(": 0 at index [2].")):
+            lonlat_to_healpix(
+                Longitude(0, u.deg), Latitude(0, u.deg), np.array([1, 4, 0], dtype)
+            )
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from .. import get_num_threads, set_num_threads, to_ring, use_num_threads
+
+
+def test_set_num_threads():
+    previous = get_num_threads()
+    set_num_threads(3)
+    try:
+        assert get_num_threads() == 3
+        # kernels reuse the pool
+        assert (to_ring(np.arange(12), 0) == np.arange(12)).all()
+        assert get_num_threads() == 3
+    finally:
+        set_num_threads(0)
+    assert get_num_threads() == previous
+
+
+def test_use_num_threads():
+    previous = get_num_threads()
+    with use_num_threads(2):
+        assert get_num_threads() == 2
+        with use_num_threads(1):
+            assert get_num_threads() == 1
+        assert get_num_threads() == 2
+    assert get_num_threads() == previous
+
+
+def test_set_num_threads_exception():
+    with pytest.raises(ValueError, match="num_threads must be positive or 0"):
+        set_num_threads(-1)
+    with pytest.raises(ValueError, match="num_threads must be at most 65535"):
+        set_num_threads(2**16)
+    with pytest.raises(
+        ValueError, match="num_threads must be at most 65535"
+    ), use_num_threads(2**16):
+        pass
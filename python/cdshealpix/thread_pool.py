@@ -0,0 +1,97 @@
+"""Settings of the thread pool shared by the parallel functions."""
+from contextlib import contextmanager
+
+from . import cdshealpix
+
+__all__ = ["set_num_threads", "get_num_threads", "use_num_threads"]
+
+# The number of threads is given to the Rust kernels as an uint16
+_MAX_NUM_THREADS = 2**16 - 1
+
+
+def _check_num_threads(num_threads):
+    if num_threads < 0:
+        raise ValueError("num_threads must be positive or 0")
+    if num_threads > _MAX_NUM_THREADS:
+        raise ValueError(f"num_threads must be at most {_MAX_NUM_THREADS}")
+
+
+def set_num_threads(num_threads):
+    """Set the number of threads used by default in the parallel functions.
+
+    The functions called with ``num_threads=0`` (the default) all share a single
+    thread pool, created at first use and kept alive between calls. Functions
+    called with an explicit ``num_threads`` reuse the pool of the last explicit
+    size, which is replaced when another size is requested.
+
+    Parameters
+    ----------
+    num_threads : int
+        The number of threads of the default pool. 0 means it will choose the
+        number of threads based on the RAYON_NUM_THREADS environment variable
+        (if set), or the number of logical CPUs (otherwise)
+
+    Raises
+    ------
+    ValueError
+        When ``num_threads`` is negative or greater than 65535.
+
+    Examples
+    --------
+    >>> from cdshealpix import set_num_threads, get_num_threads
+    >>> set_num_threads(2)
+    >>> get_num_threads()
+    2
+    >>> set_num_threads(0)
+    """
+    _check_num_threads(num_threads)
+    cdshealpix.set_num_threads(int(num_threads))
+
+
+def get_num_threads():
+    """Get the number of threads used by default in the parallel functions.
+
+    Returns
+    -------
+    int
+        The number of threads of the default pool.
+
+    Examples
+    --------
+    >>> from cdshealpix import get_num_threads
+    >>> n = get_num_threads()
+    """
+    return cdshealpix.get_num_threads()
+
+
+@contextmanager
+def use_num_threads(num_threads):
+    """Temporarily change the number of threads used by default.
+
+    The previous setting is restored when leaving the context. As the setting is
+    process-wide, it also applies to the calls made from other Python threads
+    while in the context.
+
+    Parameters
+    ----------
+    num_threads : int
+        The number of threads of the default pool inside the context.
+
+    Raises
+    ------
+    ValueError
+        When ``num_threads`` is negative or greater than 65535.
+
+    Examples
+    --------
+    >>> from cdshealpix import use_num_threads, to_ring
+    >>> import numpy as np
+    >>> with use_num_threads(1):
+    ...     ipix_ring = to_ring(np.arange(12), 0)
+    """
+    _check_num_threads(num_threads)
+    previous = cdshealpix.set_num_threads(int(num_threads))
+    try:
+        yield
+    finally:
+        cdshealpix.set_num_threads(previous)
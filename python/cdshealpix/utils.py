@@ -8,16 +8,23 @@ from . import cdshealpix
 
 __all__ = ["from_ring", "to_ring"]
 
-# Raise a ValueError exception if the input
-# HEALPix cells array contains invalid values
 
+def _coords_dtype(lon, lat):
+    # float32 coordinates are read in place by the kernels, anything else as float64
+    if lon.dtype == np.float32 and lat.dtype == np.float32:
+        return np.float32
+    return np.float64
 
-def _check_ipixels(data, depth):
-    npix = 12 * 4 ** (depth)
-    if (data >= npix).any() or (data < 0).any():
-        raise ValueError(
-            f"The input HEALPix cells contains value out of [0, {npix - 1}]"
-        )
+
+def _as_hashes(ipix):
+    """Return ``ipix`` as an array of a dtype the kernels read in place.
+
+    The (u)int32 and (u)int64 arrays are returned as is, the others are cast to int64.
+    """
+    ipix = np.asarray(ipix)
+    if ipix.dtype in (np.uint64, np.int64, np.uint32, np.int32):
+        return ipix
+    return ipix.astype(np.int64)
 
 
 def _validate_lonlat(function):
@@ -41,29 +48,141 @@ def _validate_lonlat(function):
             raise ValueError(
                 f"'lon' and 'lat' should have the same shape but are of shapes {lon.shape} and {lat.shape}",
             )
-        # convert into astropy objects
+        # convert into astropy objects, float32 coordinates are read as is by the kernels
+        dtype = _coords_dtype(lon, lat)
         lon = (
             lon
-            if (isinstance(lon, Longitude) and lon.dtype == np.float64)
-            else Longitude(lon, dtype=np.float64)
+            if (isinstance(lon, Longitude) and lon.dtype == dtype)
+            else Longitude(lon, dtype=dtype)
         )
         lat = (
             lat
-            if (isinstance(lat, Latitude) and lat.dtype == np.float64)
-            else Latitude(lat, dtype=np.float64)
+            if (isinstance(lat, Latitude) and lat.dtype == dtype)
+            else Latitude(lat, dtype=dtype)
         )
         return function(lon, lat, *args, **kwargs)
 
     return _validate_lonlat_wrap
 
 
+@_validate_lonlat
+def _flat_radians(lon, lat):
+    """Get the coordinates of a catalog as flat contiguous arrays in radians."""
+    return np.ascontiguousarray(lon.rad).ravel(), np.ascontiguousarray(lat.rad).ravel()
+
+
+def _raw_lonlat(lon, lat, degrees):
+    """Convert plain longitudes and latitudes into float arrays in radians.
+
+    This is the astropy-free counterpart of `_validate_lonlat`, used by the
+    ``fast`` modules.
+    """
+    lon = np.atleast_1d(np.asarray(lon))
+    lat = np.atleast_1d(np.asarray(lat))
+    dtype = _coords_dtype(lon, lat)
+    lon = lon.astype(dtype, copy=False)
+    lat = lat.astype(dtype, copy=False)
+    if lon.shape != lat.shape:
+        raise ValueError(
+            f"'lon' and 'lat' should have the same shape but are of shapes {lon.shape} and {lat.shape}",
+        )
+    if degrees:
+        lon = np.deg2rad(lon)
+        lat = np.deg2rad(lat)
+    if (np.abs(lat) > np.pi / 2).any():
+        raise ValueError("Latitudes must be in the [-90, 90] degrees closed range")
+    return lon, lat
+
+
+def _first_invalid(invalid, values):
+    """Get the index, as a list, and the value of the first invalid value."""
+    flat_index = np.flatnonzero(invalid)[0]
+    index = [int(i) for i in np.unravel_index(flat_index, values.shape)]
+    return index, values.flat[flat_index]
+
+
 def _check_depth(depth):
-    ravel_depth = np.ravel(np.atleast_1d(depth))
-    if any(ravel_depth < 0) or any(ravel_depth > 29):
-        raise ValueError("Depth must be in the [0, 29] closed range")
+    # The Rust kernels check the uint8 depths they are given, only the values
+    # that would wrap around once cast to uint8 have to be rejected here.
+    depth = np.asarray(depth)
+    if depth.dtype == np.uint8 or depth.size == 0:
+        return
+    if depth.min() < 0 or depth.max() > 29:
+        index, value = _first_invalid((depth < 0) | (depth > 29), depth)
+        raise ValueError(
+            f"Depth must be in the [0, 29] closed range: {value} at index {index}."
+        )
 
 
-def to_ring(ipix, depth, num_threads=0):
+# The HEALPix indices up to this depth fit in the 32-bit integers of the compact outputs
+_COMPACT_MAX_DEPTH = 13
+
+
+def _check_compact_depth(depth):
+    if np.max(depth) > _COMPACT_MAX_DEPTH:
+        raise ValueError(
+            f"compact outputs are only available for depths up to {_COMPACT_MAX_DEPTH}"
+        )
+
+
+def _check_format(fmt, compact):
+    """Check the output format of a search."""
+    if fmt not in ("cells", "uniq", "ranges"):
+        raise ValueError(
+            f"Unknown output '{fmt}', expected 'cells', 'uniq' or 'ranges'"
+        )
+    if compact and fmt == "ranges":
+        raise ValueError("compact outputs are not available with the 'ranges' output")
+
+
+def _check_budget(flat, max_cells, max_ranges):
+    """Check the budget of the simplification of a search."""
+    if flat and (max_cells is not None or max_ranges is not None):
+        raise ValueError("max_cells and max_ranges are not available for flat results")
+    for budget in (max_cells, max_ranges):
+        if budget is not None and budget < 0:
+            raise ValueError("max_cells and max_ranges must be positive")
+
+
+def _out_dtypes(compact):
+    """Return the dtypes of the HEALPix indices and of the coordinates results."""
+    if compact:
+        return np.uint32, np.float32
+    return np.uint64, np.float64
+
+
+def _check_out(out, shape, dtype):
+    """Check that ``out`` can receive a result of the given shape and dtype.
+
+    Returns ``out`` or, if it is `None`, a newly allocated (uninitialized) array.
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    dtype = np.dtype(dtype)
+    shape = tuple(shape)
+    if not isinstance(out, np.ndarray):
+        raise ValueError(f"out must be a numpy.ndarray, got {type(out).__name__}")
+    if out.dtype != dtype:
+        raise ValueError(f"out must be of dtype {dtype}, got {out.dtype}")
+    if out.shape != shape:
+        raise ValueError(f"out must be of shape {shape}, got {out.shape}")
+    if not out.flags.c_contiguous:
+        raise ValueError("out must be C-contiguous")
+    if not out.flags.writeable:
+        raise ValueError("out must be writeable")
+    return out
+
+
+def _check_outs(out, shape, dtypes):
+    """Apply `_check_out` to each array of the tuple ``out``."""
+    if out is None:
+        out = (None,) * len(dtypes)
+    elif not isinstance(out, tuple) or len(out) != len(dtypes):
+        raise ValueError(f"out must be a tuple of {len(dtypes)} numpy.ndarray")
+    return tuple(_check_out(o, shape, d) for o, d in zip(out, dtypes))
+
+
+def to_ring(ipix, depth, num_threads=0, *, out=None, compact=False):
     """Convert HEALPix cells from the NESTED to the RING scheme.
 
     Parameters
@@ -74,8 +193,14 @@ def to_ring(ipix, depth, num_threads=0):
         The depth of the HEALPix cells.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` (`np.uint32` if ``compact`` is set) array of the
+        shape of ``ipix`` in which the result is written instead of allocating a new
+        array.
+    compact : bool, optional
+        If set to `True`, the HEALPix cell indexes are returned as `np.uint32` instead
+        of `np.uint64`. Only available for depths up to 13. Default to `False`.
 
     Returns
     -------
@@ -86,6 +211,8 @@ def to_ring(ipix, depth, num_threads=0):
     ------
     ValueError
         When the HEALPix cell indexes given have values out of :math:`[0, 4^{29 - depth}[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a depth greater than 13.
 
     Examples
     --------
@@ -97,13 +224,14 @@ def to_ring(ipix, depth, num_threads=0):
     [100526076 100591616 100591614]
     """
     _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
 
     ipix = np.atleast_1d(ipix)
-    _check_ipixels(data=ipix, depth=depth)
-    ipix = ipix.astype(np.uint64)
+    ipix = _as_hashes(ipix)
 
     # Allocation of the array containing the cells under the RING scheme
-    ipix_ring = np.zeros(ipix.shape, dtype=np.uint64)
+    ipix_ring = _check_out(out, ipix.shape, _out_dtypes(compact)[0])
 
     num_threads = np.uint16(num_threads)
     cdshealpix.to_ring(depth, ipix, ipix_ring, num_threads)
@@ -111,7 +239,7 @@ def to_ring(ipix, depth, num_threads=0):
     return ipix_ring
 
 
-def from_ring(ipix, depth, num_threads=0):
+def from_ring(ipix, depth, num_threads=0, *, out=None, compact=False):
     """Convert HEALPix cells from the RING to the NESTED scheme.
 
     Parameters
@@ -122,8 +250,14 @@ def from_ring(ipix, depth, num_threads=0):
         The depth of the HEALPix cells.
     num_threads : int, optional
         Specifies the number of threads to use for the computation. Default to 0 means
-        it will choose the number of threads based on the RAYON_NUM_THREADS environment variable (if set),
-        or the number of logical CPUs (otherwise)
+        it will use the default thread pool, see `~cdshealpix.set_num_threads`.
+    out : `numpy.ndarray`, optional
+        A C-contiguous `np.uint64` (`np.uint32` if ``compact`` is set) array of the
+        shape of ``ipix`` in which the result is written instead of allocating a new
+        array.
+    compact : bool, optional
+        If set to `True`, the HEALPix cell indexes are returned as `np.uint32` instead
+        of `np.uint64`. Only available for depths up to 13. Default to `False`.
 
     Returns
     -------
@@ -134,6 +268,8 @@ def from_ring(ipix, depth, num_threads=0):
     ------
     ValueError
         When the HEALPix cell indexes given have values out of :math:`[0, 4^{29 - depth}[`.
+        When ``out`` does not match the dtype, shape or memory layout of the result.
+        When ``compact`` is set for a depth greater than 13.
 
     Examples
     --------
@@ -145,13 +281,14 @@ def from_ring(ipix, depth, num_threads=0):
     [16777203 33554430 67108862]
     """
     _check_depth(depth)
+    if compact:
+        _check_compact_depth(depth)
 
     ipix = np.atleast_1d(ipix)
-    _check_ipixels(data=ipix, depth=depth)
-    ipix = ipix.astype(np.uint64)
+    ipix = _as_hashes(ipix)
 
     # Allocation of the array containing the cells under the NESTED scheme
-    ipix_nested = np.zeros(ipix.shape, dtype=np.uint64)
+    ipix_nested = _check_out(out, ipix.shape, _out_dtypes(compact)[0])
 
     num_threads = np.uint16(num_threads)
     cdshealpix.from_ring(depth, ipix, ipix_nested, num_threads)
@@ -0,0 +1,326 @@
+//! Searches over many regions at once.
+//!
+//! The regions are covered in parallel and their cells are concatenated CSR-style:
+//! the cells of the `i`-th region are at `offsets[i]..offsets[i + 1]` in the
+//! returned `ipix`, `depth` and `fully_covered` arrays.
+
+use ndarray::{s, Array1, ArrayView1};
+use numpy::{IntoPyArray, PyArray1, PyReadonlyArray1};
+use pyo3::{exceptions::PyValueError, prelude::*, types::PyAny, Bound, PyResult};
+#[cfg(not(target_arch = "wasm32"))]
+use rayon::prelude::*;
+
+use healpix::nested::bmoc::BMOC;
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{check, dtypes::HashValue, dtypes::HashesVec, get_cells, get_flat_cells};
+
+type BatchCells<'py> = (
+  Bound<'py, PyAny>,
+  Bound<'py, PyArray1<u8>>,
+  Bound<'py, PyArray1<bool>>,
+  Bound<'py, PyArray1<u64>>,
+);
+
+type Concatenated<T> = (Array1<T>, Array1<u8>, Array1<bool>, Array1<u64>);
+
+/// Runs `search` for each of the `n` regions, without holding the GIL, and returns
+/// the concatenation of their cells with the offsets of each region.
+fn batch_search<'py, F>(
+  py: Python<'py>,
+  n: usize,
+  flat: bool,
+  compact: bool,
+  nthreads: u16,
+  search: F,
+) -> PyResult<BatchCells<'py>>
+where
+  F: Fn(usize) -> PyResult<BMOC> + Send + Sync,
+{
+  let (ipix, depth, fully_covered, offsets) = py.allow_threads(|| {
+    if compact {
+      concatenate::<u32, _>(n, flat, nthreads, &search)
+        .map(|(ipix, depth, full, offsets)| (HashesVec::U32(ipix), depth, full, offsets))
+    } else {
+      concatenate::<u64, _>(n, flat, nthreads, &search)
+        .map(|(ipix, depth, full, offsets)| (HashesVec::U64(ipix), depth, full, offsets))
+    }
+  })?;
+  Ok((
+    ipix.into_pyarray(py),
+    depth.into_pyarray(py),
+    fully_covered.into_pyarray(py),
+    offsets.into_pyarray(py),
+  ))
+}
+
+#[allow(unused_variables)]
+fn concatenate<T, F>(n: usize, flat: bool, nthreads: u16, search: &F) -> PyResult<Concatenated<T>>
+where
+  T: HashValue,
+  F: Fn(usize) -> PyResult<BMOC> + Send + Sync,
+{
+  let cells_of = |i: usize| {
+    search(i).map(|bmoc| {
+      if flat {
+        get_flat_cells::<T>(bmoc)
+      } else {
+        get_cells::<T>(bmoc)
+      }
+    })
+  };
+  #[cfg(not(target_arch = "wasm32"))]
+  let cells = thread_pool::get(nthreads).install(|| {
+    (0..n)
+      .into_par_iter()
+      .map(cells_of)
+      .collect::<PyResult<Vec<_>>>()
+  })?;
+  #[cfg(target_arch = "wasm32")]
+  let cells = (0..n).map(cells_of).collect::<PyResult<Vec<_>>>()?;
+
+  let mut offsets = Vec::<u64>::with_capacity(n + 1);
+  offsets.push(0);
+  for (ipix, _, _) in &cells {
+    offsets.push(offsets[offsets.len() - 1] + ipix.len() as u64);
+  }
+  let len = offsets[n] as usize;
+  let mut ipix = Vec::<T>::with_capacity(len);
+  let mut depth = Vec::<u8>::with_capacity(len);
+  let mut fully_covered = Vec::<bool>::with_capacity(len);
+  for (i, d, f) in cells {
+    ipix.extend(i.iter().copied());
+    depth.extend(d.iter().copied());
+    fully_covered.extend(f.iter().copied());
+  }
+  Ok((
+    ipix.into(),
+    depth.into(),
+    fully_covered.into(),
+    offsets.into(),
+  ))
+}
+
+pub(crate) fn check_same_len(lengths: &[usize]) -> PyResult<usize> {
+  match lengths.split_first() {
+    Some((&n, others)) if others.iter().all(|&len| len == n) => Ok(n),
+    _ => Err(PyValueError::new_err(
+      "The parameters of the regions must have the same length",
+    )),
+  }
+}
+
+/// Cone searches, `lon`, `lat` and `radius` in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn cone_search_batch<'py>(
+  py: Python<'py>,
+  depth: u8,
+  delta_depth: u8,
+  lon: PyReadonlyArray1<'py, f64>,
+  lat: PyReadonlyArray1<'py, f64>,
+  radius: PyReadonlyArray1<'py, f64>,
+  flat: bool,
+  compact: bool,
+  nthreads: u16,
+) -> PyResult<BatchCells<'py>> {
+  check::check_depth(depth)?;
+  let (lon, lat, radius) = (lon.as_array(), lat.as_array(), radius.as_array());
+  let n = check_same_len(&[lon.len(), lat.len(), radius.len()])?;
+  batch_search(py, n, flat, compact, nthreads, |i| {
+    Ok(healpix::nested::cone_coverage_approx_custom(
+      depth,
+      delta_depth,
+      lon[i],
+      lat[i],
+      radius[i],
+    ))
+  })
+}
+
+/// Checks that the `offsets` of the regions cut an array of `len` elements in
+/// consecutive slices, and returns the number of regions.
+pub(crate) fn check_offsets(offsets: &[u64], len: usize) -> PyResult<usize> {
+  let is_valid = offsets.first() == Some(&0)
+    && offsets.windows(2).all(|w| w[0] <= w[1])
+    && offsets.last() == Some(&(len as u64));
+  if is_valid {
+    Ok(offsets.len() - 1)
+  } else {
+    Err(PyValueError::new_err(format!(
+      "The offsets must be increasing, from 0 to the number of vertices ({})",
+      len
+    )))
+  }
+}
+
+/// Tells whether there are at least 3 distinct vertices, without sorting them.
+fn has_3_distinct_vertices(vertices: &[(f64, f64)]) -> bool {
+  let mut distinct = vertices.iter().take(1).collect::<Vec<_>>();
+  for v in vertices {
+    if !distinct.contains(&v) {
+      distinct.push(v);
+      if distinct.len() == 3 {
+        return true;
+      }
+    }
+  }
+  false
+}
+
+/// Returns the vertices of the `i`-th polygon, at `offsets[i]..offsets[i + 1]` in `lon`
+/// and `lat`, checking that they can form a polygon.
+pub(crate) fn polygon_vertices(
+  lon: &ArrayView1<f64>,
+  lat: &ArrayView1<f64>,
+  offsets: &[u64],
+  i: usize,
+) -> PyResult<Vec<(f64, f64)>> {
+  let range = offsets[i] as usize..offsets[i + 1] as usize;
+  let vertices = lon
+    .slice(s![range.clone()])
+    .iter()
+    .zip(lat.slice(s![range]).iter())
+    .map(|(&lon, &lat)| (lon, lat))
+    .collect::<Vec<(f64, f64)>>();
+  if vertices.len() < 3 {
+    Err(PyValueError::new_err(format!(
+      "There must be at least 3 vertices in order to form a polygon: polygon {}",
+      i
+    )))
+  } else if !has_3_distinct_vertices(&vertices) {
+    Err(PyValueError::new_err(format!(
+      "There must be at least 3 distinct vertices in order to form a polygon: polygon {}",
+      i
+    )))
+  } else {
+    Ok(vertices)
+  }
+}
+
+/// Polygon searches, the vertices of the `i`-th polygon being at
+/// `offsets[i]..offsets[i + 1]` in `lon` and `lat`, in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn polygon_search_batch<'py>(
+  py: Python<'py>,
+  depth: u8,
+  lon: PyReadonlyArray1<'py, f64>,
+  lat: PyReadonlyArray1<'py, f64>,
+  offsets: PyReadonlyArray1<'py, u64>,
+  flat: bool,
+  compact: bool,
+  nthreads: u16,
+) -> PyResult<BatchCells<'py>> {
+  check::check_depth(depth)?;
+  let (lon, lat) = (lon.as_array(), lat.as_array());
+  let offsets = offsets.as_slice()?;
+  let n = check_offsets(offsets, check_same_len(&[lon.len(), lat.len()])?)?;
+  batch_search(py, n, flat, compact, nthreads, |i| {
+    polygon_vertices(&lon, &lat, offsets, i)
+      .map(|vertices| healpix::nested::polygon_coverage(depth, &vertices, true))
+  })
+}
+
+/// Checks the semi-axes `a` and `b`, in radians, of the `i`-th ellipse.
+pub(crate) fn check_ellipse(a: f64, b: f64, i: usize) -> PyResult<()> {
+  if a >= std::f64::consts::FRAC_PI_2 {
+    Err(PyValueError::new_err(format!(
+      "The semi-major axis exceeds 90deg: ellipse {}",
+      i
+    )))
+  } else if b > a {
+    Err(PyValueError::new_err(format!(
+      "The semi-minor axis is greater than the semi-major axis: ellipse {}",
+      i
+    )))
+  } else {
+    Ok(())
+  }
+}
+
+/// Elliptical cone searches, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn elliptical_cone_search_batch<'py>(
+  py: Python<'py>,
+  depth: u8,
+  delta_depth: u8,
+  lon: PyReadonlyArray1<'py, f64>,
+  lat: PyReadonlyArray1<'py, f64>,
+  a: PyReadonlyArray1<'py, f64>,
+  b: PyReadonlyArray1<'py, f64>,
+  pa: PyReadonlyArray1<'py, f64>,
+  flat: bool,
+  compact: bool,
+  nthreads: u16,
+) -> PyResult<BatchCells<'py>> {
+  check::check_depth(depth)?;
+  let (lon, lat) = (lon.as_array(), lat.as_array());
+  let (a, b, pa) = (a.as_array(), b.as_array(), pa.as_array());
+  let n = check_same_len(&[lon.len(), lat.len(), a.len(), b.len(), pa.len()])?;
+  batch_search(py, n, flat, compact, nthreads, |i| {
+    check_ellipse(a[i], b[i], i)?;
+    Ok(healpix::nested::elliptical_cone_coverage_custom(
+      depth,
+      delta_depth,
+      lon[i],
+      lat[i],
+      a[i],
+      b[i],
+      pa[i],
+    ))
+  })
+}
+
+/// Box searches, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn box_search_batch<'py>(
+  py: Python<'py>,
+  depth: u8,
+  lon: PyReadonlyArray1<'py, f64>,
+  lat: PyReadonlyArray1<'py, f64>,
+  a: PyReadonlyArray1<'py, f64>,
+  b: PyReadonlyArray1<'py, f64>,
+  pa: PyReadonlyArray1<'py, f64>,
+  flat: bool,
+  compact: bool,
+  nthreads: u16,
+) -> PyResult<BatchCells<'py>> {
+  check::check_depth(depth)?;
+  let (lon, lat) = (lon.as_array(), lat.as_array());
+  let (a, b, pa) = (a.as_array(), b.as_array(), pa.as_array());
+  let n = check_same_len(&[lon.len(), lat.len(), a.len(), b.len(), pa.len()])?;
+  batch_search(py, n, flat, compact, nthreads, |i| {
+    Ok(healpix::nested::box_coverage(
+      depth, lon[i], lat[i], a[i], b[i], pa[i],
+    ))
+  })
+}
+
+/// Zone searches, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn zone_search_batch<'py>(
+  py: Python<'py>,
+  depth: u8,
+  lon_min: PyReadonlyArray1<'py, f64>,
+  lat_min: PyReadonlyArray1<'py, f64>,
+  lon_max: PyReadonlyArray1<'py, f64>,
+  lat_max: PyReadonlyArray1<'py, f64>,
+  flat: bool,
+  compact: bool,
+  nthreads: u16,
+) -> PyResult<BatchCells<'py>> {
+  check::check_depth(depth)?;
+  let (lon_min, lat_min) = (lon_min.as_array(), lat_min.as_array());
+  let (lon_max, lat_max) = (lon_max.as_array(), lat_max.as_array());
+  let n = check_same_len(&[lon_min.len(), lat_min.len(), lon_max.len(), lat_max.len()])?;
+  batch_search(py, n, flat, compact, nthreads, |i| {
+    Ok(healpix::nested::zone_coverage(
+      depth, lon_min[i], lat_min[i], lon_max[i], lat_max[i],
+    ))
+  })
+}
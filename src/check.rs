@@ -0,0 +1,203 @@
+//! Range checks of the HEALPix depths, nsides and cell indices.
+//!
+//! The kernels test their inputs element-wise while computing (a single pass over
+//! the arrays) and only raise a flag when they meet an invalid value. The arrays
+//! are then scanned again, sequentially, to build a precise error message. This
+//! second scan only happens on the error path.
+
+use std::sync::atomic::{AtomicBool, Ordering};
+
+use ndarray::{ArrayViewD, Dimension};
+use pyo3::{exceptions::PyValueError, PyErr, PyResult};
+
+use crate::dtypes::HashValue;
+
+pub const MAX_DEPTH: u8 = 29;
+pub const MAX_NSIDE: u32 = 1 << 29;
+
+/// Number of cells at the given depth, `depth` must be valid.
+#[inline]
+fn n_hash(depth: u8) -> u64 {
+  12_u64 << (depth << 1)
+}
+
+/// Number of cells for the given nside, `nside` must be valid.
+#[inline]
+fn n_hash_ring(nside: u32) -> u64 {
+  12 * (nside as u64) * (nside as u64)
+}
+
+#[inline]
+pub fn is_valid_depth(depth: u8) -> bool {
+  depth <= MAX_DEPTH
+}
+
+#[inline]
+pub fn is_valid_nside(nside: u32) -> bool {
+  (1..=MAX_NSIDE).contains(&nside)
+}
+
+/// Tells whether `hash` is a valid nested cell index at the given depth.
+#[inline]
+pub fn is_valid_hash(depth: u8, hash: u64) -> bool {
+  is_valid_depth(depth) && hash < n_hash(depth)
+}
+
+/// Tells whether `hash` is a valid ring cell index for the given nside.
+#[inline]
+pub fn is_valid_hash_ring(nside: u32, hash: u64) -> bool {
+  is_valid_nside(nside) && hash < n_hash_ring(nside)
+}
+
+/// Flag shared by the threads of a kernel, raised when an invalid input is met.
+#[derive(Default)]
+pub struct InvalidInput(AtomicBool);
+
+impl InvalidInput {
+  #[inline]
+  pub fn raise(&self) {
+    self.0.store(true, Ordering::Relaxed);
+  }
+
+  #[inline]
+  pub fn is_raised(&self) -> bool {
+    self.0.load(Ordering::Relaxed)
+  }
+}
+
+pub fn depth_error() -> PyErr {
+  PyValueError::new_err("Depth must be in the [0, 29] closed range")
+}
+
+pub fn nside_error() -> PyErr {
+  PyValueError::new_err("nside must be in the [1, (1 << 29)[ closed range")
+}
+
+pub fn check_depth(depth: u8) -> PyResult<()> {
+  if is_valid_depth(depth) {
+    Ok(())
+  } else {
+    Err(depth_error())
+  }
+}
+
+pub fn check_nside(nside: u32) -> PyResult<()> {
+  if is_valid_nside(nside) {
+    Ok(())
+  } else {
+    Err(nside_error())
+  }
+}
+
+/// Negative indices given from Python wrap around when cast to `u64`,
+/// we print them back as negative values.
+fn display_hash(hash: u64) -> String {
+  if hash > i64::MAX as u64 {
+    (hash as i64).to_string()
+  } else {
+    hash.to_string()
+  }
+}
+
+/// Only returned if the kernel flag was raised while all the inputs are valid.
+fn unreachable_error() -> PyErr {
+  PyValueError::new_err("Invalid HEALPix input")
+}
+
+fn depth_error_at(depth: u8, index: &[usize]) -> PyErr {
+  PyValueError::new_err(format!(
+    "Depth must be in the [0, 29] closed range: {} at index {:?}.",
+    depth, index
+  ))
+}
+
+fn nside_error_at(nside: u32, index: &[usize]) -> PyErr {
+  PyValueError::new_err(format!(
+    "nside must be in the [1, (1 << 29)[ closed range: {} at index {:?}.",
+    nside, index
+  ))
+}
+
+fn hash_error(hash: u64, n_hash: u64, index: &[usize]) -> PyErr {
+  PyValueError::new_err(format!(
+    "The input HEALPix array contains values out of [0, {}[: {} at index {:?}.",
+    n_hash,
+    display_hash(hash),
+    index
+  ))
+}
+
+/// Returns the error describing the first invalid depth.
+pub fn first_invalid_depth(depth: &ArrayViewD<u8>) -> PyErr {
+  depth
+    .indexed_iter()
+    .find(|(_, &d)| !is_valid_depth(d))
+    .map(|(index, &d)| depth_error_at(d, index.slice()))
+    .unwrap_or_else(unreachable_error)
+}
+
+/// Returns the error describing the first invalid nside.
+pub fn first_invalid_nside(nside: &ArrayViewD<u32>) -> PyErr {
+  nside
+    .indexed_iter()
+    .find(|(_, &n)| !is_valid_nside(n))
+    .map(|(index, &n)| nside_error_at(n, index.slice()))
+    .unwrap_or_else(unreachable_error)
+}
+
+/// Returns the error describing the first invalid (depth, hash) tuple.
+/// `depth` and `ipix` must have the same shape.
+pub fn first_invalid_hash<T: HashValue>(depth: &ArrayViewD<u8>, ipix: &ArrayViewD<T>) -> PyErr {
+  for ((index, &p), &d) in ipix.indexed_iter().zip(depth.iter()) {
+    let p = p.to_hash();
+    if !is_valid_depth(d) {
+      return depth_error_at(d, index.slice());
+    } else if p >= n_hash(d) {
+      return hash_error(p, n_hash(d), index.slice());
+    }
+  }
+  unreachable_error()
+}
+
+/// Same as `first_invalid_hash` for a single depth.
+pub fn first_invalid_hash_at_depth<T: HashValue>(depth: u8, ipix: &ArrayViewD<T>) -> PyErr {
+  if !is_valid_depth(depth) {
+    return depth_error();
+  }
+  let n = n_hash(depth);
+  ipix
+    .indexed_iter()
+    .find(|(_, &p)| p.to_hash() >= n)
+    .map(|(index, &p)| hash_error(p.to_hash(), n, index.slice()))
+    .unwrap_or_else(unreachable_error)
+}
+
+/// Returns the error describing the first invalid (nside, hash) tuple.
+/// `nside` and `ipix` must have the same shape.
+pub fn first_invalid_hash_ring<T: HashValue>(
+  nside: &ArrayViewD<u32>,
+  ipix: &ArrayViewD<T>,
+) -> PyErr {
+  for ((index, &p), &n) in ipix.indexed_iter().zip(nside.iter()) {
+    let p = p.to_hash();
+    if !is_valid_nside(n) {
+      return nside_error_at(n, index.slice());
+    } else if p >= n_hash_ring(n) {
+      return hash_error(p, n_hash_ring(n), index.slice());
+    }
+  }
+  unreachable_error()
+}
+
+/// Same as `first_invalid_hash_ring` for a single nside.
+pub fn first_invalid_hash_at_nside<T: HashValue>(nside: u32, ipix: &ArrayViewD<T>) -> PyErr {
+  if !is_valid_nside(nside) {
+    return nside_error();
+  }
+  let n = n_hash_ring(nside);
+  ipix
+    .indexed_iter()
+    .find(|(_, &p)| p.to_hash() >= n)
+    .map(|(index, &p)| hash_error(p.to_hash(), n, index.slice()))
+    .unwrap_or_else(unreachable_error)
+}
@@ -0,0 +1,457 @@
+//! Classification of many points against many regions.
+//!
+//! The coverages of the regions are indexed by the NUNIQ index of their cells. Each
+//! point is hashed once, at the depth of the coverages, and looked up at every depth
+//! of the index by shifting its hash. A point in a cell fully covered by a region is
+//! inside it without further test, the others are tested exactly against the region.
+
+use std::{
+  collections::HashMap,
+  f64::consts::{FRAC_PI_2, PI},
+  ops::Range,
+};
+
+use ndarray::ArrayView1;
+use numpy::{IntoPyArray, PyArray1, PyReadonlyArray1};
+use pyo3::{exceptions::PyValueError, prelude::*, Bound, PyResult};
+#[cfg(not(target_arch = "wasm32"))]
+use rayon::prelude::*;
+
+use healpix::{
+  nested::bmoc::BMOC,
+  sph_geom::{
+    coo3d::{Coo3D, LonLat},
+    Polygon,
+  },
+};
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  batch::{check_ellipse, check_offsets, check_same_len, polygon_vertices},
+  check,
+  coverage::nuniq,
+  dtypes::{as_1d, with_lonlat, CoordValue, Coords},
+};
+
+/// Number of points classified by each task.
+const CHUNK_LEN: usize = 1 << 14;
+
+type Pairs<'py> = (Bound<'py, PyArray1<u64>>, Bound<'py, PyArray1<u64>>);
+
+pub(crate) trait Region: Send + Sync {
+  /// Exact containment test of a point, `lon` and `lat` in radians.
+  fn contains_lonlat(&self, lon: f64, lat: f64) -> bool;
+}
+
+pub(crate) struct Cone {
+  lon: f64,
+  lat: f64,
+  cos_lat: f64,
+  /// Haversine of the radius.
+  hav_radius: f64,
+}
+
+impl Cone {
+  pub(crate) fn new(lon: f64, lat: f64, radius: f64) -> Self {
+    let s = (0.5 * radius.min(PI)).sin();
+    Self {
+      lon,
+      lat,
+      cos_lat: lat.cos(),
+      hav_radius: s * s,
+    }
+  }
+}
+
+impl Region for Cone {
+  #[inline]
+  fn contains_lonlat(&self, lon: f64, lat: f64) -> bool {
+    let s_lat = (0.5 * (lat - self.lat)).sin();
+    let s_lon = (0.5 * (lon - self.lon)).sin();
+    s_lat * s_lat + self.cos_lat * lat.cos() * s_lon * s_lon <= self.hav_radius
+  }
+}
+
+/// An elliptical cone: a point is inside when its orthographic projection on the plane
+/// tangent to the center is inside the ellipse of semi-axes `sin(a)` and `sin(b)`.
+pub(crate) struct Ellipse {
+  /// Unit vector of the center.
+  center: [f64; 3],
+  /// Unit vector of the direction of the semi-major axis, at the center.
+  major: [f64; 3],
+  /// Unit vector of the direction of the semi-minor axis, at the center.
+  minor: [f64; 3],
+  sin2_a: f64,
+  sin2_b: f64,
+}
+
+/// The unit vectors of the center (`lon`, `lat`), and of the directions, at the center,
+/// of position angle `pa` (east of north) and `pa + 90deg`, all in radians.
+fn local_frame(lon: f64, lat: f64, pa: f64) -> [[f64; 3]; 3] {
+  let (sin_lon, cos_lon) = lon.sin_cos();
+  let (sin_lat, cos_lat) = lat.sin_cos();
+  let (sin_pa, cos_pa) = pa.sin_cos();
+  let north = [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat];
+  let east = [-sin_lon, cos_lon, 0.0];
+  [
+    [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat],
+    [0, 1, 2].map(|k| cos_pa * north[k] + sin_pa * east[k]),
+    [0, 1, 2].map(|k| cos_pa * east[k] - sin_pa * north[k]),
+  ]
+}
+
+impl Ellipse {
+  /// Ellipse of center (`lon`, `lat`), of semi-axes `a` and `b` and of position angle
+  /// `pa` (east of north), in radians.
+  pub(crate) fn new(lon: f64, lat: f64, a: f64, b: f64, pa: f64) -> Self {
+    let [center, major, minor] = local_frame(lon, lat, pa);
+    let (sin_a, sin_b) = (a.sin(), b.sin());
+    Self {
+      center,
+      major,
+      minor,
+      sin2_a: sin_a * sin_a,
+      sin2_b: sin_b * sin_b,
+    }
+  }
+}
+
+#[inline]
+fn dot(u: &[f64; 3], v: &[f64; 3]) -> f64 {
+  u[0] * v[0] + u[1] * v[1] + u[2] * v[2]
+}
+
+impl Region for Ellipse {
+  #[inline]
+  fn contains_lonlat(&self, lon: f64, lat: f64) -> bool {
+    let (sin_lon, cos_lon) = lon.sin_cos();
+    let (sin_lat, cos_lat) = lat.sin_cos();
+    let p = [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat];
+    let (u, v) = (dot(&p, &self.major), dot(&p, &self.minor));
+    // u² / sin²(a) + v² / sin²(b) <= 1, without dividing by a null semi-minor axis
+    dot(&p, &self.center) > 0.0
+      && u * u * self.sin2_b + v * v * self.sin2_a <= self.sin2_a * self.sin2_b
+  }
+}
+
+impl Region for Polygon {
+  #[inline]
+  fn contains_lonlat(&self, lon: f64, lat: f64) -> bool {
+    self.contains(&Coo3D::from_sph_coo(lon, lat))
+  }
+}
+
+/// The polygon having the given (lon, lat) vertices, in radians.
+pub(crate) fn polygon(vertices: &[(f64, f64)]) -> Polygon {
+  Polygon::new(
+    vertices
+      .iter()
+      .map(|&(lon, lat)| LonLat { lon, lat })
+      .collect::<Vec<LonLat>>()
+      .into_boxed_slice(),
+  )
+}
+
+/// The (lon, lat) vertices, in radians, of the box of center (`lon`, `lat`), of
+/// extensions `a` along its axis of position angle `pa` (east of north) and `b` along
+/// the other, as covered by `healpix::nested::box_coverage`. Its sides follow great
+/// circles.
+pub(crate) fn box_vertices(lon: f64, lat: f64, a: f64, b: f64, pa: f64) -> Vec<(f64, f64)> {
+  let [center, major, minor] = local_frame(lon, lat, pa);
+  // the sides cross the axis of `pa` at `a` from the center and the other axis at `b`:
+  // seen from the axis of `pa`, the corners are at the latitude `atan(cos(a) tan(b))`
+  let (sin_a, cos_a) = a.sin_cos();
+  let (sin_t, cos_t) = (cos_a * b.tan()).atan().sin_cos();
+  [(1.0, 1.0), (-1.0, 1.0), (-1.0, -1.0), (1.0, -1.0)]
+    .iter()
+    .map(|&(s, t)| {
+      let v = [0, 1, 2]
+        .map(|k| cos_t * (cos_a * center[k] + s * sin_a * major[k]) + t * sin_t * minor[k]);
+      (
+        v[1].atan2(v[0]).rem_euclid(2.0 * PI),
+        v[2].clamp(-1.0, 1.0).asin(),
+      )
+    })
+    .collect()
+}
+
+/// A zone, `lon_min` being greater than `lon_max` for the zones crossing the
+/// meridian 0.
+pub(crate) struct Zone {
+  pub(crate) lon_min: f64,
+  pub(crate) lat_min: f64,
+  pub(crate) lon_max: f64,
+  pub(crate) lat_max: f64,
+}
+
+impl Region for Zone {
+  #[inline]
+  fn contains_lonlat(&self, lon: f64, lat: f64) -> bool {
+    let in_lon = if self.lon_min <= self.lon_max {
+      self.lon_min <= lon && lon < self.lon_max
+    } else {
+      self.lon_min <= lon || lon < self.lon_max
+    };
+    // the north pole is in the zones reaching it
+    let in_lat =
+      self.lat_min <= lat && (lat < self.lat_max || (lat == FRAC_PI_2 && self.lat_max == lat));
+    in_lon && in_lat
+  }
+}
+
+/// The cells of the coverages of the regions.
+struct CoverageIndex {
+  /// Depth of the coverages, at which the points are hashed.
+  depth: u8,
+  /// Depths of the cells of the index, in increasing order.
+  depths: Vec<u8>,
+  /// For each cell, by NUNIQ index, its range in `regions`.
+  cells: HashMap<u64, Range<usize>>,
+  /// Index of the regions overlapping the cells, and whether they fully cover them.
+  regions: Vec<(u32, bool)>,
+}
+
+impl CoverageIndex {
+  fn new(depth: u8, coverages: Vec<BMOC>) -> Self {
+    let mut entries = coverages
+      .into_iter()
+      .enumerate()
+      .flat_map(|(i, bmoc)| {
+        bmoc
+          .into_iter()
+          .map(move |c| (nuniq(c.depth, c.hash), i as u32, c.is_full))
+      })
+      .collect::<Vec<_>>();
+    #[cfg(not(target_arch = "wasm32"))]
+    entries.par_sort_unstable();
+    #[cfg(target_arch = "wasm32")]
+    entries.sort_unstable();
+
+    let mut has_depth = [false; check::MAX_DEPTH as usize + 1];
+    let mut cells = HashMap::new();
+    let mut regions = Vec::with_capacity(entries.len());
+    let mut start = 0;
+    for (i, &(uniq, region, is_full)) in entries.iter().enumerate() {
+      regions.push((region, is_full));
+      if entries.get(i + 1).map_or(true, |next| next.0 != uniq) {
+        has_depth[((63 - uniq.leading_zeros()) >> 1) as usize - 1] = true;
+        cells.insert(uniq, start..i + 1);
+        start = i + 1;
+      }
+    }
+    let depths = (0..=depth).filter(|&d| has_depth[d as usize]).collect();
+    Self {
+      depth,
+      depths,
+      cells,
+      regions,
+    }
+  }
+
+  /// Writes in `found` the indices of the regions containing the point, in increasing
+  /// order.
+  fn regions_containing<R: Region>(&self, regions: &[R], lon: f64, lat: f64, found: &mut Vec<u32>) {
+    found.clear();
+    let hash = healpix::nested::get(self.depth).hash(lon, lat);
+    for &d in &self.depths {
+      let uniq = nuniq(d, hash >> ((self.depth - d) << 1));
+      if let Some(range) = self.cells.get(&uniq) {
+        for &(r, is_full) in &self.regions[range.clone()] {
+          if is_full || regions[r as usize].contains_lonlat(lon, lat) {
+            found.push(r);
+          }
+        }
+      }
+    }
+    found.sort_unstable();
+  }
+}
+
+/// Returns the (point, region) pairs, ordered by point then by region.
+fn classify<T: CoordValue, R: Region>(
+  index: &CoverageIndex,
+  regions: &[R],
+  lon: ArrayView1<T>,
+  lat: ArrayView1<T>,
+) -> (Vec<u64>, Vec<u64>) {
+  let classify_chunk = |chunk: usize| {
+    let mut pairs = Vec::<(u64, u64)>::new();
+    let mut found = Vec::<u32>::new();
+    for i in chunk * CHUNK_LEN..((chunk + 1) * CHUNK_LEN).min(lon.len()) {
+      index.regions_containing(regions, lon[i].to_f64(), lat[i].to_f64(), &mut found);
+      pairs.extend(found.iter().map(|&r| (i as u64, r as u64)));
+    }
+    pairs
+  };
+  let n_chunks = lon.len().div_ceil(CHUNK_LEN);
+  #[cfg(not(target_arch = "wasm32"))]
+  let chunks = (0..n_chunks)
+    .into_par_iter()
+    .map(classify_chunk)
+    .collect::<Vec<_>>();
+  #[cfg(target_arch = "wasm32")]
+  let chunks = (0..n_chunks).map(classify_chunk).collect::<Vec<_>>();
+
+  let len = chunks.iter().map(Vec::len).sum();
+  let mut points = Vec::<u64>::with_capacity(len);
+  let mut regions = Vec::<u64>::with_capacity(len);
+  for (p, r) in chunks.into_iter().flatten() {
+    points.push(p);
+    regions.push(r);
+  }
+  (points, regions)
+}
+
+/// Indexes the coverages of the `n` regions, computed by `coverage`, and classifies
+/// the points, without holding the GIL.
+#[allow(unused_variables)]
+fn points_in_regions<'py, R, F>(
+  py: Python<'py>,
+  depth: u8,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  n: usize,
+  region: F,
+  nthreads: u16,
+) -> PyResult<Pairs<'py>>
+where
+  R: Region,
+  F: Fn(usize) -> PyResult<(R, BMOC)> + Send + Sync,
+{
+  if n > u32::MAX as usize {
+    return Err(PyValueError::new_err("Too many regions"));
+  }
+  let (points, regions) = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    let run = || -> PyResult<(Vec<u64>, Vec<u64>)> {
+      #[cfg(not(target_arch = "wasm32"))]
+      let regions = (0..n)
+        .into_par_iter()
+        .map(&region)
+        .collect::<PyResult<Vec<_>>>()?;
+      #[cfg(target_arch = "wasm32")]
+      let regions = (0..n).map(&region).collect::<PyResult<Vec<_>>>()?;
+
+      let (regions, coverages): (Vec<R>, Vec<BMOC>) = regions.into_iter().unzip();
+      let index = CoverageIndex::new(depth, coverages);
+      Ok(classify(&index, &regions, lon, lat))
+    };
+    #[cfg(not(target_arch = "wasm32"))]
+    let pairs = py.allow_threads(|| thread_pool::get(nthreads).install(run));
+    #[cfg(target_arch = "wasm32")]
+    let pairs = py.allow_threads(run);
+    pairs
+  })?;
+  Ok((points.into_pyarray(py), regions.into_pyarray(py)))
+}
+
+/// Points (`lon`, `lat`) in cones, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn points_in_cones<'py>(
+  py: Python<'py>,
+  depth: u8,
+  delta_depth: u8,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  cone_lon: PyReadonlyArray1<'py, f64>,
+  cone_lat: PyReadonlyArray1<'py, f64>,
+  radius: PyReadonlyArray1<'py, f64>,
+  nthreads: u16,
+) -> PyResult<Pairs<'py>> {
+  check::check_depth(depth)?;
+  let (cone_lon, cone_lat) = (cone_lon.as_array(), cone_lat.as_array());
+  let radius = radius.as_array();
+  let n = check_same_len(&[cone_lon.len(), cone_lat.len(), radius.len()])?;
+  points_in_regions(
+    py,
+    depth,
+    lon,
+    lat,
+    n,
+    |i| {
+      let (lon, lat, radius) = (cone_lon[i], cone_lat[i], radius[i]);
+      let coverage =
+        healpix::nested::cone_coverage_approx_custom(depth, delta_depth, lon, lat, radius);
+      Ok((Cone::new(lon, lat, radius), coverage))
+    },
+    nthreads,
+  )
+}
+
+/// Points (`lon`, `lat`) in elliptical cones, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn points_in_ellipses<'py>(
+  py: Python<'py>,
+  depth: u8,
+  delta_depth: u8,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  ellipse_lon: PyReadonlyArray1<'py, f64>,
+  ellipse_lat: PyReadonlyArray1<'py, f64>,
+  a: PyReadonlyArray1<'py, f64>,
+  b: PyReadonlyArray1<'py, f64>,
+  pa: PyReadonlyArray1<'py, f64>,
+  nthreads: u16,
+) -> PyResult<Pairs<'py>> {
+  check::check_depth(depth)?;
+  let (ellipse_lon, ellipse_lat) = (ellipse_lon.as_array(), ellipse_lat.as_array());
+  let (a, b, pa) = (a.as_array(), b.as_array(), pa.as_array());
+  let n = check_same_len(&[
+    ellipse_lon.len(),
+    ellipse_lat.len(),
+    a.len(),
+    b.len(),
+    pa.len(),
+  ])?;
+  points_in_regions(
+    py,
+    depth,
+    lon,
+    lat,
+    n,
+    |i| {
+      let (lon, lat, a, b, pa) = (ellipse_lon[i], ellipse_lat[i], a[i], b[i], pa[i]);
+      check_ellipse(a, b, i)?;
+      let coverage =
+        healpix::nested::elliptical_cone_coverage_custom(depth, delta_depth, lon, lat, a, b, pa);
+      Ok((Ellipse::new(lon, lat, a, b, pa), coverage))
+    },
+    nthreads,
+  )
+}
+
+/// Points (`lon`, `lat`) in polygons, the vertices of the `i`-th polygon being at
+/// `offsets[i]..offsets[i + 1]` in `poly_lon` and `poly_lat`, all in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn points_in_polygons<'py>(
+  py: Python<'py>,
+  depth: u8,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  poly_lon: PyReadonlyArray1<'py, f64>,
+  poly_lat: PyReadonlyArray1<'py, f64>,
+  offsets: PyReadonlyArray1<'py, u64>,
+  nthreads: u16,
+) -> PyResult<Pairs<'py>> {
+  check::check_depth(depth)?;
+  let (poly_lon, poly_lat) = (poly_lon.as_array(), poly_lat.as_array());
+  let offsets = offsets.as_slice()?;
+  let n = check_offsets(offsets, check_same_len(&[poly_lon.len(), poly_lat.len()])?)?;
+  points_in_regions(
+    py,
+    depth,
+    lon,
+    lat,
+    n,
+    |i| {
+      let vertices = polygon_vertices(&poly_lon, &poly_lat, offsets, i)?;
+      let coverage = healpix::nested::polygon_coverage(depth, &vertices, true);
+      Ok((polygon(&vertices), coverage))
+    },
+    nthreads,
+  )
+}
@@ -0,0 +1,817 @@
+//! Output formats of the coverages returned by the searches, and operations on them.
+//!
+//! Besides the (hash, depth, fully covered) cells, a coverage can be returned as the
+//! NUNIQ indices of its cells, or as the sorted ranges [start, end[ of the depth 29
+//! cells it contains, adjacent ranges being merged.
+//!
+//! The cells given back from Python are turned into BMOCs, whose set operations merge
+//! their sorted cells in linear time, keeping the multi-order form. Points and cells
+//! are tested against a coverage by binary search in its merged depth 29 ranges.
+//! Coverages are dilated and eroded ring by ring, at their deepest depth, each ring
+//! being made of the external edges of the cells of the previous one.
+
+use ndarray::{Array1, Array2, ArrayViewD, Zip};
+use numpy::{IntoPyArray, PyArray1, PyArrayDyn, PyReadonlyArrayDyn};
+use pyo3::{exceptions::PyValueError, prelude::*, Bound, PyAny, PyResult};
+#[cfg(not(target_arch = "wasm32"))]
+use rayon::prelude::*;
+
+use healpix::compass_point::{Cardinal, Ordinal};
+use healpix::nested::{
+  bmoc::{BMOCBuilderUnsafe, BMOC},
+  Layer,
+};
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  check, contains,
+  dtypes::{as_1d, with_hashes, with_lonlat, CoordValue, Coords, HashValue, Hashes, HashesVec},
+  regions, search_cells,
+};
+
+/// The cells of a coverage given from Python: their hashes, their depths and whether
+/// they are fully covered.
+pub(crate) type CoverageCells<'py> = (
+  Hashes<'py>,
+  PyReadonlyArrayDyn<'py, u8>,
+  PyReadonlyArrayDyn<'py, bool>,
+);
+
+/// The formats of the coverages.
+#[derive(Clone, Copy)]
+pub(crate) enum Format {
+  /// The cells, their depths and whether they are fully covered.
+  Cells,
+  /// The NUNIQ indices of the cells.
+  Uniq,
+  /// The merged ranges of depth 29 cells.
+  Ranges,
+}
+
+impl Format {
+  pub(crate) fn parse(name: &str) -> PyResult<Self> {
+    match name {
+      "cells" => Ok(Self::Cells),
+      "uniq" => Ok(Self::Uniq),
+      "ranges" => Ok(Self::Ranges),
+      _ => Err(PyValueError::new_err(format!(
+        "Unknown output '{}', expected 'cells', 'uniq' or 'ranges'",
+        name
+      ))),
+    }
+  }
+}
+
+/// A coverage in one of the `Format`s.
+pub(crate) enum Coverage {
+  Cells(HashesVec, Array1<u8>, Array1<bool>),
+  Uniq(HashesVec),
+  Ranges(Array2<u64>),
+}
+
+impl Coverage {
+  pub(crate) fn new(bmoc: BMOC, format: Format, flat: bool, compact: bool) -> Self {
+    match format {
+      Format::Cells => {
+        let (ipix, depth, fully_covered) = search_cells(bmoc, flat, compact);
+        Self::Cells(ipix, depth, fully_covered)
+      }
+      Format::Uniq => {
+        let uniq = if flat {
+          bmoc
+            .flat_iter_cell()
+            .map(|c| nuniq(c.depth, c.hash))
+            .collect::<Vec<_>>()
+        } else {
+          bmoc
+            .into_iter()
+            .map(|c| nuniq(c.depth, c.hash))
+            .collect::<Vec<_>>()
+        };
+        if compact {
+          Self::Uniq(HashesVec::U32(uniq.into_iter().map(|u| u as u32).collect()))
+        } else {
+          Self::Uniq(HashesVec::U64(uniq.into()))
+        }
+      }
+      Format::Ranges => Self::of_ranges(ranges(bmoc)),
+    }
+  }
+
+  /// The coverage made of sorted non-overlapping cells, in their order.
+  pub(crate) fn of_cells(cells: &[Cell], format: Format, compact: bool) -> Self {
+    let hashes = |hash: fn(&Cell) -> u64| {
+      if compact {
+        HashesVec::U32(cells.iter().map(|c| hash(c) as u32).collect())
+      } else {
+        HashesVec::U64(cells.iter().map(hash).collect())
+      }
+    };
+    match format {
+      Format::Cells => Self::Cells(
+        hashes(|c| c.hash),
+        cells.iter().map(|c| c.depth).collect(),
+        cells.iter().map(|c| c.full).collect(),
+      ),
+      Format::Uniq => Self::Uniq(hashes(|c| nuniq(c.depth, c.hash))),
+      Format::Ranges => Self::of_ranges(merge_ranges(
+        cells.len(),
+        cells.iter().map(|c| (c.depth, c.hash)),
+      )),
+    }
+  }
+
+  fn of_ranges(ranges: Vec<u64>) -> Self {
+    let n = ranges.len() / 2;
+    Self::Ranges(Array2::from_shape_vec((n, 2), ranges).unwrap())
+  }
+
+  pub(crate) fn into_py(self, py: Python<'_>) -> PyResult<Bound<'_, PyAny>> {
+    match self {
+      Self::Cells(ipix, depth, fully_covered) => Ok(
+        (
+          ipix.into_pyarray(py),
+          depth.into_pyarray(py),
+          fully_covered.into_pyarray(py),
+        )
+          .into_pyobject(py)?
+          .into_any(),
+      ),
+      Self::Uniq(uniq) => Ok(uniq.into_pyarray(py)),
+      Self::Ranges(ranges) => Ok(ranges.into_pyarray(py).into_any()),
+    }
+  }
+}
+
+#[inline]
+pub(crate) fn nuniq(depth: u8, hash: u64) -> u64 {
+  (4_u64 << (depth << 1)) | hash
+}
+
+/// Returns the flattened ranges [start, end[ of the depth 29 cells of the coverage,
+/// sorted and with the adjacent ranges merged.
+pub(crate) fn ranges(bmoc: BMOC) -> Vec<u64> {
+  merge_ranges(
+    bmoc.entries.len(),
+    bmoc.into_iter().map(|c| (c.depth, c.hash)),
+  )
+}
+
+/// Returns the flattened ranges of the depth 29 cells of sorted (depth, hash) cells,
+/// with the adjacent ranges merged.
+fn merge_ranges(len: usize, cells: impl Iterator<Item = (u8, u64)>) -> Vec<u64> {
+  let mut ranges = Vec::<u64>::with_capacity(len << 1);
+  for (depth, hash) in cells {
+    let shift = (check::MAX_DEPTH - depth) << 1;
+    let (start, end) = (hash << shift, (hash + 1) << shift);
+    match ranges.last_mut() {
+      Some(last) if *last == start => *last = end,
+      _ => ranges.extend([start, end]),
+    }
+  }
+  ranges
+}
+
+/// The sorted and merged ranges of the depth 29 cells of a coverage, flattened.
+pub(crate) struct Ranges(Vec<u64>);
+
+impl Ranges {
+  /// Ranges of the cells of the coverage or, with `fully_covered`, of its fully
+  /// covered cells only.
+  pub(crate) fn new(bmoc: BMOC, fully_covered: bool) -> Self {
+    Self::of_cells(&cells_of(bmoc), fully_covered)
+  }
+
+  fn of_cells(cells: &[Cell], fully_covered: bool) -> Self {
+    Self::filtered(cells, |c| c.full || !fully_covered)
+  }
+
+  /// Ranges of the cells of the coverage that are not fully covered.
+  fn of_partial_cells(cells: &[Cell]) -> Self {
+    Self::filtered(cells, |c| !c.full)
+  }
+
+  fn filtered(cells: &[Cell], keep: impl Fn(&Cell) -> bool) -> Self {
+    let len = cells.len();
+    let cells = cells.iter().filter(|c| keep(c)).map(|c| (c.depth, c.hash));
+    Self(merge_ranges(len, cells))
+  }
+
+  /// Tells whether the depth 29 cells [start, end[ are all in the ranges.
+  #[inline]
+  pub(crate) fn contains(&self, start: u64, end: u64) -> bool {
+    let i = self.0.partition_point(|&x| x <= start);
+    i & 1 == 1 && end <= self.0[i]
+  }
+
+  /// Tells whether the cell `hash` at `depth` is in the ranges.
+  #[inline]
+  pub(crate) fn contains_cell(&self, depth: u8, hash: u64) -> bool {
+    let shift = (check::MAX_DEPTH - depth) << 1;
+    self.contains(hash << shift, (hash + 1) << shift)
+  }
+}
+
+/// Builds the BMOC at `depth_max` of non-overlapping cells given in any order.
+fn to_bmoc<T: HashValue>(
+  depth_max: u8,
+  ipix: ArrayViewD<T>,
+  depth: ArrayViewD<u8>,
+  fully_covered: ArrayViewD<bool>,
+) -> PyResult<BMOC> {
+  if ipix.shape() != depth.shape() || ipix.shape() != fully_covered.shape() {
+    return Err(PyValueError::new_err(
+      "The cells, their depths and their flags must have the same shape",
+    ));
+  }
+  let mut builder = BMOCBuilderUnsafe::new(depth_max, ipix.len());
+  for ((p, &d), &full) in ipix.iter().zip(depth.iter()).zip(fully_covered.iter()) {
+    let hash = p.to_hash();
+    if !check::is_valid_hash(d, hash) {
+      return Err(check::first_invalid_hash(&depth, &ipix));
+    }
+    builder.push(d, hash, full);
+  }
+  Ok(builder.to_bmoc_from_unordered())
+}
+
+/// The deepest of the depths of the cells of the coverages and `depth`.
+fn depth_max(coverages: &[CoverageCells], depth: u8) -> PyResult<u8> {
+  let depth_max = coverages
+    .iter()
+    .flat_map(|(_, d, _)| d.as_array().iter().copied().max())
+    .fold(depth, u8::max);
+  check::check_depth(depth_max)?;
+  Ok(depth_max)
+}
+
+/// Builds the BMOCs of the coverages, at the deepest of their depths and `depth`.
+pub(crate) fn to_bmocs(py: Python, coverages: &[CoverageCells], depth: u8) -> PyResult<Vec<BMOC>> {
+  let depth_max = depth_max(coverages, depth)?;
+  coverages
+    .iter()
+    .map(|(ipix, d, full)| {
+      let (d, full) = (d.as_array(), full.as_array());
+      with_hashes!(ipix, |ipix| {
+        py.allow_threads(|| to_bmoc(depth_max, ipix, d, full))
+      })
+    })
+    .collect()
+}
+
+#[derive(Clone, Copy)]
+enum Operation {
+  Union,
+  Intersection,
+  Difference,
+  Complement,
+}
+
+impl Operation {
+  fn parse(name: &str) -> PyResult<Self> {
+    match name {
+      "union" => Ok(Self::Union),
+      "intersection" => Ok(Self::Intersection),
+      "difference" => Ok(Self::Difference),
+      "complement" => Ok(Self::Complement),
+      _ => Err(PyValueError::new_err(format!(
+        "Unknown operation '{}', expected 'union', 'intersection', 'difference' or \
+         'complement'",
+        name
+      ))),
+    }
+  }
+}
+
+/// Set `operation` on the coverages, folded from the first one, at the deepest of
+/// their depths and `depth`. The complement only applies to the first coverage.
+#[pyfunction]
+pub fn coverage_operation<'py>(
+  py: Python<'py>,
+  operation: &str,
+  coverages: Vec<CoverageCells<'py>>,
+  depth: u8,
+  output: &str,
+) -> PyResult<Bound<'py, PyAny>> {
+  let operation = Operation::parse(operation)?;
+  let format = Format::parse(output)?;
+  let mut bmocs = to_bmocs(py, &coverages, depth)?.into_iter();
+  let first = bmocs
+    .next()
+    .ok_or_else(|| PyValueError::new_err("At least one coverage is expected"))?;
+  let coverage = py.allow_threads(|| {
+    let bmoc = match operation {
+      Operation::Union => bmocs.fold(first, |acc, bmoc| acc.or(&bmoc)),
+      Operation::Intersection => bmocs.fold(first, |acc, bmoc| acc.and(&bmoc)),
+      Operation::Difference => bmocs.fold(first, |acc, bmoc| acc.minus(&bmoc)),
+      Operation::Complement => first.not(),
+    };
+    Coverage::new(bmoc, format, false, false)
+  });
+  coverage.into_py(py)
+}
+
+/// A cell of a coverage.
+#[derive(Clone, Copy)]
+pub(crate) struct Cell {
+  depth: u8,
+  hash: u64,
+  full: bool,
+}
+
+impl Cell {
+  /// The range [start, end[ of the depth 29 cells in the cell.
+  #[inline]
+  fn range(&self) -> (u64, u64) {
+    let shift = (check::MAX_DEPTH - self.depth) << 1;
+    (self.hash << shift, (self.hash + 1) << shift)
+  }
+
+  #[inline]
+  fn parent(&self, full: bool) -> Self {
+    Self {
+      depth: self.depth - 1,
+      hash: self.hash >> 2,
+      full,
+    }
+  }
+}
+
+/// Number of ranges of the depth 29 cells of the sorted cells, once merged.
+fn n_ranges(cells: &[Cell]) -> usize {
+  let mut n = 0;
+  let mut last_end = None;
+  for cell in cells {
+    let (start, end) = cell.range();
+    if last_end != Some(start) {
+      n += 1;
+    }
+    last_end = Some(end);
+  }
+  n
+}
+
+/// Replaces the sorted cells at `depth` that are partially covered, or all of them
+/// with `all`, by their partially covered parents. The parents absorb the cells they
+/// contain, and four fully covered siblings are merged into their parent.
+fn coarsen(cells: &[Cell], depth: u8, all: bool) -> Vec<Cell> {
+  let mut coarse = Vec::<Cell>::with_capacity(cells.len());
+  for &cell in cells {
+    let cell = if cell.depth == depth && (all || !cell.full) {
+      cell.parent(false)
+    } else {
+      cell
+    };
+    let (start, end) = cell.range();
+    if coarse.last().is_some_and(|last| end <= last.range().1) {
+      continue;
+    }
+    // the previous cells starting in the cell are in it
+    while coarse.last().is_some_and(|last| start <= last.range().0) {
+      coarse.pop();
+    }
+    push_packed(&mut coarse, cell);
+  }
+  coarse
+}
+
+/// Pushes a cell after the sorted cells, merging four fully covered siblings into
+/// their parent.
+fn push_packed(cells: &mut Vec<Cell>, cell: Cell) {
+  cells.push(cell);
+  while let [.., a, b, c, d] = cells[..] {
+    let siblings = d.depth > 0
+      && d.hash & 3 == 3
+      && a.hash + 3 == d.hash
+      && [a, b, c].iter().all(|s| s.depth == d.depth);
+    if !(siblings && [a, b, c, d].iter().all(|s| s.full)) {
+      break;
+    }
+    cells.truncate(cells.len() - 4);
+    cells.push(d.parent(true));
+  }
+}
+
+/// The sorted cells of a BMOC.
+pub(crate) fn cells_of(bmoc: BMOC) -> Vec<Cell> {
+  bmoc
+    .into_iter()
+    .map(|c| Cell {
+      depth: c.depth,
+      hash: c.hash,
+      full: c.is_full,
+    })
+    .collect()
+}
+
+/// The cells of the flattened BMOC, all at its depth.
+pub(crate) fn flat_cells_of(bmoc: BMOC) -> Vec<Cell> {
+  bmoc
+    .flat_iter_cell()
+    .map(|c| Cell {
+      depth: c.depth,
+      hash: c.hash,
+      full: c.is_full,
+    })
+    .collect()
+}
+
+/// Builds the BMOC at `depth_max` of non-overlapping cells.
+pub(crate) fn cells_to_bmoc(depth_max: u8, cells: &[Cell]) -> BMOC {
+  let mut builder = BMOCBuilderUnsafe::new(depth_max, cells.len());
+  for cell in cells {
+    builder.push(cell.depth, cell.hash, cell.full);
+  }
+  builder.to_bmoc_from_unordered()
+}
+
+/// Coarsens the deepest partially covered cells of the coverage until it has at most
+/// `max_cells` cells and `max_ranges` ranges of depth 29 cells, or is only made of
+/// cells at depth 0. The coverage only grows, by the area of the coarsened cells.
+pub(crate) fn simplify(bmoc: BMOC, max_cells: Option<usize>, max_ranges: Option<usize>) -> BMOC {
+  if max_cells.is_none() && max_ranges.is_none() {
+    return bmoc;
+  }
+  let mut cells = cells_of(bmoc);
+  let fits = |cells: &[Cell]| {
+    max_cells.map_or(true, |n| cells.len() <= n)
+      && max_ranges.map_or(true, |n| n_ranges(cells) <= n)
+  };
+  while !fits(&cells) {
+    let deepest = |partial: bool| {
+      cells
+        .iter()
+        .filter(|c| !(partial && c.full))
+        .map(|c| c.depth)
+        .max()
+        .unwrap_or(0)
+    };
+    cells = match (deepest(true), deepest(false)) {
+      (0, 0) => break,
+      (0, depth) => coarsen(&cells, depth, true),
+      (depth, _) => coarsen(&cells, depth, false),
+    };
+  }
+  let depth_max = cells.iter().map(|c| c.depth).max().unwrap_or(0);
+  cells_to_bmoc(depth_max, &cells)
+}
+
+/// Simplifies the coverage to at most `max_cells` cells and `max_ranges` ranges, see
+/// `simplify`.
+#[pyfunction]
+pub fn coverage_simplify<'py>(
+  py: Python<'py>,
+  coverage: CoverageCells<'py>,
+  max_cells: Option<usize>,
+  max_ranges: Option<usize>,
+  output: &str,
+) -> PyResult<Bound<'py, PyAny>> {
+  let format = Format::parse(output)?;
+  let bmoc = to_bmocs(py, std::slice::from_ref(&coverage), 0)?.remove(0);
+  let coverage =
+    py.allow_threads(|| Coverage::new(simplify(bmoc, max_cells, max_ranges), format, false, false));
+  coverage.into_py(py)
+}
+
+/// The cells at `depth + delta_depth` along the outside of the cell `hash` at `depth`.
+fn external_cells(depth: u8, hash: u64, delta_depth: u8) -> Vec<u64> {
+  let edges = healpix::nested::get(depth).external_edge_struct(hash, delta_depth);
+  let mut cells = Vec::with_capacity(4 + (4 << delta_depth));
+  for cardinal in [Cardinal::S, Cardinal::E, Cardinal::N, Cardinal::W] {
+    cells.extend(edges.get_corner(&cardinal));
+  }
+  for ordinal in [Ordinal::SE, Ordinal::NE, Ordinal::NW, Ordinal::SW] {
+    cells.extend(edges.get_edge(&ordinal).iter().copied());
+  }
+  cells
+}
+
+/// Returns the sorted cells at `depth` of `n` successive rings around the cells, each
+/// ring being made of the cells along the outside of the previous ring that are in no
+/// previous ring and for which `keep` holds.
+#[allow(unused_variables)]
+fn rings<F>(depth: u8, cells: &[Cell], n: u32, keep: F, nthreads: u16) -> Vec<u64>
+where
+  F: Fn(u64) -> bool + Send + Sync,
+{
+  let mut seen = Vec::<u64>::new();
+  let mut ring = cells.iter().map(|c| (c.depth, c.hash)).collect::<Vec<_>>();
+  for _ in 0..n {
+    let outside = |&(d, h): &(u8, u64)| external_cells(d, h, depth - d);
+    #[cfg(not(target_arch = "wasm32"))]
+    let mut next = thread_pool::get(nthreads).install(|| {
+      let mut next = ring
+        .par_iter()
+        .flat_map_iter(outside)
+        .filter(|&h| keep(h))
+        .collect::<Vec<_>>();
+      next.par_sort_unstable();
+      next
+    });
+    #[cfg(target_arch = "wasm32")]
+    let mut next = {
+      let mut next = ring
+        .iter()
+        .flat_map(outside)
+        .filter(|&h| keep(h))
+        .collect::<Vec<_>>();
+      next.sort_unstable();
+      next
+    };
+    next.dedup();
+    next.retain(|h| seen.binary_search(h).is_err());
+    if next.is_empty() {
+      break;
+    }
+    seen.extend_from_slice(&next);
+    seen.sort_unstable();
+    ring = next.into_iter().map(|h| (depth, h)).collect();
+  }
+  seen
+}
+
+/// Cells at `depth` of the given hashes.
+fn cells_at(depth: u8, hashes: &[u64], full: impl Fn(u64) -> bool) -> Vec<Cell> {
+  hashes
+    .iter()
+    .map(|&hash| Cell {
+      depth,
+      hash,
+      full: full(hash),
+    })
+    .collect()
+}
+
+/// Adds to the cells of the coverage the `n` rings of cells at `depth` around it.
+fn dilate(cells: Vec<Cell>, depth: u8, n: u32, nthreads: u16) -> BMOC {
+  let ranges = Ranges::of_cells(&cells, false);
+  let added = rings(
+    depth,
+    &cells,
+    n,
+    |h| !ranges.contains_cell(depth, h),
+    nthreads,
+  );
+  let added = cells_at(depth, &added, |_| true);
+  // the cells of the coverage and the added cells are disjoint
+  let mut merged = Vec::with_capacity(cells.len() + added.len());
+  let (mut i, mut j) = (0, 0);
+  while i < cells.len() || j < added.len() {
+    let cell = if j == added.len() || (i < cells.len() && cells[i].range() < added[j].range()) {
+      i += 1;
+      cells[i - 1]
+    } else {
+      j += 1;
+      added[j - 1]
+    };
+    push_packed(&mut merged, cell);
+  }
+  cells_to_bmoc(depth, &merged)
+}
+
+/// Returns the cells at `depth` of the `n` rings of the coverage along its outside,
+/// from outside in.
+fn inner_rings(cells: &[Cell], depth: u8, n: u32, nthreads: u16) -> Vec<u64> {
+  let ranges = Ranges::of_cells(cells, false);
+  let outside = rings(
+    depth,
+    cells,
+    1,
+    |h| !ranges.contains_cell(depth, h),
+    nthreads,
+  );
+  let outside = cells_at(depth, &outside, |_| true);
+  rings(
+    depth,
+    &outside,
+    n,
+    |h| ranges.contains_cell(depth, h),
+    nthreads,
+  )
+}
+
+#[derive(Clone, Copy)]
+enum Morphology {
+  Dilate,
+  Erode,
+  Border,
+  OuterBorder,
+}
+
+/// Runs `morphology` on the cells of the coverage, at the deepest of their depths and
+/// `depth`.
+fn morphology<'py>(
+  py: Python<'py>,
+  operation: Morphology,
+  coverage: CoverageCells<'py>,
+  n: u32,
+  depth: u8,
+  output: &str,
+  nthreads: u16,
+) -> PyResult<Bound<'py, PyAny>> {
+  let format = Format::parse(output)?;
+  let coverages = std::slice::from_ref(&coverage);
+  let depth = depth_max(coverages, depth)?;
+  let bmoc = to_bmocs(py, coverages, depth)?.remove(0);
+  let coverage = py.allow_threads(|| {
+    let cells = cells_of(bmoc);
+    let bmoc = match operation {
+      Morphology::Dilate => dilate(cells, depth, n, nthreads),
+      Morphology::Erode => {
+        let removed = inner_rings(&cells, depth, n, nthreads);
+        cells_to_bmoc(depth, &cells)
+          .minus(&cells_to_bmoc(depth, &cells_at(depth, &removed, |_| true)))
+      }
+      Morphology::Border => {
+        let full = Ranges::of_cells(&cells, true);
+        let border = inner_rings(&cells, depth, 1, nthreads);
+        cells_to_bmoc(
+          depth,
+          &cells_at(depth, &border, |h| full.contains_cell(depth, h)),
+        )
+      }
+      Morphology::OuterBorder => {
+        let ranges = Ranges::of_cells(&cells, false);
+        let border = rings(
+          depth,
+          &cells,
+          1,
+          |h| !ranges.contains_cell(depth, h),
+          nthreads,
+        );
+        cells_to_bmoc(depth, &cells_at(depth, &border, |_| true))
+      }
+    };
+    Coverage::new(bmoc, format, false, false)
+  });
+  coverage.into_py(py)
+}
+
+/// Adds to the coverage the cells at its deepest depth, or `depth`, up to `n` cells
+/// away from it.
+#[pyfunction]
+pub fn coverage_dilate<'py>(
+  py: Python<'py>,
+  coverage: CoverageCells<'py>,
+  n: u32,
+  depth: u8,
+  output: &str,
+  nthreads: u16,
+) -> PyResult<Bound<'py, PyAny>> {
+  morphology(py, Morphology::Dilate, coverage, n, depth, output, nthreads)
+}
+
+/// Removes from the coverage the cells at its deepest depth, or `depth`, up to `n`
+/// cells away from its outside.
+#[pyfunction]
+pub fn coverage_erode<'py>(
+  py: Python<'py>,
+  coverage: CoverageCells<'py>,
+  n: u32,
+  depth: u8,
+  output: &str,
+  nthreads: u16,
+) -> PyResult<Bound<'py, PyAny>> {
+  morphology(py, Morphology::Erode, coverage, n, depth, output, nthreads)
+}
+
+/// The cells at the deepest depth of the coverage, or `depth`, along its outside,
+/// inside it or, with `outer`, outside it.
+#[pyfunction]
+pub fn coverage_border<'py>(
+  py: Python<'py>,
+  coverage: CoverageCells<'py>,
+  depth: u8,
+  outer: bool,
+  output: &str,
+  nthreads: u16,
+) -> PyResult<Bound<'py, PyAny>> {
+  let morph = if outer {
+    Morphology::OuterBorder
+  } else {
+    Morphology::Border
+  };
+  morphology(py, morph, coverage, 1, depth, output, nthreads)
+}
+
+/// The ranges of the cells of a coverage that are not fully covered, with the region
+/// the points in them are tested exactly against.
+type Refinement = (Ranges, Box<dyn contains::Region>);
+
+/// Tells whether the point (`lon`, `lat`) is in the ranges or, with `refine`, in the
+/// ranges of the cells not fully covered and exactly in the region.
+#[inline]
+fn contains_point<T: CoordValue>(
+  layer: &Layer,
+  ranges: &Ranges,
+  refine: Option<&Refinement>,
+  lon: &T,
+  lat: &T,
+) -> bool {
+  let (lon, lat) = (lon.to_f64(), lat.to_f64());
+  let hash = layer.hash(lon, lat);
+  ranges.contains(hash, hash + 1)
+    || refine.map_or(false, |(partial, region)| {
+      partial.contains(hash, hash + 1) && region.contains_lonlat(lon, lat)
+    })
+}
+
+/// Tells whether the cell `ipix` at `depth` is in the ranges, raising `invalid` if the
+/// cell is not valid.
+#[inline]
+fn contains_cell<T: HashValue>(
+  ranges: &Ranges,
+  invalid: &check::InvalidInput,
+  ipix: &T,
+  depth: u8,
+) -> bool {
+  let hash = ipix.to_hash();
+  if check::is_valid_hash(depth, hash) {
+    ranges.contains_cell(depth, hash)
+  } else {
+    invalid.raise();
+    false
+  }
+}
+
+/// Builds the ranges of a single coverage.
+fn coverage_ranges(py: Python, coverage: &CoverageCells, fully_covered: bool) -> PyResult<Ranges> {
+  let bmoc = to_bmocs(py, std::slice::from_ref(coverage), 0)?.remove(0);
+  Ok(py.allow_threads(|| Ranges::new(bmoc, fully_covered)))
+}
+
+/// Tells whether the points (`lon`, `lat`), in radians, are in the cells of the
+/// coverage or, with `fully_covered`, in its fully covered cells. With a `region`, the
+/// points in the cells that are not fully covered are also tested exactly against it.
+#[pyfunction]
+#[allow(unused_variables)]
+pub fn coverage_contains<'py>(
+  py: Python<'py>,
+  coverage: CoverageCells<'py>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  fully_covered: bool,
+  region: Option<Bound<'py, regions::Region>>,
+  nthreads: u16,
+) -> PyResult<Bound<'py, PyArray1<bool>>> {
+  let bmoc = to_bmocs(py, std::slice::from_ref(&coverage), 0)?.remove(0);
+  let region = region.map(|region| region.get().exact());
+  let (ranges, refine) = py.allow_threads(|| match region {
+    Some(region) if !fully_covered => {
+      let cells = cells_of(bmoc);
+      let partial = Ranges::of_partial_cells(&cells);
+      (Ranges::of_cells(&cells, true), Some((partial, region)))
+    }
+    _ => (Ranges::new(bmoc, fully_covered), None),
+  });
+  let layer = healpix::nested::get(check::MAX_DEPTH);
+  let inside = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    let contains = |lon, lat| contains_point(layer, &ranges, refine.as_ref(), lon, lat);
+    #[cfg(not(target_arch = "wasm32"))]
+    let inside = py.allow_threads(|| {
+      thread_pool::get(nthreads).install(|| Zip::from(&lon).and(&lat).par_map_collect(contains))
+    });
+    #[cfg(target_arch = "wasm32")]
+    let inside = Zip::from(&lon).and(&lat).map_collect(contains);
+    Ok(inside)
+  })?;
+  Ok(inside.into_pyarray(py))
+}
+
+/// Tells whether the cells `ipix` at `depth` are in the cells of the coverage or, with
+/// `fully_covered`, in its fully covered cells.
+#[pyfunction]
+#[allow(unused_variables)]
+pub fn coverage_contains_ipix<'py>(
+  py: Python<'py>,
+  coverage: CoverageCells<'py>,
+  ipix: Hashes<'py>,
+  depth: PyReadonlyArrayDyn<'py, u8>,
+  fully_covered: bool,
+  nthreads: u16,
+) -> PyResult<Bound<'py, PyArrayDyn<bool>>> {
+  let ranges = coverage_ranges(py, &coverage, fully_covered)?;
+  let depth = depth.as_array();
+  let inside = with_hashes!(ipix, |ipix| {
+    if ipix.shape() != depth.shape() {
+      return Err(PyValueError::new_err(
+        "The cells and their depths must have the same shape",
+      ));
+    }
+    let invalid = check::InvalidInput::default();
+    let contains = |p, &d: &u8| contains_cell(&ranges, &invalid, p, d);
+    #[cfg(not(target_arch = "wasm32"))]
+    let inside = py.allow_threads(|| {
+      thread_pool::get(nthreads).install(|| Zip::from(&ipix).and(&depth).par_map_collect(contains))
+    });
+    #[cfg(target_arch = "wasm32")]
+    let inside = Zip::from(&ipix).and(&depth).map_collect(contains);
+    if invalid.is_raised() {
+      return Err(check::first_invalid_hash(&depth, &ipix));
+    }
+    Ok(inside)
+  })?;
+  Ok(inside.into_pyarray(py))
+}
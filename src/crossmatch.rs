@@ -0,0 +1,165 @@
+//! Positional cross-match of two catalogs.
+//!
+//! The second catalog is indexed by its nested hashes, at the depth where a cell and
+//! its neighbours contain all the points within the cross-match radius. The points of
+//! the first catalog are then matched by chunks, probing the cell of each point and
+//! its neighbours.
+
+use numpy::{IntoPyArray, PyArray1, PyReadonlyArray1};
+use pyo3::{exceptions::PyValueError, prelude::*, Bound, PyResult};
+#[cfg(not(target_arch = "wasm32"))]
+use rayon::prelude::*;
+
+use healpix::compass_point::MainWind;
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  dtypes::{as_1d, with_lonlat, CoordValue, Coords},
+  sort::sort_by_hash,
+};
+
+/// Number of points of the first catalog matched by each task.
+const CHUNK_LEN: usize = 1 << 12;
+
+type Matches<'py> = (
+  Bound<'py, PyArray1<u64>>,
+  Bound<'py, PyArray1<u64>>,
+  Bound<'py, PyArray1<f64>>,
+);
+
+/// Depth at which the cell of a point and its neighbours contain all the points
+/// within `radius`.
+fn depth_for(radius: f64) -> u8 {
+  healpix::best_starting_depth(radius)
+}
+
+/// Haversine distance, in radians, between two points given in radians.
+#[inline]
+pub(crate) fn distance(lon1: f64, lat1: f64, lon2: f64, lat2: f64) -> f64 {
+  let s_lat = (0.5 * (lat2 - lat1)).sin();
+  let s_lon = (0.5 * (lon2 - lon1)).sin();
+  let hav = s_lat * s_lat + lat1.cos() * lat2.cos() * s_lon * s_lon;
+  2.0 * hav.sqrt().min(1.0).asin()
+}
+
+/// The cell `hash` at `depth` followed by its neighbours, if they exist.
+pub(crate) fn cell_and_neighbours(depth: u8, hash: u64) -> [Option<u64>; 9] {
+  let neighbours = healpix::nested::neighbours(depth, hash, false);
+  [
+    Some(hash),
+    neighbours.get(MainWind::S).copied(),
+    neighbours.get(MainWind::SE).copied(),
+    neighbours.get(MainWind::E).copied(),
+    neighbours.get(MainWind::SW).copied(),
+    neighbours.get(MainWind::NE).copied(),
+    neighbours.get(MainWind::W).copied(),
+    neighbours.get(MainWind::NW).copied(),
+    neighbours.get(MainWind::N).copied(),
+  ]
+}
+
+/// Sorts the points of a catalog by nested hash, at the depth of the cross-match
+/// radius (in radians). Returns the sorted hashes and the indices of the points in
+/// that order.
+#[pyfunction]
+pub fn crossmatch_index<'py>(
+  py: Python<'py>,
+  radius: f64,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  nthreads: u16,
+) -> PyResult<(Bound<'py, PyArray1<u64>>, Bound<'py, PyArray1<u64>>)> {
+  let depth = depth_for(radius);
+  let (hashes, order) = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    Ok(py.allow_threads(|| sort_by_hash(depth, lon, lat, nthreads)))
+  })?;
+  Ok((hashes.into_pyarray(py), order.into_pyarray(py)))
+}
+
+/// Matches the points of the first catalog, whose first point is at `start` in the
+/// whole catalog, against the second catalog indexed by `crossmatch_index`.
+/// Returns the indices of the matched pairs, ordered by point of the first catalog
+/// then by distance, and their distances in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+#[allow(unused_variables)]
+pub fn crossmatch_chunk<'py>(
+  py: Python<'py>,
+  radius: f64,
+  lon1: Coords<'py>,
+  lat1: Coords<'py>,
+  start: u64,
+  lon2: Coords<'py>,
+  lat2: Coords<'py>,
+  hashes: PyReadonlyArray1<'py, u64>,
+  order: PyReadonlyArray1<'py, u64>,
+  nthreads: u16,
+) -> PyResult<Matches<'py>> {
+  let depth = depth_for(radius);
+  let (hashes, order) = (hashes.as_slice()?, order.as_slice()?);
+  let (idx1, idx2, dist) = with_lonlat!(lon1, lat1, |lon1, lat1| {
+    let (lon1, lat1) = as_1d(lon1, lat1)?;
+    with_lonlat!(lon2, lat2, |lon2, lat2| {
+      let (lon2, lat2) = as_1d(lon2, lat2)?;
+      if hashes.len() != lon2.len() || order.len() != lon2.len() {
+        return Err(PyValueError::new_err(
+          "The index does not match the second catalog",
+        ));
+      }
+      let layer = healpix::nested::get(depth);
+      let match_chunk = |chunk: usize| {
+        let mut matches = Vec::<(u64, u64, f64)>::new();
+        for i in chunk * CHUNK_LEN..((chunk + 1) * CHUNK_LEN).min(lon1.len()) {
+          let (lon, lat) = (lon1[i].to_f64(), lat1[i].to_f64());
+          let n = matches.len();
+          for cell in cell_and_neighbours(depth, layer.hash(lon, lat))
+            .into_iter()
+            .flatten()
+          {
+            let from = hashes.partition_point(|&h| h < cell);
+            let to = from + hashes[from..].partition_point(|&h| h == cell);
+            for &j in &order[from..to] {
+              let j = j as usize;
+              let d = distance(lon, lat, lon2[j].to_f64(), lat2[j].to_f64());
+              if d <= radius {
+                matches.push((start + i as u64, j as u64, d));
+              }
+            }
+          }
+          matches[n..].sort_unstable_by(|a, b| a.2.total_cmp(&b.2).then(a.1.cmp(&b.1)));
+        }
+        matches
+      };
+      let n_chunks = lon1.len().div_ceil(CHUNK_LEN);
+      #[cfg(not(target_arch = "wasm32"))]
+      let chunks = py.allow_threads(|| {
+        thread_pool::get(nthreads).install(|| {
+          (0..n_chunks)
+            .into_par_iter()
+            .map(match_chunk)
+            .collect::<Vec<_>>()
+        })
+      });
+      #[cfg(target_arch = "wasm32")]
+      let chunks = (0..n_chunks).map(match_chunk).collect::<Vec<_>>();
+
+      let len = chunks.iter().map(Vec::len).sum();
+      let mut idx1 = Vec::<u64>::with_capacity(len);
+      let mut idx2 = Vec::<u64>::with_capacity(len);
+      let mut dist = Vec::<f64>::with_capacity(len);
+      for (i, j, d) in chunks.into_iter().flatten() {
+        idx1.push(i);
+        idx2.push(j);
+        dist.push(d);
+      }
+      Ok((idx1, idx2, dist))
+    })
+  })?;
+  Ok((
+    idx1.into_pyarray(py),
+    idx2.into_pyarray(py),
+    dist.into_pyarray(py),
+  ))
+}
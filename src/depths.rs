@@ -0,0 +1,113 @@
+//! Hashes of points at several depths from a single projection.
+//!
+//! A nested hash at depth `d` is the hash at depth 29 shifted right by `2 * (29 - d)`
+//! bits. The offsets in the cell at depth `d` follow from the offsets at depth 29 and
+//! the bits dropped by the shift: the even bits are the lowest bits of the x
+//! coordinate of the depth 29 cell in its depth `d` cell, the odd ones those of y.
+
+use ndarray::{Array2, ArrayViewMut1, Zip};
+use numpy::{IntoPyArray, PyArray2};
+use pyo3::{prelude::*, Bound, PyResult};
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  check,
+  dtypes::{as_1d, with_lonlat, CoordValue, Coords},
+};
+
+type DepthHashes<'py> = (
+  Bound<'py, PyArray2<u64>>,
+  Option<Bound<'py, PyArray2<f64>>>,
+  Option<Bound<'py, PyArray2<f64>>>,
+);
+
+/// Gathers the even bits of `x` in its lowest 32 bits.
+#[inline]
+fn even_bits(mut x: u64) -> u64 {
+  x &= 0x5555555555555555;
+  x = (x | (x >> 1)) & 0x3333333333333333;
+  x = (x | (x >> 2)) & 0x0F0F0F0F0F0F0F0F;
+  x = (x | (x >> 4)) & 0x00FF00FF00FF00FF;
+  x = (x | (x >> 8)) & 0x0000FFFF0000FFFF;
+  (x | (x >> 16)) & 0x00000000FFFFFFFF
+}
+
+/// Writes the hashes of a point at each of the `depths` and, with `offsets`, its
+/// offsets in the cells.
+#[allow(clippy::too_many_arguments)]
+fn hash_at_depths<T: CoordValue>(
+  depths: &[u8],
+  offsets: bool,
+  lon: T,
+  lat: T,
+  mut ipix: ArrayViewMut1<u64>,
+  mut dx: ArrayViewMut1<f64>,
+  mut dy: ArrayViewMut1<f64>,
+) {
+  let (hash, dx29, dy29) =
+    healpix::nested::hash_with_dxdy(check::MAX_DEPTH, lon.to_f64(), lat.to_f64());
+  for (k, &depth) in depths.iter().enumerate() {
+    let shift = (check::MAX_DEPTH - depth) << 1;
+    ipix[k] = hash >> shift;
+    if offsets {
+      let low = hash & ((1_u64 << shift) - 1);
+      let scale = (1_u64 << (shift >> 1)) as f64;
+      dx[k] = (even_bits(low) as f64 + dx29) / scale;
+      dy[k] = (even_bits(low >> 1) as f64 + dy29) / scale;
+    }
+  }
+}
+
+/// Hashes of points (`lon`, `lat`), in radians, at each of the `depths`, one row per
+/// point, and with `offsets` their (dx, dy) offsets in the cells.
+#[pyfunction]
+#[allow(unused_variables)]
+pub fn lonlat_to_healpix_depths<'py>(
+  py: Python<'py>,
+  depths: Vec<u8>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  offsets: bool,
+  nthreads: u16,
+) -> PyResult<DepthHashes<'py>> {
+  for &depth in &depths {
+    check::check_depth(depth)?;
+  }
+  let (ipix, dx, dy) = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    let shape = (lon.len(), depths.len());
+    let offsets_shape = if offsets { shape } else { (lon.len(), 0) };
+    let mut ipix = Array2::<u64>::zeros(shape);
+    let mut dx = Array2::<f64>::zeros(offsets_shape);
+    let mut dy = Array2::<f64>::zeros(offsets_shape);
+    #[cfg(not(target_arch = "wasm32"))]
+    py.allow_threads(|| {
+      thread_pool::get(nthreads).install(|| {
+        Zip::from(ipix.rows_mut())
+          .and(dx.rows_mut())
+          .and(dy.rows_mut())
+          .and(&lon)
+          .and(&lat)
+          .par_for_each(|i, x, y, &lon, &lat| hash_at_depths(&depths, offsets, lon, lat, i, x, y))
+      })
+    });
+    #[cfg(target_arch = "wasm32")]
+    Zip::from(ipix.rows_mut())
+      .and(dx.rows_mut())
+      .and(dy.rows_mut())
+      .and(&lon)
+      .and(&lat)
+      .for_each(|i, x, y, &lon, &lat| hash_at_depths(&depths, offsets, lon, lat, i, x, y));
+    Ok((ipix, dx, dy))
+  })?;
+  if offsets {
+    Ok((
+      ipix.into_pyarray(py),
+      Some(dx.into_pyarray(py)),
+      Some(dy.into_pyarray(py)),
+    ))
+  } else {
+    Ok((ipix.into_pyarray(py), None, None))
+  }
+}
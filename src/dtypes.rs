@@ -0,0 +1,297 @@
+//! Numpy dtypes accepted as input and output by the kernels.
+//!
+//! Coordinates and HEALPix indices are read in place, in the dtype they are given,
+//! instead of being converted to `f64`/`u64` arrays on the Python side.
+//! Results are written either as `u64`/`i64`/`f64` or, for the compact outputs,
+//! as `u32`/`i32`/`f32`.
+//! The kernels are instantiated once per dtype with the `with_*!` macros.
+
+use ndarray::{Array1, ArrayView1, ArrayViewD, Ix1};
+use numpy::{Element, IntoPyArray, PyArrayDyn, PyReadonlyArrayDyn};
+use pyo3::{exceptions::PyValueError, Bound, FromPyObject, PyAny, PyResult, Python};
+
+/// HEALPix indices arrays.
+#[derive(FromPyObject)]
+pub enum Hashes<'py> {
+  U64(PyReadonlyArrayDyn<'py, u64>),
+  I64(PyReadonlyArrayDyn<'py, i64>),
+  U32(PyReadonlyArrayDyn<'py, u32>),
+  I32(PyReadonlyArrayDyn<'py, i32>),
+}
+
+/// Longitudes or latitudes arrays.
+#[derive(FromPyObject)]
+pub enum Coords<'py> {
+  F64(PyReadonlyArrayDyn<'py, f64>),
+  F32(PyReadonlyArrayDyn<'py, f32>),
+}
+
+/// Output arrays of HEALPix indices.
+#[derive(FromPyObject)]
+pub enum HashesMut<'py> {
+  U64(Bound<'py, PyArrayDyn<u64>>),
+  U32(Bound<'py, PyArrayDyn<u32>>),
+}
+
+/// Output arrays of neighbour HEALPix indices, -1 standing for a missing neighbour.
+#[derive(FromPyObject)]
+pub enum NeighboursMut<'py> {
+  I64(Bound<'py, PyArrayDyn<i64>>),
+  I32(Bound<'py, PyArrayDyn<i32>>),
+}
+
+/// Output arrays of coordinates, offsets or weights.
+#[derive(FromPyObject)]
+pub enum CoordsMut<'py> {
+  F64(Bound<'py, PyArrayDyn<f64>>),
+  F32(Bound<'py, PyArrayDyn<f32>>),
+}
+
+/// HEALPix indices of the cells returned by a search.
+pub enum HashesVec {
+  U64(Array1<u64>),
+  U32(Array1<u32>),
+}
+
+impl HashesVec {
+  pub fn into_pyarray(self, py: Python<'_>) -> Bound<'_, PyAny> {
+    match self {
+      HashesVec::U64(a) => a.into_pyarray(py).into_any(),
+      HashesVec::U32(a) => a.into_pyarray(py).into_any(),
+    }
+  }
+}
+
+/// Views the longitudes and latitudes of a list of points, which must be 1-D arrays
+/// of the same length.
+pub fn as_1d<'a, T>(
+  lon: ArrayViewD<'a, T>,
+  lat: ArrayViewD<'a, T>,
+) -> PyResult<(ArrayView1<'a, T>, ArrayView1<'a, T>)> {
+  match (
+    lon.into_dimensionality::<Ix1>(),
+    lat.into_dimensionality::<Ix1>(),
+  ) {
+    (Ok(lon), Ok(lat)) if lon.len() == lat.len() => Ok((lon, lat)),
+    _ => Err(PyValueError::new_err(
+      "lon and lat must be 1-D arrays of the same length",
+    )),
+  }
+}
+
+pub trait HashValue: Element + Copy + Send + Sync {
+  /// Negative values wrap around to values greater than `i64::MAX`,
+  /// rejected by the range checks.
+  fn to_hash(self) -> u64;
+  /// The caller makes sure that `hash` fits in `Self`.
+  fn from_hash(hash: u64) -> Self;
+}
+
+impl HashValue for u64 {
+  #[inline]
+  fn to_hash(self) -> u64 {
+    self
+  }
+  #[inline]
+  fn from_hash(hash: u64) -> Self {
+    hash
+  }
+}
+
+impl HashValue for i64 {
+  #[inline]
+  fn to_hash(self) -> u64 {
+    self as u64
+  }
+  #[inline]
+  fn from_hash(hash: u64) -> Self {
+    hash as i64
+  }
+}
+
+impl HashValue for u32 {
+  #[inline]
+  fn to_hash(self) -> u64 {
+    self as u64
+  }
+  #[inline]
+  fn from_hash(hash: u64) -> Self {
+    hash as u32
+  }
+}
+
+impl HashValue for i32 {
+  #[inline]
+  fn to_hash(self) -> u64 {
+    self as i64 as u64
+  }
+  #[inline]
+  fn from_hash(hash: u64) -> Self {
+    hash as i32
+  }
+}
+
+pub trait NeighbourValue: HashValue {
+  fn from_neighbour(hash: Option<u64>) -> Self;
+}
+
+impl NeighbourValue for i64 {
+  #[inline]
+  fn from_neighbour(hash: Option<u64>) -> Self {
+    hash.map_or(-1, |h| h as i64)
+  }
+}
+
+impl NeighbourValue for i32 {
+  #[inline]
+  fn from_neighbour(hash: Option<u64>) -> Self {
+    hash.map_or(-1, |h| h as i32)
+  }
+}
+
+pub trait CoordValue: Element + Copy + Send + Sync {
+  fn to_f64(self) -> f64;
+  fn from_f64(value: f64) -> Self;
+}
+
+impl CoordValue for f64 {
+  #[inline]
+  fn to_f64(self) -> f64 {
+    self
+  }
+  #[inline]
+  fn from_f64(value: f64) -> Self {
+    value
+  }
+}
+
+impl CoordValue for f32 {
+  #[inline]
+  fn to_f64(self) -> f64 {
+    self as f64
+  }
+  #[inline]
+  fn from_f64(value: f64) -> Self {
+    value as f32
+  }
+}
+
+/// Evaluates `$body` with `$arr` bound to the `ArrayViewD` of the given `Hashes`.
+macro_rules! with_hashes {
+  ($hashes:expr, |$arr:ident| $body:block) => {
+    match $hashes {
+      $crate::dtypes::Hashes::U64(a) => {
+        let $arr = a.as_array();
+        $body
+      }
+      $crate::dtypes::Hashes::I64(a) => {
+        let $arr = a.as_array();
+        $body
+      }
+      $crate::dtypes::Hashes::U32(a) => {
+        let $arr = a.as_array();
+        $body
+      }
+      $crate::dtypes::Hashes::I32(a) => {
+        let $arr = a.as_array();
+        $body
+      }
+    }
+  };
+}
+
+/// Evaluates `$body` with `$lon` and `$lat` bound to the `ArrayViewD` of the given
+/// `Coords`, which must be of the same dtype.
+macro_rules! with_lonlat {
+  ($lons:expr, $lats:expr, |$lon:ident, $lat:ident| $body:block) => {
+    match ($lons, $lats) {
+      ($crate::dtypes::Coords::F64(a), $crate::dtypes::Coords::F64(b)) => {
+        let $lon = a.as_array();
+        let $lat = b.as_array();
+        $body
+      }
+      ($crate::dtypes::Coords::F32(a), $crate::dtypes::Coords::F32(b)) => {
+        let $lon = a.as_array();
+        let $lat = b.as_array();
+        $body
+      }
+      _ => Err(pyo3::exceptions::PyValueError::new_err(
+        "lon and lat must be of the same dtype",
+      )),
+    }
+  };
+}
+
+/// Evaluates `$body` with `$arr` bound to the mutable `ArrayViewMutD` of the given
+/// `HashesMut`.
+macro_rules! with_hashes_mut {
+  ($hashes:expr, |$arr:ident| $body:block) => {
+    match $hashes {
+      $crate::dtypes::HashesMut::U64(a) => {
+        let mut $arr = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        $body
+      }
+      $crate::dtypes::HashesMut::U32(a) => {
+        let mut $arr = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        $body
+      }
+    }
+  };
+}
+
+/// Evaluates `$body` with `$arr` bound to the mutable `ArrayViewMutD` of the given
+/// `NeighboursMut`.
+macro_rules! with_neighbours_mut {
+  ($neighbours:expr, |$arr:ident| $body:block) => {
+    match $neighbours {
+      $crate::dtypes::NeighboursMut::I64(a) => {
+        let mut $arr = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        $body
+      }
+      $crate::dtypes::NeighboursMut::I32(a) => {
+        let mut $arr = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        $body
+      }
+    }
+  };
+}
+
+/// Evaluates `$body` with `$a` (and `$b`) bound to the mutable `ArrayViewMutD` of the
+/// given `CoordsMut`, which must be of the same dtype.
+macro_rules! with_coords_mut {
+  ($coords:expr, |$a:ident| $body:block) => {
+    match $coords {
+      $crate::dtypes::CoordsMut::F64(a) => {
+        let mut $a = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        $body
+      }
+      $crate::dtypes::CoordsMut::F32(a) => {
+        let mut $a = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        $body
+      }
+    }
+  };
+  ($coords_a:expr, $coords_b:expr, |$a:ident, $b:ident| $body:block) => {
+    match ($coords_a, $coords_b) {
+      ($crate::dtypes::CoordsMut::F64(a), $crate::dtypes::CoordsMut::F64(b)) => {
+        let mut $a = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        let mut $b = unsafe { numpy::PyArrayMethods::as_array_mut(&b) };
+        $body
+      }
+      ($crate::dtypes::CoordsMut::F32(a), $crate::dtypes::CoordsMut::F32(b)) => {
+        let mut $a = unsafe { numpy::PyArrayMethods::as_array_mut(&a) };
+        let mut $b = unsafe { numpy::PyArrayMethods::as_array_mut(&b) };
+        $body
+      }
+      _ => Err(pyo3::exceptions::PyValueError::new_err(
+        "The output arrays must be of the same dtype",
+      )),
+    }
+  };
+}
+
+pub(crate) use with_coords_mut;
+pub(crate) use with_hashes;
+pub(crate) use with_hashes_mut;
+pub(crate) use with_lonlat;
+pub(crate) use with_neighbours_mut;
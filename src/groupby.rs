@@ -0,0 +1,130 @@
+//! Sparse aggregation of points by nested hash.
+//!
+//! The points are sorted by hash with the parallel radix sort, then the runs of equal
+//! hashes are reduced in parallel, so that only the non-empty cells are allocated,
+//! whatever the depth.
+
+use numpy::{IntoPyArray, PyArray1, PyReadonlyArray1};
+use pyo3::{exceptions::PyValueError, prelude::*, Bound, PyResult};
+#[cfg(not(target_arch = "wasm32"))]
+use rayon::prelude::*;
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  check,
+  dtypes::{as_1d, with_lonlat, Coords},
+  sort::sort_by_hash,
+};
+
+type Groups<'py> = (
+  Bound<'py, PyArray1<u64>>,
+  Bound<'py, PyArray1<u64>>,
+  Option<Bound<'py, PyArray1<f64>>>,
+);
+
+#[derive(Clone, Copy)]
+enum Reduction {
+  Sum,
+  Mean,
+  Min,
+  Max,
+}
+
+impl Reduction {
+  fn parse(name: &str) -> PyResult<Self> {
+    match name {
+      "sum" => Ok(Self::Sum),
+      "mean" => Ok(Self::Mean),
+      "min" => Ok(Self::Min),
+      "max" => Ok(Self::Max),
+      _ => Err(PyValueError::new_err(format!(
+        "Unknown reduction '{}', expected 'sum', 'mean', 'min' or 'max'",
+        name
+      ))),
+    }
+  }
+
+  /// Reduces the values of a cell, `values` being non-empty.
+  fn reduce(self, values: impl Iterator<Item = f64>, count: usize) -> f64 {
+    match self {
+      Self::Sum => values.sum(),
+      Self::Mean => values.sum::<f64>() / count as f64,
+      Self::Min => values.fold(f64::INFINITY, f64::min),
+      Self::Max => values.fold(f64::NEG_INFINITY, f64::max),
+    }
+  }
+}
+
+/// Groups the points (`lon`, `lat`), in radians, by nested hash at `depth`. Returns
+/// the sorted hashes of the non-empty cells, their number of points and, if `values`
+/// are given, the `reduction` of the values of their points.
+#[pyfunction]
+#[allow(unused_variables)]
+pub fn group_by_healpix<'py>(
+  py: Python<'py>,
+  depth: u8,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  values: Option<PyReadonlyArray1<'py, f64>>,
+  reduction: &str,
+  nthreads: u16,
+) -> PyResult<Groups<'py>> {
+  check::check_depth(depth)?;
+  let reduction = Reduction::parse(reduction)?;
+  let values = values.as_ref().map(|v| v.as_array());
+  let (cells, counts, reduced) = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    if values.is_some_and(|v| v.len() != lon.len()) {
+      return Err(PyValueError::new_err(
+        "values must have the size of lon and lat",
+      ));
+    }
+    let run = || {
+      let (hashes, order) = sort_by_hash(depth, lon, lat, nthreads);
+      let n = hashes.len();
+      let is_start = |k: &usize| *k == 0 || hashes[*k] != hashes[*k - 1];
+      let group = |(i, &start): (usize, &usize), starts: &[usize]| {
+        let end = starts.get(i + 1).copied().unwrap_or(n);
+        let reduced = values.map(|v| {
+          let cell_values = order[start..end].iter().map(|&j| v[j as usize]);
+          reduction.reduce(cell_values, end - start)
+        });
+        (hashes[start], (end - start) as u64, reduced)
+      };
+      #[cfg(not(target_arch = "wasm32"))]
+      let groups = thread_pool::get(nthreads).install(|| {
+        let starts = (0..n).into_par_iter().filter(is_start).collect::<Vec<_>>();
+        starts
+          .par_iter()
+          .enumerate()
+          .map(|entry| group(entry, &starts))
+          .collect::<Vec<_>>()
+      });
+      #[cfg(target_arch = "wasm32")]
+      let groups = {
+        let starts = (0..n).filter(is_start).collect::<Vec<_>>();
+        starts
+          .iter()
+          .enumerate()
+          .map(|entry| group(entry, &starts))
+          .collect::<Vec<_>>()
+      };
+      let mut cells = Vec::with_capacity(groups.len());
+      let mut counts = Vec::with_capacity(groups.len());
+      let mut reduced = Vec::with_capacity(if values.is_some() { groups.len() } else { 0 });
+      for (cell, count, value) in groups {
+        cells.push(cell);
+        counts.push(count);
+        reduced.extend(value);
+      }
+      (cells, counts, values.map(|_| reduced))
+    };
+    Ok(py.allow_threads(run))
+  })?;
+  Ok((
+    cells.into_pyarray(py),
+    counts.into_pyarray(py),
+    reduced.map(|r| r.into_pyarray(py)),
+  ))
+}
@@ -0,0 +1,360 @@
+//! Moves of nested cells between depths, and their UNIQ and ZUNIQ encodings.
+//!
+//! The cells may be of mixed depths: the depths are arrays of the shape of the cells,
+//! broadcast on the Python side. A cell at depth `d` has the parent `hash >> 2k` at
+//! depth `d - k` and the children `hash << 2k..(hash + 1) << 2k` at depth `d + k`.
+//! Its UNIQ index is `4 * 4^d + hash`, and its ZUNIQ index
+//! `(2 * hash + 1) << 2 * (29 - d)`, which lies among the ZUNIQ indices of its
+//! descendants.
+
+use ndarray::{ArrayViewD, ArrayViewMutD, Zip};
+use numpy::{PyArrayDyn, PyArrayMethods, PyReadonlyArrayDyn};
+use pyo3::{exceptions::PyValueError, prelude::*, Bound, PyErr, PyResult};
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  check,
+  dtypes::{with_hashes, with_hashes_mut, HashValue, Hashes, HashesMut},
+};
+
+/// End of the UNIQ indices, 4^31: the UNIQ indices of the cells at depth `d` are in
+/// [4^(d + 1), 4^(d + 2)[.
+const UNIQ_END: u64 = 16 << (check::MAX_DEPTH << 1);
+/// End of the ZUNIQ indices: the index after the last cell at depth 0.
+const ZUNIQ_END: u64 = 24 << (check::MAX_DEPTH << 1);
+
+fn check_shapes(shapes: &[&[usize]]) -> PyResult<()> {
+  if shapes.windows(2).all(|w| w[0] == w[1]) {
+    Ok(())
+  } else {
+    Err(PyValueError::new_err(
+      "The cells, their depths and the outputs must have the same shape",
+    ))
+  }
+}
+
+/// Writes `f(hash, depth, target_depth)` in `out` for each cell, in parallel.
+/// Returns whether `f` rejected a cell.
+#[allow(unused_variables)]
+fn map_cells<T, U, F>(
+  py: Python,
+  ipix: &ArrayViewD<T>,
+  depth: &ArrayViewD<u8>,
+  target: &ArrayViewD<u8>,
+  out: &mut ArrayViewMutD<U>,
+  f: F,
+  nthreads: u16,
+) -> PyResult<bool>
+where
+  T: HashValue,
+  U: HashValue,
+  F: Fn(u64, u8, u8) -> Option<u64> + Send + Sync,
+{
+  check_shapes(&[ipix.shape(), depth.shape(), target.shape(), out.shape()])?;
+  let invalid = check::InvalidInput::default();
+  let apply = |o: &mut U, p: &T, &d: &u8, &t: &u8| match f(p.to_hash(), d, t) {
+    Some(h) => *o = U::from_hash(h),
+    None => invalid.raise(),
+  };
+  #[cfg(not(target_arch = "wasm32"))]
+  py.allow_threads(|| {
+    thread_pool::get(nthreads).install(|| {
+      Zip::from(out)
+        .and(ipix)
+        .and(depth)
+        .and(target)
+        .par_for_each(apply)
+    })
+  });
+  #[cfg(target_arch = "wasm32")]
+  Zip::from(out)
+    .and(ipix)
+    .and(depth)
+    .and(target)
+    .for_each(apply);
+  Ok(invalid.is_raised())
+}
+
+/// Writes the (hash, depth) decoded by `f` from each index in `ipix` and `depth`, in
+/// parallel. Returns whether `f` rejected an index.
+#[allow(unused_variables)]
+fn decode_cells<T, U, F>(
+  py: Python,
+  indices: &ArrayViewD<T>,
+  ipix: &mut ArrayViewMutD<U>,
+  depth: &mut ArrayViewMutD<u8>,
+  f: F,
+  nthreads: u16,
+) -> PyResult<bool>
+where
+  T: HashValue,
+  U: HashValue,
+  F: Fn(u64) -> Option<(u64, u8)> + Send + Sync,
+{
+  check_shapes(&[indices.shape(), ipix.shape(), depth.shape()])?;
+  let invalid = check::InvalidInput::default();
+  let apply = |p: &mut U, d: &mut u8, index: &T| match f(index.to_hash()) {
+    Some((hash, depth)) => {
+      *p = U::from_hash(hash);
+      *d = depth;
+    }
+    None => invalid.raise(),
+  };
+  #[cfg(not(target_arch = "wasm32"))]
+  py.allow_threads(|| {
+    thread_pool::get(nthreads)
+      .install(|| Zip::from(ipix).and(depth).and(indices).par_for_each(apply))
+  });
+  #[cfg(target_arch = "wasm32")]
+  Zip::from(ipix).and(depth).and(indices).for_each(apply);
+  Ok(invalid.is_raised())
+}
+
+/// Returns the error describing the first rejected cell: either its hash is invalid at
+/// its depth, or its target depth is not valid according to `is_valid_target`.
+fn first_invalid_cell<T: HashValue>(
+  ipix: &ArrayViewD<T>,
+  depth: &ArrayViewD<u8>,
+  target: &ArrayViewD<u8>,
+  is_valid_target: impl Fn(u8, u8) -> bool,
+  target_error: &str,
+) -> PyErr {
+  for ((index, &p), (&d, &t)) in ipix.indexed_iter().zip(depth.iter().zip(target.iter())) {
+    if !check::is_valid_hash(d, p.to_hash()) {
+      break;
+    } else if !is_valid_target(d, t) {
+      return PyValueError::new_err(format!(
+        "{}: {} for a cell of depth {} at index {:?}.",
+        target_error,
+        t,
+        d,
+        index.slice()
+      ));
+    }
+  }
+  check::first_invalid_hash(depth, ipix)
+}
+
+/// Returns the error describing the first index that `f` rejects.
+fn first_invalid_index<T: HashValue>(
+  indices: &ArrayViewD<T>,
+  f: impl Fn(u64) -> Option<(u64, u8)>,
+  name: &str,
+) -> PyErr {
+  indices
+    .indexed_iter()
+    .find(|(_, &p)| f(p.to_hash()).is_none())
+    .map(|(index, &p)| {
+      PyValueError::new_err(format!(
+        "The input {} array contains invalid values: {} at index {:?}.",
+        name,
+        p.to_hash() as i64,
+        index.slice()
+      ))
+    })
+    .unwrap_or_else(|| PyValueError::new_err(format!("Invalid {} input", name)))
+}
+
+#[inline]
+fn parent(hash: u64, depth: u8, parent_depth: u8) -> Option<u64> {
+  (check::is_valid_hash(depth, hash) && parent_depth <= depth)
+    .then(|| hash >> ((depth - parent_depth) << 1))
+}
+
+#[inline]
+fn first_child(hash: u64, depth: u8, child_depth: u8) -> Option<u64> {
+  (check::is_valid_hash(depth, hash) && depth <= child_depth && child_depth <= check::MAX_DEPTH)
+    .then(|| hash << ((child_depth - depth) << 1))
+}
+
+#[inline]
+fn uniq(hash: u64, depth: u8, _: u8) -> Option<u64> {
+  check::is_valid_hash(depth, hash).then(|| (4_u64 << (depth << 1)) | hash)
+}
+
+#[inline]
+fn from_uniq_index(uniq: u64) -> Option<(u64, u8)> {
+  (4..UNIQ_END).contains(&uniq).then(|| {
+    let depth = (((63 - uniq.leading_zeros()) >> 1) - 1) as u8;
+    (uniq - (4_u64 << (depth << 1)), depth)
+  })
+}
+
+#[inline]
+fn zuniq(hash: u64, depth: u8, _: u8) -> Option<u64> {
+  check::is_valid_hash(depth, hash).then(|| ((hash << 1) | 1) << ((check::MAX_DEPTH - depth) << 1))
+}
+
+#[inline]
+fn from_zuniq_index(zuniq: u64) -> Option<(u64, u8)> {
+  let shift = zuniq.trailing_zeros();
+  let is_valid = zuniq < ZUNIQ_END && shift % 2 == 0 && shift <= (check::MAX_DEPTH << 1) as u32;
+  is_valid.then(|| {
+    let depth = check::MAX_DEPTH - (shift >> 1) as u8;
+    (zuniq >> (shift + 1), depth)
+  })
+}
+
+/// Parents at `parent_depth` of the cells `ipix` at `depth`.
+#[pyfunction]
+pub fn to_parent<'py>(
+  py: Python<'py>,
+  ipix: Hashes<'py>,
+  depth: PyReadonlyArrayDyn<'py, u8>,
+  parent_depth: PyReadonlyArrayDyn<'py, u8>,
+  out: HashesMut<'py>,
+  nthreads: u16,
+) -> PyResult<()> {
+  let (depth, parent_depth) = (depth.as_array(), parent_depth.as_array());
+  with_hashes!(ipix, |ipix| {
+    with_hashes_mut!(out, |out| {
+      if map_cells(py, &ipix, &depth, &parent_depth, &mut out, parent, nthreads)? {
+        return Err(first_invalid_cell(
+          &ipix,
+          &depth,
+          &parent_depth,
+          |d, t| t <= d,
+          "The parent depth must not be greater than the depth of the cell",
+        ));
+      }
+      Ok(())
+    })
+  })
+}
+
+/// Ranges [`start`, `end`[ of the children at `child_depth` of the cells `ipix` at
+/// `depth`.
+#[pyfunction]
+pub fn children_range<'py>(
+  py: Python<'py>,
+  ipix: Hashes<'py>,
+  depth: PyReadonlyArrayDyn<'py, u8>,
+  child_depth: PyReadonlyArrayDyn<'py, u8>,
+  start: HashesMut<'py>,
+  end: HashesMut<'py>,
+  nthreads: u16,
+) -> PyResult<()> {
+  let (depth, child_depth) = (depth.as_array(), child_depth.as_array());
+  with_hashes!(ipix, |ipix| {
+    let mut invalid = with_hashes_mut!(start, |start| {
+      map_cells(
+        py,
+        &ipix,
+        &depth,
+        &child_depth,
+        &mut start,
+        first_child,
+        nthreads,
+      )
+    })?;
+    invalid |= with_hashes_mut!(end, |end| {
+      let next_first_child =
+        |h: u64, d: u8, t: u8| first_child(h, d, t).map(|c| c + (1 << ((t - d) << 1)));
+      map_cells(
+        py,
+        &ipix,
+        &depth,
+        &child_depth,
+        &mut end,
+        next_first_child,
+        nthreads,
+      )
+    })?;
+    if invalid {
+      return Err(first_invalid_cell(
+        &ipix,
+        &depth,
+        &child_depth,
+        |d, t| d <= t && check::is_valid_depth(t),
+        "The child depth must be in [depth of the cell, 29]",
+      ));
+    }
+    Ok(())
+  })
+}
+
+/// UNIQ indices of the cells `ipix` at `depth`.
+#[pyfunction]
+pub fn to_uniq<'py>(
+  py: Python<'py>,
+  ipix: Hashes<'py>,
+  depth: PyReadonlyArrayDyn<'py, u8>,
+  out: HashesMut<'py>,
+  nthreads: u16,
+) -> PyResult<()> {
+  let depth = depth.as_array();
+  with_hashes!(ipix, |ipix| {
+    with_hashes_mut!(out, |out| {
+      if map_cells(py, &ipix, &depth, &depth, &mut out, uniq, nthreads)? {
+        return Err(check::first_invalid_hash(&depth, &ipix));
+      }
+      Ok(())
+    })
+  })
+}
+
+/// Cells and depths of UNIQ indices.
+#[pyfunction]
+pub fn from_uniq<'py>(
+  py: Python<'py>,
+  uniq: Hashes<'py>,
+  ipix: HashesMut<'py>,
+  depth: Bound<'py, PyArrayDyn<u8>>,
+  nthreads: u16,
+) -> PyResult<()> {
+  let mut depth = unsafe { depth.as_array_mut() };
+  with_hashes!(uniq, |uniq| {
+    with_hashes_mut!(ipix, |ipix| {
+      if decode_cells(py, &uniq, &mut ipix, &mut depth, from_uniq_index, nthreads)? {
+        return Err(first_invalid_index(&uniq, from_uniq_index, "UNIQ"));
+      }
+      Ok(())
+    })
+  })
+}
+
+/// ZUNIQ indices of the cells `ipix` at `depth`.
+#[pyfunction]
+pub fn to_zuniq<'py>(
+  py: Python<'py>,
+  ipix: Hashes<'py>,
+  depth: PyReadonlyArrayDyn<'py, u8>,
+  out: Bound<'py, PyArrayDyn<u64>>,
+  nthreads: u16,
+) -> PyResult<()> {
+  let depth = depth.as_array();
+  let mut out = unsafe { out.as_array_mut() };
+  with_hashes!(ipix, |ipix| {
+    if map_cells(py, &ipix, &depth, &depth, &mut out, zuniq, nthreads)? {
+      return Err(check::first_invalid_hash(&depth, &ipix));
+    }
+    Ok(())
+  })
+}
+
+/// Cells and depths of ZUNIQ indices.
+#[pyfunction]
+pub fn from_zuniq<'py>(
+  py: Python<'py>,
+  zuniq: Hashes<'py>,
+  ipix: Bound<'py, PyArrayDyn<u64>>,
+  depth: Bound<'py, PyArrayDyn<u8>>,
+  nthreads: u16,
+) -> PyResult<()> {
+  let mut ipix = unsafe { ipix.as_array_mut() };
+  let mut depth = unsafe { depth.as_array_mut() };
+  with_hashes!(zuniq, |zuniq| {
+    if decode_cells(
+      py,
+      &zuniq,
+      &mut ipix,
+      &mut depth,
+      from_zuniq_index,
+      nthreads,
+    )? {
+      return Err(first_invalid_index(&zuniq, from_zuniq_index, "ZUNIQ"));
+    }
+    Ok(())
+  })
+}
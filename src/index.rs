@@ -0,0 +1,383 @@
+//! Row queries on a catalog sorted by nested hash at depth 29.
+//!
+//! The coverage of a region, given by the BMOC builders of the searches, is turned
+//! into ranges of depth 29 hashes which are binary searched in the sorted hashes of
+//! the catalog, within the range of their base cell. The rows of the fully covered
+//! cells are returned as is, the other rows are tested exactly against the region.
+//! The coordinates of the catalog are sorted as the hashes, so that the rows of a
+//! cell are read contiguously, also when the index is memory-mapped.
+//!
+//! The k nearest neighbours of a position are searched in cones of growing radius,
+//! probing the cell of the position and its neighbours at the depth of the radius as
+//! the cross-match does, until k points are found within the radius.
+
+use std::{f64::consts::PI, ops::Range};
+
+use ndarray::ArrayView1;
+use numpy::{IntoPyArray, PyArray1, PyReadonlyArray1};
+use pyo3::{exceptions::PyValueError, prelude::*, Bound, PyResult};
+#[cfg(not(target_arch = "wasm32"))]
+use rayon::prelude::*;
+
+use healpix::nested::bmoc::BMOC;
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  check,
+  contains::{box_vertices, polygon, Cone, Region, Zone},
+  crossmatch::{cell_and_neighbours, distance},
+  dtypes::{as_1d, with_lonlat, CoordValue, Coords},
+  sort::sort_by_hash,
+};
+
+/// Largest radius, in radians, of the cones probed by the k nearest neighbours search
+/// through the cell of their center and its neighbours. Beyond, all the points are
+/// tested.
+const MAX_RING_RADIUS: f64 = PI / 6.0;
+
+/// The sorted hashes of an index, the rows in that order and the base cell offsets.
+type SortedHashes<'py> = (
+  PyReadonlyArray1<'py, u64>,
+  PyReadonlyArray1<'py, u64>,
+  PyReadonlyArray1<'py, u64>,
+);
+
+/// Sorts the points of a catalog by nested hash at depth 29, `lon` and `lat` in
+/// radians. Returns the sorted hashes and the rows of the points in that order.
+#[pyfunction]
+pub fn index_catalog<'py>(
+  py: Python<'py>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  nthreads: u16,
+) -> PyResult<(Bound<'py, PyArray1<u64>>, Bound<'py, PyArray1<u64>>)> {
+  let (hashes, rows) = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    Ok(py.allow_threads(|| sort_by_hash(check::MAX_DEPTH, lon, lat, nthreads)))
+  })?;
+  Ok((hashes.into_pyarray(py), rows.into_pyarray(py)))
+}
+
+/// Returns the range, in the sorted depth 29 `hashes`, of the cell `hash` at `depth`.
+fn cell_range(hashes: &[u64], base_offsets: &[u64], depth: u8, hash: u64) -> Range<usize> {
+  let base = (hash >> (depth << 1)) as usize;
+  let (start, end) = (base_offsets[base] as usize, base_offsets[base + 1] as usize);
+  let shift = (check::MAX_DEPTH - depth) << 1;
+  let from = start + hashes[start..end].partition_point(|&h| h < hash << shift);
+  let to = from + hashes[from..end].partition_point(|&h| h < (hash + 1) << shift);
+  from..to
+}
+
+/// Returns, in increasing order, the rows of the points in the region.
+/// `base_offsets` are the offsets in `hashes` of the 12 base cells, and their end.
+fn rows_in<T: CoordValue, R: Region>(
+  hashes: &[u64],
+  rows: &[u64],
+  base_offsets: &[u64],
+  lon: ArrayView1<T>,
+  lat: ArrayView1<T>,
+  region: &R,
+  coverage: BMOC,
+) -> Vec<u64> {
+  let mut found = Vec::new();
+  for cell in coverage.into_iter() {
+    let range = cell_range(hashes, base_offsets, cell.depth, cell.hash);
+    if cell.is_full {
+      found.extend_from_slice(&rows[range]);
+    } else {
+      found.extend(
+        range
+          .filter(|&k| region.contains_lonlat(lon[k].to_f64(), lat[k].to_f64()))
+          .map(|k| rows[k]),
+      );
+    }
+  }
+  found.sort_unstable();
+  found
+}
+
+/// Checks that the base cell offsets cut the `len` hashes of an index.
+fn check_base_offsets(base_offsets: &[u64], len: usize) -> PyResult<()> {
+  let is_valid = base_offsets.len() == 13
+    && base_offsets[0] == 0
+    && base_offsets.windows(2).all(|w| w[0] <= w[1])
+    && base_offsets[12] == len as u64;
+  if is_valid {
+    Ok(())
+  } else {
+    Err(PyValueError::new_err(
+      "The base cell offsets do not match the index",
+    ))
+  }
+}
+
+/// Writes in `nearest` the (distance, row) of the `k` nearest points of (`lon`, `lat`),
+/// ordered by distance then by row, `radius` being the radius of the first cone
+/// searched.
+#[allow(clippy::too_many_arguments)]
+fn k_nearest<T: CoordValue>(
+  hashes: &[u64],
+  rows: &[u64],
+  base_offsets: &[u64],
+  cat_lon: ArrayView1<T>,
+  cat_lat: ArrayView1<T>,
+  lon: f64,
+  lat: f64,
+  k: usize,
+  mut radius: f64,
+  nearest: &mut Vec<(f64, u64)>,
+) {
+  let d = |j: usize| distance(lon, lat, cat_lon[j].to_f64(), cat_lat[j].to_f64());
+  loop {
+    nearest.clear();
+    if radius > MAX_RING_RADIUS {
+      nearest.extend((0..hashes.len()).map(|j| (d(j), rows[j])));
+      break;
+    }
+    let depth = healpix::best_starting_depth(radius);
+    let hash = healpix::nested::get(depth).hash(lon, lat);
+    for cell in cell_and_neighbours(depth, hash).into_iter().flatten() {
+      for j in cell_range(hashes, base_offsets, depth, cell) {
+        let dist = d(j);
+        if dist <= radius {
+          nearest.push((dist, rows[j]));
+        }
+      }
+    }
+    // the points out of the cone are farther than the k found within it
+    if nearest.len() >= k {
+      break;
+    }
+    radius *= 2.0;
+  }
+  let order = |a: &(f64, u64), b: &(f64, u64)| a.0.total_cmp(&b.0).then(a.1.cmp(&b.1));
+  if nearest.len() > k {
+    nearest.select_nth_unstable_by(k - 1, order);
+    nearest.truncate(k);
+  }
+  nearest.sort_unstable_by(order);
+}
+
+/// Runs a query, without holding the GIL, on a catalog indexed by `index_catalog`,
+/// (`lon`, `lat`) being the coordinates of the catalog sorted as `hashes`.
+fn query<'py, R, F>(
+  py: Python<'py>,
+  index: SortedHashes<'py>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  region: F,
+) -> PyResult<Bound<'py, PyArray1<u64>>>
+where
+  R: Region,
+  F: FnOnce() -> (R, BMOC) + Send,
+{
+  let (hashes, rows, base_offsets) = (
+    index.0.as_slice()?,
+    index.1.as_slice()?,
+    index.2.as_slice()?,
+  );
+  check_base_offsets(base_offsets, hashes.len())?;
+  let found = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    if hashes.len() != lon.len() || rows.len() != lon.len() {
+      return Err(PyValueError::new_err(
+        "The index does not match the catalog",
+      ));
+    }
+    Ok(py.allow_threads(|| {
+      let (region, coverage) = region();
+      rows_in(hashes, rows, base_offsets, lon, lat, &region, coverage)
+    }))
+  })?;
+  Ok(found.into_pyarray(py))
+}
+
+/// Rows of the indexed catalog in a cone, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn index_cone_search<'py>(
+  py: Python<'py>,
+  hashes: PyReadonlyArray1<'py, u64>,
+  rows: PyReadonlyArray1<'py, u64>,
+  base_offsets: PyReadonlyArray1<'py, u64>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  depth: u8,
+  delta_depth: u8,
+  cone_lon: f64,
+  cone_lat: f64,
+  radius: f64,
+) -> PyResult<Bound<'py, PyArray1<u64>>> {
+  check::check_depth(depth)?;
+  query(py, (hashes, rows, base_offsets), lon, lat, || {
+    let coverage =
+      healpix::nested::cone_coverage_approx_custom(depth, delta_depth, cone_lon, cone_lat, radius);
+    (Cone::new(cone_lon, cone_lat, radius), coverage)
+  })
+}
+
+/// Rows of the indexed catalog in a polygon, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn index_polygon_search<'py>(
+  py: Python<'py>,
+  hashes: PyReadonlyArray1<'py, u64>,
+  rows: PyReadonlyArray1<'py, u64>,
+  base_offsets: PyReadonlyArray1<'py, u64>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  depth: u8,
+  poly_lon: PyReadonlyArray1<'py, f64>,
+  poly_lat: PyReadonlyArray1<'py, f64>,
+) -> PyResult<Bound<'py, PyArray1<u64>>> {
+  check::check_depth(depth)?;
+  let vertices = poly_lon
+    .as_array()
+    .iter()
+    .zip(poly_lat.as_array().iter())
+    .map(|(&lon, &lat)| (lon, lat))
+    .collect::<Vec<(f64, f64)>>();
+  query(py, (hashes, rows, base_offsets), lon, lat, || {
+    let coverage = healpix::nested::polygon_coverage(depth, &vertices, true);
+    (polygon(&vertices), coverage)
+  })
+}
+
+/// Rows of the indexed catalog in a box, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn index_box_search<'py>(
+  py: Python<'py>,
+  hashes: PyReadonlyArray1<'py, u64>,
+  rows: PyReadonlyArray1<'py, u64>,
+  base_offsets: PyReadonlyArray1<'py, u64>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  depth: u8,
+  box_lon: f64,
+  box_lat: f64,
+  a: f64,
+  b: f64,
+  pa: f64,
+) -> PyResult<Bound<'py, PyArray1<u64>>> {
+  check::check_depth(depth)?;
+  query(py, (hashes, rows, base_offsets), lon, lat, || {
+    let coverage = healpix::nested::box_coverage(depth, box_lon, box_lat, a, b, pa);
+    (polygon(&box_vertices(box_lon, box_lat, a, b, pa)), coverage)
+  })
+}
+
+/// Rows of the indexed catalog in a zone, all the parameters in radians.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+pub fn index_zone_search<'py>(
+  py: Python<'py>,
+  hashes: PyReadonlyArray1<'py, u64>,
+  rows: PyReadonlyArray1<'py, u64>,
+  base_offsets: PyReadonlyArray1<'py, u64>,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  depth: u8,
+  lon_min: f64,
+  lat_min: f64,
+  lon_max: f64,
+  lat_max: f64,
+) -> PyResult<Bound<'py, PyArray1<u64>>> {
+  check::check_depth(depth)?;
+  query(py, (hashes, rows, base_offsets), lon, lat, || {
+    let coverage = healpix::nested::zone_coverage(depth, lon_min, lat_min, lon_max, lat_max);
+    let zone = Zone {
+      lon_min,
+      lat_min,
+      lon_max,
+      lat_max,
+    };
+    (zone, coverage)
+  })
+}
+
+/// Rows of the `k` nearest points of the indexed catalog to each position (`lon`,
+/// `lat`) in radians, and their distances in radians, flattened by position.
+#[pyfunction]
+#[allow(clippy::too_many_arguments)]
+#[allow(unused_variables)]
+pub fn index_knn_search<'py>(
+  py: Python<'py>,
+  hashes: PyReadonlyArray1<'py, u64>,
+  rows: PyReadonlyArray1<'py, u64>,
+  base_offsets: PyReadonlyArray1<'py, u64>,
+  cat_lon: Coords<'py>,
+  cat_lat: Coords<'py>,
+  lon: PyReadonlyArray1<'py, f64>,
+  lat: PyReadonlyArray1<'py, f64>,
+  k: usize,
+  nthreads: u16,
+) -> PyResult<(Bound<'py, PyArray1<u64>>, Bound<'py, PyArray1<f64>>)> {
+  let (hashes, rows, base_offsets) = (
+    hashes.as_slice()?,
+    rows.as_slice()?,
+    base_offsets.as_slice()?,
+  );
+  check_base_offsets(base_offsets, hashes.len())?;
+  if k == 0 || k > hashes.len() {
+    return Err(PyValueError::new_err(
+      "k must be in [1, number of points in the index]",
+    ));
+  }
+  let (lon, lat) = (lon.as_array(), lat.as_array());
+  if lon.len() != lat.len() {
+    return Err(PyValueError::new_err(
+      "lon and lat must be 1-D arrays of the same length",
+    ));
+  }
+  // the radius of a cone containing k points, were they uniformly distributed
+  let radius = 2.0 * (k as f64 / hashes.len() as f64).sqrt();
+  let (found_rows, found_dist) = with_lonlat!(cat_lon, cat_lat, |cat_lon, cat_lat| {
+    let (cat_lon, cat_lat) = as_1d(cat_lon, cat_lat)?;
+    if rows.len() != cat_lon.len() || hashes.len() != cat_lon.len() {
+      return Err(PyValueError::new_err(
+        "The index does not match the catalog",
+      ));
+    }
+    let mut found_rows = vec![0_u64; lon.len() * k];
+    let mut found_dist = vec![0_f64; lon.len() * k];
+    let search = |(i, (rows_i, dist_i)): (usize, (&mut [u64], &mut [f64]))| {
+      let mut nearest = Vec::with_capacity(k);
+      k_nearest(
+        hashes,
+        rows,
+        base_offsets,
+        cat_lon,
+        cat_lat,
+        lon[i],
+        lat[i],
+        k,
+        radius,
+        &mut nearest,
+      );
+      for (j, (dist, row)) in nearest.into_iter().enumerate() {
+        rows_i[j] = row;
+        dist_i[j] = dist;
+      }
+    };
+    #[cfg(not(target_arch = "wasm32"))]
+    py.allow_threads(|| {
+      thread_pool::get(nthreads).install(|| {
+        found_rows
+          .par_chunks_mut(k)
+          .zip(found_dist.par_chunks_mut(k))
+          .enumerate()
+          .for_each(search)
+      })
+    });
+    #[cfg(target_arch = "wasm32")]
+    found_rows
+      .chunks_mut(k)
+      .zip(found_dist.chunks_mut(k))
+      .enumerate()
+      .for_each(search);
+    Ok((found_rows, found_dist))
+  })?;
+  Ok((found_rows.into_pyarray(py), found_dist.into_pyarray(py)))
+}
@@ -1,14 +1,32 @@
-use ndarray::{Array1, Zip};
+use ndarray::{Array1, ArrayViewD, ArrayViewMutD, Zip};
 use numpy::{IntoPyArray, PyArray1, PyArrayDyn, PyArrayMethods, PyReadonlyArrayDyn};
 use pyo3::{
   prelude::{pymodule, Bound, PyModule, PyResult, Python},
-  types::PyModuleMethods,
+  types::{PyAny, PyModuleMethods},
   wrap_pyfunction,
 };
 
 use healpix::compass_point::{Cardinal, MainWind, Ordinal};
 
+mod batch;
+mod check;
+mod contains;
+mod coverage;
+mod crossmatch;
+mod depths;
+mod dtypes;
+mod groupby;
+mod hierarchy;
+mod index;
+mod regions;
 mod skymap_functions;
+mod sort;
+mod thread_pool;
+
+use dtypes::{
+  with_coords_mut, with_hashes, with_hashes_mut, with_lonlat, with_neighbours_mut, CoordValue,
+  Coords, CoordsMut, HashValue, Hashes, HashesMut, HashesVec, NeighbourValue, NeighboursMut,
+};
 
 /// This uses rust-numpy for numpy interoperability between
 /// Python and Rust.
@@ -30,194 +48,291 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     .unwrap();
   m.add_function(wrap_pyfunction!(skymap_functions::depth_skymap, m)?)
     .unwrap();
+  // hashes at several depths from a single projection
+  m.add_function(wrap_pyfunction!(depths::lonlat_to_healpix_depths, m)?)
+    .unwrap();
+  // moves between depths, UNIQ and ZUNIQ indices
+  m.add_function(wrap_pyfunction!(hierarchy::to_parent, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(hierarchy::children_range, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(hierarchy::to_uniq, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(hierarchy::from_uniq, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(hierarchy::to_zuniq, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(hierarchy::from_zuniq, m)?)
+    .unwrap();
+  // batched searches
+  m.add_function(wrap_pyfunction!(batch::cone_search_batch, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(batch::polygon_search_batch, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(batch::elliptical_cone_search_batch, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(batch::box_search_batch, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(batch::zone_search_batch, m)?)
+    .unwrap();
+  // set operations, simplification, morphology and membership tests on coverages
+  m.add_function(wrap_pyfunction!(coverage::coverage_operation, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(coverage::coverage_simplify, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(coverage::coverage_dilate, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(coverage::coverage_erode, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(coverage::coverage_border, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(coverage::coverage_contains, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(coverage::coverage_contains_ipix, m)?)
+    .unwrap();
+  // regions with memoized coverages
+  m.add_class::<regions::Region>().unwrap();
+  // classification of points against many regions
+  m.add_function(wrap_pyfunction!(contains::points_in_cones, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(contains::points_in_ellipses, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(contains::points_in_polygons, m)?)
+    .unwrap();
+  // cross-match
+  m.add_function(wrap_pyfunction!(crossmatch::crossmatch_index, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(crossmatch::crossmatch_chunk, m)?)
+    .unwrap();
+  // sorting and grouping of points by nested hash
+  m.add_function(wrap_pyfunction!(sort::sort_by_healpix, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(groupby::group_by_healpix, m)?)
+    .unwrap();
+  // row queries on an indexed catalog
+  m.add_function(wrap_pyfunction!(index::index_catalog, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(index::index_cone_search, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(index::index_polygon_search, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(index::index_box_search, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(index::index_zone_search, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(index::index_knn_search, m)?)
+    .unwrap();
+  // thread pool settings
+  m.add_function(wrap_pyfunction!(thread_pool::set_num_threads, m)?)
+    .unwrap();
+  m.add_function(wrap_pyfunction!(thread_pool::get_num_threads, m)?)
+    .unwrap();
 
   // wrapper of to_ring and from_ring
   #[pyfn(m)]
   #[pyo3(name = "to_ring")]
   unsafe fn to_ring<'a>(
-    _py: Python,
+    py: Python,
     depth: u8,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
-    ipix_ring: &Bound<'a, PyArrayDyn<u64>>,
+    ipix: Hashes<'a>,
+    ipix_ring: HashesMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let ipix = ipix.as_array();
-    let mut ipix_ring = ipix_ring.as_array_mut();
+    check::check_depth(depth)?;
 
     let layer = healpix::nested::get(depth);
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(&ipix)
-          .and(&mut ipix_ring)
-          .par_for_each(|&pix, pix_ring| {
-            *pix_ring = layer.to_ring(pix);
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&ipix)
-        .and(&mut ipix_ring)
-        .for_each(|&pix, pix_ring| {
-          *pix_ring = layer.to_ring(pix);
-        });
-    }
-    Ok(())
+    with_hashes!(ipix, |ipix| {
+      with_hashes_mut!(ipix_ring, |ipix_ring| {
+        let invalid = check::InvalidInput::default();
+        #[cfg(not(target_arch = "wasm32"))]
+        {
+          let pool = thread_pool::get(nthreads);
+          py.allow_threads(|| {
+            pool.install(|| {
+              Zip::from(&ipix)
+                .and(&mut ipix_ring)
+                .par_for_each(|&pix, pix_ring| {
+                  let pix = pix.to_hash();
+                  if check::is_valid_hash(depth, pix) {
+                    *pix_ring = HashValue::from_hash(layer.to_ring(pix));
+                  } else {
+                    invalid.raise();
+                  }
+                })
+            })
+          });
+        }
+        #[cfg(target_arch = "wasm32")]
+        {
+          Zip::from(&ipix)
+            .and(&mut ipix_ring)
+            .for_each(|&pix, pix_ring| {
+              let pix = pix.to_hash();
+              if check::is_valid_hash(depth, pix) {
+                *pix_ring = HashValue::from_hash(layer.to_ring(pix));
+              } else {
+                invalid.raise();
+              }
+            });
+        }
+        if invalid.is_raised() {
+          return Err(check::first_invalid_hash_at_depth(depth, &ipix));
+        }
+        Ok(())
+      })
+    })
   }
 
   #[pyfn(m)]
   unsafe fn from_ring<'a>(
-    _py: Python,
+    py: Python,
     depth: u8,
-    ipix_ring: &Bound<'a, PyArrayDyn<u64>>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
+    ipix_ring: Hashes<'a>,
+    ipix: HashesMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let ipix_ring = ipix_ring.as_array();
-    let mut ipix = ipix.as_array_mut();
+    check::check_depth(depth)?;
 
     let layer = healpix::nested::get(depth);
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(&ipix_ring)
-          .and(&mut ipix)
-          .par_for_each(|&pix_ring, pix| {
-            *pix = layer.from_ring(pix_ring);
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&ipix_ring)
-        .and(&mut ipix)
-        .for_each(|&pix_ring, pix| {
-          *pix = layer.from_ring(pix_ring);
-        });
-    }
+    with_hashes!(ipix_ring, |ipix_ring| {
+      with_hashes_mut!(ipix, |ipix| {
+        let invalid = check::InvalidInput::default();
+        #[cfg(not(target_arch = "wasm32"))]
+        {
+          let pool = thread_pool::get(nthreads);
+          py.allow_threads(|| {
+            pool.install(|| {
+              Zip::from(&ipix_ring)
+                .and(&mut ipix)
+                .par_for_each(|&pix_ring, pix| {
+                  let pix_ring = pix_ring.to_hash();
+                  if check::is_valid_hash(depth, pix_ring) {
+                    *pix = HashValue::from_hash(layer.from_ring(pix_ring));
+                  } else {
+                    invalid.raise();
+                  }
+                })
+            })
+          });
+        }
+        #[cfg(target_arch = "wasm32")]
+        {
+          Zip::from(&ipix_ring)
+            .and(&mut ipix)
+            .for_each(|&pix_ring, pix| {
+              let pix_ring = pix_ring.to_hash();
+              if check::is_valid_hash(depth, pix_ring) {
+                *pix = HashValue::from_hash(layer.from_ring(pix_ring));
+              } else {
+                invalid.raise();
+              }
+            });
+        }
 
-    Ok(())
+        if invalid.is_raised() {
+          return Err(check::first_invalid_hash_at_depth(depth, &ipix_ring));
+        }
+        Ok(())
+      })
+    })
   }
 
-  /// wrapper of `lonlat_to_healpix`
+  /// wrapper of `lonlat_to_healpix`, the offsets `dx` and `dy` being only computed
+  /// when given
   #[pyfn(m)]
   unsafe fn lonlat_to_healpix<'a>(
-    _py: Python,
+    py: Python,
     depth: &Bound<'a, PyArrayDyn<u8>>,
-    lon: &Bound<'a, PyArrayDyn<f64>>,
-    lat: &Bound<'a, PyArrayDyn<f64>>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
-    dx: &Bound<'a, PyArrayDyn<f64>>,
-    dy: &Bound<'a, PyArrayDyn<f64>>,
+    lon: Coords<'a>,
+    lat: Coords<'a>,
+    ipix: HashesMut<'a>,
+    dx: Option<CoordsMut<'a>>,
+    dy: Option<CoordsMut<'a>>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let lon = lon.as_array();
-    let lat = lat.as_array();
     let depth = depth.as_array();
-    let mut ipix = ipix.as_array_mut();
-    let mut dx = dx.as_array_mut();
-    let mut dy = dy.as_array_mut();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(&mut ipix)
-          .and(&mut dx)
-          .and(&mut dy)
-          .and(&lon)
-          .and(&lat)
-          .and(&depth)
-          .par_for_each(|p, x, y, &lon, &lat, &d| {
-            let r = healpix::nested::hash_with_dxdy(d, lon, lat);
-            *p = r.0;
-            *x = r.1;
-            *y = r.2;
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&mut ipix)
-        .and(&mut dx)
-        .and(&mut dy)
-        .and(&lon)
-        .and(&lat)
-        .and(&depth)
-        .for_each(|p, x, y, &lon, &lat, &d| {
-          let r = healpix::nested::hash_with_dxdy(d, lon, lat);
-          *p = r.0;
-          *x = r.1;
-          *y = r.2;
-        });
+    let invalid = with_lonlat!(lon, lat, |lon, lat| {
+      with_hashes_mut!(ipix, |ipix| {
+        match (dx, dy) {
+          (Some(dx), Some(dy)) => with_coords_mut!(dx, dy, |dx, dy| {
+            Ok(hash_lonlat(
+              py,
+              nthreads,
+              lon,
+              lat,
+              depth.view(),
+              ipix.view_mut(),
+              Some((dx.view_mut(), dy.view_mut())),
+              check::is_valid_depth,
+              healpix::nested::hash_with_dxdy,
+            ))
+          }),
+          _ => Ok(hash_lonlat::<_, _, f64, _>(
+            py,
+            nthreads,
+            lon,
+            lat,
+            depth.view(),
+            ipix.view_mut(),
+            None,
+            check::is_valid_depth,
+            healpix::nested::hash_with_dxdy,
+          )),
+        }
+      })
+    })?;
+    if invalid {
+      return Err(check::first_invalid_depth(&depth));
     }
-
     Ok(())
   }
 
+  /// wrapper of `lonlat_to_healpix_ring`, the offsets `dx` and `dy` being only
+  /// computed when given
   #[pyfn(m)]
   unsafe fn lonlat_to_healpix_ring<'a>(
-    _py: Python,
+    py: Python,
     nside: &Bound<'a, PyArrayDyn<u32>>,
-    lon: &Bound<'a, PyArrayDyn<f64>>,
-    lat: &Bound<'a, PyArrayDyn<f64>>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
-    dx: &Bound<'a, PyArrayDyn<f64>>,
-    dy: &Bound<'a, PyArrayDyn<f64>>,
+    lon: Coords<'a>,
+    lat: Coords<'a>,
+    ipix: HashesMut<'a>,
+    dx: Option<CoordsMut<'a>>,
+    dy: Option<CoordsMut<'a>>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let lon = lon.as_array();
-    let lat = lat.as_array();
     let nside = nside.as_array();
-    let mut ipix = ipix.as_array_mut();
-    let mut dx = dx.as_array_mut();
-    let mut dy = dy.as_array_mut();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(&mut ipix)
-          .and(&mut dx)
-          .and(&mut dy)
-          .and(&lon)
-          .and(&lat)
-          .and(&nside)
-          .par_for_each(|p, x, y, &lon, &lat, &n| {
-            let r = healpix::ring::hash_with_dxdy(n, lon, lat);
-            *p = r.0;
-            *x = r.1;
-            *y = r.2;
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&mut ipix)
-        .and(&mut dx)
-        .and(&mut dy)
-        .and(&lon)
-        .and(&lat)
-        .and(&nside)
-        .for_each(|p, x, y, &lon, &lat, &n| {
-          let r = healpix::ring::hash_with_dxdy(n, lon, lat);
-          *p = r.0;
-          *x = r.1;
-          *y = r.2;
-        });
+    let invalid = with_lonlat!(lon, lat, |lon, lat| {
+      with_hashes_mut!(ipix, |ipix| {
+        match (dx, dy) {
+          (Some(dx), Some(dy)) => with_coords_mut!(dx, dy, |dx, dy| {
+            Ok(hash_lonlat(
+              py,
+              nthreads,
+              lon,
+              lat,
+              nside.view(),
+              ipix.view_mut(),
+              Some((dx.view_mut(), dy.view_mut())),
+              check::is_valid_nside,
+              healpix::ring::hash_with_dxdy,
+            ))
+          }),
+          _ => Ok(hash_lonlat::<_, _, f64, _>(
+            py,
+            nthreads,
+            lon,
+            lat,
+            nside.view(),
+            ipix.view_mut(),
+            None,
+            check::is_valid_nside,
+            healpix::ring::hash_with_dxdy,
+          )),
+        }
+      })
+    })?;
+    if invalid {
+      return Err(check::first_invalid_nside(&nside));
     }
     Ok(())
   }
@@ -225,105 +340,133 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
   /// wrapper of `healpix_to_lonlat`
   #[pyfn(m)]
   unsafe fn healpix_to_lonlat<'a>(
-    _py: Python,
+    py: Python,
     depth: &Bound<'a, PyArrayDyn<u8>>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
+    ipix: Hashes<'a>,
     dx: f64,
     dy: f64,
-    lon: &Bound<'a, PyArrayDyn<f64>>,
-    lat: &Bound<'a, PyArrayDyn<f64>>,
+    lon: CoordsMut<'a>,
+    lat: CoordsMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let mut lon = lon.as_array_mut();
-    let mut lat = lat.as_array_mut();
-    let ipix = ipix.as_array();
     let depth = depth.as_array();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(&ipix)
-          .and(&depth)
-          .and(&mut lon)
-          .and(&mut lat)
-          .par_for_each(|&p, &d, lon, lat| {
-            let (l, b) = healpix::nested::sph_coo(d, p, dx, dy);
-            *lon = l;
-            *lat = b;
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&ipix)
-        .and(&depth)
-        .and(&mut lon)
-        .and(&mut lat)
-        .for_each(|&p, &d, lon, lat| {
-          let (l, b) = healpix::nested::sph_coo(d, p, dx, dy);
-          *lon = l;
-          *lat = b;
-        });
-    }
-    Ok(())
+    with_hashes!(ipix, |ipix| {
+      with_coords_mut!(lon, lat, |lon, lat| {
+        let invalid = check::InvalidInput::default();
+        #[cfg(not(target_arch = "wasm32"))]
+        {
+          let pool = thread_pool::get(nthreads);
+          py.allow_threads(|| {
+            pool.install(|| {
+              Zip::from(&ipix)
+                .and(&depth)
+                .and(&mut lon)
+                .and(&mut lat)
+                .par_for_each(|&p, &d, lon, lat| {
+                  let p = p.to_hash();
+                  if check::is_valid_hash(d, p) {
+                    let (l, b) = healpix::nested::sph_coo(d, p, dx, dy);
+                    *lon = CoordValue::from_f64(l);
+                    *lat = CoordValue::from_f64(b);
+                  } else {
+                    invalid.raise();
+                  }
+                })
+            })
+          });
+        }
+        #[cfg(target_arch = "wasm32")]
+        {
+          Zip::from(&ipix)
+            .and(&depth)
+            .and(&mut lon)
+            .and(&mut lat)
+            .for_each(|&p, &d, lon, lat| {
+              let p = p.to_hash();
+              if check::is_valid_hash(d, p) {
+                let (l, b) = healpix::nested::sph_coo(d, p, dx, dy);
+                *lon = CoordValue::from_f64(l);
+                *lat = CoordValue::from_f64(b);
+              } else {
+                invalid.raise();
+              }
+            });
+        }
+        if invalid.is_raised() {
+          return Err(check::first_invalid_hash(&depth, &ipix));
+        }
+        Ok(())
+      })
+    })
   }
 
   #[pyfn(m)]
   unsafe fn healpix_to_lonlat_ring<'a>(
-    _py: Python,
+    py: Python,
     nside: &Bound<'a, PyArrayDyn<u32>>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
+    ipix: Hashes<'a>,
     dx: f64,
     dy: f64,
-    lon: &Bound<'a, PyArrayDyn<f64>>,
-    lat: &Bound<'a, PyArrayDyn<f64>>,
+    lon: CoordsMut<'a>,
+    lat: CoordsMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let mut lon = lon.as_array_mut();
-    let mut lat = lat.as_array_mut();
-    let ipix = ipix.as_array();
     let nside = nside.as_array();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(&ipix)
-          .and(&nside)
-          .and(&mut lon)
-          .and(&mut lat)
-          .par_for_each(|&p, &n, lon, lat| {
-            let (l, b) = healpix::ring::sph_coo(n, p, dx, dy);
-            *lon = l;
-            *lat = b;
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&ipix)
-        .and(&nside)
-        .and(&mut lon)
-        .and(&mut lat)
-        .for_each(|&p, &n, lon, lat| {
-          let (l, b) = healpix::ring::sph_coo(n, p, dx, dy);
-          *lon = l;
-          *lat = b;
-        });
-    }
-    Ok(())
+    with_hashes!(ipix, |ipix| {
+      with_coords_mut!(lon, lat, |lon, lat| {
+        let invalid = check::InvalidInput::default();
+        #[cfg(not(target_arch = "wasm32"))]
+        {
+          let pool = thread_pool::get(nthreads);
+          py.allow_threads(|| {
+            pool.install(|| {
+              Zip::from(&ipix)
+                .and(&nside)
+                .and(&mut lon)
+                .and(&mut lat)
+                .par_for_each(|&p, &n, lon, lat| {
+                  let p = p.to_hash();
+                  if check::is_valid_hash_ring(n, p) {
+                    let (l, b) = healpix::ring::sph_coo(n, p, dx, dy);
+                    *lon = CoordValue::from_f64(l);
+                    *lat = CoordValue::from_f64(b);
+                  } else {
+                    invalid.raise();
+                  }
+                })
+            })
+          });
+        }
+        #[cfg(target_arch = "wasm32")]
+        {
+          Zip::from(&ipix)
+            .and(&nside)
+            .and(&mut lon)
+            .and(&mut lat)
+            .for_each(|&p, &n, lon, lat| {
+              let p = p.to_hash();
+              if check::is_valid_hash_ring(n, p) {
+                let (l, b) = healpix::ring::sph_coo(n, p, dx, dy);
+                *lon = CoordValue::from_f64(l);
+                *lat = CoordValue::from_f64(b);
+              } else {
+                invalid.raise();
+              }
+            });
+        }
+        if invalid.is_raised() {
+          return Err(check::first_invalid_hash_ring(&nside, &ipix));
+        }
+        Ok(())
+      })
+    })
   }
 
   /// wrapper of `healpix_to_xy`
   #[pyfn(m)]
   unsafe fn healpix_to_xy<'a>(
-    _py: Python,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
+    py: Python,
+    ipix: Hashes<'a>,
     depth: &Bound<'a, PyArrayDyn<u8>>,
     x: &Bound<'a, PyArrayDyn<f64>>,
     y: &Bound<'a, PyArrayDyn<f64>>,
@@ -331,140 +474,169 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
   ) -> PyResult<()> {
     let mut x = x.as_array_mut();
     let mut y = y.as_array_mut();
-    let ipix = ipix.as_array();
     let depth = depth.as_array();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
+    with_hashes!(ipix, |ipix| {
+      let invalid = check::InvalidInput::default();
+      #[cfg(not(target_arch = "wasm32"))]
+      {
+        let pool = thread_pool::get(nthreads);
+        py.allow_threads(|| {
+          pool.install(|| {
+            Zip::from(&ipix)
+              .and(&depth)
+              .and(&mut x)
+              .and(&mut y)
+              .par_for_each(|&p, &d, hpx, hpy| {
+                let p = p.to_hash();
+                if check::is_valid_hash(d, p) {
+                  let layer = healpix::nested::get(d);
+                  let (x, y) = layer.center_of_projected_cell(p);
+                  *hpx = x;
+                  *hpy = y;
+                } else {
+                  invalid.raise();
+                }
+              })
+          })
+        });
+      }
+      #[cfg(target_arch = "wasm32")]
+      {
         Zip::from(&ipix)
           .and(&depth)
           .and(&mut x)
           .and(&mut y)
-          .par_for_each(|&p, &d, hpx, hpy| {
-            let layer = healpix::nested::get(d);
-            let (x, y) = layer.center_of_projected_cell(p);
-            *hpx = x;
-            *hpy = y;
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&ipix)
-        .and(&depth)
-        .and(&mut x)
-        .and(&mut y)
-        .for_each(|&p, &d, hpx, hpy| {
-          let layer = healpix::nested::get(d);
-          let (x, y) = layer.center_of_projected_cell(p);
-          *hpx = x;
-          *hpy = y;
-        });
-    }
-    Ok(())
+          .for_each(|&p, &d, hpx, hpy| {
+            let p = p.to_hash();
+            if check::is_valid_hash(d, p) {
+              let layer = healpix::nested::get(d);
+              let (x, y) = layer.center_of_projected_cell(p);
+              *hpx = x;
+              *hpy = y;
+            } else {
+              invalid.raise();
+            }
+          });
+      }
+      if invalid.is_raised() {
+        return Err(check::first_invalid_hash(&depth, &ipix));
+      }
+      Ok(())
+    })
   }
 
   #[pyfn(m)]
   unsafe fn healpix_to_xy_ring<'a>(
-    _py: Python,
+    py: Python,
     nside: &Bound<'a, PyArrayDyn<u32>>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
+    ipix: Hashes<'a>,
     x: &Bound<'a, PyArrayDyn<f64>>,
     y: &Bound<'a, PyArrayDyn<f64>>,
     nthreads: u16,
   ) -> PyResult<()> {
     let mut x = x.as_array_mut();
     let mut y = y.as_array_mut();
-    let ipix = ipix.as_array();
     let nside = nside.as_array();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
+    with_hashes!(ipix, |ipix| {
+      let invalid = check::InvalidInput::default();
+      #[cfg(not(target_arch = "wasm32"))]
+      {
+        let pool = thread_pool::get(nthreads);
+        py.allow_threads(|| {
+          pool.install(|| {
+            Zip::from(&ipix)
+              .and(&nside)
+              .and(&mut x)
+              .and(&mut y)
+              .par_for_each(|&p, &n, hpx, hpy| {
+                let p = p.to_hash();
+                if check::is_valid_hash_ring(n, p) {
+                  let (x, y) = healpix::ring::center_of_projected_cell(n, p);
+                  *hpx = x;
+                  *hpy = y;
+                } else {
+                  invalid.raise();
+                }
+              })
+          })
+        });
+      }
+      #[cfg(target_arch = "wasm32")]
+      {
         Zip::from(&ipix)
           .and(&nside)
           .and(&mut x)
           .and(&mut y)
-          .par_for_each(|&p, &n, hpx, hpy| {
-            let (x, y) = healpix::ring::center_of_projected_cell(n, p);
-            *hpx = x;
-            *hpy = y;
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&ipix)
-        .and(&nside)
-        .and(&mut x)
-        .and(&mut y)
-        .for_each(|&p, &n, hpx, hpy| {
-          let (x, y) = healpix::ring::center_of_projected_cell(n, p);
-          *hpx = x;
-          *hpy = y;
-        });
-    }
-    Ok(())
+          .for_each(|&p, &n, hpx, hpy| {
+            let p = p.to_hash();
+            if check::is_valid_hash_ring(n, p) {
+              let (x, y) = healpix::ring::center_of_projected_cell(n, p);
+              *hpx = x;
+              *hpy = y;
+            } else {
+              invalid.raise();
+            }
+          });
+      }
+      if invalid.is_raised() {
+        return Err(check::first_invalid_hash_ring(&nside, &ipix));
+      }
+      Ok(())
+    })
   }
 
   /// wrapper of `lonlat_to_xy`
   #[pyfn(m)]
   unsafe fn lonlat_to_xy<'a>(
-    _py: Python,
-    lon: &Bound<'a, PyArrayDyn<f64>>,
-    lat: &Bound<'a, PyArrayDyn<f64>>,
+    py: Python,
+    lon: Coords<'a>,
+    lat: Coords<'a>,
     x: &Bound<'a, PyArrayDyn<f64>>,
     y: &Bound<'a, PyArrayDyn<f64>>,
     nthreads: u16,
   ) -> PyResult<()> {
     let mut x = x.as_array_mut();
     let mut y = y.as_array_mut();
-    let lon = lon.as_array();
-    let lat = lat.as_array();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
+    with_lonlat!(lon, lat, |lon, lat| {
+      #[cfg(not(target_arch = "wasm32"))]
+      {
+        let pool = thread_pool::get(nthreads);
+        py.allow_threads(|| {
+          pool.install(|| {
+            Zip::from(&lon)
+              .and(&lat)
+              .and(&mut x)
+              .and(&mut y)
+              .par_for_each(|&l, &b, hpx, hpy| {
+                let (l, b) = (l.to_f64(), b.to_f64());
+                let (x, y) = healpix::proj(l, b);
+                *hpx = x;
+                *hpy = y;
+              })
+          })
+        });
+      }
+      #[cfg(target_arch = "wasm32")]
+      {
         Zip::from(&lon)
           .and(&lat)
           .and(&mut x)
           .and(&mut y)
-          .par_for_each(|&l, &b, hpx, hpy| {
+          .for_each(|&l, &b, hpx, hpy| {
+            let (l, b) = (l.to_f64(), b.to_f64());
             let (x, y) = healpix::proj(l, b);
             *hpx = x;
             *hpy = y;
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(&lon)
-        .and(&lat)
-        .and(&mut x)
-        .and(&mut y)
-        .for_each(|&l, &b, hpx, hpy| {
-          let (x, y) = healpix::proj(l, b);
-          *hpx = x;
-          *hpy = y;
-        });
-    }
-    Ok(())
+          });
+      }
+      Ok(())
+    })
   }
 
   /// wrapper of `xy_to_lonlat`
   #[pyfn(m)]
   unsafe fn xy_to_lonlat<'a>(
-    _py: Python,
+    py: Python,
     x: &Bound<'a, PyArrayDyn<f64>>,
     y: &Bound<'a, PyArrayDyn<f64>>,
     lon: &Bound<'a, PyArrayDyn<f64>>,
@@ -477,20 +649,19 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     let mut lat = lat.as_array_mut();
     #[cfg(not(target_arch = "wasm32"))]
     {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(&x)
-          .and(&y)
-          .and(&mut lon)
-          .and(&mut lat)
-          .par_for_each(|&hpx, &hpy, l, b| {
-            let r = healpix::unproj(hpx, hpy);
-            *l = r.0;
-            *b = r.1;
-          })
+      let pool = thread_pool::get(nthreads);
+      py.allow_threads(|| {
+        pool.install(|| {
+          Zip::from(&x)
+            .and(&y)
+            .and(&mut lon)
+            .and(&mut lat)
+            .par_for_each(|&hpx, &hpy, l, b| {
+              let r = healpix::unproj(hpx, hpy);
+              *l = r.0;
+              *b = r.1;
+            })
+        })
       });
     }
     #[cfg(target_arch = "wasm32")]
@@ -511,207 +682,269 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
   /// wrapper of `vertices`
   #[pyfn(m)]
   unsafe fn vertices<'a>(
-    _py: Python,
+    py: Python,
     depth: &Bound<'a, PyArrayDyn<u8>>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
+    ipix: Hashes<'a>,
     step: usize,
-    lon: &Bound<'a, PyArrayDyn<f64>>,
-    lat: &Bound<'a, PyArrayDyn<f64>>,
+    lon: CoordsMut<'a>,
+    lat: CoordsMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
     let depth = depth.as_array();
-    let ipix = ipix.as_array();
-    let mut lon = lon.as_array_mut();
-    let mut lat = lat.as_array_mut();
-
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        if step == 1 {
-          Zip::from(lon.rows_mut())
-            .and(lat.rows_mut())
-            .and(&ipix)
-            .and(&depth)
-            .par_for_each(|mut lon, mut lat, &p, &d| {
-              let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
-                healpix::nested::vertices(d, p);
-              lon[0] = s_lon;
-              lat[0] = s_lat;
-
-              lon[1] = e_lon;
-              lat[1] = e_lat;
-
-              lon[2] = n_lon;
-              lat[2] = n_lat;
-
-              lon[3] = w_lon;
-              lat[3] = w_lat;
-            });
-        } else {
-          Zip::from(lon.rows_mut())
-            .and(lat.rows_mut())
-            .and(&ipix)
-            .and(&depth)
-            .par_for_each(|mut lon, mut lat, &p, &d| {
-              let r = healpix::nested::path_along_cell_edge(d, p, &Cardinal::S, false, step as u32);
 
-              for i in 0..(4 * step) {
-                let (l, b) = r[i];
-                lon[i] = l;
-                lat[i] = b;
+    with_hashes!(ipix, |ipix| {
+      with_coords_mut!(lon, lat, |lon, lat| {
+        let invalid = check::InvalidInput::default();
+        #[cfg(not(target_arch = "wasm32"))]
+        {
+          let pool = thread_pool::get(nthreads);
+          py.allow_threads(|| {
+            pool.install(|| {
+              if step == 1 {
+                Zip::from(lon.rows_mut())
+                  .and(lat.rows_mut())
+                  .and(&ipix)
+                  .and(&depth)
+                  .par_for_each(|mut lon, mut lat, &p, &d| {
+                    let p = p.to_hash();
+                    if check::is_valid_hash(d, p) {
+                      let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
+                        healpix::nested::vertices(d, p);
+                      lon[0] = CoordValue::from_f64(s_lon);
+                      lat[0] = CoordValue::from_f64(s_lat);
+
+                      lon[1] = CoordValue::from_f64(e_lon);
+                      lat[1] = CoordValue::from_f64(e_lat);
+
+                      lon[2] = CoordValue::from_f64(n_lon);
+                      lat[2] = CoordValue::from_f64(n_lat);
+
+                      lon[3] = CoordValue::from_f64(w_lon);
+                      lat[3] = CoordValue::from_f64(w_lat);
+                    } else {
+                      invalid.raise();
+                    }
+                  });
+              } else {
+                Zip::from(lon.rows_mut())
+                  .and(lat.rows_mut())
+                  .and(&ipix)
+                  .and(&depth)
+                  .par_for_each(|mut lon, mut lat, &p, &d| {
+                    let p = p.to_hash();
+                    if check::is_valid_hash(d, p) {
+                      let r = healpix::nested::path_along_cell_edge(
+                        d,
+                        p,
+                        &Cardinal::S,
+                        false,
+                        step as u32,
+                      );
+
+                      for i in 0..(4 * step) {
+                        let (l, b) = r[i];
+                        lon[i] = CoordValue::from_f64(l);
+                        lat[i] = CoordValue::from_f64(b);
+                      }
+                    } else {
+                      invalid.raise();
+                    }
+                  });
               }
-            });
-        }
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      if step == 1 {
-        Zip::from(lon.rows_mut())
-          .and(lat.rows_mut())
-          .and(&ipix)
-          .and(&depth)
-          .for_each(|mut lon, mut lat, &p, &d| {
-            let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
-              healpix::nested::vertices(d, p);
-            lon[0] = s_lon;
-            lat[0] = s_lat;
-
-            lon[1] = e_lon;
-            lat[1] = e_lat;
-
-            lon[2] = n_lon;
-            lat[2] = n_lat;
-
-            lon[3] = w_lon;
-            lat[3] = w_lat;
+            })
           });
-      } else {
-        Zip::from(lon.rows_mut())
-          .and(lat.rows_mut())
-          .and(&ipix)
-          .and(&depth)
-          .for_each(|mut lon, mut lat, &p, &d| {
-            let r = healpix::nested::path_along_cell_edge(d, p, &Cardinal::S, false, step as u32);
-
-            for i in 0..(4 * step) {
-              let (l, b) = r[i];
-              lon[i] = l;
-              lat[i] = b;
-            }
-          });
-      }
-    }
+        }
+        #[cfg(target_arch = "wasm32")]
+        {
+          if step == 1 {
+            Zip::from(lon.rows_mut())
+              .and(lat.rows_mut())
+              .and(&ipix)
+              .and(&depth)
+              .for_each(|mut lon, mut lat, &p, &d| {
+                let p = p.to_hash();
+                if check::is_valid_hash(d, p) {
+                  let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
+                    healpix::nested::vertices(d, p);
+                  lon[0] = CoordValue::from_f64(s_lon);
+                  lat[0] = CoordValue::from_f64(s_lat);
+
+                  lon[1] = CoordValue::from_f64(e_lon);
+                  lat[1] = CoordValue::from_f64(e_lat);
+
+                  lon[2] = CoordValue::from_f64(n_lon);
+                  lat[2] = CoordValue::from_f64(n_lat);
+
+                  lon[3] = CoordValue::from_f64(w_lon);
+                  lat[3] = CoordValue::from_f64(w_lat);
+                } else {
+                  invalid.raise();
+                }
+              });
+          } else {
+            Zip::from(lon.rows_mut())
+              .and(lat.rows_mut())
+              .and(&ipix)
+              .and(&depth)
+              .for_each(|mut lon, mut lat, &p, &d| {
+                let p = p.to_hash();
+                if check::is_valid_hash(d, p) {
+                  let r =
+                    healpix::nested::path_along_cell_edge(d, p, &Cardinal::S, false, step as u32);
+
+                  for i in 0..(4 * step) {
+                    let (l, b) = r[i];
+                    lon[i] = CoordValue::from_f64(l);
+                    lat[i] = CoordValue::from_f64(b);
+                  }
+                } else {
+                  invalid.raise();
+                }
+              });
+          }
+        }
 
-    Ok(())
+        if invalid.is_raised() {
+          return Err(check::first_invalid_hash(&depth, &ipix));
+        }
+        Ok(())
+      })
+    })
   }
 
   #[pyfn(m)]
   unsafe fn vertices_ring<'a>(
-    _py: Python,
+    py: Python,
     nside: u32,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
+    ipix: Hashes<'a>,
     step: usize,
-    lon: &Bound<'a, PyArrayDyn<f64>>,
-    lat: &Bound<'a, PyArrayDyn<f64>>,
+    lon: CoordsMut<'a>,
+    lat: CoordsMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let ipix = ipix.as_array();
-    let mut lon = lon.as_array_mut();
-    let mut lat = lat.as_array_mut();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        if step == 1 {
-          Zip::from(lon.rows_mut())
-            .and(lat.rows_mut())
-            .and(&ipix)
-            .par_for_each(|mut lon, mut lat, &p| {
-              let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
-                healpix::ring::vertices(nside, p);
-              lon[0] = s_lon;
-              lat[0] = s_lat;
-
-              lon[1] = e_lon;
-              lat[1] = e_lat;
-
-              lon[2] = n_lon;
-              lat[2] = n_lat;
-
-              lon[3] = w_lon;
-              lat[3] = w_lat;
-            });
-        } else {
-          let d = healpix::depth(nside);
-          let l = healpix::nested::get(d);
-
-          Zip::from(lon.rows_mut())
-            .and(lat.rows_mut())
-            .and(&ipix)
-            .par_for_each(|mut lon, mut lat, &p| {
-              let np = l.from_ring(p);
-
-              let r =
-                healpix::nested::path_along_cell_edge(d, np, &Cardinal::S, false, step as u32);
-
-              for i in 0..(4 * step) {
-                let (l, b) = r[i];
-                lon[i] = l;
-                lat[i] = b;
+    check::check_nside(nside)?;
+    with_hashes!(ipix, |ipix| {
+      with_coords_mut!(lon, lat, |lon, lat| {
+        let invalid = check::InvalidInput::default();
+        #[cfg(not(target_arch = "wasm32"))]
+        {
+          let pool = thread_pool::get(nthreads);
+          py.allow_threads(|| {
+            pool.install(|| {
+              if step == 1 {
+                Zip::from(lon.rows_mut())
+                  .and(lat.rows_mut())
+                  .and(&ipix)
+                  .par_for_each(|mut lon, mut lat, &p| {
+                    let p = p.to_hash();
+                    if check::is_valid_hash_ring(nside, p) {
+                      let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
+                        healpix::ring::vertices(nside, p);
+                      lon[0] = CoordValue::from_f64(s_lon);
+                      lat[0] = CoordValue::from_f64(s_lat);
+
+                      lon[1] = CoordValue::from_f64(e_lon);
+                      lat[1] = CoordValue::from_f64(e_lat);
+
+                      lon[2] = CoordValue::from_f64(n_lon);
+                      lat[2] = CoordValue::from_f64(n_lat);
+
+                      lon[3] = CoordValue::from_f64(w_lon);
+                      lat[3] = CoordValue::from_f64(w_lat);
+                    } else {
+                      invalid.raise();
+                    }
+                  });
+              } else {
+                let d = healpix::depth(nside);
+                let l = healpix::nested::get(d);
+
+                Zip::from(lon.rows_mut())
+                  .and(lat.rows_mut())
+                  .and(&ipix)
+                  .par_for_each(|mut lon, mut lat, &p| {
+                    let p = p.to_hash();
+                    if check::is_valid_hash_ring(nside, p) {
+                      let np = l.from_ring(p);
+
+                      let r = healpix::nested::path_along_cell_edge(
+                        d,
+                        np,
+                        &Cardinal::S,
+                        false,
+                        step as u32,
+                      );
+
+                      for i in 0..(4 * step) {
+                        let (l, b) = r[i];
+                        lon[i] = CoordValue::from_f64(l);
+                        lat[i] = CoordValue::from_f64(b);
+                      }
+                    } else {
+                      invalid.raise();
+                    }
+                  });
               }
-            });
-        }
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      if step == 1 {
-        Zip::from(lon.rows_mut())
-          .and(lat.rows_mut())
-          .and(&ipix)
-          .par_for_each(|mut lon, mut lat, &p| {
-            let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
-              healpix::ring::vertices(nside, p);
-            lon[0] = s_lon;
-            lat[0] = s_lat;
-
-            lon[1] = e_lon;
-            lat[1] = e_lat;
-
-            lon[2] = n_lon;
-            lat[2] = n_lat;
-
-            lon[3] = w_lon;
-            lat[3] = w_lat;
-          });
-      } else {
-        let d = healpix::depth(nside);
-        let l = healpix::nested::get(d);
-        Zip::from(lon.rows_mut())
-          .and(lat.rows_mut())
-          .and(&ipix)
-          .par_for_each(|mut lon, mut lat, &p| {
-            let np = l.from_ring(p);
-
-            let r = healpix::nested::path_along_cell_edge(d, np, &Cardinal::S, false, step as u32);
-
-            for i in 0..(4 * step) {
-              let (l, b) = r[i];
-              lon[i] = l;
-              lat[i] = b;
-            }
+            })
           });
-      }
-    }
-    Ok(())
+        }
+        #[cfg(target_arch = "wasm32")]
+        {
+          if step == 1 {
+            Zip::from(lon.rows_mut())
+              .and(lat.rows_mut())
+              .and(&ipix)
+              .par_for_each(|mut lon, mut lat, &p| {
+                let p = p.to_hash();
+                if check::is_valid_hash_ring(nside, p) {
+                  let [(s_lon, s_lat), (e_lon, e_lat), (n_lon, n_lat), (w_lon, w_lat)] =
+                    healpix::ring::vertices(nside, p);
+                  lon[0] = CoordValue::from_f64(s_lon);
+                  lat[0] = CoordValue::from_f64(s_lat);
+
+                  lon[1] = CoordValue::from_f64(e_lon);
+                  lat[1] = CoordValue::from_f64(e_lat);
+
+                  lon[2] = CoordValue::from_f64(n_lon);
+                  lat[2] = CoordValue::from_f64(n_lat);
+
+                  lon[3] = CoordValue::from_f64(w_lon);
+                  lat[3] = CoordValue::from_f64(w_lat);
+                } else {
+                  invalid.raise();
+                }
+              });
+          } else {
+            let d = healpix::depth(nside);
+            let l = healpix::nested::get(d);
+            Zip::from(lon.rows_mut())
+              .and(lat.rows_mut())
+              .and(&ipix)
+              .par_for_each(|mut lon, mut lat, &p| {
+                let p = p.to_hash();
+                if check::is_valid_hash_ring(nside, p) {
+                  let np = l.from_ring(p);
+
+                  let r =
+                    healpix::nested::path_along_cell_edge(d, np, &Cardinal::S, false, step as u32);
+
+                  for i in 0..(4 * step) {
+                    let (l, b) = r[i];
+                    lon[i] = CoordValue::from_f64(l);
+                    lat[i] = CoordValue::from_f64(b);
+                  }
+                } else {
+                  invalid.raise();
+                }
+              });
+          }
+        }
+        if invalid.is_raised() {
+          return Err(check::first_invalid_hash_at_nside(nside, &ipix));
+        }
+        Ok(())
+      })
+    })
   }
 
   /// Wrapper of `neighbours`
@@ -719,89 +952,73 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
   /// `[S, SE, E, SW, C, NE, W, NW, N]`
   #[pyfn(m)]
   unsafe fn neighbours<'a>(
-    _py: Python,
+    py: Python,
     depth: u8,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
-    neighbours: &Bound<'a, PyArrayDyn<i64>>,
+    ipix: Hashes<'a>,
+    neighbours: NeighboursMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let ipix = ipix.as_array();
-    let mut neighbours = neighbours.as_array_mut();
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(neighbours.rows_mut())
-          .and(&ipix)
-          .par_for_each(|mut n, &p| {
-            let map = healpix::nested::neighbours(depth, p, true);
-
-            n[0] = map
-              .get(MainWind::S)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-            n[1] = map
-              .get(MainWind::SE)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-            n[2] = map
-              .get(MainWind::E)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-            n[3] = map
-              .get(MainWind::SW)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-            n[4] = p as i64;
-            n[5] = map
-              .get(MainWind::NE)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-            n[6] = map
-              .get(MainWind::W)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-            n[7] = map
-              .get(MainWind::NW)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-            n[8] = map
-              .get(MainWind::N)
-              .map_or_else(|| -1_i64, |&val| val as i64);
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(neighbours.rows_mut())
-        .and(&ipix)
-        .for_each(|mut n, &p| {
-          let map = healpix::nested::neighbours(depth, p, true);
-
-          n[0] = map
-            .get(MainWind::S)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-          n[1] = map
-            .get(MainWind::SE)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-          n[2] = map
-            .get(MainWind::E)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-          n[3] = map
-            .get(MainWind::SW)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-          n[4] = p as i64;
-          n[5] = map
-            .get(MainWind::NE)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-          n[6] = map
-            .get(MainWind::W)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-          n[7] = map
-            .get(MainWind::NW)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-          n[8] = map
-            .get(MainWind::N)
-            .map_or_else(|| -1_i64, |&val| val as i64);
-        });
-    }
-    Ok(())
+    check::check_depth(depth)?;
+    with_hashes!(ipix, |ipix| {
+      with_neighbours_mut!(neighbours, |neighbours| {
+        let invalid = check::InvalidInput::default();
+        #[cfg(not(target_arch = "wasm32"))]
+        {
+          let pool = thread_pool::get(nthreads);
+          py.allow_threads(|| {
+            pool.install(|| {
+              Zip::from(neighbours.rows_mut())
+                .and(&ipix)
+                .par_for_each(|mut n, &p| {
+                  let p = p.to_hash();
+                  if check::is_valid_hash(depth, p) {
+                    let map = healpix::nested::neighbours(depth, p, true);
+
+                    n[0] = NeighbourValue::from_neighbour(map.get(MainWind::S).copied());
+                    n[1] = NeighbourValue::from_neighbour(map.get(MainWind::SE).copied());
+                    n[2] = NeighbourValue::from_neighbour(map.get(MainWind::E).copied());
+                    n[3] = NeighbourValue::from_neighbour(map.get(MainWind::SW).copied());
+                    n[4] = HashValue::from_hash(p);
+                    n[5] = NeighbourValue::from_neighbour(map.get(MainWind::NE).copied());
+                    n[6] = NeighbourValue::from_neighbour(map.get(MainWind::W).copied());
+                    n[7] = NeighbourValue::from_neighbour(map.get(MainWind::NW).copied());
+                    n[8] = NeighbourValue::from_neighbour(map.get(MainWind::N).copied());
+                  } else {
+                    invalid.raise();
+                  }
+                })
+            })
+          });
+        }
+        #[cfg(target_arch = "wasm32")]
+        {
+          Zip::from(neighbours.rows_mut())
+            .and(&ipix)
+            .for_each(|mut n, &p| {
+              let p = p.to_hash();
+              if check::is_valid_hash(depth, p) {
+                let map = healpix::nested::neighbours(depth, p, true);
+
+                n[0] = NeighbourValue::from_neighbour(map.get(MainWind::S).copied());
+                n[1] = NeighbourValue::from_neighbour(map.get(MainWind::SE).copied());
+                n[2] = NeighbourValue::from_neighbour(map.get(MainWind::E).copied());
+                n[3] = NeighbourValue::from_neighbour(map.get(MainWind::SW).copied());
+                n[4] = HashValue::from_hash(p);
+                n[5] = NeighbourValue::from_neighbour(map.get(MainWind::NE).copied());
+                n[6] = NeighbourValue::from_neighbour(map.get(MainWind::W).copied());
+                n[7] = NeighbourValue::from_neighbour(map.get(MainWind::NW).copied());
+                n[8] = NeighbourValue::from_neighbour(map.get(MainWind::N).copied());
+              } else {
+                invalid.raise();
+              }
+            });
+        }
+        if invalid.is_raised() {
+          return Err(check::first_invalid_hash_at_depth(depth, &ipix));
+        }
+        Ok(())
+      })
+    })
   }
 
   /// Cone search
@@ -814,24 +1031,18 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     lat: f64,
     radius: f64,
     flat: bool,
-  ) -> (
-    Bound<'_, PyArray1<u64>>,
-    Bound<'_, PyArray1<u8>>,
-    Bound<'_, PyArray1<bool>>,
-  ) {
-    let bmoc = healpix::nested::cone_coverage_approx_custom(depth, delta_depth, lon, lat, radius);
-
-    let (ipix, depth, fully_covered) = if flat {
-      get_flat_cells(bmoc)
-    } else {
-      get_cells(bmoc)
-    };
-
-    (
-      ipix.into_pyarray(py),
-      depth.into_pyarray(py),
-      fully_covered.into_pyarray(py),
-    )
+    compact: bool,
+    output: &str,
+    max_cells: Option<usize>,
+    max_ranges: Option<usize>,
+  ) -> PyResult<Bound<'_, PyAny>> {
+    let format = coverage::Format::parse(output)?;
+    let coverage = py.allow_threads(|| {
+      let bmoc = healpix::nested::cone_coverage_approx_custom(depth, delta_depth, lon, lat, radius);
+      let bmoc = coverage::simplify(bmoc, max_cells, max_ranges);
+      coverage::Coverage::new(bmoc, format, flat, compact)
+    });
+    coverage.into_py(py)
   }
 
   /// Elliptical cone search
@@ -846,25 +1057,19 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     b: f64,
     pa: f64,
     flat: bool,
-  ) -> (
-    Bound<'_, PyArray1<u64>>,
-    Bound<'_, PyArray1<u8>>,
-    Bound<'_, PyArray1<bool>>,
-  ) {
-    let bmoc =
-      healpix::nested::elliptical_cone_coverage_custom(depth, delta_depth, lon, lat, a, b, pa);
-
-    let (ipix, depth, fully_covered) = if flat {
-      get_flat_cells(bmoc)
-    } else {
-      get_cells(bmoc)
-    };
-
-    (
-      ipix.into_pyarray(py),
-      depth.into_pyarray(py),
-      fully_covered.into_pyarray(py),
-    )
+    compact: bool,
+    output: &str,
+    max_cells: Option<usize>,
+    max_ranges: Option<usize>,
+  ) -> PyResult<Bound<'_, PyAny>> {
+    let format = coverage::Format::parse(output)?;
+    let coverage = py.allow_threads(|| {
+      let bmoc =
+        healpix::nested::elliptical_cone_coverage_custom(depth, delta_depth, lon, lat, a, b, pa);
+      let bmoc = coverage::simplify(bmoc, max_cells, max_ranges);
+      coverage::Coverage::new(bmoc, format, flat, compact)
+    });
+    coverage.into_py(py)
   }
 
   /// Polygon search
@@ -875,35 +1080,29 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     lon: PyReadonlyArrayDyn<'a, f64>,
     lat: PyReadonlyArrayDyn<'a, f64>,
     flat: bool,
-  ) -> (
-    Bound<'a, PyArray1<u64>>,
-    Bound<'a, PyArray1<u8>>,
-    Bound<'a, PyArray1<bool>>,
-  ) {
+    compact: bool,
+    output: &str,
+    max_cells: Option<usize>,
+    max_ranges: Option<usize>,
+  ) -> PyResult<Bound<'a, PyAny>> {
+    let format = coverage::Format::parse(output)?;
     let lon = lon.as_array();
     let lat = lat.as_array();
 
-    // Stack the longitude and latitudes and store them in a
-    // Vec<(f64, f64)>
-    let vertices = lon
-      .iter()
-      .zip(lat.iter())
-      .map(|(&lon, &lat)| (lon, lat))
-      .collect::<Vec<(f64, f64)>>();
-
-    let bmoc = healpix::nested::polygon_coverage(depth, &vertices.into_boxed_slice(), true);
-
-    let (ipix, depth, fully_covered) = if flat {
-      get_flat_cells(bmoc)
-    } else {
-      get_cells(bmoc)
-    };
-
-    (
-      ipix.into_pyarray(py),
-      depth.into_pyarray(py),
-      fully_covered.into_pyarray(py),
-    )
+    let coverage = py.allow_threads(|| {
+      // Stack the longitude and latitudes and store them in a
+      // Vec<(f64, f64)>
+      let vertices = lon
+        .iter()
+        .zip(lat.iter())
+        .map(|(&lon, &lat)| (lon, lat))
+        .collect::<Vec<(f64, f64)>>();
+
+      let bmoc = healpix::nested::polygon_coverage(depth, &vertices.into_boxed_slice(), true);
+      let bmoc = coverage::simplify(bmoc, max_cells, max_ranges);
+      coverage::Coverage::new(bmoc, format, flat, compact)
+    });
+    coverage.into_py(py)
   }
 
   /// A box is defined by a center, two angles on the sides
@@ -927,24 +1126,18 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     b: f64,
     pa: f64,
     flat: bool,
-  ) -> (
-    Bound<'_, PyArray1<u64>>,
-    Bound<'_, PyArray1<u8>>,
-    Bound<'_, PyArray1<bool>>,
-  ) {
-    let bmoc = healpix::nested::box_coverage(depth, lon, lat, a, b, pa);
-
-    let (ipix, depth, fully_covered) = if flat {
-      get_flat_cells(bmoc)
-    } else {
-      get_cells(bmoc)
-    };
-
-    (
-      ipix.into_pyarray(py),
-      depth.into_pyarray(py),
-      fully_covered.into_pyarray(py),
-    )
+    compact: bool,
+    output: &str,
+    max_cells: Option<usize>,
+    max_ranges: Option<usize>,
+  ) -> PyResult<Bound<'_, PyAny>> {
+    let format = coverage::Format::parse(output)?;
+    let coverage = py.allow_threads(|| {
+      let bmoc = healpix::nested::box_coverage(depth, lon, lat, a, b, pa);
+      let bmoc = coverage::simplify(bmoc, max_cells, max_ranges);
+      coverage::Coverage::new(bmoc, format, flat, compact)
+    });
+    coverage.into_py(py)
   }
 
   /// A zone is defined by its corners. Its sides follow great circles along the
@@ -966,145 +1159,144 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     lon_max: f64,
     lat_max: f64,
     flat: bool,
-  ) -> (
-    Bound<'_, PyArray1<u64>>,
-    Bound<'_, PyArray1<u8>>,
-    Bound<'_, PyArray1<bool>>,
-  ) {
-    let bmoc = healpix::nested::zone_coverage(depth, lon_min, lat_min, lon_max, lat_max);
-
-    let (ipix, depth, fully_covered) = if flat {
-      get_flat_cells(bmoc)
-    } else {
-      get_cells(bmoc)
-    };
-
-    (
-      ipix.into_pyarray(py),
-      depth.into_pyarray(py),
-      fully_covered.into_pyarray(py),
-    )
+    compact: bool,
+    output: &str,
+    max_cells: Option<usize>,
+    max_ranges: Option<usize>,
+  ) -> PyResult<Bound<'_, PyAny>> {
+    let format = coverage::Format::parse(output)?;
+    let coverage = py.allow_threads(|| {
+      let bmoc = healpix::nested::zone_coverage(depth, lon_min, lat_min, lon_max, lat_max);
+      let bmoc = coverage::simplify(bmoc, max_cells, max_ranges);
+      coverage::Coverage::new(bmoc, format, flat, compact)
+    });
+    coverage.into_py(py)
   }
 
   #[pyfn(m)]
   unsafe fn external_neighbours<'a>(
-    _py: Python,
+    py: Python,
     depth: u8,
     delta_depth: u8,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
-    corners: &Bound<'a, PyArrayDyn<i64>>,
-    edges: &Bound<'a, PyArrayDyn<u64>>,
+    ipix: Hashes<'a>,
+    corners: NeighboursMut<'a>,
+    edges: HashesMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let ipix = ipix.as_array();
-
-    let mut corners = corners.as_array_mut();
-    let mut edges = edges.as_array_mut();
+    check::check_depth(depth)?;
+    check::check_depth(depth.saturating_add(delta_depth))?;
 
     let layer = healpix::nested::get(depth);
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(corners.rows_mut())
-          .and(edges.rows_mut())
-          .and(&ipix)
-          .par_for_each(|mut c, mut e, &p| {
-            let external_edges = layer.external_edge_struct(p, delta_depth);
-
-            c[0] = external_edges
-              .get_corner(&Cardinal::S)
-              .map_or_else(|| -1_i64, |val| val as i64);
-            c[1] = external_edges
-              .get_corner(&Cardinal::E)
-              .map_or_else(|| -1_i64, |val| val as i64);
-            c[2] = external_edges
-              .get_corner(&Cardinal::N)
-              .map_or_else(|| -1_i64, |val| val as i64);
-            c[3] = external_edges
-              .get_corner(&Cardinal::W)
-              .map_or_else(|| -1_i64, |val| val as i64);
-
-            let num_cells_per_edge = 2_i32.pow(delta_depth as u32) as usize;
-            let mut offset = 0;
-            // SE
-            let se_edge = external_edges.get_edge(&Ordinal::SE);
-            for i in 0..num_cells_per_edge {
-              e[offset + i] = se_edge[i];
-            }
-            offset += num_cells_per_edge;
-            // NE
-            let ne_edge = external_edges.get_edge(&Ordinal::NE);
-            for i in 0..num_cells_per_edge {
-              e[offset + i] = ne_edge[i];
-            }
-            offset += num_cells_per_edge;
-            // NW
-            let nw_edge = external_edges.get_edge(&Ordinal::NW);
-            for i in 0..num_cells_per_edge {
-              e[offset + i] = nw_edge[i];
-            }
-            offset += num_cells_per_edge;
-            // SW
-            let sw_edge = external_edges.get_edge(&Ordinal::SW);
-            for i in 0..num_cells_per_edge {
-              e[offset + i] = sw_edge[i];
-            }
-          })
-      });
-    }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(corners.rows_mut())
-        .and(edges.rows_mut())
-        .and(&ipix)
-        .for_each(|mut c, mut e, &p| {
-          let external_edges = layer.external_edge_struct(p, delta_depth);
-
-          c[0] = external_edges
-            .get_corner(&Cardinal::S)
-            .map_or_else(|| -1_i64, |val| val as i64);
-          c[1] = external_edges
-            .get_corner(&Cardinal::E)
-            .map_or_else(|| -1_i64, |val| val as i64);
-          c[2] = external_edges
-            .get_corner(&Cardinal::N)
-            .map_or_else(|| -1_i64, |val| val as i64);
-          c[3] = external_edges
-            .get_corner(&Cardinal::W)
-            .map_or_else(|| -1_i64, |val| val as i64);
-
-          let num_cells_per_edge = 2_i32.pow(delta_depth as u32) as usize;
-          let mut offset = 0;
-          // SE
-          let se_edge = external_edges.get_edge(&Ordinal::SE);
-          for i in 0..num_cells_per_edge {
-            e[offset + i] = se_edge[i];
-          }
-          offset += num_cells_per_edge;
-          // NE
-          let ne_edge = external_edges.get_edge(&Ordinal::NE);
-          for i in 0..num_cells_per_edge {
-            e[offset + i] = ne_edge[i];
+    with_hashes!(ipix, |ipix| {
+      with_neighbours_mut!(corners, |corners| {
+        with_hashes_mut!(edges, |edges| {
+          let invalid = check::InvalidInput::default();
+          #[cfg(not(target_arch = "wasm32"))]
+          {
+            let pool = thread_pool::get(nthreads);
+            py.allow_threads(|| {
+              pool.install(|| {
+                Zip::from(corners.rows_mut())
+                  .and(edges.rows_mut())
+                  .and(&ipix)
+                  .par_for_each(|mut c, mut e, &p| {
+                    let p = p.to_hash();
+                    if check::is_valid_hash(depth, p) {
+                      let external_edges = layer.external_edge_struct(p, delta_depth);
+
+                      c[0] =
+                        NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::S));
+                      c[1] =
+                        NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::E));
+                      c[2] =
+                        NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::N));
+                      c[3] =
+                        NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::W));
+
+                      let num_cells_per_edge = 2_i32.pow(delta_depth as u32) as usize;
+                      let mut offset = 0;
+                      // SE
+                      let se_edge = external_edges.get_edge(&Ordinal::SE);
+                      for i in 0..num_cells_per_edge {
+                        e[offset + i] = HashValue::from_hash(se_edge[i]);
+                      }
+                      offset += num_cells_per_edge;
+                      // NE
+                      let ne_edge = external_edges.get_edge(&Ordinal::NE);
+                      for i in 0..num_cells_per_edge {
+                        e[offset + i] = HashValue::from_hash(ne_edge[i]);
+                      }
+                      offset += num_cells_per_edge;
+                      // NW
+                      let nw_edge = external_edges.get_edge(&Ordinal::NW);
+                      for i in 0..num_cells_per_edge {
+                        e[offset + i] = HashValue::from_hash(nw_edge[i]);
+                      }
+                      offset += num_cells_per_edge;
+                      // SW
+                      let sw_edge = external_edges.get_edge(&Ordinal::SW);
+                      for i in 0..num_cells_per_edge {
+                        e[offset + i] = HashValue::from_hash(sw_edge[i]);
+                      }
+                    } else {
+                      invalid.raise();
+                    }
+                  })
+              })
+            });
           }
-          offset += num_cells_per_edge;
-          // NW
-          let nw_edge = external_edges.get_edge(&Ordinal::NW);
-          for i in 0..num_cells_per_edge {
-            e[offset + i] = nw_edge[i];
+          #[cfg(target_arch = "wasm32")]
+          {
+            Zip::from(corners.rows_mut())
+              .and(edges.rows_mut())
+              .and(&ipix)
+              .for_each(|mut c, mut e, &p| {
+                let p = p.to_hash();
+                if check::is_valid_hash(depth, p) {
+                  let external_edges = layer.external_edge_struct(p, delta_depth);
+
+                  c[0] = NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::S));
+                  c[1] = NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::E));
+                  c[2] = NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::N));
+                  c[3] = NeighbourValue::from_neighbour(external_edges.get_corner(&Cardinal::W));
+
+                  let num_cells_per_edge = 2_i32.pow(delta_depth as u32) as usize;
+                  let mut offset = 0;
+                  // SE
+                  let se_edge = external_edges.get_edge(&Ordinal::SE);
+                  for i in 0..num_cells_per_edge {
+                    e[offset + i] = HashValue::from_hash(se_edge[i]);
+                  }
+                  offset += num_cells_per_edge;
+                  // NE
+                  let ne_edge = external_edges.get_edge(&Ordinal::NE);
+                  for i in 0..num_cells_per_edge {
+                    e[offset + i] = HashValue::from_hash(ne_edge[i]);
+                  }
+                  offset += num_cells_per_edge;
+                  // NW
+                  let nw_edge = external_edges.get_edge(&Ordinal::NW);
+                  for i in 0..num_cells_per_edge {
+                    e[offset + i] = HashValue::from_hash(nw_edge[i]);
+                  }
+                  offset += num_cells_per_edge;
+                  // SW
+                  let sw_edge = external_edges.get_edge(&Ordinal::SW);
+                  for i in 0..num_cells_per_edge {
+                    e[offset + i] = HashValue::from_hash(sw_edge[i]);
+                  }
+                } else {
+                  invalid.raise();
+                }
+              })
           }
-          offset += num_cells_per_edge;
-          // SW
-          let sw_edge = external_edges.get_edge(&Ordinal::SW);
-          for i in 0..num_cells_per_edge {
-            e[offset + i] = sw_edge[i];
+          if invalid.is_raised() {
+            return Err(check::first_invalid_hash_at_depth(depth, &ipix));
           }
+          Ok(())
         })
-    }
-    Ok(())
+      })
+    })
   }
 
   ////////////////////////////
@@ -1112,80 +1304,179 @@ fn cdshealpix(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
   ////////////////////////////
   #[pyfn(m)]
   fn bilinear_interpolation<'a>(
+    py: Python,
     depth: u8,
-    lon: PyReadonlyArrayDyn<'a, f64>,
-    lat: PyReadonlyArrayDyn<'a, f64>,
-    ipix: &Bound<'a, PyArrayDyn<u64>>,
-    weights: &Bound<'a, PyArrayDyn<f64>>,
+    lon: Coords<'a>,
+    lat: Coords<'a>,
+    ipix: HashesMut<'a>,
+    weights: CoordsMut<'a>,
     nthreads: u16,
   ) -> PyResult<()> {
-    let lon = lon.as_array();
-    let lat = lat.as_array();
-
-    let mut ipix = unsafe { ipix.as_array_mut() };
-    let mut weights = unsafe { weights.as_array_mut() };
+    check::check_depth(depth)?;
 
     let layer = healpix::nested::get(depth);
-    #[cfg(not(target_arch = "wasm32"))]
-    {
-      let pool = rayon::ThreadPoolBuilder::new()
-        .num_threads(nthreads as usize)
-        .build()
-        .unwrap();
-      pool.install(|| {
-        Zip::from(ipix.rows_mut())
-          .and(weights.rows_mut())
-          .and(&lon)
-          .and(&lat)
-          .par_for_each(|mut pix, mut w, &l, &b| {
-            let [(p1, w1), (p2, w2), (p3, w3), (p4, w4)] = layer.bilinear_interpolation(l, b);
-
-            pix[0] = p1;
-            pix[1] = p2;
-            pix[2] = p3;
-            pix[3] = p4;
-
-            w[0] = w1;
-            w[1] = w2;
-            w[2] = w3;
-            w[3] = w4;
-          })
-      });
+    with_lonlat!(lon, lat, |lon, lat| {
+      with_hashes_mut!(ipix, |ipix| {
+        with_coords_mut!(weights, |weights| {
+          #[cfg(not(target_arch = "wasm32"))]
+          {
+            let pool = thread_pool::get(nthreads);
+            py.allow_threads(|| {
+              pool.install(|| {
+                Zip::from(ipix.rows_mut())
+                  .and(weights.rows_mut())
+                  .and(&lon)
+                  .and(&lat)
+                  .par_for_each(|mut pix, mut w, &l, &b| {
+                    let (l, b) = (l.to_f64(), b.to_f64());
+                    let [(p1, w1), (p2, w2), (p3, w3), (p4, w4)] =
+                      layer.bilinear_interpolation(l, b);
+
+                    pix[0] = HashValue::from_hash(p1);
+                    pix[1] = HashValue::from_hash(p2);
+                    pix[2] = HashValue::from_hash(p3);
+                    pix[3] = HashValue::from_hash(p4);
+
+                    w[0] = CoordValue::from_f64(w1);
+                    w[1] = CoordValue::from_f64(w2);
+                    w[2] = CoordValue::from_f64(w3);
+                    w[3] = CoordValue::from_f64(w4);
+                  })
+              })
+            });
+          }
+          #[cfg(target_arch = "wasm32")]
+          {
+            Zip::from(ipix.rows_mut())
+              .and(weights.rows_mut())
+              .and(&lon)
+              .and(&lat)
+              .for_each(|mut pix, mut w, &l, &b| {
+                let (l, b) = (l.to_f64(), b.to_f64());
+                let [(p1, w1), (p2, w2), (p3, w3), (p4, w4)] = layer.bilinear_interpolation(l, b);
+
+                pix[0] = HashValue::from_hash(p1);
+                pix[1] = HashValue::from_hash(p2);
+                pix[2] = HashValue::from_hash(p3);
+                pix[3] = HashValue::from_hash(p4);
+
+                w[0] = CoordValue::from_f64(w1);
+                w[1] = CoordValue::from_f64(w2);
+                w[2] = CoordValue::from_f64(w3);
+                w[3] = CoordValue::from_f64(w4);
+              });
+          }
+          Ok(())
+        })
+      })
+    })
+  }
+
+  Ok(())
+}
+
+/// Writes in `ipix` the hashes of the points (`lon`, `lat`) in the layers (depths or
+/// nsides) `layer` and, if given, their offsets in their cells in `offsets`.
+/// Returns whether an invalid layer was met.
+#[allow(clippy::too_many_arguments, unused_variables)]
+fn hash_lonlat<T, H, C, L>(
+  py: Python,
+  nthreads: u16,
+  lon: ArrayViewD<T>,
+  lat: ArrayViewD<T>,
+  layer: ArrayViewD<L>,
+  mut ipix: ArrayViewMutD<H>,
+  offsets: Option<(ArrayViewMutD<C>, ArrayViewMutD<C>)>,
+  is_valid: fn(L) -> bool,
+  hash_with_dxdy: fn(L, f64, f64) -> (u64, f64, f64),
+) -> bool
+where
+  T: CoordValue,
+  H: HashValue,
+  C: CoordValue,
+  L: Copy + Send + Sync,
+{
+  let invalid = check::InvalidInput::default();
+  let hash = |p: &mut H, lon: &T, lat: &T, &l: &L| {
+    if is_valid(l) {
+      let (h, dx, dy) = hash_with_dxdy(l, lon.to_f64(), lat.to_f64());
+      *p = H::from_hash(h);
+      Some((dx, dy))
+    } else {
+      invalid.raise();
+      None
     }
-    #[cfg(target_arch = "wasm32")]
-    {
-      Zip::from(ipix.rows_mut())
-        .and(weights.rows_mut())
+  };
+  match offsets {
+    Some((mut dx, mut dy)) => {
+      let zip = Zip::from(&mut ipix)
+        .and(&mut dx)
+        .and(&mut dy)
         .and(&lon)
         .and(&lat)
-        .for_each(|mut pix, mut w, &l, &b| {
-          let [(p1, w1), (p2, w2), (p3, w3), (p4, w4)] = layer.bilinear_interpolation(l, b);
-
-          pix[0] = p1;
-          pix[1] = p2;
-          pix[2] = p3;
-          pix[3] = p4;
-
-          w[0] = w1;
-          w[1] = w2;
-          w[2] = w3;
-          w[3] = w4;
-        });
+        .and(&layer);
+      let hash = |p: &mut H, x: &mut C, y: &mut C, lon: &T, lat: &T, l: &L| {
+        if let Some((dx, dy)) = hash(p, lon, lat, l) {
+          *x = C::from_f64(dx);
+          *y = C::from_f64(dy);
+        }
+      };
+      #[cfg(not(target_arch = "wasm32"))]
+      py.allow_threads(|| thread_pool::get(nthreads).install(|| zip.par_for_each(hash)));
+      #[cfg(target_arch = "wasm32")]
+      zip.for_each(hash);
+    }
+    None => {
+      let zip = Zip::from(&mut ipix).and(&lon).and(&lat).and(&layer);
+      let hash = |p: &mut H, lon: &T, lat: &T, l: &L| {
+        hash(p, lon, lat, l);
+      };
+      #[cfg(not(target_arch = "wasm32"))]
+      py.allow_threads(|| thread_pool::get(nthreads).install(|| zip.par_for_each(hash)));
+      #[cfg(target_arch = "wasm32")]
+      zip.for_each(hash);
     }
-    Ok(())
   }
+  invalid.is_raised()
+}
 
-  Ok(())
+/// Cells of the result of a search, with the HEALPix indices stored as `u32` in the
+/// compact case (the depth must then be at most 13).
+fn search_cells(
+  bmoc: healpix::nested::bmoc::BMOC,
+  flat: bool,
+  compact: bool,
+) -> (HashesVec, Array1<u8>, Array1<bool>) {
+  match (flat, compact) {
+    (false, false) => {
+      let (ipix, depth, fully_covered) = get_cells::<u64>(bmoc);
+      (HashesVec::U64(ipix), depth, fully_covered)
+    }
+    (false, true) => {
+      let (ipix, depth, fully_covered) = get_cells::<u32>(bmoc);
+      (HashesVec::U32(ipix), depth, fully_covered)
+    }
+    (true, false) => {
+      let (ipix, depth, fully_covered) = get_flat_cells::<u64>(bmoc);
+      (HashesVec::U64(ipix), depth, fully_covered)
+    }
+    (true, true) => {
+      let (ipix, depth, fully_covered) = get_flat_cells::<u32>(bmoc);
+      (HashesVec::U32(ipix), depth, fully_covered)
+    }
+  }
 }
 
-fn get_cells(bmoc: healpix::nested::bmoc::BMOC) -> (Array1<u64>, Array1<u8>, Array1<bool>) {
+pub(crate) fn get_cells<T: HashValue>(
+  bmoc: healpix::nested::bmoc::BMOC,
+) -> (Array1<T>, Array1<u8>, Array1<bool>) {
   let len = bmoc.entries.len();
-  let mut ipix = Vec::<u64>::with_capacity(len);
+  let mut ipix = Vec::<T>::with_capacity(len);
   let mut depth = Vec::<u8>::with_capacity(len);
   let mut fully_covered = Vec::<bool>::with_capacity(len);
 
   for c in bmoc.into_iter() {
-    ipix.push(c.hash);
+    ipix.push(T::from_hash(c.hash));
     depth.push(c.depth);
     fully_covered.push(c.is_full);
   }
@@ -1197,14 +1488,16 @@ fn get_cells(bmoc: healpix::nested::bmoc::BMOC) -> (Array1<u64>, Array1<u8>, Arr
   (ipix.into(), depth.into(), fully_covered.into())
 }
 
-fn get_flat_cells(bmoc: healpix::nested::bmoc::BMOC) -> (Array1<u64>, Array1<u8>, Array1<bool>) {
+pub(crate) fn get_flat_cells<T: HashValue>(
+  bmoc: healpix::nested::bmoc::BMOC,
+) -> (Array1<T>, Array1<u8>, Array1<bool>) {
   let len = bmoc.deep_size();
-  let mut ipix = Vec::<u64>::with_capacity(len);
+  let mut ipix = Vec::<T>::with_capacity(len);
   let mut depth = Vec::<u8>::with_capacity(len);
   let mut fully_covered = Vec::<bool>::with_capacity(len);
 
   for c in bmoc.flat_iter_cell() {
-    ipix.push(c.hash);
+    ipix.push(T::from_hash(c.hash));
     depth.push(c.depth);
     fully_covered.push(c.is_full);
   }
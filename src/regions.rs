@@ -0,0 +1,290 @@
+//! Regions whose coverages are memoized.
+//!
+//! A region keeps its geometry, and the cells of its coverages computed for each
+//! (depth, delta_depth, flat) in a cache bounded in memory: once the cache is full,
+//! the least recently used coverages are dropped first. The cells are only converted
+//! to the requested format when a coverage is queried, so that the repeated queries
+//! neither recompute the coverage nor hold the lock of the cache while converting it.
+
+use std::{
+  mem::size_of,
+  sync::{Arc, Mutex},
+};
+
+use numpy::PyReadonlyArrayDyn;
+use pyo3::{exceptions::PyValueError, prelude::*, Bound, PyAny, PyResult};
+
+use healpix::nested::bmoc::BMOC;
+
+use crate::{
+  contains::{self, box_vertices, polygon, Cone, Ellipse, Zone},
+  coverage::{cells_of, cells_to_bmoc, flat_cells_of, simplify, Cell, Coverage, Format},
+};
+
+/// The geometry of a region, in radians.
+enum Shape {
+  Cone {
+    lon: f64,
+    lat: f64,
+    radius: f64,
+  },
+  EllipticalCone {
+    lon: f64,
+    lat: f64,
+    a: f64,
+    b: f64,
+    pa: f64,
+  },
+  Polygon(Box<[(f64, f64)]>),
+  Box {
+    lon: f64,
+    lat: f64,
+    a: f64,
+    b: f64,
+    pa: f64,
+  },
+  Zone {
+    lon_min: f64,
+    lat_min: f64,
+    lon_max: f64,
+    lat_max: f64,
+  },
+}
+
+impl Shape {
+  /// The coverage of the shape at `depth`, `delta_depth` being only used by the cones.
+  fn bmoc(&self, depth: u8, delta_depth: u8) -> BMOC {
+    match self {
+      Self::Cone { lon, lat, radius } => {
+        healpix::nested::cone_coverage_approx_custom(depth, delta_depth, *lon, *lat, *radius)
+      }
+      Self::EllipticalCone { lon, lat, a, b, pa } => {
+        healpix::nested::elliptical_cone_coverage_custom(
+          depth,
+          delta_depth,
+          *lon,
+          *lat,
+          *a,
+          *b,
+          *pa,
+        )
+      }
+      Self::Polygon(vertices) => healpix::nested::polygon_coverage(depth, vertices, true),
+      Self::Box { lon, lat, a, b, pa } => {
+        healpix::nested::box_coverage(depth, *lon, *lat, *a, *b, *pa)
+      }
+      Self::Zone {
+        lon_min,
+        lat_min,
+        lon_max,
+        lat_max,
+      } => healpix::nested::zone_coverage(depth, *lon_min, *lat_min, *lon_max, *lat_max),
+    }
+  }
+
+  /// The exact containment test of the shape.
+  fn exact(&self) -> Box<dyn contains::Region> {
+    match self {
+      Self::Cone { lon, lat, radius } => Box::new(Cone::new(*lon, *lat, *radius)),
+      Self::EllipticalCone { lon, lat, a, b, pa } => {
+        Box::new(Ellipse::new(*lon, *lat, *a, *b, *pa))
+      }
+      Self::Polygon(vertices) => Box::new(polygon(vertices)),
+      Self::Box { lon, lat, a, b, pa } => Box::new(polygon(&box_vertices(*lon, *lat, *a, *b, *pa))),
+      Self::Zone {
+        lon_min,
+        lat_min,
+        lon_max,
+        lat_max,
+      } => Box::new(Zone {
+        lon_min: *lon_min,
+        lat_min: *lat_min,
+        lon_max: *lon_max,
+        lat_max: *lat_max,
+      }),
+    }
+  }
+}
+
+/// The (depth, delta_depth, flat) of a coverage.
+type Key = (u8, u8, bool);
+
+/// The memoized coverages of a region, the least recently used first.
+struct Cache {
+  max_memory: usize,
+  memory: usize,
+  entries: Vec<(Key, Arc<[Cell]>)>,
+}
+
+impl Cache {
+  fn new(max_memory: usize) -> Self {
+    Self {
+      max_memory,
+      memory: 0,
+      entries: Vec::new(),
+    }
+  }
+
+  #[inline]
+  fn memory_of(cells: &[Cell]) -> usize {
+    cells.len() * size_of::<Cell>()
+  }
+
+  /// The cells of the coverage `key`, which becomes the most recently used.
+  fn get(&mut self, key: Key) -> Option<Arc<[Cell]>> {
+    let i = self.entries.iter().position(|(k, _)| *k == key)?;
+    let entry = self.entries.remove(i);
+    let cells = entry.1.clone();
+    self.entries.push(entry);
+    Some(cells)
+  }
+
+  /// Memoizes the cells of the coverage `key`, dropping the least recently used
+  /// coverages to stay within `max_memory`. A coverage larger than `max_memory` is
+  /// not memoized.
+  fn insert(&mut self, key: Key, cells: Arc<[Cell]>) {
+    let memory = Self::memory_of(&cells);
+    if memory > self.max_memory || self.entries.iter().any(|(k, _)| *k == key) {
+      return;
+    }
+    while self.memory + memory > self.max_memory {
+      let (_, dropped) = self.entries.remove(0);
+      self.memory -= Self::memory_of(&dropped);
+    }
+    self.memory += memory;
+    self.entries.push((key, cells));
+  }
+
+  fn clear(&mut self) {
+    self.memory = 0;
+    self.entries.clear();
+  }
+}
+
+/// A region, with its coverages memoized in at most `max_memory` bytes.
+#[pyclass(frozen, module = "cdshealpix.cdshealpix")]
+pub struct Region {
+  shape: Shape,
+  cache: Mutex<Cache>,
+}
+
+impl Region {
+  fn new(shape: Shape, max_memory: usize) -> Self {
+    Self {
+      shape,
+      cache: Mutex::new(Cache::new(max_memory)),
+    }
+  }
+
+  /// The exact containment test of the region.
+  pub(crate) fn exact(&self) -> Box<dyn contains::Region> {
+    self.shape.exact()
+  }
+
+  /// The cells of the coverage `key`, computed without holding the lock of the cache
+  /// if they are not memoized.
+  fn cells(&self, key: Key) -> Arc<[Cell]> {
+    if let Some(cells) = self.cache.lock().unwrap().get(key) {
+      return cells;
+    }
+    let (depth, delta_depth, flat) = key;
+    let bmoc = self.shape.bmoc(depth, delta_depth);
+    let cells: Arc<[Cell]> = if flat {
+      flat_cells_of(bmoc).into()
+    } else {
+      cells_of(bmoc).into()
+    };
+    self.cache.lock().unwrap().insert(key, cells.clone());
+    cells
+  }
+}
+
+#[pymethods]
+impl Region {
+  /// Cone of center (`lon`, `lat`) and of radius `radius`, in radians.
+  #[staticmethod]
+  fn cone(lon: f64, lat: f64, radius: f64, max_memory: usize) -> Self {
+    Self::new(Shape::Cone { lon, lat, radius }, max_memory)
+  }
+
+  /// Elliptical cone of center (`lon`, `lat`), of semi-axes `a` and `b` and of
+  /// position angle `pa`, in radians.
+  #[staticmethod]
+  fn elliptical_cone(lon: f64, lat: f64, a: f64, b: f64, pa: f64, max_memory: usize) -> Self {
+    Self::new(Shape::EllipticalCone { lon, lat, a, b, pa }, max_memory)
+  }
+
+  /// Polygon of vertices (`lon`, `lat`), in radians.
+  #[staticmethod]
+  fn polygon<'py>(
+    lon: PyReadonlyArrayDyn<'py, f64>,
+    lat: PyReadonlyArrayDyn<'py, f64>,
+    max_memory: usize,
+  ) -> PyResult<Self> {
+    let (lon, lat) = (lon.as_array(), lat.as_array());
+    if lon.len() != lat.len() {
+      return Err(PyValueError::new_err(
+        "The longitudes and latitudes of the vertices must have the same size",
+      ));
+    }
+    let vertices = lon.iter().copied().zip(lat.iter().copied()).collect();
+    Ok(Self::new(Shape::Polygon(vertices), max_memory))
+  }
+
+  /// Box of center (`lon`, `lat`), of extensions `a` and `b` along its axes and of
+  /// rotation angle `pa`, in radians.
+  #[staticmethod]
+  #[pyo3(name = "box")]
+  fn box_(lon: f64, lat: f64, a: f64, b: f64, pa: f64, max_memory: usize) -> Self {
+    Self::new(Shape::Box { lon, lat, a, b, pa }, max_memory)
+  }
+
+  /// Zone of corners (`lon_min`, `lat_min`) and (`lon_max`, `lat_max`), in radians.
+  #[staticmethod]
+  fn zone(lon_min: f64, lat_min: f64, lon_max: f64, lat_max: f64, max_memory: usize) -> Self {
+    let shape = Shape::Zone {
+      lon_min,
+      lat_min,
+      lon_max,
+      lat_max,
+    };
+    Self::new(shape, max_memory)
+  }
+
+  /// The coverage of the region, as returned by the searches.
+  #[allow(clippy::too_many_arguments)]
+  fn coverage<'py>(
+    &self,
+    py: Python<'py>,
+    depth: u8,
+    delta_depth: u8,
+    flat: bool,
+    compact: bool,
+    output: &str,
+    max_cells: Option<usize>,
+    max_ranges: Option<usize>,
+  ) -> PyResult<Bound<'py, PyAny>> {
+    let format = Format::parse(output)?;
+    let coverage = py.allow_threads(|| {
+      let cells = self.cells((depth, delta_depth, flat));
+      if max_cells.is_none() && max_ranges.is_none() {
+        Coverage::of_cells(&cells, format, compact)
+      } else {
+        let bmoc = simplify(cells_to_bmoc(depth, &cells), max_cells, max_ranges);
+        Coverage::new(bmoc, format, false, compact)
+      }
+    });
+    coverage.into_py(py)
+  }
+
+  /// The number of memoized coverages and the memory they use, in bytes.
+  fn cache_info(&self) -> (usize, usize) {
+    let cache = self.cache.lock().unwrap();
+    (cache.entries.len(), cache.memory)
+  }
+
+  /// Drops the memoized coverages.
+  fn clear_cache(&self) {
+    self.cache.lock().unwrap().clear();
+  }
+}
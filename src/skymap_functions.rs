@@ -30,8 +30,10 @@ pub fn read_skymap<'py>(
   module: &Bound<'py, PyModule>,
   path: String,
 ) -> PyResult<Bound<'py, PyAny>> {
-  SkyMapEnum::from_fits_file(&path)
-    .map_err(|err| PyIOError::new_err(err.to_string()))
+  module
+    .py()
+    .allow_threads(|| SkyMapEnum::from_fits_file(&path).map_err(|err| err.to_string()))
+    .map_err(PyIOError::new_err)
     .map(|sky_map_enum| match sky_map_enum {
       SkyMapEnum::ImplicitU64U8(s) => s
         .values()
@@ -97,24 +99,26 @@ impl<'py> SupportedArray<'py> {
 }
 
 #[pyfunction]
-pub fn write_skymap(values: SupportedArray<'_>, path: String) -> Result<(), PyErr> {
+pub fn write_skymap(py: Python<'_>, values: SupportedArray<'_>, path: String) -> Result<(), PyErr> {
   let writer =
     BufWriter::new(File::create(path).map_err(|err| PyIOError::new_err(err.to_string()))?);
   match values {
-    SupportedArray::F64(values) => write_skymap_gen(writer, values.as_slice()),
-    SupportedArray::I64(values) => write_skymap_gen(writer, values.as_slice()),
-    SupportedArray::F32(values) => write_skymap_gen(writer, values.as_slice()),
-    SupportedArray::I32(values) => write_skymap_gen(writer, values.as_slice()),
-    SupportedArray::I16(values) => write_skymap_gen(writer, values.as_slice()),
-    SupportedArray::U8(values) => write_skymap_gen(writer, values.as_slice()),
+    SupportedArray::F64(values) => write_skymap_gen(py, writer, values.as_slice()),
+    SupportedArray::I64(values) => write_skymap_gen(py, writer, values.as_slice()),
+    SupportedArray::F32(values) => write_skymap_gen(py, writer, values.as_slice()),
+    SupportedArray::I32(values) => write_skymap_gen(py, writer, values.as_slice()),
+    SupportedArray::I16(values) => write_skymap_gen(py, writer, values.as_slice()),
+    SupportedArray::U8(values) => write_skymap_gen(py, writer, values.as_slice()),
   }
 }
-fn write_skymap_gen<T: SkyMapValue>(
+fn write_skymap_gen<T: SkyMapValue + Sync>(
+  py: Python<'_>,
   writer: BufWriter<File>,
   as_slice_res: Result<&[T], NotContiguousError>,
 ) -> Result<(), PyErr> {
   as_slice_res.map_err(move |e| e.into()).and_then(|slice| {
-    write_implicit_skymap_fits(writer, slice).map_err(|err| PyIOError::new_err(err.to_string()))
+    py.allow_threads(|| write_implicit_skymap_fits(writer, slice).map_err(|err| err.to_string()))
+      .map_err(PyIOError::new_err)
   })
 }
 
@@ -188,42 +192,34 @@ fn skymap_ref_to_img<'py, 'a, S>(
   py: Python<'py>,
 ) -> PyResult<Bound<'py, PyArray3<u8>>>
 where
-  S: SkyMap<'a> + 'a,
+  S: SkyMap<'a> + Sync + 'a,
   S::ValueType: Val,
 {
-  if convert_to_gal {
-    let vec = to_skymap_img_default(
-      skymap,
-      (image_size << 1, image_size),
-      None,
-      None,
-      Some(PosConversion::EqMap2GalImg),
-      None,
-      None,
-    )
-    .map_err(|e| PyValueError::new_err(e.to_string()))?;
-    PyArray1::from_slice(py, vec.as_slice()).reshape(Ix3(
-      image_size as usize,
-      (image_size << 1) as usize,
-      4_usize,
-    ))
+  let pos_convert = if convert_to_gal {
+    Some(PosConversion::EqMap2GalImg)
   } else {
-    let vec = to_skymap_img_default(
-      skymap,
-      (image_size << 1, image_size),
-      None,
-      None,
-      None,
-      None,
-      None,
-    )
-    .map_err(|e| PyValueError::new_err(e.to_string()))?;
-    PyArray1::from_slice(py, vec.as_slice()).reshape(Ix3(
-      image_size as usize,
-      (image_size << 1) as usize,
-      4_usize,
-    ))
-  }
+    None
+  };
+  // the image is computed without holding the GIL
+  let vec = py
+    .allow_threads(|| {
+      to_skymap_img_default(
+        skymap,
+        (image_size << 1, image_size),
+        None,
+        None,
+        pos_convert,
+        None,
+        None,
+      )
+      .map_err(|e| e.to_string())
+    })
+    .map_err(PyValueError::new_err)?;
+  PyArray1::from_slice(py, vec.as_slice()).reshape(Ix3(
+    image_size as usize,
+    (image_size << 1) as usize,
+    4_usize,
+  ))
 }
 
 #[pyfunction]
@@ -0,0 +1,140 @@
+//! Sorting of points by nested hash.
+//!
+//! The points are hashed in parallel, then their (hash, index) pairs are sorted with a
+//! parallel LSD radix sort: each pass counts the digits of chunks of the pairs in
+//! parallel, and scatters the chunks in parallel at the offsets given by the counts.
+//! The passes on a digit shared by all the hashes are skipped.
+
+use ndarray::ArrayView1;
+use numpy::{IntoPyArray, PyArray1};
+use pyo3::{prelude::*, Bound, PyResult};
+#[cfg(not(target_arch = "wasm32"))]
+use rayon::prelude::*;
+
+#[cfg(not(target_arch = "wasm32"))]
+use crate::thread_pool;
+use crate::{
+  check,
+  dtypes::{as_1d, with_lonlat, CoordValue, Coords},
+};
+
+/// Number of bits of the digits of the radix sort.
+#[cfg(not(target_arch = "wasm32"))]
+const RADIX_BITS: u32 = 8;
+#[cfg(not(target_arch = "wasm32"))]
+const N_BUCKETS: usize = 1 << RADIX_BITS;
+/// Number of pairs counted and scattered by each task.
+#[cfg(not(target_arch = "wasm32"))]
+const CHUNK_LEN: usize = 1 << 16;
+
+/// Pointer to the destination of a pass, written at disjoint offsets by the tasks.
+#[cfg(not(target_arch = "wasm32"))]
+struct Dest(*mut (u64, u64));
+
+#[cfg(not(target_arch = "wasm32"))]
+unsafe impl Send for Dest {}
+#[cfg(not(target_arch = "wasm32"))]
+unsafe impl Sync for Dest {}
+
+#[cfg(not(target_arch = "wasm32"))]
+impl Dest {
+  fn get(&self) -> *mut (u64, u64) {
+    self.0
+  }
+}
+
+/// Sorts, stably, the (key, value) pairs by the `bits` lowest bits of their keys, the
+/// other bits being 0.
+#[cfg(not(target_arch = "wasm32"))]
+pub(crate) fn radix_sort(entries: Vec<(u64, u64)>, bits: u32) -> Vec<(u64, u64)> {
+  let len = entries.len();
+  let mut src = entries;
+  let mut dst = vec![(0_u64, 0_u64); len];
+  for shift in (0..bits).step_by(RADIX_BITS as usize) {
+    let digit = |key: u64| ((key >> shift) as usize) & (N_BUCKETS - 1);
+    let mut offsets = src
+      .par_chunks(CHUNK_LEN)
+      .map(|chunk| {
+        let mut counts = [0_usize; N_BUCKETS];
+        for &(key, _) in chunk {
+          counts[digit(key)] += 1;
+        }
+        counts
+      })
+      .collect::<Vec<_>>();
+    // the pairs are already sorted on a digit they all share
+    if (0..N_BUCKETS).any(|b| offsets.iter().map(|counts| counts[b]).sum::<usize>() == len) {
+      continue;
+    }
+    // the pairs of a chunk having a given digit follow those of the previous chunks
+    let mut start = 0;
+    for b in 0..N_BUCKETS {
+      for counts in offsets.iter_mut() {
+        let count = counts[b];
+        counts[b] = start;
+        start += count;
+      }
+    }
+    let dest = Dest(dst.as_mut_ptr());
+    src
+      .par_chunks(CHUNK_LEN)
+      .zip(offsets.par_iter_mut())
+      .for_each(|(chunk, offsets)| {
+        for &entry in chunk {
+          let offset = &mut offsets[digit(entry.0)];
+          // SAFETY: the offsets of the chunks are disjoint and lower than `len`
+          unsafe { dest.get().add(*offset).write(entry) };
+          *offset += 1;
+        }
+      });
+    std::mem::swap(&mut src, &mut dst);
+  }
+  src
+}
+
+/// Returns the hashes at `depth` of the points, sorted, and the rows of the points in
+/// that order.
+#[allow(unused_variables)]
+pub(crate) fn sort_by_hash<T: CoordValue>(
+  depth: u8,
+  lon: ArrayView1<T>,
+  lat: ArrayView1<T>,
+  nthreads: u16,
+) -> (Vec<u64>, Vec<u64>) {
+  let layer = healpix::nested::get(depth);
+  let hash_of = |i: usize| (layer.hash(lon[i].to_f64(), lat[i].to_f64()), i as u64);
+  #[cfg(not(target_arch = "wasm32"))]
+  let entries = thread_pool::get(nthreads).install(|| {
+    let entries = (0..lon.len())
+      .into_par_iter()
+      .map(hash_of)
+      .collect::<Vec<_>>();
+    // 4 bits for the base cell and 2 bits per depth
+    radix_sort(entries, 4 + 2 * depth as u32)
+  });
+  #[cfg(target_arch = "wasm32")]
+  let entries = {
+    let mut entries = (0..lon.len()).map(hash_of).collect::<Vec<_>>();
+    entries.sort_unstable();
+    entries
+  };
+  entries.into_iter().unzip()
+}
+
+/// Sorts points (`lon`, `lat`), in radians, by nested hash at `depth`. Returns the
+/// indices of the points in that order and their sorted hashes.
+#[pyfunction]
+pub fn sort_by_healpix<'py>(
+  py: Python<'py>,
+  depth: u8,
+  lon: Coords<'py>,
+  lat: Coords<'py>,
+  nthreads: u16,
+) -> PyResult<(Bound<'py, PyArray1<u64>>, Bound<'py, PyArray1<u64>>)> {
+  check::check_depth(depth)?;
+  let (hashes, order) = with_lonlat!(lon, lat, |lon, lat| {
+    let (lon, lat) = as_1d(lon, lat)?;
+    Ok(py.allow_threads(|| sort_by_hash(depth, lon, lat, nthreads)))
+  })?;
+  Ok((order.into_pyarray(py), hashes.into_pyarray(py)))
+}
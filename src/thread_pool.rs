@@ -0,0 +1,73 @@
+use std::sync::{
+  atomic::{AtomicUsize, Ordering},
+  Arc, Mutex, OnceLock,
+};
+
+use pyo3::prelude::*;
+use rayon::{ThreadPool, ThreadPoolBuilder};
+
+/// Number of threads used by the kernels called with `nthreads = 0`.
+/// `0` lets Rayon choose (RAYON_NUM_THREADS environment variable if set,
+/// or the number of logical CPUs otherwise).
+static DEFAULT_NUM_THREADS: AtomicUsize = AtomicUsize::new(0);
+
+/// A pool and its requested number of threads.
+type Pool = Option<(usize, Arc<ThreadPool>)>;
+
+/// The pools kept alive between calls: the default pool and the pool of the last
+/// explicit number of threads. Any other pool is dropped when replaced, its threads
+/// stopping once the running calls using it are over.
+#[derive(Default)]
+struct Pools {
+  default: Pool,
+  last: Pool,
+}
+
+fn pools() -> &'static Mutex<Pools> {
+  static POOLS: OnceLock<Mutex<Pools>> = OnceLock::new();
+  POOLS.get_or_init(|| Mutex::new(Pools::default()))
+}
+
+/// Returns the pool of `slot` if it has `n` threads, replacing it otherwise.
+fn get_or_build(slot: &mut Pool, n: usize) -> Arc<ThreadPool> {
+  match slot {
+    Some((m, pool)) if *m == n => pool.clone(),
+    _ => {
+      let pool = Arc::new(ThreadPoolBuilder::new().num_threads(n).build().unwrap());
+      *slot = Some((n, pool.clone()));
+      pool
+    }
+  }
+}
+
+/// Returns the process-wide pool having `nthreads` threads, building it on first use.
+/// `nthreads = 0` stands for the default set with `set_num_threads`.
+pub fn get(nthreads: u16) -> Arc<ThreadPool> {
+  let default = DEFAULT_NUM_THREADS.load(Ordering::Relaxed);
+  let mut pools = pools().lock().unwrap_or_else(|e| e.into_inner());
+  match nthreads as usize {
+    0 => get_or_build(&mut pools.default, default),
+    n if n == default => get_or_build(&mut pools.default, default),
+    n => get_or_build(&mut pools.last, n),
+  }
+}
+
+/// Set the number of threads of the pool used by default, `0` restoring Rayon's choice,
+/// and returns the previous setting.
+/// The previous default pool is released (its threads stop once the running calls
+/// using it are over).
+#[pyfunction]
+pub fn set_num_threads(num_threads: u16) -> u16 {
+  let previous = DEFAULT_NUM_THREADS.swap(num_threads as usize, Ordering::Relaxed);
+  if previous != num_threads as usize {
+    let mut pools = pools().lock().unwrap_or_else(|e| e.into_inner());
+    pools.default = None;
+  }
+  previous as u16
+}
+
+/// Number of threads of the pool used by default.
+#[pyfunction]
+pub fn get_num_threads() -> usize {
+  get(0).current_num_threads()
+}